@@ -0,0 +1,245 @@
+# backend/admission.py
+
+import re
+import asyncio
+from collections import deque
+from typing import Any, Optional, Dict, List, Tuple, Deque, Pattern
+
+from fastapi import FastAPI, status
+
+
+READ_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+# (route class, method, path pattern) rules checked in order, the first matching rule wins.
+# Requests not matched by any rule are classified as reads or writes by their method.
+# Route classes without limits (e.g. long-lived streams, which would hold the slot forever) are not limited
+DEFAULT_ROUTE_CLASS_RULES: List[Tuple[str, str, Pattern]] = [
+    ("streams", "GET", re.compile(r"^/books/changes$")),
+    ("files", "GET", re.compile(r"^/books/[^/]+/files/[^/]+$")),
+    ("files", "POST", re.compile(r"^/books/[^/]+/files$")),
+    ("auth", "POST", re.compile(r"^/token$")),
+    ("auth", "POST", re.compile(r"^/user/signup$")),
+    ("bulk", "GET", re.compile(r"^/books$")),
+    ("bulk", "GET", re.compile(r"^/books/search$")),
+]
+
+# route class -> (max concurrency, max queue length, queue timeout in milliseconds, reject status code)
+DEFAULT_ROUTE_CLASS_LIMITS: Dict[str, Tuple[int, int, float, int]] = {
+    # bcrypt verification is CPU bound, a few concurrent logins saturate the CPU already
+    "auth": (4, 16, 500.0, status.HTTP_429_TOO_MANY_REQUESTS),
+    "reads": (64, 128, 100.0, status.HTTP_503_SERVICE_UNAVAILABLE),
+    "writes": (16, 32, 500.0, status.HTTP_503_SERVICE_UNAVAILABLE),
+    "bulk": (8, 16, 250.0, status.HTTP_503_SERVICE_UNAVAILABLE),
+    # uploads and downloads hold their slots while the content is transferred, apart from the short requests
+    "files": (32, 32, 250.0, status.HTTP_503_SERVICE_UNAVAILABLE),
+}
+
+
+class AdmissionLimiter:
+    """
+    Concurrency limiter of a single route class with a short bounded wait queue.
+    Up to 'max_concurrency' requests are executed at once, up to 'max_queue' more requests wait for a free slot
+    for at most 'queue_timeout_ms', the rest are rejected at once. A released slot is handed off directly to
+    the first waiting request, so the waiting requests are admitted in the order of their arrival.
+    Must be used from the event loop thread only
+    """
+
+    def __init__(
+            self,
+            route_class: str,
+            max_concurrency: int,
+            max_queue: int = 0,
+            queue_timeout_ms: float = 100.0,
+            reject_status_code: int = status.HTTP_503_SERVICE_UNAVAILABLE,
+            retry_after_seconds: int = 1
+    ):
+        self.route_class: str = route_class
+        self.max_concurrency: int = max_concurrency
+        self.max_queue: int = max_queue
+        self.queue_timeout_ms: float = queue_timeout_ms
+        self.reject_status_code: int = reject_status_code
+        self.retry_after_seconds: int = retry_after_seconds
+        self.in_flight: int = 0
+        self.admitted_total: int = 0
+        self.rejected_total: int = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}({self.route_class}, max_concurrency={self.max_concurrency}, "
+            f"max_queue={self.max_queue}, queue_timeout_ms={self.queue_timeout_ms})"
+        )
+
+    async def acquire(self) -> bool:
+        """
+        Takes the execution slot, waits in the queue for it if all the slots are taken
+
+        :return bool: True if the slot is taken and must be released, False if the request is rejected
+        """
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            self.admitted_total += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_total += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait((waiter,), timeout=self.queue_timeout_ms / 1000)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if waiter.done():
+            self.admitted_total += 1
+            return True
+        self._abandon(waiter)
+        self.rejected_total += 1
+        return False
+
+    def release(self) -> None:
+        """
+        Releases the execution slot, hands it off to the first waiting request if any
+
+        :return None:
+        """
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            # the slot was handed off right before the waiter gave up, pass it on
+            self.release()
+            return
+        waiter.cancel()
+        self._waiters.remove(waiter)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+        }
+
+
+class AdmissionController:
+    """
+    Classifies the requests into route classes (auth, reads, writes, bulk) and keeps the limiter of every class
+    """
+
+    def __init__(
+            self,
+            limiters: Dict[str, AdmissionLimiter],
+            rules: Optional[List[Tuple[str, str, Pattern]]] = None
+    ):
+        self.limiters: Dict[str, AdmissionLimiter] = limiters
+        self.rules: List[Tuple[str, str, Pattern]] = DEFAULT_ROUTE_CLASS_RULES if rules is None else rules
+
+    def classify(self, method: str, path: str) -> str:
+        """
+        Returns the route class of the request
+
+        :param str method: HTTP method of the request
+        :param str path: path of the request
+        :return str: route class
+        """
+        for route_class, rule_method, path_pattern in self.rules:
+            if method == rule_method and path_pattern.match(path):
+                return route_class
+        return "reads" if method in READ_METHODS else "writes"
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Returns current in-flight and queued requests along with admission counters per route class
+
+        :return Dict[str, Dict[str, int]]: stats per route class
+        """
+        return {route_class: limiter.get_stats() for route_class, limiter in self.limiters.items()}
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware admitting the requests by the concurrency limits of their route classes.
+    Requests over the limit of their class are rejected quickly with 429 / 503 and Retry-After header,
+    so saturated expensive routes (e.g. logins) never starve the cheap ones of the worker threads and CPU.
+    Requests of the route classes without the limiter are passed through as they are
+    """
+
+    def __init__(self, app: Any, controller: AdmissionController, logger: Optional[Any] = None):
+        self.app = app
+        self.controller: AdmissionController = controller
+        self.logger: Optional[Any] = logger
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route_class = self.controller.classify(scope["method"], scope["path"])
+        limiter = self.controller.limiters.get(route_class)
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        if not await limiter.acquire():
+            if self.logger: self.logger.warning(
+                f"Rejected {scope['method']} {scope['path']} request: {route_class} route class is saturated "
+                f"({limiter.in_flight} in flight, {limiter.max_queue} queued)"
+            )
+            await self._reject(limiter, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+    @staticmethod
+    async def _reject(limiter: AdmissionLimiter, send: Any) -> None:
+        body = f'{{"detail": "The server is busy with {limiter.route_class} requests, please retry later"}}'.encode()
+        await send({
+            "type": "http.response.start",
+            "status": limiter.reject_status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(limiter.retry_after_seconds).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def init_admission_control(app: FastAPI, config: Dict[str, Any], logger: Optional[Any] = None) -> Optional[AdmissionController]:
+    """
+    Adds the admission control middleware to the application if 'ADMISSION_CONTROL_ENABLED' config value is set.
+    Limits of every route class are taken from ADMISSION_<CLASS>_MAX_CONCURRENCY, ADMISSION_<CLASS>_MAX_QUEUE
+    and ADMISSION_<CLASS>_QUEUE_TIMEOUT_MS config values, falling back to DEFAULT_ROUTE_CLASS_LIMITS
+
+    :param FastAPI app: application instance
+    :param Dict[str, Any] config: config extracted from .env file
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :return Optional[AdmissionController]: admission controller or None if admission control is disabled
+    """
+    if (config.get("ADMISSION_CONTROL_ENABLED") or "false").lower() != "true":
+        return None
+    retry_after_seconds = int(config.get("ADMISSION_RETRY_AFTER_SECONDS") or 1)
+    limiters = {}
+    for route_class, (max_concurrency, max_queue, queue_timeout_ms, reject_status_code) in DEFAULT_ROUTE_CLASS_LIMITS.items():
+        prefix = f"ADMISSION_{route_class.upper()}"
+        limiters[route_class] = AdmissionLimiter(
+            route_class=route_class,
+            max_concurrency=int(config.get(f"{prefix}_MAX_CONCURRENCY") or max_concurrency),
+            max_queue=int(config.get(f"{prefix}_MAX_QUEUE") or max_queue),
+            queue_timeout_ms=float(config.get(f"{prefix}_QUEUE_TIMEOUT_MS") or queue_timeout_ms),
+            reject_status_code=reject_status_code,
+            retry_after_seconds=retry_after_seconds
+        )
+    controller = AdmissionController(limiters=limiters)
+    app.add_middleware(AdmissionControlMiddleware, controller=controller, logger=logger)
+    if logger: logger.debug(f"Admission control is enabled: {', '.join(map(repr, limiters.values()))}")
+    return controller
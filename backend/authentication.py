@@ -1,13 +1,15 @@
 # backend/authentication.py
 
-from typing import Annotated, AnyStr, Union, NoReturn, Optional, Any
+from typing import Annotated, AnyStr, Union, NoReturn, Optional, Any, Dict
 
 from jose import JWTError
 from dotenv import dotenv_values
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 
 from .database import MongoAdapter
+from .invalidation import make_invalidation_key
 from .models import User, UserInDB, TokenData
 from .security import verify_password, decode_jwt_token
 
@@ -84,57 +86,88 @@ def get_user(mongo_adapter: MongoAdapter, username: AnyStr, logger: Optional[Any
     return
 
 
-async def get_current_user(mongo_adapter: MongoAdapter, token: Annotated[AnyStr, Depends(oauth2_scheme)], logger: Optional[Any] = None) -> Union[UserInDB, NoReturn]:
+async def get_token_payload(request: Request, token: Annotated[AnyStr, Depends(oauth2_scheme)]) -> Union[Dict[str, Any], NoReturn]:
     """
-    Receives token, attempts to decode the received token, verifies it and returns the current user.
-    If the token is invalid, returns an HTTP error right away.
+    Receives token, decodes and verifies it and checks it is not revoked, returns the token payload.
+    Revocation is checked against the local denylist of the application (request.app.state.token_denylist),
+    so the check adds no database round trip to the authenticated request
 
-    :param db: database with users collection
-    :type db: MongoAdapter class instance
+    :param request: request object
+    :type request: Request
     :param token: incoming JWT token
     :type token: Annotated[AnyStr, Depends(oauth2_scheme)]
-    :param logger: logger instance, defaults to None
-    :type logger: Optional[Any]
     :raises credentials_exception: HTTPException contains status_code=HTTP_401_UNAUTHORIZED, related message and headers as per OAuth2 specs
-    :return: either current user object or raises HTTPException
-    :rtype: Union[UserInDB, NoReturn]
+    :return: either decoded token payload or raises HTTPException
+    :rtype: Union[Dict[str, Any], NoReturn]
     """
+    logger = getattr(request.app.state, "logger", None)
     # create alias for frequently used exception
     credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Could not validate credentials!",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
     try:
         payload = decode_jwt_token(encoded_token=token)
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
     except JWTError as e:
         if logger: logger.warning(f"Exception with JWT token: {e}")
         raise credentials_exception
-    user = get_user(mongo_adapter=mongo_adapter, username=token_data.username)
-    if user is None:
+    if payload.get("sub") is None:
+        raise credentials_exception
+    token_denylist = getattr(request.app.state, "token_denylist", None)
+    if token_denylist is not None and payload.get("jti") and token_denylist.is_revoked(payload["jti"]):
+        if logger: logger.warning(f"Revoked JWT token {payload['jti']} of {payload['sub']} is presented")
         raise credentials_exception
+    return payload
+
+
+async def get_current_user(request: Request, payload: Annotated[Dict[str, Any], Depends(get_token_payload)]) -> Union[UserInDB, NoReturn]:
+    """
+    Receives the verified token payload and returns the current user from the users collection
+    of the application (request.app.state.users_adapter), cached by the users cache of the application
+    (request.app.state.users_cache) if any, which is evicted by the invalidation bus on every user write.
+    If the user is not found, returns an HTTP error right away.
+
+    :param request: request object
+    :type request: Request
+    :param payload: verified JWT token payload
+    :type payload: Annotated[Dict[str, Any], Depends(get_token_payload)]
+    :raises credentials_exception: HTTPException contains status_code=HTTP_401_UNAUTHORIZED, related message and headers as per OAuth2 specs
+    :return: either current user object or raises HTTPException
+    :rtype: Union[UserInDB, NoReturn]
+    """
+    token_data = TokenData(username=payload["sub"])
+    users_adapter = request.app.state.users_adapter
+    users_cache = getattr(request.app.state, "users_cache", None)
+    user, cache_key, generation = None, None, None
+    if users_cache is not None:
+        cache_key = make_invalidation_key(users_adapter.collection_name, "username", token_data.username)
+        generation = users_cache.generation
+        user = users_cache.get(cache_key)
+    if user is None:
+        user = await run_in_threadpool(get_user, mongo_adapter=users_adapter, username=token_data.username)
+        if user is not None and users_cache is not None:
+            users_cache.set(cache_key, user, generation=generation)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Could not validate credentials!",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
 
-async def get_current_active_user(current_user: Annotated[UserInDB, Depends(get_current_user)], logger: Optional[Any] = None) -> Union[UserInDB, NoReturn]:
+async def get_current_active_user(current_user: Annotated[UserInDB, Depends(get_current_user)]) -> Union[UserInDB, NoReturn]:
     """
     Checks the current user's 'disabled' attribute value and returns user pydantic model if current user is not disabled
 
     :param current_user: either passed User model or dependency
     :type current_user: Annotated[User, Depends(get_current_user)]
-    :param logger: logger instance, defaults to None
-    :type logger: Optional[Any]
     :raises HTTPException: raised when current user 'disabled' attribute value is True 
     :return: either current user model if user is not disabled 
     :rtype: Union[UserInDB, NoReturn]
     """
     if current_user.disabled:
-        if logger: logger.warning(f"Current user is disabled: {current_user.disabled}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Current user {current_user.username} is inactive!"
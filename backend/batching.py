@@ -0,0 +1,159 @@
+# backend/batching.py
+
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Optional, Dict, List, Tuple
+
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError, WriteConcernError
+
+from .database import MongoAdapter
+
+
+DUPLICATE_KEY_ERROR_CODE = 11000
+
+
+class WriteCoalescer:
+    """
+    Group-commit batcher of single document inserts.
+    Inserts submitted by concurrent requests are collected by the background flusher thread for up to
+    'max_delay_ms' after the first of them arrives or until 'max_batch_size' documents are collected,
+    and are written by a single unordered bulk write. Every caller blocks until its own document is flushed
+    and gets either its own inserted _id or its own write error (e.g. DuplicateKeyError), so failure of one
+    document never fails the rest of the batch
+    """
+
+    def __init__(
+            self,
+            mongo_adapter: MongoAdapter,
+            max_delay_ms: float = 5.0,
+            max_batch_size: int = 100,
+            logger: Optional[Any] = None
+    ):
+        self.mongo_adapter: MongoAdapter = mongo_adapter
+        self.max_delay_ms: float = max_delay_ms
+        self.max_batch_size: int = max_batch_size
+        self.logger: Optional[Any] = logger
+        self._queue: "queue.Queue[Optional[Tuple[Dict[str, Any], Future]]]" = queue.Queue()
+        self._closed: bool = False
+        # makes closing atomic with queueing, so nothing is queued after the stop sentinel
+        self._lock = threading.Lock()
+        self._flusher = threading.Thread(target=self._run, name="write-coalescer", daemon=True)
+        self._flusher.start()
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}({self.mongo_adapter.collection_name}, "
+            f"max_delay_ms={self.max_delay_ms}, max_batch_size={self.max_batch_size})"
+        )
+
+    def insert(self, data: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """
+        Queues the document for insertion and blocks until the batch containing it is written
+
+        :param Dict[str, Any] data: document to be written in DB
+        :param Optional[float] timeout: maximum number of seconds to wait for the flush, waits forever if None
+        :raises RuntimeError: if the coalescer is already closed
+        :raises DuplicateKeyError: if the document violates unique index
+        :raises WriteError: if the document failed to be written for any other reason
+        :return Any: _id of inserted entry
+        """
+        return self.submit(data).result(timeout=timeout)
+
+    def submit(self, data: Dict[str, Any]) -> Future:
+        """
+        Queues the document for insertion without waiting
+
+        :param Dict[str, Any] data: document to be written in DB
+        :raises RuntimeError: if the coalescer is already closed
+        :return Future: future resolved with _id of inserted entry or with the write error of the document
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"{self.__class__.__name__} is already closed!")
+            self._queue.put((data, future))
+        return future
+
+    def close(self) -> None:
+        """
+        Flushes the queued documents and stops the flusher thread
+
+        :return None:
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._flusher.join()
+        # nothing can be queued after the sentinel, still no caller may be left waiting forever
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError(f"{self.__class__.__name__} is closed before the document is written!"))
+
+    def _collect_batch(self, first_item: Tuple[Dict[str, Any], Future]) -> Tuple[List[Tuple[Dict[str, Any], Future]], bool]:
+        batch = [first_item]
+        deadline = time.monotonic() + self.max_delay_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining_seconds = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining_seconds) if remaining_seconds > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        stopped = False
+        while not stopped:
+            first_item = self._queue.get()
+            if first_item is None:
+                break
+            batch, stopped = self._collect_batch(first_item)
+            self._flush(batch)
+
+    def _flush(self, batch: List[Tuple[Dict[str, Any], Future]]) -> None:
+        # futures cancelled by the callers are still written, the documents are already accepted
+        for _, future in batch: future.set_running_or_notify_cancel()
+        write_errors: Dict[int, Dict[str, Any]] = {}
+        write_concern_error: Optional[WriteConcernError] = None
+        try:
+            self.mongo_adapter.bulk_write([InsertOne(data) for data, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            write_errors = {write_error["index"]: write_error for write_error in e.details.get("writeErrors", [])}
+            write_concern_errors = e.details.get("writeConcernErrors") or []
+            if write_concern_errors:
+                # the documents are written but not acknowledged as required, as single inserts report it
+                write_concern_error = WriteConcernError(
+                    write_concern_errors[0].get("errmsg"), write_concern_errors[0].get("code"), write_concern_errors[0]
+                )
+        except Exception as e:
+            if self.logger: self.logger.warning(f"Bulk write of {len(batch)} coalesced documents failed: {e}")
+            for _, future in batch:
+                if not future.done(): future.set_exception(e)
+            return
+        if self.logger: self.logger.debug(
+            f"Flushed {len(batch)} coalesced documents to {self.mongo_adapter.collection_name}, failed: {len(write_errors)}"
+        )
+        for index, (data, future) in enumerate(batch):
+            if future.done():
+                continue
+            write_error = write_errors.get(index)
+            if write_error is None and write_concern_error is not None:
+                future.set_exception(write_concern_error)
+            elif write_error is None:
+                # pymongo assigns _id to the inserted documents in place
+                future.set_result(data.get("_id"))
+            elif write_error.get("code") == DUPLICATE_KEY_ERROR_CODE:
+                future.set_exception(DuplicateKeyError(write_error.get("errmsg"), write_error.get("code"), write_error))
+            else:
+                future.set_exception(WriteError(write_error.get("errmsg"), write_error.get("code"), write_error))
@@ -0,0 +1,368 @@
+# backend/changes.py
+
+import json
+import asyncio
+import threading
+from uuid import uuid4
+from itertools import count
+from collections import deque
+from typing import Any, Optional, Dict, List, Tuple, Deque
+
+from pydantic import BaseModel, Field
+from pymongo.errors import PyMongoError, OperationFailure
+
+from .models import Book
+from .database import MongoAdapter
+from .repository import BookRepository, BookChange, MongoBookRepository
+
+
+class TooManySubscribersError(RuntimeError):
+    """
+    Raised when the change feed already serves the maximum number of subscribers
+    """
+
+
+class BookChangeEvent(BaseModel):
+    """
+    Single change of the book shelf sent to the change feed subscribers
+    """
+    event_id: str = Field(..., example="42")
+    operation: str = Field(..., example="add")
+    book: Optional[Book] = Field(None)
+    previous_book: Optional[Book] = Field(None)
+
+    def to_sse(self) -> str:
+        """
+        Formats the event as Server-Sent Event, the event ID is sent back by the reconnecting client
+        as Last-Event-ID header
+
+        :return str: event in text/event-stream format
+        """
+        data = json.dumps(self.dict(exclude={"event_id"}), separators=(",", ":"))
+        return f"id: {self.event_id}\nevent: {self.operation}\ndata: {data}\n\n"
+
+
+class BookChangeSubscription:
+    """
+    Queue of the events of a single subscriber living in the event loop of the subscriber.
+    'replayed_events' are the events missed since the Last-Event-ID, 'reset' is set if those cannot be replayed
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_queue: int, replayed_events: List[BookChangeEvent], reset: bool):
+        self.loop: asyncio.AbstractEventLoop = loop
+        self.max_queue: int = max_queue
+        self.replayed_events: List[BookChangeEvent] = replayed_events
+        self.reset: bool = reset
+        self._queue: "asyncio.Queue[Optional[BookChangeEvent]]" = asyncio.Queue()
+        self.closed: bool = False
+
+    def _deliver(self, event: Optional[BookChangeEvent]) -> None:
+        if self.closed:
+            return
+        if event is not None and self._queue.qsize() >= self.max_queue:
+            # the slow subscriber is disconnected, it catches up from the history after reconnecting
+            event = None
+        if event is None: self.closed = True
+        self._queue.put_nowait(event)
+
+    async def get(self) -> Optional[BookChangeEvent]:
+        """
+        Waits for the next event
+
+        :return Optional[BookChangeEvent]: next event or None once the subscription is closed
+        """
+        return await self._queue.get()
+
+
+class BookChangeFeed:
+    """
+    Fan-out of the book shelf changes to the subscribers (e.g. Server-Sent Events streams).
+    The last 'history_size' events are kept, so the reconnecting subscriber gets the events it missed
+    since its last event ID. Events are published from any thread and are delivered to every subscriber
+    in its own event loop, subscribers falling more than 'max_queue' events behind are disconnected.
+    This base class publishes the changes made through the given repository in the current process
+    """
+
+    def __init__(
+            self,
+            history_size: int = 1000,
+            max_queue: int = 100,
+            max_subscribers: int = 1000,
+            logger: Optional[Any] = None
+    ):
+        self.history_size: int = history_size
+        self.max_queue: int = max_queue
+        self.max_subscribers: int = max_subscribers
+        self.logger: Optional[Any] = logger
+        self._lock = threading.Lock()
+        self._history: Deque[BookChangeEvent] = deque(maxlen=history_size)
+        self._subscriptions: List[BookChangeSubscription] = []
+        # event IDs of every process start are distinct, so the IDs issued before the restart are never matched
+        self._id_prefix: str = uuid4().hex[:8]
+        self._sequence = count(1)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self._subscriptions)} subscribers, {len(self._history)} events)"
+
+    def attach(self, book_repository: BookRepository) -> None:
+        """
+        Publishes the changes made through the repository
+
+        :param BookRepository book_repository: book repository
+        :return None:
+        """
+        book_repository.subscribe(self._on_book_change)
+
+    def _on_book_change(self, change: BookChange) -> None:
+        self.publish(operation=change.operation, book=change.book, previous_book=change.previous_book)
+
+    def publish(
+            self,
+            operation: str,
+            book: Optional[Book],
+            previous_book: Optional[Book] = None,
+            event_id: Optional[str] = None
+    ) -> None:
+        """
+        Appends the event to the history and delivers it to all the subscribers, safe to call from any thread
+
+        :param str operation: change operation, e.g. 'add', 'delete', 'replace', 'checkout', 'return'
+        :param Optional[Book] book: changed book, None if unknown (e.g. deleted book without pre-image)
+        :param Optional[Book] previous_book: book before the change (if known)
+        :param Optional[str] event_id: unique ID of the event the subscriber resumes after, next sequence number if None
+        :return None:
+        """
+        with self._lock:
+            event = BookChangeEvent(
+                event_id=event_id or f"{self._id_prefix}-{next(self._sequence)}",
+                operation=operation,
+                book=book,
+                previous_book=previous_book
+            )
+            self._history.append(event)
+            for subscription in self._subscriptions:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> BookChangeSubscription:
+        """
+        Subscribes to the events published after the given event ID (or from now on), must be called
+        from the event loop the events are awaited in
+
+        :param Optional[str] last_event_id: ID of the last event received by the reconnecting subscriber
+        :raises TooManySubscribersError: if the maximum number of subscribers is reached
+        :return BookChangeSubscription: subscription to be unsubscribed once the subscriber is gone
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscribers:
+                raise TooManySubscribersError(f"Change feed already serves {len(self._subscriptions)} subscribers!")
+            replayed_events, reset = self._get_events_after(last_event_id)
+            subscription = BookChangeSubscription(loop=loop, max_queue=self.max_queue, replayed_events=replayed_events, reset=reset)
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def _get_events_after(self, last_event_id: Optional[str]) -> Tuple[List[BookChangeEvent], bool]:
+        if not last_event_id:
+            return [], False
+        for position in range(len(self._history) - 1, -1, -1):
+            if self._history[position].event_id == last_event_id:
+                return list(self._history)[position + 1:], False
+        # the event is too old or unknown (e.g. the server restarted), the subscriber has to reload the books
+        return [], True
+
+    def unsubscribe(self, subscription: BookChangeSubscription) -> None:
+        """
+        Removes the subscription
+
+        :param BookChangeSubscription subscription: subscription returned by subscribe()
+        :return None:
+        """
+        with self._lock:
+            if subscription in self._subscriptions: self._subscriptions.remove(subscription)
+
+    def _disconnect_subscribers(self) -> None:
+        # must be called under the lock
+        for subscription in self._subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription._deliver, None)
+        self._subscriptions.clear()
+
+    def reset(self) -> None:
+        """
+        Drops the history and disconnects all the subscribers, once some changes may have been missed
+        (e.g. the change stream could not be resumed). The reconnecting subscribers are told to reset,
+        as their last event IDs are no longer known
+
+        :return None:
+        """
+        with self._lock:
+            self._history.clear()
+            self._disconnect_subscribers()
+
+    def start(self) -> None:
+        """
+        Starts watching the changes made outside of the process, no-op for the process local feed
+
+        :return None:
+        """
+
+    def close(self) -> None:
+        """
+        Closes all the subscriptions and stops watching the changes
+
+        :return None:
+        """
+        with self._lock:
+            self._disconnect_subscribers()
+
+
+class MongoBookChangeFeed(BookChangeFeed):
+    """
+    Change feed publishing the changes of the books collection made by any service worker, watched by
+    MongoDB change stream (requires replica set or sharded cluster). Event IDs are the change stream resume tokens,
+    so they are the same in every worker and the subscriber reconnecting to another worker resumes seamlessly,
+    while the watcher resumes its own change stream after failures without missing any change.
+    Deleted books are known only if the collection records pre-images (MongoDB 6.0+, 'pre_images' set).
+    If the server does not support change streams (standalone server), the changes made through
+    the given repository in the current process are published instead
+    """
+
+    # error code of $changeStream stage run on the standalone server
+    CHANGE_STREAM_NOT_SUPPORTED_ERROR_CODE = 40573
+
+    def __init__(
+            self,
+            mongo_adapter: MongoAdapter,
+            book_repository: Optional[BookRepository] = None,
+            pre_images: bool = False,
+            history_size: int = 1000,
+            max_queue: int = 100,
+            max_subscribers: int = 1000,
+            logger: Optional[Any] = None
+    ):
+        super().__init__(history_size=history_size, max_queue=max_queue, max_subscribers=max_subscribers, logger=logger)
+        self.mongo_adapter: MongoAdapter = mongo_adapter
+        self.book_repository: Optional[BookRepository] = book_repository
+        self.pre_images: bool = pre_images
+        self._resume_token: Optional[Dict[str, Any]] = None
+        self._stop_event = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    @staticmethod
+    def to_book_change(change: Dict[str, Any]) -> Optional[Tuple[str, Optional[Book], Optional[Book]]]:
+        """
+        Translates the change stream event into the book shelf change
+
+        :param Dict[str, Any] change: change stream event
+        :return Optional[Tuple[str, Optional[Book], Optional[Book]]]: operation, book and previous book,
+                                                                       None for the events not changing the books
+        """
+        operation_type = change.get("operationType")
+
+        def to_book(document: Optional[Dict[str, Any]]) -> Optional[Book]:
+            if not document:
+                return None
+            document = {key: value for key, value in document.items() if key != "_id"}
+            return Book(**document)
+
+        previous_book = to_book(change.get("fullDocumentBeforeChange"))
+        if operation_type == "insert":
+            return "add", to_book(change.get("fullDocument")), None
+        if operation_type == "replace":
+            return "replace", to_book(change.get("fullDocument")), previous_book
+        if operation_type == "delete":
+            return "delete", previous_book, None
+        if operation_type == "update":
+            updated_fields = change.get("updateDescription", {}).get("updatedFields", {})
+            operation = "update"
+            if set(updated_fields) == {"available"}:
+                operation = "return" if updated_fields["available"] else "checkout"
+            return operation, to_book(change.get("fullDocument")), previous_book
+        return None
+
+    def _watch(self) -> None:
+        watch_kwargs = {"full_document": "updateLookup", "max_await_time_ms": 1000}
+        if self.pre_images: watch_kwargs["full_document_before_change"] = "whenAvailable"
+        with self.mongo_adapter.collection.watch(resume_after=self._resume_token, **watch_kwargs) as stream:
+            while not self._stop_event.is_set():
+                change = stream.try_next()
+                if change is None:
+                    continue
+                self._resume_token = stream.resume_token
+                book_change = self.to_book_change(change)
+                if book_change:
+                    operation, book, previous_book = book_change
+                    self.publish(
+                        operation=operation, book=book, previous_book=previous_book,
+                        event_id=self._resume_token["_data"]
+                    )
+
+    def _run(self) -> None:
+        retry_delay_seconds = 0.1
+        while not self._stop_event.is_set():
+            try:
+                self._watch()
+                retry_delay_seconds = 0.1
+            except OperationFailure as e:
+                if e.code == self.CHANGE_STREAM_NOT_SUPPORTED_ERROR_CODE:
+                    if self.logger: self.logger.warning(
+                        f"Change streams are not supported: {e}, publishing the changes of this process only"
+                    )
+                    if self.book_repository: self.attach(self.book_repository)
+                    return
+                if self.logger: self.logger.warning(f"Books change stream failed: {e}, starting from now on")
+                # the resume token is no longer in the oplog (or invalidated), so the changes in the gap are lost:
+                # the connected subscribers are disconnected too, they reconnect, get reset and reload the books
+                self._resume_token = None
+                self.reset()
+            except PyMongoError as e:
+                if self.logger: self.logger.warning(f"Books change stream is interrupted: {e}, resuming")
+            self._stop_event.wait(retry_delay_seconds)
+            retry_delay_seconds = min(retry_delay_seconds * 2, 5.0)
+
+    def start(self) -> None:
+        if self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._run, name="books-change-stream", daemon=True)
+        self._watcher.start()
+
+    def close(self) -> None:
+        if self._watcher is not None:
+            self._stop_event.set()
+            self._watcher.join()
+            self._watcher = None
+        super().close()
+
+
+def init_book_change_feed(
+        config: Dict[str, Any],
+        book_repository: BookRepository,
+        logger: Optional[Any] = None
+) -> BookChangeFeed:
+    """
+    Creates the book change feed of the repository. The mongo repository is watched by MongoDB change stream
+    unless 'BOOK_CHANGES_CHANGE_STREAMS_ENABLED' config value is false, otherwise the changes made by
+    the current process are published
+
+    :param Dict[str, Any] config: config extracted from .env file
+    :param BookRepository book_repository: book repository
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :return BookChangeFeed: book change feed instance
+    """
+    feed_params = {
+        "history_size": int(config.get("BOOK_CHANGES_HISTORY_SIZE") or 1000),
+        "max_queue": int(config.get("BOOK_CHANGES_MAX_QUEUE") or 100),
+        "max_subscribers": int(config.get("BOOK_CHANGES_MAX_SUBSCRIBERS") or 1000),
+        "logger": logger,
+    }
+    change_streams_enabled = (config.get("BOOK_CHANGES_CHANGE_STREAMS_ENABLED") or "true").lower() == "true"
+    if change_streams_enabled and isinstance(book_repository, MongoBookRepository):
+        return MongoBookChangeFeed(
+            mongo_adapter=book_repository.mongo_adapter,
+            book_repository=book_repository,
+            pre_images=(config.get("BOOK_CHANGES_PRE_IMAGES") or "false").lower() == "true",
+            **feed_params
+        )
+    book_change_feed = BookChangeFeed(**feed_params)
+    book_change_feed.attach(book_repository)
+    return book_change_feed
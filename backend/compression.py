@@ -0,0 +1,290 @@
+# backend/compression.py
+
+import re
+import zlib
+from typing import Any, Optional, Dict, List, Tuple, Pattern, Callable
+
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+
+try:
+    import brotli
+except ImportError:
+    # optional, 'br' encoding is not offered without it
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    # optional, 'zstd' encoding is not offered without it
+    zstandard = None
+
+
+# route profile rules, the first matching (method, path pattern) rule wins, "default" profile otherwise
+DEFAULT_COMPRESSION_ROUTE_RULES: List[Tuple[str, str, Pattern]] = [
+    ("streams", "GET", re.compile(r"^/books/changes$")),
+    ("bulk", "GET", re.compile(r"^/books$")),
+    ("bulk", "GET", re.compile(r"^/books/search$")),
+]
+
+# route profile -> encoding -> compression level. Events are flushed one by one, so streams use the cheapest levels,
+# while the large pages are worth more CPU. Levels: gzip 1-9, br 0-11, zstd 1-22
+DEFAULT_COMPRESSION_LEVELS: Dict[str, Dict[str, int]] = {
+    "default": {"gzip": 6, "br": 4, "zstd": 3},
+    "bulk": {"gzip": 6, "br": 5, "zstd": 6},
+    "streams": {"gzip": 1, "br": 1, "zstd": 1},
+}
+
+# the first encoding accepted by the client with the highest weight is used
+ENCODINGS_BY_PREFERENCE = ("zstd", "br", "gzip")
+
+# media types worth compressing, images, PDFs and archives are compressed already
+COMPRESSIBLE_CONTENT_TYPE_PATTERN = re.compile(
+    r"^(text/[^;]+|application/(json|javascript|xml|x-ndjson)|application/[^;]+\+(json|xml))\s*(;|$)"
+)
+
+# bodies above this size are compressed off the event loop
+THREADPOOL_COMPRESSION_SIZE = 65536
+
+
+class Compressor:
+    """
+    Streaming compressor of a single response body in one of the supported encodings.
+    Every compressed chunk is flushed, so the streamed parts (e.g. Server-Sent Events) reach the client at once
+    """
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding: str = encoding
+        self.level: int = level
+        self._process: Callable[[bytes], bytes]
+        self._flush: Callable[[], bytes]
+        self._finish: Callable[[], bytes]
+        if encoding == "gzip":
+            # wbits 31 selects gzip container
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self._process, self._finish = compressor.compress, compressor.flush
+            self._flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+        elif encoding == "br" and brotli is not None:
+            compressor = brotli.Compressor(quality=level)
+            self._process, self._flush, self._finish = compressor.process, compressor.flush, compressor.finish
+        elif encoding == "zstd" and zstandard is not None:
+            compressor = zstandard.ZstdCompressor(level=level).compressobj()
+            self._process, self._finish = compressor.compress, compressor.flush
+            self._flush = lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        else:
+            raise ValueError(f"Unsupported content encoding: {encoding}")
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.encoding}, level={self.level})"
+
+    def compress(self, chunk: bytes, last: bool = False) -> bytes:
+        """
+        Compresses the next chunk of the body
+
+        :param bytes chunk: chunk of the body
+        :param bool last: if True, the chunk is the last one and the compressed stream is finished
+        :return bytes: compressed data to be sent
+        """
+        if not chunk and not last:
+            return b""
+        compressed = self._process(chunk) if chunk else b""
+        return compressed + (self._finish() if last else self._flush())
+
+    @staticmethod
+    def compress_body(encoding: str, level: int, body: bytes) -> bytes:
+        """
+        Compresses the whole body at once
+
+        :param str encoding: content encoding
+        :param int level: compression level
+        :param bytes body: body to be compressed
+        :return bytes: compressed body
+        """
+        return Compressor(encoding=encoding, level=level).compress(body, last=True)
+
+
+def get_available_encodings() -> List[str]:
+    """
+    Returns the content encodings supported by the installed packages, in the order of preference
+
+    :return List[str]: content encodings
+    """
+    available = {"gzip": True, "br": brotli is not None, "zstd": zstandard is not None}
+    return [encoding for encoding in ENCODINGS_BY_PREFERENCE if available[encoding]]
+
+
+def select_encoding(accept_encoding: Optional[str], available_encodings: List[str]) -> Optional[str]:
+    """
+    Selects the content encoding of the response by the 'Accept-Encoding' request header
+
+    :param Optional[str] accept_encoding: value of the 'Accept-Encoding' header, e.g. 'gzip, br;q=0.9'
+    :param List[str] available_encodings: supported encodings in the order of preference
+    :return Optional[str]: selected encoding or None to send the body as it is
+    """
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding: weights[coding.lower()] = weight
+    candidates = [
+        (weights.get(encoding, weights.get("*", 0.0)), -position, encoding)
+        for position, encoding in enumerate(available_encodings)
+    ]
+    weight, _, encoding = max(candidates, default=(0.0, 0, None))
+    return encoding if weight > 0 else None
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing the responses in the best encoding accepted by the client (zstd, br or gzip,
+    depending on the installed packages). Complete bodies are compressed only above 'minimum_size' bytes.
+    Streaming bodies are compressed chunk by chunk as they are sent, every chunk is flushed and nothing is
+    buffered. Partial content, already encoded responses, incompressible media types and 'no-transform'
+    responses are sent as they are. Compression levels are chosen per route profile
+    """
+
+    def __init__(
+            self,
+            app: Any,
+            minimum_size: int = 1024,
+            levels: Optional[Dict[str, Dict[str, int]]] = None,
+            rules: Optional[List[Tuple[str, str, Pattern]]] = None,
+            encodings: Optional[List[str]] = None,
+            logger: Optional[Any] = None
+    ):
+        self.app = app
+        self.minimum_size: int = minimum_size
+        self.levels: Dict[str, Dict[str, int]] = DEFAULT_COMPRESSION_LEVELS if levels is None else levels
+        self.rules: List[Tuple[str, str, Pattern]] = DEFAULT_COMPRESSION_ROUTE_RULES if rules is None else rules
+        self.encodings: List[str] = get_available_encodings() if encodings is None else encodings
+        self.logger: Optional[Any] = logger
+
+    def get_level(self, method: str, path: str, encoding: str) -> int:
+        """
+        Returns the compression level of the route
+
+        :param str method: HTTP method of the request
+        :param str path: path of the request
+        :param str encoding: selected content encoding
+        :return int: compression level
+        """
+        profile = "default"
+        for rule_profile, rule_method, path_pattern in self.rules:
+            if method == rule_method and path_pattern.match(path):
+                profile = rule_profile
+                break
+        return self.levels.get(profile, self.levels["default"])[encoding]
+
+    @staticmethod
+    def _is_compressible(message: Dict[str, Any]) -> bool:
+        if message["status"] < 200 or message["status"] in (204, 206, 304):
+            return False
+        headers = {name.lower(): value for name, value in message.get("headers", ())}
+        if b"content-encoding" in headers or b"no-transform" in headers.get(b"cache-control", b"").lower():
+            return False
+        return bool(COMPRESSIBLE_CONTENT_TYPE_PATTERN.match(headers.get(b"content-type", b"").decode("latin-1").lower()))
+
+    @staticmethod
+    def _get_encoded_headers(message: Dict[str, Any], encoding: str) -> List[Tuple[bytes, bytes]]:
+        headers = []
+        for name, value in message.get("headers", ()):
+            lowered_name = name.lower()
+            if lowered_name == b"content-length" or lowered_name == b"vary":
+                continue
+            # the strong validator names the identity representation only
+            if lowered_name == b"etag" and not value.startswith(b"W/"):
+                value = b"W/" + value
+            headers.append((name, value))
+        vary = [value for name, value in message.get("headers", ()) if name.lower() == b"vary"]
+        headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+        headers.append((b"content-encoding", encoding.encode()))
+        return headers
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = None
+        for header_name, header_value in scope.get("headers", ()):
+            if header_name == b"accept-encoding":
+                accept_encoding = header_value.decode("latin-1")
+                break
+        encoding = select_encoding(accept_encoding, self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        level = self.get_level(scope["method"], scope["path"], encoding)
+        start_message: Optional[Dict[str, Any]] = None
+        compressor: Optional[Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                if self._is_compressible(message):
+                    # held back until the first body part tells whether the body is complete and how large it is
+                    start_message = message
+                else:
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body, more_body = message.get("body", b""), message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = Compressor(encoding=encoding, level=level)
+                await send({**start_message, "headers": self._get_encoded_headers(start_message, encoding)})
+            if len(body) >= THREADPOOL_COMPRESSION_SIZE:
+                compressed = await run_in_threadpool(compressor.compress, body, not more_body)
+            else:
+                compressed = compressor.compress(body, last=not more_body)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def init_compression(app: FastAPI, config: Dict[str, Any], logger: Optional[Any] = None) -> None:
+    """
+    Adds the response compression middleware to the application if 'COMPRESSION_ENABLED' config value is set.
+    Levels of every route profile are taken from COMPRESSION_<PROFILE>_<GZIP|BR|ZSTD>_LEVEL config values,
+    falling back to DEFAULT_COMPRESSION_LEVELS
+
+    :param FastAPI app: application instance
+    :param Dict[str, Any] config: config extracted from .env file
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :return None:
+    """
+    if (config.get("COMPRESSION_ENABLED") or "false").lower() != "true":
+        return
+    levels = {
+        profile: {
+            encoding: int(config.get(f"COMPRESSION_{profile.upper()}_{encoding.upper()}_LEVEL") or level)
+            for encoding, level in profile_levels.items()
+        }
+        for profile, profile_levels in DEFAULT_COMPRESSION_LEVELS.items()
+    }
+    encodings = get_available_encodings()
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=int(config.get("COMPRESSION_MINIMUM_SIZE") or 1024),
+        levels=levels,
+        encodings=encodings,
+        logger=logger
+    )
+    if logger: logger.debug(f"Response compression is enabled, encodings: {', '.join(encodings)}")
@@ -1,9 +1,21 @@
 # backend/database.py
 
-from typing import Any, Optional, Dict, List, AnyStr, Tuple
+import time
+import threading
+from contextlib import nullcontext
+from typing import Any, Optional, Dict, List, AnyStr, Tuple, Iterator, Callable, Union
 
+import gridfs
 import pymongo
-from pydantic import BaseModel, Field
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+from pydantic import BaseModel, Field, validator
+
+from .indexes import IndexSpec, IndexDiffReport, to_index_specs, diff_indexes
+from .invalidation import get_invalidation_keys
+from .memory_database import get_in_memory_mongo_client
+from .resilience import CircuitBreaker, RetryPolicy, CIRCUIT_BREAKER_FAILURE_ERRORS
 
 
 class AuthCredentials(BaseModel):
@@ -18,6 +30,131 @@ class AuthCredentials(BaseModel):
     authMechanism: str = Field(..., example="DEFAULT")
 
 
+# time limit of the explain of the slow query shape, run in the background apart from the slow query itself
+SLOW_QUERY_EXPLAIN_MAX_TIME_MS = 1000
+
+# read preference modes accepted by QueryOptions, named as in MongoDB connection string
+READ_PREFERENCES = {
+    "primary": Primary(),
+    "primaryPreferred": PrimaryPreferred(),
+    "secondary": Secondary(),
+    "secondaryPreferred": SecondaryPreferred(),
+    "nearest": Nearest(),
+}
+
+
+class QueryOptions(BaseModel):
+    """
+    Custom validation class used to accept and validate consistency and durability options
+    of MongoDB operations: read preference, read concern, write concern and server-side time limit.
+    Options left as None fall back to the adapter defaults and then to the client defaults
+    """
+    read_preference: Optional[str] = Field(None, example="secondaryPreferred")
+    read_concern: Optional[str] = Field(None, example="majority")
+    write_concern: Optional[Union[int, str]] = Field(None, example="majority")
+    journal: Optional[bool] = Field(None, example=True)
+    write_timeout_ms: Optional[int] = Field(None, example=1000)
+    max_time_ms: Optional[int] = Field(None, example=500)
+
+    class Config:
+        # keeps integers and strings of Union[int, str] fields as they are instead of casting to the first type
+        smart_union = True
+
+    @validator("read_preference")
+    def validate_read_preference(cls, read_preference):
+        if read_preference is not None and read_preference not in READ_PREFERENCES:
+            raise ValueError(f"Unsupported read preference: {read_preference}, expected one of: {', '.join(READ_PREFERENCES)}")
+        return read_preference
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], prefix: str = "MONGODB") -> "QueryOptions":
+        """
+        Extracts query options from the config values named by the given prefix, e.g. MONGODB_READ_PREFERENCE,
+        MONGODB_READ_CONCERN, MONGODB_WRITE_CONCERN, MONGODB_WRITE_CONCERN_JOURNAL,
+        MONGODB_WRITE_CONCERN_TIMEOUT_MS and MONGODB_MAX_TIME_MS
+
+        :param Dict[str, Any] config: config extracted from .env file
+        :param str prefix: prefix of the config keys
+        :return QueryOptions: query options, unset config values are left as None
+        """
+        write_concern = config.get(f"{prefix}_WRITE_CONCERN") or None
+        if write_concern and write_concern.isdigit(): write_concern = int(write_concern)
+        journal = config.get(f"{prefix}_WRITE_CONCERN_JOURNAL") or None
+        write_timeout_ms = config.get(f"{prefix}_WRITE_CONCERN_TIMEOUT_MS") or None
+        max_time_ms = config.get(f"{prefix}_MAX_TIME_MS") or None
+        return cls(
+            read_preference=config.get(f"{prefix}_READ_PREFERENCE") or None,
+            read_concern=config.get(f"{prefix}_READ_CONCERN") or None,
+            write_concern=write_concern,
+            journal=journal.lower() == "true" if journal else None,
+            write_timeout_ms=int(write_timeout_ms) if write_timeout_ms else None,
+            max_time_ms=int(max_time_ms) if max_time_ms else None
+        )
+
+    def merge(self, options: Optional["QueryOptions"]) -> "QueryOptions":
+        """
+        Overrides these options by the options set in the given ones
+
+        :param Optional[QueryOptions] options: overriding options
+        :return QueryOptions: merged options
+        """
+        if options is None:
+            return self
+        return self.copy(update=options.dict(exclude_none=True))
+
+    def get_collection_options(self) -> Dict[str, Any]:
+        """
+        Builds keyword arguments of pymongo Collection.with_options() for the options
+
+        :return Dict[str, Any]: with_options() keyword arguments, empty if no collection level option is set
+        """
+        collection_options = {}
+        if self.read_preference is not None: collection_options["read_preference"] = READ_PREFERENCES[self.read_preference]
+        if self.read_concern is not None: collection_options["read_concern"] = ReadConcern(level=self.read_concern)
+        if self.write_concern is not None or self.journal is not None or self.write_timeout_ms is not None:
+            collection_options["write_concern"] = WriteConcern(
+                w=self.write_concern, j=self.journal, wtimeout=self.write_timeout_ms
+            )
+        return collection_options
+
+
+def get_slow_query_params(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extracts slow query logging params of MongoAdapter from the config
+
+    :param Dict[str, Any] config: config extracted from .env file
+    :return Dict[str, Any]: 'slow_query_threshold_ms' and 'explain_slow_queries' keyword arguments of MongoAdapter
+    """
+    slow_query_threshold_ms = config.get("MONGODB_SLOW_QUERY_THRESHOLD_MS")
+    return {
+        "slow_query_threshold_ms": float(slow_query_threshold_ms) if slow_query_threshold_ms else None,
+        "explain_slow_queries": (config.get("MONGODB_EXPLAIN_SLOW_QUERIES") or "false").lower() == "true"
+    }
+
+
+def get_mongo_client_params(config: Dict[str, Any], prefix: str = "MONGODB") -> Dict[str, Any]:
+    """
+    Extracts the client param of MongoAdapter from the config: if '<prefix>_CLIENT' config value is "memory",
+    the adapter works with the in-memory client shared by all the adapters of the same host and port (delayed by
+    '<prefix>_MEMORY_LATENCY_MS' per operation), else with pymongo client connected to the server
+
+    :param Dict[str, Any] config: config extracted from .env file
+    :param str prefix: prefix of the config keys
+    :raises ValueError: if unsupported client is configured
+    :return Dict[str, Any]: 'client' keyword argument of MongoAdapter, empty for pymongo client
+    """
+    client = (config.get(f"{prefix}_CLIENT") or "pymongo").lower()
+    if client not in ("pymongo", "memory"):
+        raise ValueError(f"Unsupported MongoDB client: {client}, expected one of: pymongo, memory")
+    if client == "pymongo":
+        return {}
+    return {"client": get_in_memory_mongo_client(
+        host=config[f"{prefix}_HOST"],
+        port=config[f"{prefix}_PORT"],
+        latency_ms=float(config.get(f"{prefix}_MEMORY_LATENCY_MS") or 0.0)
+    )}
+
+
 class MongoAdapter:
 
     def __init__(
@@ -32,11 +169,20 @@ class MongoAdapter:
             auth_source: Optional[AnyStr] = None,
             auth_mechanism: Optional[AnyStr] = "DEFAULT",
             recreate_indexes: Optional[bool] = True,
-            required_index_params: Optional[List[Tuple[str, bool]]] = None,
+            required_index_params: Optional[List[Union[IndexSpec, Tuple]]] = None,
+            slow_query_threshold_ms: Optional[float] = None,
+            explain_slow_queries: Optional[bool] = False,
+            query_options: Optional[QueryOptions] = None,
+            operation_timeout_ms: Optional[float] = None,
+            retry_policy: Optional[RetryPolicy] = None,
+            circuit_breaker: Optional[CircuitBreaker] = None,
+            invalidation_bus: Optional[Any] = None,
+            invalidation_key_fields: Optional[List[str]] = None,
+            client: Optional[Any] = None,
             logger: Optional[Any] = None
     ):
         self.host: AnyStr = host
-        self.port: int = port,
+        self.port: int = port
         if not isinstance(port, int): self.port = int(port)
 
         self.db_name: AnyStr = db_name
@@ -50,15 +196,34 @@ class MongoAdapter:
         if auth_source: self.auth_source = auth_source
         self.auth_mechanism = auth_mechanism
 
-        self.client: pymongo.MongoClient
-        self.init_mongo_client()
+        # the passed client (e.g. InMemoryMongoClient) is used as is, instead of connecting to the server
+        self.client: pymongo.MongoClient = client
+        if self.client is None: self.init_mongo_client()
         self.db = self.client[self.db_name]
         self.collection = self.db[self.collection_name]
         self.logger: Optional[Any] = logger
 
-        self.required_index_params: List[Tuple[str, bool]] = [("book_id", True)]
+        self.required_index_params: List[Union[IndexSpec, Tuple]] = [("book_id", True)]
         if required_index_params: self.required_index_params = required_index_params
 
+        # queries slower than the threshold are logged, query timing is turned off if threshold is None
+        self.slow_query_threshold_ms: Optional[float] = slow_query_threshold_ms
+        self.explain_slow_queries: bool = explain_slow_queries
+        # query shape -> winning plan stages, every query shape is explained only once
+        self._explained_query_shapes: Dict[str, List[str]] = {}
+        self._explained_query_shapes_lock = threading.Lock()
+        # default options of all the operations, overridden by the options passed per call
+        self.query_options: QueryOptions = query_options or QueryOptions()
+        # deadline of every operation including server selection and retries, no deadline if None
+        self.operation_timeout_ms: Optional[float] = operation_timeout_ms
+        # reads are retried on transient errors only if the retry policy is passed
+        self.retry_policy: Optional[RetryPolicy] = retry_policy
+        self.circuit_breaker: Optional[CircuitBreaker] = circuit_breaker
+        # keys of the written documents are published to the bus, so the workers evict the cached copies
+        self.invalidation_bus: Optional[Any] = invalidation_bus
+        self.invalidation_key_fields: List[str] = invalidation_key_fields or []
+        if self.invalidation_bus is not None: self.invalidation_bus.register(self, self.invalidation_key_fields)
+
         if self.recreate_indexes: self.recreate_required_indexes()
 
     def __str__(self):
@@ -68,10 +233,23 @@ class MongoAdapter:
             Supports either usage with the MongoDB that requires authentication (accepts username, password, 
             auth_source, auth_mechanism if bool flag 'requires_auth' passed as True).
             Accepts passing custom 'required_index_params' in the proper format to ensure that important indexes are set 
-            for the given collection (passes <[("book_id", True)]> as 'required_index_params' by default).
+            for the given collection (passes <[("book_id", True)]> as 'required_index_params' by default), either as 
+            legacy tuples or as declarative IndexSpec objects (compound, partial, TTL and text indexes).
+            Reports the drift between the declared and the existing indexes together with index usage statistics 
+            (see 'diff_required_indexes').
             Automatically calls inner method 'recreate_required_indexes' to ensure that all needed indexes will be set.
             Allows turning off automatic indexes recreation by manual passing False to the bool flag 
             'recreate_indexes' (True by default).
+            Times the queries and logs every query slower than 'slow_query_threshold_ms' together with its filter, 
+            collection and duration. If bool flag 'explain_slow_queries' is passed as True, also explains the plan of 
+            every new slow query shape in the background and warns about the collection scans.
+            Accepts default 'query_options' (read preference, read concern, write concern, maxTimeMS) applied to all 
+            the operations, every operation method also accepts 'options' overriding the defaults for the single call.
+            Bounds the latency of the operations during incidents: every operation gets 'operation_timeout_ms' deadline, 
+            reads are retried on transient errors by 'retry_policy' within the deadline, and 'circuit_breaker' fails 
+            the operations fast with CircuitOpenError while the cluster is unavailable.
+            Accepts ready 'client' instead of connecting to the server, e.g. InMemoryMongoClient keeping 
+            the collections in memory for the tests and the local development (see 'get_mongo_client_params').
         """
 
     def __repr__(self):
@@ -108,56 +286,288 @@ class MongoAdapter:
         """
         Checks that required index names exist within the collection, restores them if they does not exist yet,
         and marks selected indexes as either unique to allow only unique entries in DB or not unique
-        (depending on developer choice)
+        (depending on developer choice). Existing indexes differing from their specs are not rebuilt
+        automatically (rebuilding may lock big collections), the differences are logged instead
 
-        :param required_index_params: list of tuples of the following format:
+        :param required_index_params: list of IndexSpec objects or tuples of the following format:
                                     [("<index_name>", <uniqueness_bool>), ("<index_name>", <uniqueness_bool>)],
                                     where <index_name> indicates required index name, while <uniqueness_bool> flag
-                                    marks if required index should be unique
-        :type required_index_params: List[Tuple[str, bool]]
+                                    marks if required index should be unique.
+                                    By default the index is created as single-field ascending index on the field
+                                    named as index. Other index kinds (e.g. text indexes) are described by extended
+                                    tuples ("<index_name>", <uniqueness_bool>, <index_keys>[, <index_options>]),
+                                    where <index_keys> is a list of (<field>, <index_type>) pairs and
+                                    <index_options> is a dict of extra create_index options (e.g. text 'weights')
+        :type required_index_params: List[Union[IndexSpec, Tuple]]
+        :raises ValueError: if required_index_params has incompatible format
         :return None:
         """
+        # validate self.required_index_params before touching the collection
+        index_specs = to_index_specs(self.required_index_params)
         # extract currently existing indexes from the DB collection
-        db_index_names_tuple = tuple(dict(self.collection.index_information()).keys())
+        index_information = dict(self.collection.index_information())
         if self.logger: self.logger.debug(
-            f"There are the following indexes {self.collection.name} within the collection: {', '.join(db_index_names_tuple)}"
+            f"There are the following indexes {self.collection.name} within the collection: {', '.join(index_information)}"
         )
-        # check that self.required_index_params value is valid, else return None
-        if not isinstance(self.required_index_params, list):
-            raise ValueError(
-                "Invalid value was passed as <required_index_params> or the format is not compatible with the requirements: "
-                "List[Tuple[str, bool]]"
-            )
-        # iterate over List[Tuple[str, bool]]
-        for required_index_data_piece in self.required_index_params:
-            if not isinstance(required_index_data_piece, tuple) or len(required_index_data_piece) != 2:
-                raise ValueError(
-                    "One of the elements of <required_index_params> has invalid value or the format is not compatible with the requirements: "
-                    "Tuple[str, bool], or there were more than 2 elements passed within the tuple"
-                )
-            required_index_name, uniqueness_bool = required_index_data_piece
+        report = diff_indexes(collection_name=self.collection_name, index_specs=index_specs, index_information=index_information)
+        for index_spec in index_specs:
             # check if need to restore absent index name
-            if required_index_name not in db_index_names_tuple:
+            if index_spec.name in report.missing:
                 if self.logger: self.logger.warning(
-                    f"THe following index is required for the work: {required_index_name}, although it is absent in the collection. "
+                    f"THe following index is required for the work: {index_spec.name}, although it is absent in the collection. "
                     f"Required index will be restored!"
                 )
-                self.collection.create_index(
-                    [(required_index_name, pymongo.ASCENDING)],
-                    unique=uniqueness_bool,
-                    name=required_index_name
+                self.collection.create_index(index_spec.keys, **index_spec.get_create_index_options())
+        for index_name, differences in report.changed.items():
+            if self.logger: self.logger.warning(
+                f"Index {index_name} of the collection {self.collection_name} differs from its spec: {'; '.join(differences)}"
+            )
+
+    def get_index_usage(self) -> Dict[str, int]:
+        """
+        Extracts index usage statistics of the collection by $indexStats aggregation stage.
+        Statistics are kept by every server separately and are reset on server restart
+
+        :return Dict[str, int]: number of index accesses per index name
+        """
+        return {
+            index_stats["name"]: int(index_stats.get("accesses", {}).get("ops", 0))
+            for index_stats in self.collection.aggregate([{"$indexStats": {}}])
+        }
+
+    def diff_required_indexes(self, include_usage: bool = True) -> IndexDiffReport:
+        """
+        Dry-run comparison of the required indexes with the indexes existing within the collection,
+        nothing is created or dropped
+
+        :param bool include_usage: add index usage statistics to the report if True
+        :return IndexDiffReport: missing, changed and extra (not declared) indexes with their usage
+        """
+        return diff_indexes(
+            collection_name=self.collection_name,
+            index_specs=to_index_specs(self.required_index_params),
+            index_information=dict(self.collection.index_information()),
+            index_usage=self.get_index_usage() if include_usage else None
+        )
+
+    def drop_unused_indexes(self, dry_run: bool = True) -> List[str]:
+        """
+        Drops the indexes which are neither declared as required nor used since the server start,
+        such indexes only slow down the writes
+
+        :param bool dry_run: only returns the names of the indexes to be dropped if True
+        :return List[str]: names of the dropped (or to be dropped) indexes
+        """
+        report = self.diff_required_indexes(include_usage=True)
+        index_names = [index_name for index_name in report.extra if index_name in report.unused]
+        if not dry_run:
+            for index_name in index_names:
+                if self.logger: self.logger.warning(f"Dropping unused index {index_name} of the collection {self.collection_name}")
+                self.collection.drop_index(index_name)
+        return index_names
+
+    @staticmethod
+    def get_query_shape(data: Any) -> Any:
+        """
+        Replaces all the values of the query filter with their type names, so the filters differing only by
+        the queried values (e.g. {"book_name": "A"} and {"book_name": "B"}) have the same shape
+
+        :param Any data: query filter
+        :return Any: query shape
+        """
+        if isinstance(data, dict):
+            return {key: MongoAdapter.get_query_shape(value) for key, value in sorted(data.items())}
+        if isinstance(data, (list, tuple)):
+            return [MongoAdapter.get_query_shape(value) for value in data]
+        return type(data).__name__
+
+    @staticmethod
+    def _collect_plan_stages(plan: Any) -> List[str]:
+        # winning plan is a tree of stages nested by 'inputStage', 'inputStages' or 'queryPlan' keys
+        # depending on the query engine and the server version
+        stages = []
+        if isinstance(plan, dict):
+            if "stage" in plan: stages.append(plan["stage"])
+            for value in plan.values():
+                stages.extend(MongoAdapter._collect_plan_stages(value))
+        elif isinstance(plan, list):
+            for value in plan:
+                stages.extend(MongoAdapter._collect_plan_stages(value))
+        return stages
+
+    def explain_query(self, data: Dict[str, Any], max_time_ms: Optional[int] = None) -> List[str]:
+        """
+        Explains the plan chosen by the server for the query filter, warns if the plan scans the whole collection
+        (e.g. because of the index missing on the filtered field)
+
+        :param Dict[str, Any] data: query filter
+        :param Optional[int] max_time_ms: server-side time limit of the explain, no limit if None
+        :return List[str]: stages of the winning plan, e.g. ["FETCH", "IXSCAN"] or ["COLLSCAN"]
+        """
+        explanation = self.collection.find(data).max_time_ms(max_time_ms).explain()
+        stages = self._collect_plan_stages(explanation.get("queryPlanner", {}).get("winningPlan", {}))
+        if "COLLSCAN" in stages and self.logger: self.logger.warning(
+            f"Query {self.get_query_shape(data)} scans the whole collection {self.collection_name} (COLLSCAN), "
+            f"consider adding the index on the filtered fields!"
+        )
+        return stages
+
+    def _explain_query_shape(self, query_shape: str, data: Dict[str, Any]) -> None:
+        try:
+            self._explained_query_shapes[query_shape] = self.explain_query(data, max_time_ms=SLOW_QUERY_EXPLAIN_MAX_TIME_MS)
+        except Exception as e:
+            if self.logger: self.logger.warning(f"Failed to explain query {query_shape} on {self.collection_name}: {e}")
+            # release the shape, so the next slow query of the shape is explained again
+            with self._explained_query_shapes_lock:
+                self._explained_query_shapes.pop(query_shape, None)
+
+    def _schedule_query_shape_explain(self, data: Dict[str, Any]) -> None:
+        query_shape = repr(self.get_query_shape(data))
+        with self._explained_query_shapes_lock:
+            if query_shape in self._explained_query_shapes:
+                return
+            # reserve the shape, so concurrent slow queries of the same shape are not explained twice
+            self._explained_query_shapes[query_shape] = []
+        # explained in the background, out of the deadline of the slow query and without delaying its caller
+        threading.Thread(
+            target=self._explain_query_shape, args=(query_shape, data), name="slow-query-explain", daemon=True
+        ).start()
+
+    def _run_timed_query(self, operation: str, data: Optional[Dict[str, Any]], query: Callable[[], Any]) -> Any:
+        # runs the query as is if query timing is turned off
+        if self.slow_query_threshold_ms is None:
+            return query()
+        started_at = time.perf_counter()
+        succeeded = False
+        try:
+            result = query()
+            succeeded = True
+            return result
+        finally:
+            duration_ms = (time.perf_counter() - started_at) * 1000
+            if duration_ms >= self.slow_query_threshold_ms:
+                if self.logger: self.logger.warning(
+                    f"Slow query: {operation} on {self.db_name}.{self.collection_name} with filter {data} "
+                    f"took {duration_ms:.1f} ms (threshold: {self.slow_query_threshold_ms} ms)"
+                )
+                # failed queries (e.g. timed out ones) are not explained, their plan is not what made them fail
+                if self.explain_slow_queries and succeeded and data is not None:
+                    self._schedule_query_shape_explain(data)
+
+    def get_collection(self, options: Optional[QueryOptions] = None) -> Tuple[Any, QueryOptions]:
+        """
+        Returns the collection configured with the adapter default options overridden by the given ones
+
+        :param Optional[QueryOptions] options: options of the single operation
+        :return Tuple[Any, QueryOptions]: configured collection and the effective options
+        """
+        effective_options = self.query_options.merge(options)
+        collection_options = effective_options.get_collection_options()
+        if not collection_options:
+            return self.collection, effective_options
+        return self.collection.with_options(**collection_options), effective_options
+
+    def _run_query(
+            self,
+            operation: str,
+            data: Optional[Dict[str, Any]],
+            query: Callable[[], Any],
+            idempotent: bool = False
+    ) -> Any:
+        # applies circuit breaker, per-call deadline and (for idempotent operations only) retries to the timed query
+        deadline = time.monotonic() + self.operation_timeout_ms / 1000 if self.operation_timeout_ms else None
+        attempt = 0
+        while True:
+            if self.circuit_breaker: self.circuit_breaker.before_call()
+            try:
+                # pymongo.timeout() bounds server selection, connection checkout and the server-side execution
+                with pymongo.timeout(max(deadline - time.monotonic(), 0.001)) if deadline else nullcontext():
+                    result = self._run_timed_query(operation, data, query)
+            except Exception as e:
+                failed = isinstance(e, CIRCUIT_BREAKER_FAILURE_ERRORS)
+                if self.circuit_breaker:
+                    # errors like duplicate key prove that the cluster is available
+                    if failed: self.circuit_breaker.record_failure()
+                    else: self.circuit_breaker.record_success()
+                if not (failed and idempotent and self.retry_policy and self.retry_policy.is_retryable(e)):
+                    raise
+                delay_seconds = self.retry_policy.get_delay_seconds(attempt)
+                if delay_seconds is None or (deadline and time.monotonic() + delay_seconds >= deadline):
+                    raise
+                if self.logger: self.logger.warning(
+                    f"Retrying {operation} on {self.collection_name} in {delay_seconds * 1000:.0f} ms "
+                    f"after attempt {attempt + 1} failed: {e}"
                 )
-        
-    def insert_db_entry(self, data: Dict[str, Any]) -> Any:
+                time.sleep(delay_seconds)
+                attempt += 1
+                continue
+            if self.circuit_breaker: self.circuit_breaker.record_success()
+            return result
+
+    @staticmethod
+    def _get_max_time_kwargs(options: QueryOptions, argument_name: str = "max_time_ms") -> Dict[str, int]:
+        # pymongo cursors accept 'max_time_ms', while command helpers (count, find_one_and_*) accept 'maxTimeMS'
+        if options.max_time_ms is None:
+            return {}
+        return {argument_name: options.max_time_ms}
+
+    def _publish_invalidation(self, *documents: Optional[Dict[str, Any]]) -> None:
+        """
+        Publishes the invalidation keys of the written documents to the invalidation bus (if any).
+        The write has already succeeded, so publishing failures are logged and never raised
+
+        :param Optional[Dict[str, Any]] documents: written documents, filters of the writes or None,
+                                                   collection-wide key is published if no key field is found
+        :return None:
+        """
+        if self.invalidation_bus is None:
+            return
+        try:
+            self.invalidation_bus.publish(
+                get_invalidation_keys(self.collection_name, self.invalidation_key_fields, *documents)
+            )
+        except Exception as e:
+            if self.logger: self.logger.exception(f"Failed to publish invalidation of {self.collection_name}: {e}")
+
+    def insert_db_entry(self, data: Dict[str, Any], options: Optional[QueryOptions] = None) -> Any:
             """
             Writes document in the collection, returning _id of inserted document
 
             :param Dict[str, Any] data: document to be written in DB
+            :param Optional[QueryOptions] options: options overriding the adapter defaults for this call
             :return Any: _id of inserted entry
             """
-            return self.collection.insert_one(data).inserted_id
+            collection, _ = self.get_collection(options)
+            inserted_id = self._run_query("insert_one", None, lambda: collection.insert_one(data).inserted_id)
+            self._publish_invalidation(data)
+            return inserted_id
+
+    def bulk_write(
+            self,
+            requests: List[Any],
+            ordered: bool = False,
+            options: Optional[QueryOptions] = None
+    ) -> pymongo.results.BulkWriteResult:
+        """
+        Sends a batch of write operations (pymongo InsertOne, ReplaceOne, DeleteOne etc.) to the server
+        in as few round trips as possible
+
+        :param List[Any] requests: list of pymongo write operations
+        :param bool ordered: if True, stops on the first failed operation, else attempts all the operations
+                             and reports all the failures together
+        :param Optional[QueryOptions] options: options overriding the adapter defaults for this call
+        :raises pymongo.errors.BulkWriteError: if any of the operations failed, error details are indexed by
+                                               position of the operation within the requests
+        :return pymongo.results.BulkWriteResult: result of the bulk write
+        """
+        collection, _ = self.get_collection(options)
+        try:
+            return self._run_query("bulk_write", None, lambda: collection.bulk_write(requests, ordered=ordered))
+        finally:
+            # some of the operations may have been applied even if the batch failed
+            self._publish_invalidation()
 
-    def silent_replace_db_entry(self, index_name: str, data: Dict[str, Any]) -> Any:
+    def silent_replace_db_entry(self, index_name: str, data: Dict[str, Any], options: Optional[QueryOptions] = None) -> Any:
         """
         Silently replaces (updates and inserts) DB entry with new data piece by given index name.
         If no DB entry is found by the filter within the collection, creates DB entry with new data piece without
@@ -165,38 +575,258 @@ class MongoAdapter:
 
         :param str index_name: index name used to filter data in DB collection
         :param Dict[str, Any] data: new data piece
+        :param Optional[QueryOptions] options: options overriding the adapter defaults for this call
         :raises ValueError: if number of modified entries in DB collection is not equal to 1, raises ValueError
         :return Any upserted_id: the _id of the new document if a matching document did not exist and
                                 inserting a new document took place. Otherwise None
         """
         q_filter = {index_name: data[index_name]}
-        result = self.collection.replace_one(filter=q_filter, replacement=data, upsert=True)
+        collection, _ = self.get_collection(options)
+        result = self._run_query(
+            "replace_one", q_filter, lambda: collection.replace_one(filter=q_filter, replacement=data, upsert=True)
+        )
+        self._publish_invalidation(data)
         if result.modified_count > 1:
             raise ValueError(
                 f"Error while rewriting the block of data! Replaced entries: {result.modified_count}, expected: 1!"
             )
         return result.upserted_id
 
-    def extract_db_entry(self, index_name: str, entry_id: str) -> Any:
+    def find_one_and_replace(
+            self,
+            index_name: str,
+            data: Dict[str, Any],
+            options: Optional[QueryOptions] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Atomically replaces (updates and inserts) DB entry with new data piece by given index name in one round trip,
+        returning the previous version of the document
+
+        :param str index_name: index name used to filter data in DB collection
+        :param Dict[str, Any] data: new data piece
+        :param Optional[QueryOptions] options: options overriding the adapter defaults for this call
+        :return Optional[Dict[str, Any]]: replaced document without the internal _id field or None if
+                                          the document did not exist and was inserted
+        """
+        q_filter = {index_name: data[index_name]}
+        collection, effective_options = self.get_collection(options)
+        previous_document = self._run_query("find_one_and_replace", q_filter, lambda: collection.find_one_and_replace(
+            filter=q_filter,
+            replacement=data,
+            projection={"_id": False},
+            upsert=True,
+            return_document=pymongo.ReturnDocument.BEFORE,
+            **self._get_max_time_kwargs(effective_options, "maxTimeMS")
+        ))
+        self._publish_invalidation(previous_document, data)
+        return previous_document
+
+    def find_one_and_update(
+            self,
+            data: Dict[str, Any],
+            update: Dict[str, Any],
+            return_updated: bool = True,
+            options: Optional[QueryOptions] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Atomically finds a single document matching the filter and applies the update to it in one round trip.
+        Since the filter is evaluated and the update is applied as a single operation on the server, the filter can
+        be used as the precondition of the update (e.g. the document is still in the expected state) without
+        any risk of lost updates under concurrent requests
+
+        :param Dict[str, Any] data: filter used to match the document (and the precondition of the update)
+        :param Dict[str, Any] update: update operators to be applied, e.g. {"$set": {"available": False}}
+        :param bool return_updated: return the document after the update if True, else before the update
+        :param Optional[QueryOptions] options: options overriding the adapter defaults for this call
+        :return Optional[Dict[str, Any]]: document without the internal _id field or None if nothing matched
+        """
+        collection, effective_options = self.get_collection(options)
+        document = self._run_query("find_one_and_update", data, lambda: collection.find_one_and_update(
+            filter=data,
+            update=update,
+            projection={"_id": False},
+            return_document=pymongo.ReturnDocument.AFTER if return_updated else pymongo.ReturnDocument.BEFORE,
+            **self._get_max_time_kwargs(effective_options, "maxTimeMS")
+        ))
+        # the filter names the document before the update, the document names it after the update (or before)
+        if document is not None: self._publish_invalidation(data, document)
+        return document
+
+    def update_db_entries(
+            self,
+            data: Dict[str, Any],
+            update: Dict[str, Any],
+            options: Optional[QueryOptions] = None
+    ) -> int:
+        """
+        Applies the update to all the documents matching the filter
+
+        :param Dict[str, Any] data: filter used to match the documents
+        :param Dict[str, Any] update: update operators to be applied, e.g. {"$set": {"revoked": True}}
+        :param Optional[QueryOptions] options: options overriding the adapter defaults for this call
+        :return int: number of modified documents
+        """
+        collection, _ = self.get_collection(options)
+        result = self._run_query("update_many", data, lambda: collection.update_many(filter=data, update=update))
+        if result.modified_count: self._publish_invalidation(data)
+        return result.modified_count
+
+    def extract_db_entry(self, index_name: str, entry_id: str, options: Optional[QueryOptions] = None) -> Any:
         """
         Extract one document from the DB collection using filter based on passed index_name and entry_id
 
         :param str index_name: index name used to filter data in DB collection
         :param Any entry_id: ID of the DB entry to be extracted from the collection
+        :param Optional[QueryOptions] options: options overriding the adapter defaults for this call
         :return Any: document
         """
         q_filter = {index_name: entry_id}
-        result = self.collection.find_one(filter=q_filter)
+        collection, effective_options = self.get_collection(options)
+        result = self._run_query("find_one", q_filter, lambda: collection.find_one(
+            filter=q_filter, **self._get_max_time_kwargs(effective_options)
+        ), idempotent=True)
         return result
 
-    def read_first_match(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    def read_first_match(self, data: Dict[str, Any], options: Optional[QueryOptions] = None) -> Dict[str, Any]:
         """
         Returns first matching document from the collection
 
         :param Dict[str, Any] data: document to be written in DB
+        :param Optional[QueryOptions] options: options overriding the adapter defaults for this call
         :return Dict[str: Any]: document
         """
-        return self.collection.find_one(data)
+        collection, effective_options = self.get_collection(options)
+        return self._run_query("find_one", data, lambda: collection.find_one(
+            data, **self._get_max_time_kwargs(effective_options)
+        ), idempotent=True)
+
+    def read_many(
+            self,
+            data: Optional[Dict[str, Any]] = None,
+            limit: int = 0,
+            skip: int = 0,
+            sort: Optional[List[Tuple[str, int]]] = None,
+            options: Optional[QueryOptions] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns a page of matching documents from the collection, leaving out the internal _id field
+
+        :param Optional[Dict[str, Any]] data: filter used to match documents, matches all documents if not passed
+        :param int limit: maximum number of documents to return, 0 means no limit
+        :param int skip: number of matching documents to skip before returning results
+        :param Optional[List[Tuple[str, int]]] sort: list of (key, direction) pairs, natural order if not passed
+        :param Optional[QueryOptions] options: options overriding the adapter defaults for this call
+        :return List[Dict[str, Any]]: list of documents
+        """
+        collection, effective_options = self.get_collection(options)
+
+        def read_page() -> List[Dict[str, Any]]:
+            # cursor is created per attempt, so the retried query never continues the failed cursor
+            cursor = collection.find(
+                data or {}, projection={"_id": False}, skip=skip, limit=limit, **self._get_max_time_kwargs(effective_options)
+            )
+            if sort: cursor = cursor.sort(sort)
+            return list(cursor)
+
+        return self._run_query("find", data or {}, read_page, idempotent=True)
+
+    def iterate_db_entries(
+            self,
+            data: Optional[Dict[str, Any]] = None,
+            batch_size: int = 1000,
+            options: Optional[QueryOptions] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily iterates over all matching documents of the collection, leaving out the internal _id field.
+        Documents are fetched from the server in batches, so the whole collection is never held in memory.
+        The time limit of the options is not applied, since the iteration time depends on the consumer
+
+        :param Optional[Dict[str, Any]] data: filter used to match documents, matches all documents if not passed
+        :param int batch_size: number of documents fetched per round trip
+        :param Optional[QueryOptions] options: options overriding the adapter defaults for this call
+        :return Iterator[Dict[str, Any]]: documents iterator
+        """
+        collection, _ = self.get_collection(options)
+        yield from collection.find(data or {}, projection={"_id": False}, batch_size=batch_size)
+
+    def count_db_entries(self, data: Optional[Dict[str, Any]] = None, options: Optional[QueryOptions] = None) -> int:
+        """
+        Counts documents matching the filter within the collection
+
+        :param Optional[Dict[str, Any]] data: filter used to match documents, counts all documents if not passed
+        :param Optional[QueryOptions] options: options overriding the adapter defaults for this call
+        :return int: number of matching documents
+        """
+        collection, effective_options = self.get_collection(options)
+        return self._run_query("count_documents", data or {}, lambda: collection.count_documents(
+            data or {}, **self._get_max_time_kwargs(effective_options, "maxTimeMS")
+        ), idempotent=True)
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], options: Optional[QueryOptions] = None) -> List[Dict[str, Any]]:
+        """
+        Runs the read-only aggregation pipeline over the collection and returns all of its results.
+        Pipelines writing the results ($out, $merge) must not be passed, as the call is retried like the reads
+
+        :param List[Dict[str, Any]] pipeline: aggregation pipeline
+        :param Optional[QueryOptions] options: options overriding the adapter defaults for this call
+        :return List[Dict[str, Any]]: list of result documents
+        """
+        collection, effective_options = self.get_collection(options)
+        return self._run_query("aggregate", None, lambda: list(collection.aggregate(
+            pipeline, **self._get_max_time_kwargs(effective_options, "maxTimeMS")
+        )), idempotent=True)
+
+    def text_search(
+            self,
+            query: str,
+            limit: int = 10,
+            skip: int = 0,
+            options: Optional[QueryOptions] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Runs full-text search over the text index of the collection and returns a page of matching documents
+        ranked by relevance (text score), leaving out the internal _id field.
+        Requires a text index to exist within the collection
+
+        :param str query: search phrase, see MongoDB $text operator for the syntax
+        :param int limit: maximum number of documents to return, 0 means no limit
+        :param int skip: number of best matching documents to skip before returning results
+        :param Optional[QueryOptions] options: options overriding the adapter defaults for this call
+        :return List[Dict[str, Any]]: list of documents, each one with its relevance as 'score' field
+        """
+        text_score = {"$meta": "textScore"}
+        q_filter = {"$text": {"$search": query}}
+        collection, effective_options = self.get_collection(options)
+        return self._run_query("find", q_filter, lambda: list(collection.find(
+            q_filter,
+            projection={"_id": False, "score": text_score},
+            skip=skip,
+            limit=limit,
+            **self._get_max_time_kwargs(effective_options)
+        ).sort([("score", text_score)])), idempotent=True)
+
+    def get_gridfs_bucket(self, chunk_size_bytes: int = 261120) -> gridfs.GridFSBucket:
+        """
+        Returns GridFS bucket whose files collection is the collection of the adapter
+        (e.g. 'book_files' bucket for 'book_files.files' collection), configured with the adapter default options
+
+        :param int chunk_size_bytes: size of the chunks the uploaded files are split into
+        :raises ValueError: if the collection of the adapter is not a files collection of a bucket
+                            or the adapter does not work with pymongo client
+        :return gridfs.GridFSBucket: GridFS bucket
+        """
+        if not self.collection_name.endswith(".files"):
+            raise ValueError(f"Collection {self.collection_name} is not a GridFS files collection!")
+        if not isinstance(self.db, pymongo.database.Database):
+            raise ValueError(f"GridFS bucket requires pymongo client, {self.client!r} is used instead!")
+        collection_options = self.query_options.get_collection_options()
+        return gridfs.GridFSBucket(
+            self.db,
+            bucket_name=self.collection_name[:-len(".files")],
+            chunk_size_bytes=chunk_size_bytes,
+            write_concern=collection_options.get("write_concern"),
+            read_preference=collection_options.get("read_preference")
+        )
 
     def get_collection_names(self) -> List[AnyStr]:
         """
@@ -206,18 +836,26 @@ class MongoAdapter:
         """
         return self.db.list_collection_names()
 
-    def delete_db_entry(self, index_name: str, entry_id: Any) -> pymongo.results.DeleteResult:
+    def delete_db_entry(
+            self,
+            index_name: str,
+            entry_id: Any,
+            options: Optional[QueryOptions] = None
+    ) -> pymongo.results.DeleteResult:
         """
         Deletes DB entry from the collection by given index name and entry_id. Raises exception if number of deleted
         entries is not equal to 1
 
         :param str index_name: index name used to filter data in DB collection
         :param Any entry_id: ID of the DB entry to be deleted from the collection
+        :param Optional[QueryOptions] options: options overriding the adapter defaults for this call
         :raises ValueError: if number of deleted entries in DB collection is greater than 1, raises ValueError
         :return result: pymongo.results.DeleteResult
         """
         q_filter = {index_name: entry_id}
-        result = self.collection.delete_one(filter=q_filter)
+        collection, _ = self.get_collection(options)
+        result = self._run_query("delete_one", q_filter, lambda: collection.delete_one(filter=q_filter))
+        if result.deleted_count: self._publish_invalidation(q_filter)
         if result.deleted_count > 1:
             raise ValueError(
                 f"Error while deleting entry {entry_id} by index {index_name} from the collection {self.collection}, "
@@ -225,11 +863,17 @@ class MongoAdapter:
             )
         return result
 
-    def find_one_and_delete(self, data: Dict[str, Any]) -> Dict:
+    def find_one_and_delete(self, data: Dict[str, Any], options: Optional[QueryOptions] = None) -> Dict:
         """
         Finds a single document and deletes it, returning the document
 
         :param Dict[str, Any] data: document to be deleted from DB
+        :param Optional[QueryOptions] options: options overriding the adapter defaults for this call
         :return Dict: document
         """
-        return self.collection.find_one_and_delete(data)
+        collection, effective_options = self.get_collection(options)
+        document = self._run_query("find_one_and_delete", data, lambda: collection.find_one_and_delete(
+            data, **self._get_max_time_kwargs(effective_options, "maxTimeMS")
+        ))
+        if document is not None: self._publish_invalidation(data, document)
+        return document
@@ -1,19 +1,67 @@
 # backend/endpoints.py
 
+import math
+import time
+import asyncio
 from uuid import uuid4
-from datetime import timedelta
-from typing import Union, List, Dict, Annotated, NoReturn
+from urllib.parse import quote
+from datetime import datetime, timedelta, timezone
+from typing import Union, List, Dict, Annotated, NoReturn, Optional
 
 from dotenv import dotenv_values
-from fastapi import FastAPI, Path, Body, Query, HTTPException, status, Request, Depends
+from fastapi import FastAPI, Path, Body, Query, Header, HTTPException, status, Request, Response, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
+from pymongo.errors import ConnectionFailure, ExecutionTimeout
 
 from utils.logger_setup import logger_setup
-from .database import MongoAdapter
-from .security import create_access_token, get_password_hash
-from .mock_data import default_book_shelf, default_book, default_user
-from .models import IncomingBookData, Book, Message, Error, User, Token, UserInDB
-from .authentication import oauth2_scheme, get_current_active_user, authenticate_user
+from .database import MongoAdapter, QueryOptions, get_slow_query_params, get_mongo_client_params
+from .resilience import CircuitOpenError, get_resilience_params
+from .indexes import IndexSpec
+from .profiling import init_profiling
+from .compression import init_compression
+from .admission import AdmissionController, init_admission_control
+from .ratelimit import init_rate_limiting
+from .throttling import init_login_throttle
+from .refresh_tokens import RefreshTokenStore, InvalidRefreshTokenError, init_refresh_token_store
+from .revocation import TokenDenylist, init_token_denylist
+from .invalidation import InvalidationBus, InvalidatingCache, init_invalidation_bus
+from .security import create_access_token, get_password_hash, key_ring
+from .mock_data import default_book, default_user
+from .models import (
+    IncomingBookData, Book, BookFile, BookShelfStats, Message, Error, User, Token, UserInDB, RefreshTokenRequest
+)
+from .authentication import get_token_payload, get_current_active_user, authenticate_user
+from .search import TitleSuggester
+from .changes import BookChangeFeed, TooManySubscribersError, init_book_change_feed
+from .stats import BookShelfStatistics, init_book_statistics
+from .similarity import SimilarBooksIndex, init_similar_books_index
+from .files import (
+    FileStore,
+    BookFileNotFoundError,
+    FileTooLargeError,
+    RangeNotSatisfiableError,
+    init_file_store,
+    parse_range_header,
+)
+from .idempotency import (
+    IDEMPOTENCY_KEY_HEADER,
+    IdempotencyStore,
+    IdempotencyKeyReusedError,
+    IdempotentRequestInProgressError,
+    init_idempotency_store,
+    run_idempotent,
+)
+from .repository import (
+    BookRepository,
+    BookChange,
+    BookAlreadyExistsError,
+    BookNotFoundError,
+    BookAvailabilityConflictError,
+    init_book_repository,
+)
 
 
 # extract environmental variables from .env file
@@ -25,6 +73,22 @@ app = FastAPI()
 # init logger instance
 logger = logger_setup()
 
+# add response compression middleware (only if enabled by config), innermost, so the compression CPU time
+# is spent within the admission limits and shows up in the request profiles
+init_compression(app=app, config=config, logger=logger)
+
+# add sampled request profiling middleware (only if enabled by config)
+init_profiling(app=app, config=config, logger=logger)
+
+# add per route class concurrency limits (only if enabled by config)
+admission_controller: Optional[AdmissionController] = init_admission_control(app=app, config=config, logger=logger)
+
+# add per-IP and per-user rate limits (only if enabled by config), abusive clients are rejected before admission
+init_rate_limiting(app=app, config=config, logger=logger)
+
+# init bus announcing the written users to the caches of all the service workers
+invalidation_bus: InvalidationBus = init_invalidation_bus(config=config, logger=logger)
+
 # init MongoAdapter class instances to work with different collections in DB
 ma_user_collection = MongoAdapter(
     host=config["MONGODB_HOST"],
@@ -34,19 +98,275 @@ ma_user_collection = MongoAdapter(
     password=config["MONGODB_PASSWORD"],
     requires_auth=True,
     collection_name=config["MONGODB_USER_COLLECTION_NAME"],
-    required_index_params=[("username", True)]
+    required_index_params=[IndexSpec(name="username", unique=True)],
+    **get_slow_query_params(config),
+    **get_mongo_client_params(config),
+    **get_resilience_params(config, logger=logger),
+    # reads must see the latest writes, so they are never served by secondaries
+    query_options=QueryOptions.from_config(config).merge(QueryOptions(read_preference="primary")),
+    invalidation_bus=invalidation_bus,
+    invalidation_key_fields=["username"],
+    logger=logger
 )
 
-ma_books_collection = MongoAdapter(
-    host=config["MONGODB_HOST"],
-    port=config["MONGODB_PORT"],
-    db_name=config["MONGODB_DB_NAME"],
-    username=config["MONGODB_USERNAME"],
-    password=config["MONGODB_PASSWORD"],
-    requires_auth=True,
-    collection_name=config["MONGODB_BOOK_SHELF_COLLECTION_NAME"],
-    required_index_params=[("book_id", True)]
+# init cache of the users read by every authenticated request, evicted by the invalidation bus
+users_cache = InvalidatingCache(
+    collection_name=ma_user_collection.collection_name,
+    ttl_seconds=float(config.get("USER_CACHE_TTL_SECONDS") or 300.0),
+    max_size=int(config.get("USER_CACHE_MAX_SIZE") or 10000)
 )
+invalidation_bus.subscribe(users_cache.invalidate)
+
+# init brute-force protection of the login endpoint
+login_throttle = init_login_throttle(config=config, logger=logger)
+
+# init store of the refresh tokens exchanged for new access tokens without password verification
+refresh_token_store: RefreshTokenStore = init_refresh_token_store(config=config, logger=logger)
+
+# init local set of revoked access tokens checked by every authenticated request
+token_denylist: TokenDenylist = init_token_denylist(config=config, logger=logger)
+
+# shared with the authentication dependencies
+app.state.logger = logger
+app.state.users_adapter = ma_user_collection
+app.state.token_denylist = token_denylist
+app.state.users_cache = users_cache
+
+# init book repository with the storage backend selected by config (MongoDB, SQLite or in-memory)
+book_repository: BookRepository = init_book_repository(config=config, logger=logger)
+
+# init in-memory prefix index of book names serving autocomplete without touching the storage
+title_suggester = TitleSuggester()
+
+
+def update_title_suggester(change: BookChange) -> None:
+    """
+    Keeps title suggester in sync with the book shelf, called by the book repository on every write
+
+    :param change: book shelf change
+    :type change: BookChange
+    :return None:
+    """
+    if change.previous_book:
+        if change.previous_book.book_name == change.book.book_name:
+            return
+        title_suggester.remove(change.previous_book.book_name)
+    if change.operation == "delete":
+        title_suggester.remove(change.book.book_name)
+    else:
+        title_suggester.add(change.book.book_name)
+
+
+book_repository.subscribe(update_title_suggester)
+
+# init feed of the book shelf changes streamed to the subscribers as Server-Sent Events
+book_change_feed: BookChangeFeed = init_book_change_feed(config=config, book_repository=book_repository, logger=logger)
+
+# init statistics of the book shelf kept up to date by the writes and recounted periodically
+book_statistics: BookShelfStatistics = init_book_statistics(config=config, book_repository=book_repository, logger=logger)
+
+# init index of the most similar books, built and kept up to date in the background
+similar_books_index: SimilarBooksIndex = init_similar_books_index(
+    config=config, book_repository=book_repository, logger=logger
+)
+
+# init store of the files attached to the books (covers, sample PDFs etc.)
+file_store: FileStore = init_file_store(config=config, logger=logger)
+# media types accepted by the file uploads, any type is accepted if empty
+allowed_file_content_types = {
+    content_type.strip().lower()
+    for content_type in (config.get("FILE_ALLOWED_CONTENT_TYPES") or "").split(",") if content_type.strip()
+}
+
+
+def detach_book_files(change: BookChange) -> None:
+    """
+    Deletes the files attached to the deleted book, called by the book repository on every write
+
+    :param change: book shelf change
+    :type change: BookChange
+    :return None:
+    """
+    if change.operation == "delete":
+        file_store.delete_book_files(book_id=change.book.book_id)
+
+
+book_repository.subscribe(detach_book_files)
+
+# init store of the responses replayed to the retried write requests carrying Idempotency-Key header
+idempotency_store: IdempotencyStore = init_idempotency_store(config=config, logger=logger)
+
+
+@app.exception_handler(IdempotencyKeyReusedError)
+async def idempotency_key_reused_exception_handler(request: Request, exc: IdempotencyKeyReusedError) -> JSONResponse:
+    return JSONResponse(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, content={"detail": str(exc)})
+
+
+@app.exception_handler(IdempotentRequestInProgressError)
+async def idempotent_request_in_progress_exception_handler(
+    request: Request,
+    exc: IdempotentRequestInProgressError
+) -> JSONResponse:
+    return JSONResponse(status_code=status.HTTP_409_CONFLICT, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(TooManySubscribersError)
+async def too_many_subscribers_exception_handler(request: Request, exc: TooManySubscribersError) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)}, headers={"Retry-After": "5"}
+    )
+
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_exception_handler(request: Request, exc: CircuitOpenError) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "The database is temporarily unavailable, please retry later"},
+        headers={"Retry-After": str(max(math.ceil(exc.retry_after_seconds), 1))}
+    )
+
+
+@app.exception_handler(ConnectionFailure)
+@app.exception_handler(ExecutionTimeout)
+async def database_unavailable_exception_handler(request: Request, exc: Exception) -> JSONResponse:
+    logger.warning(f"Database call of {request.method} {request.url.path} request failed: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "The database did not respond in time, please retry later"},
+        headers={"Retry-After": "1"}
+    )
+
+
+@app.on_event("startup")
+def build_title_suggester() -> None:
+    """
+    Fills title suggester with the names of all the books on the book shelf on application start up
+
+    :return None:
+    """
+    title_suggester.add_many(book.book_name for book in book_repository.iter_books())
+    logger.debug("Title suggester is built: %s", title_suggester)
+
+
+@app.on_event("startup")
+def calibrate_login_throttle() -> None:
+    """
+    Measures the duration of the password verification on application start up, failed logins of
+    unknown usernames are padded to it
+
+    :return None:
+    """
+    login_throttle.calibrate()
+
+
+@app.on_event("startup")
+def start_invalidation_bus() -> None:
+    """
+    Starts receiving the invalidations published by the other service workers on application start up
+
+    :return None:
+    """
+    invalidation_bus.start()
+
+
+@app.on_event("startup")
+def start_token_denylist() -> None:
+    """
+    Loads the revoked access tokens and starts keeping them in sync on application start up
+
+    :return None:
+    """
+    token_denylist.start()
+
+
+@app.on_event("startup")
+def start_book_change_feed() -> None:
+    """
+    Starts watching the book shelf changes on application start up
+
+    :return None:
+    """
+    book_change_feed.start()
+
+
+@app.on_event("startup")
+def start_book_statistics() -> None:
+    """
+    Counts the books on the book shelf and starts recounting them periodically on application start up
+
+    :return None:
+    """
+    book_statistics.start()
+
+
+@app.on_event("startup")
+def start_similar_books_index() -> None:
+    """
+    Starts building the index of the most similar books on application start up
+
+    :return None:
+    """
+    similar_books_index.start()
+
+
+@app.on_event("shutdown")
+def close_similar_books_index() -> None:
+    """
+    Stops updating the index of the most similar books on application shut down
+
+    :return None:
+    """
+    similar_books_index.close()
+
+
+@app.on_event("shutdown")
+def close_book_statistics() -> None:
+    """
+    Stops recounting the books on application shut down
+
+    :return None:
+    """
+    book_statistics.close()
+
+
+@app.on_event("shutdown")
+def close_book_change_feed() -> None:
+    """
+    Closes the change streams of the subscribers and stops watching the book shelf changes on application shut down
+
+    :return None:
+    """
+    book_change_feed.close()
+
+
+@app.on_event("shutdown")
+def close_token_denylist() -> None:
+    """
+    Stops syncing the revoked access tokens on application shut down
+
+    :return None:
+    """
+    token_denylist.close()
+
+
+@app.on_event("shutdown")
+def close_invalidation_bus() -> None:
+    """
+    Stops receiving the invalidations of the other service workers on application shut down
+
+    :return None:
+    """
+    invalidation_bus.close()
+
+
+@app.on_event("shutdown")
+def close_book_repository() -> None:
+    """
+    Releases resources held by the book repository (e.g. flushes coalesced writes) on application shut down
+
+    :return None:
+    """
+    book_repository.close()
 
 
 @app.get("/", tags=["root"])
@@ -64,6 +384,46 @@ async def read_root() -> Dict:
     }
 
 
+@app.get(
+    "/.well-known/jwks.json",
+    summary="Public keys verifying JWT access tokens",
+    status_code=status.HTTP_200_OK,
+    tags=["root"]
+)
+async def show_jwks(response: Response) -> Dict:
+    """
+    Returns the public keys of all the JWT signing keys in use as JSON Web Key Set, so other services
+    verify the access tokens locally by the 'kid' header of the token. Empty for symmetric algorithms
+
+    :param response: response object
+    :type response: Response
+    :return: JSON Web Key Set
+    :rtype: Dict
+    """
+    response.headers["Cache-Control"] = f"public, max-age={int(config.get('JWKS_CACHE_MAX_AGE_SECONDS') or 300)}"
+    return key_ring.get_jwks()
+
+
+@app.get(
+    "/admission/stats",
+    summary="Show in-flight requests per route class",
+    status_code=status.HTTP_200_OK,
+    tags=["root"],
+    dependencies=[Depends(get_token_payload)]
+)
+async def show_admission_stats() -> Dict:
+    """
+    Returns the number of in-flight and queued requests along with admitted and rejected requests counters
+    of every route class (auth, reads, writes, bulk) limited by admission control
+
+    :return: admission control status and stats per route class
+    :rtype: Dict
+    """
+    if admission_controller is None:
+        return {"enabled": False, "route_classes": {}}
+    return {"enabled": True, "route_classes": admission_controller.get_stats()}
+
+
 @app.post(
     "/token",
     summary="Login to get JWT access token",
@@ -82,6 +442,7 @@ async def login_for_access_token(
     :param form_data: data from the authentication form
     :type form_data: Annotated[OAuth2PasswordRequestForm, Depends
     :raises HTTPException: exception with status_code HTTP_401_UNAUTHORIZED in case the system was not able to authenticate the user 
+    :raises HTTPException: exception with status_code HTTP_429_TOO_MANY_REQUESTS in case the username or the client IP is locked out after too many failed attempts
     :return: JWT access token in dict format with indicated token type 
     :rtype: Token pydantic model
     """
@@ -90,28 +451,157 @@ async def login_for_access_token(
         "Detected incoming POST request to /token endpoint from the client "
         "with IP %s ...", client_host
     )
-    # attempt to authenticate user
-    user = authenticate_user(
+    # reject locked out attempts before any password hash is verified
+    lockout_seconds = login_throttle.get_lockout_seconds(username=form_data.username, client_host=client_host)
+    if lockout_seconds > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts, please retry later",
+            headers={"Retry-After": str(math.ceil(lockout_seconds))},
+        )
+    started_at = time.perf_counter()
+    # attempt to authenticate user, bcrypt verification is CPU bound, so it must not block the event loop
+    user = await run_in_threadpool(
+        authenticate_user,
         mongo_adapter=ma_user_collection, 
         username=form_data.username, 
         password=form_data.password
     )
     if not user:
+        login_throttle.record_failure(username=form_data.username, client_host=client_host)
+        # unknown usernames are rejected without hashing, pad them to the duration of password verification
+        await login_throttle.delay_failure(elapsed_seconds=time.perf_counter() - started_at)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    login_throttle.record_success(username=form_data.username, client_host=client_host)
+    refresh_token, refresh_token_expires_at = await run_in_threadpool(refresh_token_store.issue, username=user.username)
+    return create_token_response(
+        username=user.username, refresh_token=refresh_token, refresh_token_expires_at=refresh_token_expires_at
+    )
+
+
+@app.post(
+    "/token/refresh",
+    summary="Exchange refresh token for new JWT access token",
+    response_model=Token,
+    tags=["user"]
+)
+async def refresh_access_token(
+    request: Request,
+    refresh_token_request: RefreshTokenRequest = Body(..., title="Refresh token issued along with the access token")
+) -> Token:
+    """
+    Exchanges the refresh token for new JWT access token and new refresh token without password verification.
+    Every refresh token is single use, presenting the used one again revokes the whole login session
+
+    :param request: request object
+    :type request: Request
+    :param refresh_token_request: refresh token issued by /token or by the previous refresh
+    :type refresh_token_request: RefreshTokenRequest pydantic model
+    :raises HTTPException: exception with status_code HTTP_401_UNAUTHORIZED in case the refresh token is unknown, expired, revoked or already used
+    :return: JWT access token in dict format with indicated token type along with new refresh token
+    :rtype: Token pydantic model
+    """
+    logger.debug(
+        "Detected incoming POST request to /token/refresh endpoint from the client "
+        "with IP %s ...", request.client.host
+    )
+    try:
+        username, refresh_token, refresh_token_expires_at = await run_in_threadpool(
+            refresh_token_store.rotate, token=refresh_token_request.refresh_token
+        )
+    except InvalidRefreshTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return create_token_response(
+        username=username, refresh_token=refresh_token, refresh_token_expires_at=refresh_token_expires_at
+    )
+
+
+@app.post(
+    "/token/revoke",
+    summary="Revoke refresh token",
+    response_model=Message,
+    tags=["user"]
+)
+async def revoke_refresh_token(
+    refresh_token_request: RefreshTokenRequest = Body(..., title="Refresh token to be revoked")
+) -> Message:
+    """
+    Revokes the refresh token along with all the tokens it was rotated to (i.e. logs the session out).
+    Revoking unknown token is not an error, so the response tells nothing about the token validity
+
+    :param refresh_token_request: refresh token to be revoked
+    :type refresh_token_request: RefreshTokenRequest pydantic model
+    :return: Message about revoked refresh token
+    :rtype: Message
+    """
+    await run_in_threadpool(refresh_token_store.revoke, token=refresh_token_request.refresh_token)
+    return Message(message="Refresh token is revoked")
+
+
+@app.post(
+    "/user/logout",
+    summary="Revoke the current JWT access token",
+    response_model=Message,
+    tags=["user"]
+)
+async def logout(
+    payload: Annotated[Dict, Depends(get_token_payload)],
+    refresh_token_request: Optional[RefreshTokenRequest] = Body(None, title="Refresh token of the session to be revoked as well")
+) -> Message:
+    """
+    Revokes the access token the request is authenticated with, so it is rejected before its expiry.
+    The refresh token of the session is revoked as well if passed
+
+    :param payload: verified JWT token payload
+    :type payload: Annotated[Dict, Depends(get_token_payload)]
+    :param refresh_token_request: optional refresh token of the same session
+    :type refresh_token_request: Optional[RefreshTokenRequest]
+    :return: Message about successful logout
+    :rtype: Message
+    """
+    if payload.get("jti"):
+        await run_in_threadpool(token_denylist.revoke, jti=payload["jti"], expires_at=float(payload["exp"]))
+    if refresh_token_request:
+        await run_in_threadpool(refresh_token_store.revoke, token=refresh_token_request.refresh_token)
+    logger.debug("User %s logged out", payload["sub"])
+    return Message(message=f"User {payload['sub']} is logged out")
+
+
+def create_token_response(username: str, refresh_token: str, refresh_token_expires_at: datetime) -> Token:
+    """
+    Creates short-lived JWT access token for the user and bundles it with the refresh token
+
+    :param username: username, the token subject
+    :type username: str
+    :param refresh_token: refresh token issued for the user
+    :type refresh_token: str
+    :param refresh_token_expires_at: expiry time of the refresh token (UTC)
+    :type refresh_token_expires_at: datetime
+    :return: JWT access token along with the refresh token
+    :rtype: Token pydantic model
+    """
     # define JWT token expiry time
     access_token_expires = timedelta(minutes=int(config["ACCESS_TOKEN_EXPIRE_MINUTES"]))
     # create JWT access token fot the user
     # key 'sub' with the token subject is added as per JWT specs
     access_token_data = create_access_token(
-        data={"sub": user.username},  
+        data={"sub": username},
         expires_delta=access_token_expires
         )
     logger.debug("Successfully created new access token!")
-    return Token(**access_token_data)
+    return Token(
+        **access_token_data,
+        refresh_token=refresh_token,
+        refresh_token_expires_at=refresh_token_expires_at.replace(tzinfo=timezone.utc).isoformat()
+    )
 
 
 @app.get("/user/me", tags=["user"])
@@ -135,21 +625,30 @@ async def read_user_me(
     "/user/signup", 
     summary="Create new user",
     response_model=Message,
-    tags=["user"],
-    dependencies=[Depends(oauth2_scheme)]
+    tags=["user"]
 )
 async def create_user(
     request: Request,
+    response: Response,
+    payload: Annotated[Dict, Depends(get_token_payload)],
     new_user: User = Body(..., title="Required new user information", example=default_user),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_KEY_HEADER, max_length=255)
 ) -> Message:
     """
     Creates a new user with passed username and password. Adds new user entry in the DB, preserving only
-    hashed password value
+    hashed password value.
+    Retries carrying the same Idempotency-Key header get the stored response without hashing the password again
 
     :param request: request object
     :type request: Request
+    :param response: response object
+    :type response: Response
+    :param payload: decoded access token payload of the caller
+    :type payload: Annotated[Dict, Depends(get_token_payload)]
     :param new_user: new user data
     :type new_user: User pydantic model
+    :param idempotency_key: optional unique key of the request (e.g. UUID) generated by the client
+    :type idempotency_key: Optional[str]
     :return: Message about successful new user creation 
     :rtype: Message
     """
@@ -158,25 +657,254 @@ async def create_user(
         "Detected incoming POST request to /user/signup endpoint from the client with IP %s ...",
         client_host
         )
-    # get hash for plain password of the new user
-    hashed_password = get_password_hash(plain_password=new_user.password)
-    # create UserInDB user model because it should not contain plain password in attribute
-    new_user_in_db = UserInDB(
-        username=new_user.username,
-        hashed_password=hashed_password,
-        disabled=new_user.disabled,
-        full_name=new_user.full_name,
-        email=new_user.email
-    )
-    # add new user to the database
-    upserted_id = ma_user_collection.silent_replace_db_entry(
-        index_name="username", data=new_user_in_db.dict()
-    )
-    logger.debug("Inserted information about user in DB! upserted_id: %s", upserted_id)
-    return Message(
-        message=f"Successfully created new user {new_user.username}"
-                "and added to DB!"
+
+    def create_user_entry() -> Message:
+        # get hash for plain password of the new user
+        hashed_password = get_password_hash(plain_password=new_user.password)
+        # create UserInDB user model because it should not contain plain password in attribute
+        new_user_in_db = UserInDB(
+            username=new_user.username,
+            hashed_password=hashed_password,
+            disabled=new_user.disabled,
+            full_name=new_user.full_name,
+            email=new_user.email
         )
+        # add new user to the database
+        upserted_id = ma_user_collection.silent_replace_db_entry(
+            index_name="username", data=new_user_in_db.dict()
+        )
+        logger.debug("Inserted information about user in DB! upserted_id: %s", upserted_id)
+        # the replaced user may be disabled or have the new password, so the sessions of the old one are dropped
+        refresh_token_store.revoke_user(username=new_user.username)
+        return Message(
+            message=f"Successfully created new user {new_user.username}"
+                    "and added to DB!"
+            )
+
+    # password hashing is CPU bound and waiting for the in-flight duplicate is blocking,
+    # so both are moved off the event loop
+    return await run_in_threadpool(
+        run_idempotent,
+        store=idempotency_store,
+        scope="signup",
+        subject=payload["sub"],
+        key=idempotency_key,
+        # the password is fingerprinted by the keyed hash, never stored as it is or hashed by a fast hash alone
+        request_payload={
+            **new_user.dict(exclude={"password"}),
+            "password": idempotency_store.get_secret_fingerprint(new_user.password)
+        },
+        handler=create_user_entry,
+        response_model=Message,
+        response=response
+    )
+
+
+@app.get(
+    "/books/search",
+    summary="Full-text search over book names, authors and descriptions",
+    status_code=status.HTTP_200_OK,
+    response_model=List[Book],
+    tags=["books"],
+    dependencies=[Depends(get_token_payload)]
+)
+def search_books(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=256, title="Search phrase", example="sherlock holmes"),
+    limit: int = Query(default=10, ge=0, le=100, example=10),
+    skip: int = Query(default=0, ge=0, example=0)
+) -> List[Book]:
+    """
+    Searches the book shelf for the books matching the search phrase by book name, author or description.
+    Returns the page of found books ranked by relevance, best matches first
+
+    :param request: request object
+    :type request: Request
+    :param q: query parameter, search phrase
+    :type q: str
+    :param limit: query parameter, used to limit the returning book batch, defaults to 10
+    :type limit: int, optional
+    :param skip: query parameter, number of best matching books to skip, defaults to 0
+    :type skip: int, optional
+    :return: list of found books ranked by relevance
+    :rtype: List[Book]
+    """
+    client_host = request.client.host
+    logger.debug(
+        "Detected incoming GET request to /books/search endpoint from the "
+        "client with IP %s ...", client_host
+    )
+    return book_repository.search_books(query=q, limit=limit, skip=skip)
+
+
+@app.get(
+    "/books/stats",
+    summary="Statistics of the book shelf by availability and by author",
+    status_code=status.HTTP_200_OK,
+    response_model=BookShelfStats,
+    tags=["books"],
+    dependencies=[Depends(get_token_payload)]
+)
+def get_book_shelf_stats(
+    request: Request,
+    authors_limit: int = Query(default=20, ge=0, le=1000, example=20)
+) -> BookShelfStats:
+    """
+    Returns the number of books on the book shelf in total, available and checked out, and the same numbers
+    for the authors with the most books. Served from the in-memory counters, the storage is not queried
+
+    :param request: request object
+    :type request: Request
+    :param authors_limit: query parameter, maximum number of authors returned, defaults to 20
+    :type authors_limit: int, optional
+    :return: book shelf statistics
+    :rtype: BookShelfStats
+    """
+    client_host = request.client.host
+    logger.debug(
+        "Detected incoming GET request to /books/stats endpoint from the "
+        "client with IP %s ...", client_host
+    )
+    return book_statistics.get_stats(authors_limit=authors_limit)
+
+
+@app.get(
+    "/books/suggest",
+    summary="Autocomplete book names by prefix",
+    status_code=status.HTTP_200_OK,
+    response_model=List[str],
+    tags=["books"],
+    dependencies=[Depends(get_token_payload)]
+)
+def suggest_book_names(
+    prefix: str = Query(..., min_length=1, max_length=256, title="Beginning of the book name", example="harry p"),
+    limit: int = Query(default=10, ge=1, le=50, example=10)
+) -> List[str]:
+    """
+    Returns the names of the books starting with the given prefix (case and whitespace insensitive),
+    served from the in-memory title index only
+
+    :param prefix: query parameter, beginning of the book name typed by the user
+    :type prefix: str
+    :param limit: query parameter, maximum number of suggested book names, defaults to 10
+    :type limit: int, optional
+    :return: list of suggested book names in alphabetical order
+    :rtype: List[str]
+    """
+    return title_suggester.suggest(prefix=prefix, limit=limit)
+
+
+@app.get(
+    "/books/changes",
+    summary="Stream book shelf changes as Server-Sent Events",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    tags=["books"],
+    dependencies=[Depends(get_token_payload)]
+)
+async def stream_book_changes(
+    request: Request,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID", max_length=512)
+) -> StreamingResponse:
+    """
+    Streams add, replace, delete, checkout and return events of the book shelf as Server-Sent Events
+    (text/event-stream), so the clients need no polling of the book list. Reconnecting clients (e.g. browser
+    EventSource) send back the ID of the last received event and get the events they missed; if those are
+    no longer kept, the 'reset' event is sent first and the client has to reload the book list once
+
+    :param request: request object
+    :type request: Request
+    :param last_event_id: ID of the last event received before reconnecting
+    :type last_event_id: Optional[str]
+    :raises TooManySubscribersError: if the change feed already serves the maximum number of subscribers
+    :return: never ending stream of the book shelf changes
+    :rtype: StreamingResponse
+    """
+    logger.debug(
+        "Detected incoming GET request to /books/changes endpoint from the client with IP %s, last event ID: %s",
+        request.client.host, last_event_id
+    )
+    subscription = book_change_feed.subscribe(last_event_id=last_event_id)
+    keep_alive_seconds = float(config.get("BOOK_CHANGES_KEEP_ALIVE_SECONDS") or 15)
+
+    async def stream_events():
+        try:
+            yield f"retry: {int(config.get('BOOK_CHANGES_RETRY_MS') or 3000)}\n\n"
+            if subscription.reset:
+                yield "event: reset\ndata: {}\n\n"
+            for event in subscription.replayed_events:
+                yield event.to_sse()
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=keep_alive_seconds)
+                except asyncio.TimeoutError:
+                    # comment line keeps idle connections open through the proxies
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    return
+                yield event.to_sse()
+        finally:
+            book_change_feed.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # the generator never started (e.g. the client is gone before the first event) does not unsubscribe,
+        # so the slot is freed once the response is done anyway
+        background=BackgroundTask(book_change_feed.unsubscribe, subscription)
+    )
+
+
+@app.get(
+    "/books/{book_id}/similar",
+    summary="Recommend the books most similar to the particular book",
+    status_code=status.HTTP_200_OK,
+    response_model=List[Book],
+    responses={
+        status.HTTP_404_NOT_FOUND: {"model": Error}
+    },
+    tags=["books"],
+    dependencies=[Depends(get_token_payload)]
+)
+def read_similar_books(
+        request: Request,
+        book_id: str = Path(..., title="Required book ID", example="936d4b41ec874007af150bbac8e714c3"),
+        limit: int = Query(default=10, ge=1, le=100, example=10)
+) -> List[Book]:
+    """
+    Returns the books most similar to the given one by book name, author and description, best first.
+    Served from the precomputed index, the books added just now are recommended after the index is updated
+
+    :param request: request object
+    :type request: Request
+    :param book_id: Path parameter, book ID gotten from the route
+    :type book_id: str
+    :param limit: query parameter, maximum number of recommended books, defaults to 10
+                  (at most SIMILAR_BOOKS_NEIGHBORS books are kept per book)
+    :type limit: int, optional
+    :raises HTTPException: exception  with status_code HTTP_404_NOT_FOUND
+                            raised in case the given book_id is not found
+                            on the book shelf
+    :return: list of the most similar books
+    :rtype: List[Book]
+    """
+    client_host = request.client.host
+    logger.debug(
+        "Detected incoming GET request to /books/<book_id>/similar endpoint from "
+        "the client with IP %s ...", client_host
+    )
+    similar_books = similar_books_index.get_similar_books(book_id=book_id, limit=limit)
+    if similar_books is not None:
+        return similar_books
+    # the book is not indexed, find out whether it exists only on this rare path
+    if book_repository.get_book(book_id=book_id):
+        return []
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"The book with ID {book_id} was not found in the book shelf!"
+    )
 
 
 @app.get(
@@ -188,7 +916,7 @@ async def create_user(
         status.HTTP_404_NOT_FOUND: {"model": Error}
     },
     tags=["books"],
-    dependencies=[Depends(oauth2_scheme)]
+    dependencies=[Depends(get_token_payload)]
 )
 def read_book(
         request: Request, 
@@ -213,14 +941,9 @@ def read_book(
         "the client with IP %s ...", client_host
     )
 
-    # todo add authorization via JWT token
-    extracted_data = ma_books_collection.extract_db_entry(
-        index_name="book_id",
-        entry_id=book_id
-    )
-    if extracted_data:
+    returnable_book_data = book_repository.get_book(book_id=book_id)
+    if returnable_book_data:
         logger.debug("Found data of requested book with ID %s!", book_id)
-        returnable_book_data = Book(**extracted_data)
         return returnable_book_data
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
@@ -228,6 +951,89 @@ def read_book(
     )
 
 
+@app.post(
+    "/books/{book_id}/checkout",
+    summary="Check out the available book",
+    status_code=status.HTTP_200_OK,
+    response_model=Book,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"model": Error},
+        status.HTTP_409_CONFLICT: {"model": Error}
+    },
+    tags=["books"],
+    dependencies=[Depends(get_token_payload)]
+)
+def checkout_book(
+    request: Request,
+    book_id: str = Path(..., title="Required book ID", example="936d4b41ec874007af150bbac8e714c3")
+) -> Union[Book, NoReturn]:
+    """
+    Marks the available book as checked out. The availability check and the update are done
+    by the storage as a single atomic operation, so only one of concurrent requests can succeed
+
+    :param request: request object
+    :type request: Request
+    :param book_id: Path parameter, book ID gotten from the route
+    :type book_id: str
+    :raises HTTPException: exception with status_code HTTP_404_NOT_FOUND raised in case the given book_id is not found
+                            on the book shelf, or HTTP_409_CONFLICT if the book is already checked out
+    :return: pydantic model of the checked out book
+    :rtype: Union[Book, NoReturn]
+    """
+    client_host = request.client.host
+    logger.debug(
+        "Detected incoming POST request to /books/<book_id>/checkout endpoint from "
+        "the client with IP %s ...", client_host
+    )
+    try:
+        return book_repository.checkout_book(book_id=book_id)
+    except BookNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except BookAvailabilityConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
+@app.post(
+    "/books/{book_id}/return",
+    summary="Return the checked out book",
+    status_code=status.HTTP_200_OK,
+    response_model=Book,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"model": Error},
+        status.HTTP_409_CONFLICT: {"model": Error}
+    },
+    tags=["books"],
+    dependencies=[Depends(get_token_payload)]
+)
+def return_book(
+    request: Request,
+    book_id: str = Path(..., title="Required book ID", example="936d4b41ec874007af150bbac8e714c3")
+) -> Union[Book, NoReturn]:
+    """
+    Marks the checked out book as available again in a single atomic operation
+
+    :param request: request object
+    :type request: Request
+    :param book_id: Path parameter, book ID gotten from the route
+    :type book_id: str
+    :raises HTTPException: exception with status_code HTTP_404_NOT_FOUND raised in case the given book_id is not found
+                            on the book shelf, or HTTP_409_CONFLICT if the book is not checked out
+    :return: pydantic model of the returned book
+    :rtype: Union[Book, NoReturn]
+    """
+    client_host = request.client.host
+    logger.debug(
+        "Detected incoming POST request to /books/<book_id>/return endpoint from "
+        "the client with IP %s ...", client_host
+    )
+    try:
+        return book_repository.return_book(book_id=book_id)
+    except BookNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except BookAvailabilityConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
 @app.get(
     "/books",
     summary="Show all books available on the book shelf",
@@ -235,29 +1041,32 @@ def read_book(
     response_model=List[Book],
     responses={status.HTTP_500_INTERNAL_SERVER_ERROR: {"model": Error}},
     tags=["books"],
-    dependencies=[Depends(oauth2_scheme)]
+    dependencies=[Depends(get_token_payload)]
     )
 def show_books(
     request: Request,
-    limit: int = Query(default=10, example=10)
+    limit: int = Query(default=10, ge=0, example=10),
+    skip: int = Query(default=0, ge=0, example=0)
 ) -> List[Book]:
     """
     Shows all the books available on the book shelf, allows to limit the number of showed books 
+    and to skip the first books to page through the book shelf
 
     :param request: request object
     :type request: Request
     :param limit: query parameter, used to limit the returning book batch, defaults to 10
     :type limit: int, optional
+    :param skip: query parameter, number of books to skip, defaults to 0
+    :type skip: int, optional
     :return: list of books currently available on the book shelf, limited by given number (if applicable)
     :rtype: List[Book]
     """
-    # TODO implement working with MongoDB
     client_host = request.client.host
     logger.debug(
         "Detected incoming GET request to /books endpoint from the"
         "client with IP %s ...", client_host
     )
-    return list(default_book_shelf.values())[: limit]
+    return book_repository.list_books(limit=limit, skip=skip)
 
 
 @app.post(
@@ -269,22 +1078,29 @@ def show_books(
         status.HTTP_409_CONFLICT: {"model": Error},
         status.HTTP_500_INTERNAL_SERVER_ERROR: {"model": Error}
     },
-    tags=["books"],
-    dependencies=[Depends(oauth2_scheme)]
+    tags=["books"]
 )
 def add_book(
     request: Request,
-    incoming_book: IncomingBookData = Body(..., title="Required book data to be added", example=default_book)
+    response: Response,
+    payload: Annotated[Dict, Depends(get_token_payload)],
+    incoming_book: IncomingBookData = Body(..., title="Required book data to be added", example=default_book),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_KEY_HEADER, max_length=255)
 ) -> Union[Message, NoReturn]:
     """
-    Accepts book data and adds a new Book pydantic model object to the book shelf in DB
+    Accepts book data and adds a new Book pydantic model object to the book shelf in DB.
+    Retries carrying the same Idempotency-Key header get the stored response with the originally assigned book ID
 
     :param request: request object
     :type request: Request
-    :param token: JWT access token assigned to the user
-    :type token: Annotated[str, Depends(oauth2_scheme)]
+    :param response: response object
+    :type response: Response
+    :param payload: decoded access token payload of the caller
+    :type payload: Annotated[Dict, Depends(get_token_payload)]
     :param incoming_book: body parameter, new book data
     :type incoming_book: IncomingBookData, optional
+    :param idempotency_key: optional unique key of the request (e.g. UUID) generated by the client
+    :type idempotency_key: Optional[str]
     :raises HTTPException: exception with status_code HTTP_409_CONFLICT raised in case the given book name already exists on the book shelf 
     :return: message about successful adding a new book to the book shelf
     :rtype: Union[Message, NoReturn]
@@ -294,20 +1110,33 @@ def add_book(
         "Detected incoming POST request to /books/add_book endpoint"
         "from the client with IP %s ...", client_host
         )
-    # todo add authorization via JWT token
+    return run_idempotent(
+        store=idempotency_store,
+        scope="add_book",
+        subject=payload["sub"],
+        key=idempotency_key,
+        request_payload=incoming_book.dict(),
+        handler=lambda: add_book_entry(incoming_book=incoming_book),
+        response_model=Message,
+        response=response
+    )
+
+
+def add_book_entry(incoming_book: IncomingBookData) -> Union[Message, NoReturn]:
+    """
+    Creates a new Book pydantic model object with newly assigned book ID and adds it to the book shelf
+
+    :param incoming_book: new book data
+    :type incoming_book: IncomingBookData
+    :raises HTTPException: exception with status_code HTTP_409_CONFLICT raised in case the given book name already exists on the book shelf
+    :return: message about successful adding a new book to the book shelf
+    :rtype: Union[Message, NoReturn]
+    """
     incoming_book_data = incoming_book.dict()
     book_name = incoming_book_data.get("book_name")
     author = incoming_book_data.get("author")
     description = incoming_book_data.get("description")
 
-    # todo add working with MongoDB
-    # (make the entry unique, else raise exception (upsert=False))
-    if book_name in [book.book_name for book in default_book_shelf.values()]:
-        logger.warning("The aforementioned book already exists in the book shelf!")
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="The aforementioned book already exists in the book shelf!"
-        )
     book_id = uuid4().hex
     logger.debug(
         "Assigned new book ID to the added book: %s", book_id
@@ -322,7 +1151,15 @@ def add_book(
     logger.debug(
         "Created new book object! Book data:\n%s", new_book.dict()
     )
-    default_book_shelf[book_id] = new_book
+    # book name uniqueness is enforced by the storage backend itself, so no extra lookup is needed
+    try:
+        book_repository.add_book(book=new_book)
+    except BookAlreadyExistsError:
+        logger.warning("The aforementioned book already exists in the book shelf!")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The aforementioned book already exists in the book shelf!"
+        )
     logger.debug(
         "Assigned new book %s to the book shelf!", book_name
     )
@@ -341,7 +1178,7 @@ def add_book(
         status.HTTP_500_INTERNAL_SERVER_ERROR: {"model": Error}
     },
     tags=["books"],
-    dependencies=[Depends(oauth2_scheme)]
+    dependencies=[Depends(get_token_payload)]
 )
 def delete_book(
     request: Request, 
@@ -365,20 +1202,241 @@ def delete_book(
         "Detected incoming DELETE request to /books/delete endpoint"
         "from the client with IP %s ...", client_host
         )
-    # todo add authorization via JWT token            
-    # todo add working with MongoDB
-    if book_name not in [book.book_name for book in default_book_shelf.values()]:
+    deleted_book = book_repository.delete_book_by_name(book_name=book_name)
+    if not deleted_book:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"The book {book_name} was not found in the book shelf!"
         )
-    for book_id, book in default_book_shelf.items():
-        if book_name == book.book_name:
-            logger.debug(
-                "Book %s with assigned book ID %x is found on the book"
-                "shelf and is to be deleted ...", book_name, book_id
-            )
-            del default_book_shelf[book_id]
-            return Message(
-                message=f"Book {book_name} was successfully deleted from the book shelf!"
+    logger.debug(
+        "Book %s with assigned book ID %s was deleted from the book shelf!", book_name, deleted_book.book_id
+    )
+    return Message(
+        message=f"Book {book_name} was successfully deleted from the book shelf!"
+    )
+
+
+@app.post(
+    "/books/{book_id}/files",
+    summary="Attach file (e.g. cover image or sample PDF) to the book",
+    status_code=status.HTTP_201_CREATED,
+    response_model=BookFile,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"model": Error},
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {"model": Error},
+        status.HTTP_415_UNSUPPORTED_MEDIA_TYPE: {"model": Error}
+    },
+    tags=["files"],
+    dependencies=[Depends(get_token_payload)],
+    openapi_extra={
+        "requestBody": {"required": True, "content": {"application/octet-stream": {"schema": {"type": "string", "format": "binary"}}}}
+    }
+)
+async def upload_book_file(
+    request: Request,
+    book_id: str = Path(..., title="Required book ID", example="936d4b41ec874007af150bbac8e714c3"),
+    filename: str = Query(..., min_length=1, max_length=255, example="cover.jpg"),
+    content_type: str = Header("application/octet-stream"),
+    content_length: Optional[int] = Header(None)
+) -> Union[BookFile, NoReturn]:
+    """
+    Attaches the file sent as the raw request body to the book. The body is streamed to the file store
+    chunk by chunk as it arrives, so the whole file is never held in memory
+
+    :param request: request object
+    :type request: Request
+    :param book_id: Path parameter, book ID gotten from the route
+    :type book_id: str
+    :param filename: Query parameter, original name of the file
+    :type filename: str
+    :param content_type: Content-Type header, media type of the file
+    :type content_type: str
+    :param content_length: Content-Length header, checked against the maximum file size before reading the body
+    :type content_length: Optional[int]
+    :raises HTTPException: exception with status_code HTTP_404_NOT_FOUND raised in case the given book_id is not found
+                            on the book shelf, HTTP_413_REQUEST_ENTITY_TOO_LARGE if the file exceeds the maximum size
+                            or HTTP_415_UNSUPPORTED_MEDIA_TYPE if the media type of the file is not accepted
+    :return: metadata of the attached file
+    :rtype: Union[BookFile, NoReturn]
+    """
+    logger.debug(
+        "Detected incoming POST request to /books/<book_id>/files endpoint from "
+        "the client with IP %s ...", request.client.host
+    )
+    content_type = content_type.split(";")[0].strip().lower()
+    if allowed_file_content_types and content_type not in allowed_file_content_types:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Files of {content_type} type are not accepted, expected one of: {', '.join(sorted(allowed_file_content_types))}"
+        )
+    file_too_large_exception = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"The file exceeds the maximum size of {file_store.max_size_bytes} bytes!"
+    )
+    if content_length is not None and file_store.max_size_bytes is not None and content_length > file_store.max_size_bytes:
+        raise file_too_large_exception
+    if not await run_in_threadpool(book_repository.get_book, book_id=book_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"The book with ID {book_id} was not found in the book shelf!"
+        )
+    upload = await run_in_threadpool(file_store.open_upload, book_id=book_id, filename=filename, content_type=content_type)
+    # small body chunks are gathered up to the store chunk size, so the store is not called per network read
+    buffer = bytearray()
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            if len(buffer) >= file_store.chunk_size_bytes:
+                await run_in_threadpool(upload.write, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(upload.write, bytes(buffer))
+        book_file = await run_in_threadpool(upload.complete)
+    except FileTooLargeError:
+        await run_in_threadpool(upload.abort)
+        raise file_too_large_exception
+    except BaseException:
+        await run_in_threadpool(upload.abort)
+        raise
+    logger.debug("File %s (%s bytes) is attached to the book with ID %s", book_file.file_id, book_file.length, book_id)
+    return book_file
+
+
+@app.get(
+    "/books/{book_id}/files",
+    summary="Show files attached to the book",
+    status_code=status.HTTP_200_OK,
+    response_model=List[BookFile],
+    tags=["files"],
+    dependencies=[Depends(get_token_payload)]
+)
+def show_book_files(
+    book_id: str = Path(..., title="Required book ID", example="936d4b41ec874007af150bbac8e714c3")
+) -> List[BookFile]:
+    """
+    Lists the files attached to the book, oldest first
+
+    :param book_id: Path parameter, book ID gotten from the route
+    :type book_id: str
+    :return: metadata of the attached files
+    :rtype: List[BookFile]
+    """
+    return file_store.list_files(book_id=book_id)
+
+
+@app.get(
+    "/books/{book_id}/files/{file_id}",
+    summary="Download file attached to the book, supports byte ranges",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {"content": {"application/octet-stream": {}}},
+        status.HTTP_206_PARTIAL_CONTENT: {"content": {"application/octet-stream": {}}},
+        status.HTTP_304_NOT_MODIFIED: {},
+        status.HTTP_404_NOT_FOUND: {"model": Error},
+        status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE: {"model": Error}
+    },
+    tags=["files"],
+    dependencies=[Depends(get_token_payload)]
+)
+def download_book_file(
+    book_id: str = Path(..., title="Required book ID", example="936d4b41ec874007af150bbac8e714c3"),
+    file_id: str = Path(..., title="Required file ID", example="5f0c1c8f2b6e4a7d9c3e1f2a4b6d8e0c"),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
+) -> Response:
+    """
+    Streams the file content chunk by chunk. A single byte range requested by the 'Range' header is served
+    as 206 Partial Content, unless 'If-Range' names another version of the file. Files are immutable and
+    their content hash is the ETag, so the clients revalidate by 'If-None-Match' without downloading the file again
+
+    :param book_id: Path parameter, book ID gotten from the route
+    :type book_id: str
+    :param file_id: Path parameter, file ID gotten from the route
+    :type file_id: str
+    :param range_header: Range header, e.g. 'bytes=0-1023'
+    :type range_header: Optional[str]
+    :param if_range: If-Range header, ETag the range is requested for
+    :type if_range: Optional[str]
+    :param if_none_match: If-None-Match header, ETags of the cached versions
+    :type if_none_match: Optional[str]
+    :raises HTTPException: exception with status_code HTTP_404_NOT_FOUND raised in case the file is not attached to
+                            the book, or HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE if the range lies beyond the file
+    :return: streamed file content
+    :rtype: Response
+    """
+    try:
+        book_file = file_store.get_file(book_id=book_id, file_id=file_id)
+    except BookFileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"The file with ID {file_id} is not attached to the book with ID {book_id}!"
+        )
+    etag = f'"{book_file.etag}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "private, max-age=31536000, immutable"}
+    if if_none_match is not None:
+        cached_etags = [cached_etag.strip().removeprefix("W/") for cached_etag in if_none_match.split(",")]
+        if etag in cached_etags or "*" in cached_etags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    byte_range = None
+    if if_range is None or if_range.strip() == etag:
+        try:
+            byte_range = parse_range_header(range_header, book_file.length)
+        except RangeNotSatisfiableError as e:
+            raise HTTPException(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                detail=str(e),
+                headers={"Content-Range": f"bytes */{book_file.length}"}
             )
+    headers["Content-Disposition"] = f"inline; filename*=UTF-8''{quote(book_file.filename)}"
+    if byte_range is None:
+        headers["Content-Length"] = str(book_file.length)
+        return StreamingResponse(
+            file_store.iter_content(book_file), media_type=book_file.content_type, headers=headers
+        )
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{book_file.length}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        file_store.iter_content(book_file, start=start, end=end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=book_file.content_type,
+        headers=headers
+    )
+
+
+@app.delete(
+    "/books/{book_id}/files/{file_id}",
+    summary="Delete file attached to the book",
+    status_code=status.HTTP_200_OK,
+    response_model=Message,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"model": Error}
+    },
+    tags=["files"],
+    dependencies=[Depends(get_token_payload)]
+)
+def delete_book_file(
+    book_id: str = Path(..., title="Required book ID", example="936d4b41ec874007af150bbac8e714c3"),
+    file_id: str = Path(..., title="Required file ID", example="5f0c1c8f2b6e4a7d9c3e1f2a4b6d8e0c")
+) -> Union[Message, NoReturn]:
+    """
+    Deletes the file attached to the book
+
+    :param book_id: Path parameter, book ID gotten from the route
+    :type book_id: str
+    :param file_id: Path parameter, file ID gotten from the route
+    :type file_id: str
+    :raises HTTPException: exception with status_code HTTP_404_NOT_FOUND raised in case the file is not attached to the book
+    :return: message about successful file deletion
+    :rtype: Union[Message, NoReturn]
+    """
+    try:
+        file_store.delete_file(book_id=book_id, file_id=file_id)
+    except BookFileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"The file with ID {file_id} is not attached to the book with ID {book_id}!"
+        )
+    return Message(message=f"File {file_id} was successfully deleted from the book {book_id}!")
@@ -0,0 +1,449 @@
+# backend/files.py
+
+import os
+import re
+import json
+import mmap
+import hashlib
+from uuid import uuid4
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Optional, Dict, List, Tuple, Iterator
+
+from gridfs.errors import NoFile
+
+from .models import BookFile
+from .database import MongoAdapter, QueryOptions, get_slow_query_params, get_mongo_client_params
+from .resilience import get_resilience_params
+from .indexes import IndexSpec
+
+
+SUPPORTED_FILE_STORAGE_BACKENDS = ("gridfs", "disk")
+
+# IDs are used as the folder and file names of the disk backend, so anything else is never looked up
+ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class BookFileNotFoundError(KeyError):
+    """
+    Raised when the requested file is not attached to the book
+    """
+
+
+class FileTooLargeError(ValueError):
+    """
+    Raised when the uploaded file exceeds the maximum file size
+    """
+
+
+class RangeNotSatisfiableError(ValueError):
+    """
+    Raised when the requested byte range lies beyond the end of the file
+    """
+
+
+def parse_range_header(range_header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses the 'Range' request header of a single byte range, e.g. 'bytes=0-1023', 'bytes=1024-' or 'bytes=-512'.
+    Multiple ranges and malformed headers are ignored (the whole file is served), as allowed by RFC 9110
+
+    :param Optional[str] range_header: value of the 'Range' header
+    :param int length: length of the file in bytes
+    :raises RangeNotSatisfiableError: if the range starts beyond the end of the file
+    :return Optional[Tuple[int, int]]: first and last (inclusive) byte positions or None to serve the whole file
+    """
+    if not range_header:
+        return None
+    unit, _, byte_ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in byte_ranges:
+        return None
+    first, separator, last = byte_ranges.strip().partition("-")
+    if not separator or not (first or last) or not all(part.isdigit() for part in (first, last) if part):
+        return None
+    if not first:
+        # suffix range: the last N bytes
+        suffix_length = int(last)
+        if suffix_length == 0 or length == 0:
+            raise RangeNotSatisfiableError(f"Range {range_header} is not satisfiable, file length: {length}")
+        return max(length - suffix_length, 0), length - 1
+    start = int(first)
+    end = min(int(last), length - 1) if last else length - 1
+    if last and int(last) < start:
+        return None
+    if start >= length:
+        raise RangeNotSatisfiableError(f"Range {range_header} is not satisfiable, file length: {length}")
+    return start, end
+
+
+class FileUpload(ABC):
+    """
+    Single streamed upload, the content is written chunk by chunk as it arrives and hashed on the way,
+    so the whole file is never held in memory. The file becomes visible only after complete()
+    """
+
+    def __init__(self, book_file: BookFile, max_size_bytes: Optional[int] = None):
+        self.book_file: BookFile = book_file
+        self.max_size_bytes: Optional[int] = max_size_bytes
+        self.length: int = 0
+        self._sha256 = hashlib.sha256()
+
+    def write(self, chunk: bytes) -> None:
+        """
+        Writes the next chunk of the content
+
+        :param bytes chunk: chunk of the content
+        :raises FileTooLargeError: if the content exceeds the maximum file size
+        :return None:
+        """
+        self.length += len(chunk)
+        if self.max_size_bytes is not None and self.length > self.max_size_bytes:
+            raise FileTooLargeError(f"File exceeds the maximum size of {self.max_size_bytes} bytes!")
+        self._sha256.update(chunk)
+        self._write(chunk)
+
+    def complete(self) -> BookFile:
+        """
+        Completes the upload and makes the file visible
+
+        :return BookFile: metadata of the stored file
+        """
+        self.book_file = self.book_file.copy(update={"length": self.length, "etag": self._sha256.hexdigest()})
+        self._complete()
+        return self.book_file
+
+    @abstractmethod
+    def _write(self, chunk: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def _complete(self) -> None:
+        ...
+
+    @abstractmethod
+    def abort(self) -> None:
+        """
+        Discards the content written so far
+
+        :return None:
+        """
+        ...
+
+
+class FileStore(ABC):
+    """
+    Storage of the files attached to the books (covers, sample PDFs etc.).
+    Files are immutable, so their content hash is used as ETag
+    """
+
+    def __init__(self, chunk_size_bytes: int = 262144, max_size_bytes: Optional[int] = None, logger: Optional[Any] = None):
+        self.chunk_size_bytes: int = chunk_size_bytes
+        self.max_size_bytes: Optional[int] = max_size_bytes
+        self.logger: Optional[Any] = logger
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(chunk_size_bytes={self.chunk_size_bytes}, max_size_bytes={self.max_size_bytes})"
+
+    @staticmethod
+    def _new_book_file(book_id: str, filename: str, content_type: str) -> BookFile:
+        return BookFile(
+            file_id=uuid4().hex,
+            book_id=book_id,
+            filename=filename,
+            content_type=content_type,
+            length=0,
+            etag="",
+            uploaded_at=datetime.now(timezone.utc).isoformat()
+        )
+
+    @abstractmethod
+    def open_upload(self, book_id: str, filename: str, content_type: str) -> FileUpload:
+        """
+        Starts the streamed upload of the new file attached to the book
+
+        :param str book_id: ID of the book
+        :param str filename: original name of the file
+        :param str content_type: media type of the file
+        :return FileUpload: upload to write the content to
+        """
+        ...
+
+    @abstractmethod
+    def list_files(self, book_id: str) -> List[BookFile]:
+        """
+        Returns the files attached to the book, oldest first
+
+        :param str book_id: ID of the book
+        :return List[BookFile]: metadata of the files
+        """
+        ...
+
+    @abstractmethod
+    def get_file(self, book_id: str, file_id: str) -> BookFile:
+        """
+        Returns the file attached to the book
+
+        :param str book_id: ID of the book
+        :param str file_id: ID of the file
+        :raises BookFileNotFoundError: if the file is not attached to the book
+        :return BookFile: metadata of the file
+        """
+        ...
+
+    @abstractmethod
+    def iter_content(self, book_file: BookFile, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Streams the byte range of the file content chunk by chunk
+
+        :param BookFile book_file: metadata of the file
+        :param int start: first byte position
+        :param Optional[int] end: last (inclusive) byte position, end of the file if None
+        :return Iterator[bytes]: content chunks
+        """
+        ...
+
+    @abstractmethod
+    def delete_file(self, book_id: str, file_id: str) -> None:
+        """
+        Deletes the file attached to the book
+
+        :param str book_id: ID of the book
+        :param str file_id: ID of the file
+        :raises BookFileNotFoundError: if the file is not attached to the book
+        :return None:
+        """
+        ...
+
+    def delete_book_files(self, book_id: str) -> int:
+        """
+        Deletes all the files attached to the book
+
+        :param str book_id: ID of the book
+        :return int: number of deleted files
+        """
+        deleted = 0
+        for book_file in self.list_files(book_id):
+            try:
+                self.delete_file(book_id, book_file.file_id)
+                deleted += 1
+            except BookFileNotFoundError:
+                pass
+        return deleted
+
+
+class LocalDiskFileUpload(FileUpload):
+
+    def __init__(self, book_file: BookFile, file_path: str, max_size_bytes: Optional[int] = None):
+        super().__init__(book_file=book_file, max_size_bytes=max_size_bytes)
+        self.file_path: str = file_path
+        self._file = open(f"{file_path}.part", "wb")
+
+    def _write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+
+    def _complete(self) -> None:
+        self._file.close()
+        os.replace(f"{self.file_path}.part", self.file_path)
+        # metadata is written last, so the file is never listed before its content is in place
+        with open(f"{self.file_path}.json.part", "w") as metadata_file:
+            json.dump(self.book_file.dict(), metadata_file)
+        os.replace(f"{self.file_path}.json.part", f"{self.file_path}.json")
+
+    def abort(self) -> None:
+        self._file.close()
+        try:
+            os.unlink(f"{self.file_path}.part")
+        except OSError:
+            pass
+
+
+class LocalDiskFileStore(FileStore):
+    """
+    Files stored on the local disk as '<folder>/<book_id>/<file_id>' next to the '<file_id>.json' metadata.
+    Downloads are read by memory mapping, so the ranges are served from the page cache without read() calls
+    """
+
+    def __init__(self, folder_path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.folder_path: str = folder_path
+        os.makedirs(self.folder_path, exist_ok=True)
+
+    def _get_file_path(self, book_id: str, file_id: str) -> str:
+        if not ID_PATTERN.match(book_id) or not ID_PATTERN.match(file_id):
+            raise BookFileNotFoundError(f"File {file_id} of the book {book_id} is not found!")
+        return os.path.join(self.folder_path, book_id, file_id)
+
+    def open_upload(self, book_id: str, filename: str, content_type: str) -> FileUpload:
+        book_file = self._new_book_file(book_id, filename, content_type)
+        file_path = self._get_file_path(book_id, book_file.file_id)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        return LocalDiskFileUpload(book_file=book_file, file_path=file_path, max_size_bytes=self.max_size_bytes)
+
+    def list_files(self, book_id: str) -> List[BookFile]:
+        if not ID_PATTERN.match(book_id):
+            return []
+        book_files = []
+        try:
+            with os.scandir(os.path.join(self.folder_path, book_id)) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json"):
+                        with open(entry.path) as metadata_file:
+                            book_files.append(BookFile(**json.load(metadata_file)))
+        except FileNotFoundError:
+            return []
+        return sorted(book_files, key=lambda book_file: book_file.uploaded_at)
+
+    def get_file(self, book_id: str, file_id: str) -> BookFile:
+        try:
+            with open(f"{self._get_file_path(book_id, file_id)}.json") as metadata_file:
+                return BookFile(**json.load(metadata_file))
+        except FileNotFoundError:
+            raise BookFileNotFoundError(f"File {file_id} of the book {book_id} is not found!")
+
+    def iter_content(self, book_file: BookFile, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        end = book_file.length - 1 if end is None else end
+        if book_file.length == 0 or end < start:
+            return
+        with open(self._get_file_path(book_file.book_id, book_file.file_id), "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                for offset in range(start, end + 1, self.chunk_size_bytes):
+                    yield mapped_file[offset:min(offset + self.chunk_size_bytes, end + 1)]
+
+    def delete_file(self, book_id: str, file_id: str) -> None:
+        file_path = self._get_file_path(book_id, file_id)
+        try:
+            # metadata goes first, so the file is never listed without its content
+            os.unlink(f"{file_path}.json")
+        except FileNotFoundError:
+            raise BookFileNotFoundError(f"File {file_id} of the book {book_id} is not found!")
+        try:
+            os.unlink(file_path)
+        except FileNotFoundError:
+            pass
+
+
+class GridFSFileUpload(FileUpload):
+
+    def __init__(self, book_file: BookFile, grid_in: Any, max_size_bytes: Optional[int] = None):
+        super().__init__(book_file=book_file, max_size_bytes=max_size_bytes)
+        self._grid_in = grid_in
+
+    def _write(self, chunk: bytes) -> None:
+        self._grid_in.write(chunk)
+
+    def _complete(self) -> None:
+        # metadata set before close() is written with the files collection document
+        self._grid_in.metadata = GridFSFileStore.to_metadata(self.book_file)
+        self._grid_in.close()
+
+    def abort(self) -> None:
+        self._grid_in.abort()
+
+
+class GridFSFileStore(FileStore):
+    """
+    Files stored by MongoDB GridFS in chunks of 'chunk_size_bytes', so both uploads and ranged downloads
+    touch only the chunks they need. Metadata is kept in the files collection of the bucket,
+    which is the collection of the adapter
+    """
+
+    REQUIRED_INDEX_PARAMS = [
+        IndexSpec(name="metadata.book_id", keys=[("metadata.book_id", 1), ("uploadDate", 1)]),
+    ]
+
+    def __init__(self, mongo_adapter: MongoAdapter, **kwargs):
+        super().__init__(**kwargs)
+        self.mongo_adapter: MongoAdapter = mongo_adapter
+        self.bucket = mongo_adapter.get_gridfs_bucket(chunk_size_bytes=self.chunk_size_bytes)
+
+    @staticmethod
+    def to_metadata(book_file: BookFile) -> Dict[str, Any]:
+        # file ID is kept in the metadata too, since read_many() leaves out _id
+        return book_file.dict(exclude={"filename", "length"})
+
+    @staticmethod
+    def to_book_file(document: Dict[str, Any]) -> BookFile:
+        return BookFile(**{**document["metadata"], "filename": document["filename"], "length": document["length"]})
+
+    def open_upload(self, book_id: str, filename: str, content_type: str) -> FileUpload:
+        book_file = self._new_book_file(book_id, filename, content_type)
+        grid_in = self.bucket.open_upload_stream_with_id(
+            book_file.file_id, filename, metadata=self.to_metadata(book_file)
+        )
+        return GridFSFileUpload(book_file=book_file, grid_in=grid_in, max_size_bytes=self.max_size_bytes)
+
+    def list_files(self, book_id: str) -> List[BookFile]:
+        # files collection document is inserted by GridFS only when the upload is complete
+        documents = self.mongo_adapter.read_many(data={"metadata.book_id": book_id}, sort=[("uploadDate", 1)])
+        return [self.to_book_file(document) for document in documents]
+
+    def get_file(self, book_id: str, file_id: str) -> BookFile:
+        document = self.mongo_adapter.read_first_match(data={"_id": file_id, "metadata.book_id": book_id})
+        if document is None:
+            raise BookFileNotFoundError(f"File {file_id} of the book {book_id} is not found!")
+        return self.to_book_file(document)
+
+    def iter_content(self, book_file: BookFile, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        end = book_file.length - 1 if end is None else end
+        if book_file.length == 0 or end < start:
+            return
+        with self.bucket.open_download_stream(book_file.file_id) as grid_out:
+            # only the chunks of the range are fetched
+            grid_out.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = grid_out.read(min(self.chunk_size_bytes, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+    def delete_file(self, book_id: str, file_id: str) -> None:
+        self.get_file(book_id, file_id)
+        try:
+            self.bucket.delete(file_id)
+        except NoFile:
+            raise BookFileNotFoundError(f"File {file_id} of the book {book_id} is not found!")
+
+
+def init_file_store(config: Dict[str, Any], logger: Optional[Any] = None) -> FileStore:
+    """
+    Creates the file store selected by the 'FILE_STORAGE_BACKEND' config value ('gridfs' or 'disk'),
+    which defaults to 'gridfs' for the mongo book storage backend and to 'disk' for the embedded ones
+
+    :param Dict[str, Any] config: config extracted from .env file
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :raises ValueError: if unsupported file storage backend is configured
+    :return FileStore: file store instance
+    """
+    default_backend = "gridfs" if (config.get("BOOK_STORAGE_BACKEND") or "mongo").lower() == "mongo" else "disk"
+    backend = (config.get("FILE_STORAGE_BACKEND") or default_backend).lower()
+    if backend not in SUPPORTED_FILE_STORAGE_BACKENDS:
+        raise ValueError(
+            f"Unsupported file storage backend: {backend}, expected one of: {', '.join(SUPPORTED_FILE_STORAGE_BACKENDS)}"
+        )
+    store_params = {
+        "chunk_size_bytes": int(config.get("FILE_CHUNK_SIZE_KB") or 256) * 1024,
+        "max_size_bytes": int(float(config.get("FILE_MAX_SIZE_MB") or 20) * 1024 * 1024),
+        "logger": logger
+    }
+    if backend == "disk":
+        return LocalDiskFileStore(folder_path=config.get("FILE_STORAGE_FOLDER_PATH") or "data/files", **store_params)
+    mongo_adapter = MongoAdapter(
+        host=config["MONGODB_HOST"],
+        port=config["MONGODB_PORT"],
+        db_name=config["MONGODB_DB_NAME"],
+        username=config["MONGODB_USERNAME"],
+        password=config["MONGODB_PASSWORD"],
+        requires_auth=True,
+        # files collection of the bucket
+        collection_name=f"{config.get('MONGODB_FILES_BUCKET_NAME') or 'book_files'}.files",
+        required_index_params=GridFSFileStore.REQUIRED_INDEX_PARAMS,
+        **get_slow_query_params(config),
+        **get_mongo_client_params(config),
+        **get_resilience_params(config, logger=logger),
+        # uploaded files are downloaded right away, so reads are never served by secondaries
+        query_options=QueryOptions.from_config(config).merge(QueryOptions(read_preference="primary")),
+        logger=logger
+    )
+    return GridFSFileStore(mongo_adapter=mongo_adapter, **store_params)
@@ -0,0 +1,378 @@
+# backend/idempotency.py
+
+import hmac
+import json
+import time
+import hashlib
+import secrets
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Optional, Dict, Callable, Type
+
+from fastapi import Response
+from pydantic import BaseModel, Field
+from pymongo.errors import DuplicateKeyError
+
+from .database import MongoAdapter, QueryOptions, get_slow_query_params, get_mongo_client_params
+from .resilience import get_resilience_params
+from .indexes import IndexSpec
+
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+IDEMPOTENT_REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class IdempotencyKeyReusedError(ValueError):
+    """
+    Raised when the idempotency key is reused for a request with a different payload
+    """
+
+
+class IdempotentRequestInProgressError(RuntimeError):
+    """
+    Raised when the request with the same idempotency key is still being processed
+    after the waiting timeout
+    """
+
+
+class StoredResponse(BaseModel):
+    """
+    Response of the completed request stored under its idempotency key
+    """
+    request_fingerprint: str = Field(..., example="5d41402abc4b2a76b9719d911017c592")
+    body: Dict[str, Any] = Field(..., example={"message": "Default message"})
+
+
+class IdempotencyStore(ABC):
+    """
+    Storage of the responses of completed requests and of the markers of in-flight requests,
+    both keyed by idempotency key
+    """
+
+    def __init__(
+            self,
+            ttl_seconds: int = 86400,
+            wait_timeout_seconds: float = 30.0,
+            fingerprint_key: Optional[bytes] = None,
+            logger: Optional[Any] = None
+    ):
+        self.ttl_seconds: int = ttl_seconds
+        self.wait_timeout_seconds: float = wait_timeout_seconds
+        # without the shared key every process has its own one, so the retries of the requests carrying secrets
+        # are told apart from the key reuse only by the same process
+        self.fingerprint_key: bytes = fingerprint_key or secrets.token_bytes(32)
+        self.logger: Optional[Any] = logger
+
+    def get_secret_fingerprint(self, secret: str) -> str:
+        """
+        Computes the keyed hash of the secret request field (e.g. password), to be put into the request payload
+        instead of the secret itself, so the stored fingerprints cannot be brute-forced without the server key
+
+        :param str secret: secret value
+        :return str: hex digest of HMAC-SHA256 of the secret
+        """
+        return hmac.new(self.fingerprint_key, secret.encode(), hashlib.sha256).hexdigest()
+
+    @abstractmethod
+    def acquire(self, key: str, request_fingerprint: str) -> Optional[StoredResponse]:
+        """
+        Either returns the stored response of the completed request with the same key, or marks the key
+        as in-flight and returns None, so the caller has to run the request and complete or release the key.
+        Waits while the request with the same key is being processed by another caller
+
+        :param str key: idempotency key
+        :param str request_fingerprint: hash of the request payload
+        :raises IdempotencyKeyReusedError: if the key was used for the request with a different payload
+        :raises IdempotentRequestInProgressError: if the in-flight request is not completed in time
+        :return Optional[StoredResponse]: stored response or None if the key is acquired
+        """
+
+    @abstractmethod
+    def complete(self, key: str, response: StoredResponse) -> None:
+        """
+        Stores the response of the request under the acquired key, waking up the waiting callers
+
+        :param str key: idempotency key
+        :param StoredResponse response: response to be replayed
+        :return None:
+        """
+
+    @abstractmethod
+    def release(self, key: str) -> None:
+        """
+        Drops the in-flight marker of the failed request, so it can be retried
+
+        :param str key: idempotency key
+        :return None:
+        """
+
+    @staticmethod
+    def _check_fingerprint(key: str, stored_fingerprint: str, request_fingerprint: str) -> None:
+        if stored_fingerprint != request_fingerprint:
+            raise IdempotencyKeyReusedError(
+                f"Idempotency key {key} was already used for the request with a different payload!"
+            )
+
+
+class _InMemoryEntry:
+    __slots__ = ("request_fingerprint", "response", "expires_at", "completed_event")
+
+    def __init__(self, request_fingerprint: str, expires_at: float):
+        self.request_fingerprint: str = request_fingerprint
+        self.response: Optional[StoredResponse] = None
+        self.expires_at: float = expires_at
+        self.completed_event = threading.Event()
+
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+    """
+    Idempotency store keeping the responses in process memory, used along with the embedded storage backends.
+    Concurrent duplicates block on the event of the in-flight request instead of polling,
+    expired entries are purged at most once per purge interval
+    """
+
+    def __init__(
+            self,
+            ttl_seconds: int = 86400,
+            wait_timeout_seconds: float = 30.0,
+            fingerprint_key: Optional[bytes] = None,
+            logger: Optional[Any] = None
+    ):
+        super().__init__(
+            ttl_seconds=ttl_seconds,
+            wait_timeout_seconds=wait_timeout_seconds,
+            fingerprint_key=fingerprint_key,
+            logger=logger
+        )
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _InMemoryEntry] = {}
+        self._purge_interval_seconds: float = min(60.0, ttl_seconds)
+        self._next_purge_at: float = time.monotonic() + self._purge_interval_seconds
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self._entries)} keys)"
+
+    def _purge_expired(self, now: float) -> None:
+        if now < self._next_purge_at:
+            return
+        self._next_purge_at = now + self._purge_interval_seconds
+        for key in [key for key, entry in self._entries.items() if entry.expires_at <= now]:
+            del self._entries[key]
+
+    def acquire(self, key: str, request_fingerprint: str) -> Optional[StoredResponse]:
+        deadline = time.monotonic() + self.wait_timeout_seconds
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._purge_expired(now)
+                entry = self._entries.get(key)
+                if entry is None or entry.expires_at <= now:
+                    # in-flight entries expire after the waiting timeout, so a crashed request cannot hold the key forever
+                    self._entries[key] = _InMemoryEntry(request_fingerprint, expires_at=now + self.wait_timeout_seconds)
+                    if entry: entry.completed_event.set()
+                    return
+                self._check_fingerprint(key, entry.request_fingerprint, request_fingerprint)
+                if entry.response:
+                    return entry.response
+            if not entry.completed_event.wait(timeout=max(0.0, deadline - time.monotonic())):
+                raise IdempotentRequestInProgressError(f"Request with idempotency key {key} is still in progress!")
+
+    def complete(self, key: str, response: StoredResponse) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _InMemoryEntry(response.request_fingerprint, expires_at=0)
+            entry.response = response
+            entry.expires_at = time.monotonic() + self.ttl_seconds
+        entry.completed_event.set()
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        # wake up the waiters, so one of them takes the key over
+        if entry: entry.completed_event.set()
+
+
+class MongoIdempotencyStore(IdempotencyStore):
+    """
+    Idempotency store keeping the responses in the MongoDB collection with TTL index, so the responses are
+    shared by all the service workers and are removed by the server once expired.
+    The in-flight marker is inserted under the unique key index, so only one of concurrent duplicates acquires
+    the key, while the rest poll the document until the response is stored
+    """
+
+    REQUIRED_INDEX_PARAMS = [
+        IndexSpec(name="key", unique=True),
+        IndexSpec(name="expires_at", expire_after_seconds=0),
+    ]
+
+    def __init__(
+            self,
+            mongo_adapter: MongoAdapter,
+            ttl_seconds: int = 86400,
+            wait_timeout_seconds: float = 30.0,
+            poll_interval_seconds: float = 0.05,
+            fingerprint_key: Optional[bytes] = None,
+            logger: Optional[Any] = None
+    ):
+        super().__init__(
+            ttl_seconds=ttl_seconds,
+            wait_timeout_seconds=wait_timeout_seconds,
+            fingerprint_key=fingerprint_key,
+            logger=logger
+        )
+        self.mongo_adapter: MongoAdapter = mongo_adapter
+        self.poll_interval_seconds: float = poll_interval_seconds
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.mongo_adapter.collection_name})"
+
+    def acquire(self, key: str, request_fingerprint: str) -> Optional[StoredResponse]:
+        deadline = time.monotonic() + self.wait_timeout_seconds
+        poll_interval_seconds = self.poll_interval_seconds
+        while True:
+            now = datetime.utcnow()
+            lock_expires_at = now + timedelta(seconds=self.wait_timeout_seconds)
+            try:
+                self.mongo_adapter.insert_db_entry(data={
+                    "key": key,
+                    "request_fingerprint": request_fingerprint,
+                    "state": "in_progress",
+                    "expires_at": lock_expires_at
+                })
+                return
+            except DuplicateKeyError:
+                pass
+            document = self.mongo_adapter.read_first_match(data={"key": key})
+            if document:
+                self._check_fingerprint(key, document["request_fingerprint"], request_fingerprint)
+                if document["state"] == "completed" and document["expires_at"] > now:
+                    return StoredResponse(request_fingerprint=document["request_fingerprint"], body=document["body"])
+                # take over the stale marker left by a crashed request or the expired response not purged yet
+                if document["expires_at"] <= now and self.mongo_adapter.find_one_and_update(
+                    data={"key": key, "expires_at": document["expires_at"]},
+                    update={"$set": {
+                        "request_fingerprint": request_fingerprint,
+                        "state": "in_progress",
+                        "expires_at": lock_expires_at
+                    }, "$unset": {"body": ""}}
+                ):
+                    return
+            if time.monotonic() >= deadline:
+                raise IdempotentRequestInProgressError(f"Request with idempotency key {key} is still in progress!")
+            time.sleep(poll_interval_seconds)
+            poll_interval_seconds = min(poll_interval_seconds * 2, 1.0)
+
+    def complete(self, key: str, response: StoredResponse) -> None:
+        self.mongo_adapter.silent_replace_db_entry(index_name="key", data={
+            "key": key,
+            "request_fingerprint": response.request_fingerprint,
+            "state": "completed",
+            "body": response.body,
+            "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+        })
+
+    def release(self, key: str) -> None:
+        self.mongo_adapter.delete_db_entry(index_name="key", entry_id=key)
+
+
+def get_request_fingerprint(request_payload: Any) -> str:
+    """
+    Computes the hash of the request payload used to detect reusing of the idempotency key.
+    The payload must not carry secrets (e.g. passwords) as they are, see IdempotencyStore.get_secret_fingerprint()
+
+    :param Any request_payload: JSON serializable request payload
+    :return str: hex digest of the payload hash
+    """
+    serialized_payload = json.dumps(request_payload, sort_keys=True, default=str)
+    return hashlib.sha256(serialized_payload.encode()).hexdigest()
+
+
+def run_idempotent(
+        store: IdempotencyStore,
+        scope: str,
+        subject: str,
+        key: Optional[str],
+        request_payload: Any,
+        handler: Callable[[], BaseModel],
+        response_model: Type[BaseModel],
+        response: Optional[Response] = None
+) -> BaseModel:
+    """
+    Runs the handler at most once per idempotency key and replays its stored response to the retries.
+    The handler is simply called if no idempotency key is passed. Failed handlers do not store anything,
+    so the request can be retried with the same key
+
+    :param IdempotencyStore store: idempotency store
+    :param str scope: name of the operation, keeps the same keys of different endpoints apart
+    :param str subject: authenticated caller (e.g. 'sub' of the access token), keeps the same keys of different
+                        callers apart, so nobody is replayed the response of another caller
+    :param Optional[str] key: idempotency key passed by the client
+    :param Any request_payload: JSON serializable request payload
+    :param Callable[[], BaseModel] handler: callable doing the actual work and returning the response pydantic model
+    :param Type[BaseModel] response_model: response pydantic model class used to restore the stored response
+    :param Optional[Response] response: response object used to mark the replayed responses with a header
+    :return BaseModel: response pydantic model
+    """
+    if not key:
+        return handler()
+    storage_key = f"{scope}:{subject}:{key}"
+    request_fingerprint = get_request_fingerprint(request_payload)
+    stored_response = store.acquire(key=storage_key, request_fingerprint=request_fingerprint)
+    if stored_response:
+        if store.logger: store.logger.debug(f"Replaying stored response for idempotency key {storage_key}")
+        if response is not None: response.headers[IDEMPOTENT_REPLAYED_HEADER] = "true"
+        return response_model(**stored_response.body)
+    try:
+        handler_response = handler()
+    except BaseException:
+        store.release(key=storage_key)
+        raise
+    store.complete(
+        key=storage_key,
+        response=StoredResponse(request_fingerprint=request_fingerprint, body=handler_response.dict())
+    )
+    return handler_response
+
+
+def init_idempotency_store(config: Dict[str, Any], logger: Optional[Any] = None) -> IdempotencyStore:
+    """
+    Creates the idempotency store selected by the 'IDEMPOTENCY_STORE_BACKEND' config value ('mongo' or 'memory'),
+    which defaults to 'mongo' for the mongo book storage backend and to 'memory' for the embedded ones.
+    Secret request fields are fingerprinted with 'IDEMPOTENCY_FINGERPRINT_SECRET' (or 'SECRET_KEY') as the key
+
+    :param Dict[str, Any] config: config extracted from .env file
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :raises ValueError: if unsupported idempotency store backend is configured
+    :return IdempotencyStore: idempotency store instance
+    """
+    default_backend = "mongo" if (config.get("BOOK_STORAGE_BACKEND") or "mongo").lower() == "mongo" else "memory"
+    backend = (config.get("IDEMPOTENCY_STORE_BACKEND") or default_backend).lower()
+    ttl_seconds = int(config.get("IDEMPOTENCY_KEY_TTL_SECONDS") or 86400)
+    fingerprint_secret = config.get("IDEMPOTENCY_FINGERPRINT_SECRET") or config.get("SECRET_KEY")
+    fingerprint_key = fingerprint_secret.encode() if fingerprint_secret else None
+    if backend == "memory":
+        return InMemoryIdempotencyStore(ttl_seconds=ttl_seconds, fingerprint_key=fingerprint_key, logger=logger)
+    if backend != "mongo":
+        raise ValueError(f"Unsupported idempotency store backend: {backend}, expected one of: mongo, memory")
+    mongo_adapter = MongoAdapter(
+        host=config["MONGODB_HOST"],
+        port=config["MONGODB_PORT"],
+        db_name=config["MONGODB_DB_NAME"],
+        username=config["MONGODB_USERNAME"],
+        password=config["MONGODB_PASSWORD"],
+        requires_auth=True,
+        collection_name=config.get("MONGODB_IDEMPOTENCY_COLLECTION_NAME") or "idempotency_keys",
+        required_index_params=MongoIdempotencyStore.REQUIRED_INDEX_PARAMS,
+        **get_slow_query_params(config),
+        **get_mongo_client_params(config),
+        **get_resilience_params(config, logger=logger),
+        # reads must see the latest writes, so they are never served by secondaries
+        query_options=QueryOptions.from_config(config).merge(QueryOptions(read_preference="primary")),
+        logger=logger
+    )
+    return MongoIdempotencyStore(
+        mongo_adapter=mongo_adapter, ttl_seconds=ttl_seconds, fingerprint_key=fingerprint_key, logger=logger
+    )
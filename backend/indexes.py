@@ -0,0 +1,201 @@
+# backend/indexes.py
+
+from typing import Any, Optional, Dict, List, Tuple, Union
+
+import pymongo
+from pydantic import BaseModel, Field, validator
+
+
+# keys of the text index as they are reported by index_information(), text fields are replaced by these two
+TEXT_INDEX_KEYS: List[Tuple[str, Union[int, str]]] = [("_fts", "text"), ("_ftsx", 1)]
+
+# default index created by the server for every collection, never declared and never dropped
+DEFAULT_ID_INDEX_NAME = "_id_"
+
+
+class IndexSpec(BaseModel):
+    """
+    Declarative specification of the collection index.
+    Covers single-field and compound keys with the direction (or the kind, e.g. "text") of every key,
+    uniqueness, sparse and partial indexes, TTL indexes and text indexes with the field weights
+    """
+    name: str = Field(..., example="book_name")
+    # (<field>, <direction or kind>) pairs, single-field ascending index on the field named as index if empty
+    keys: List[Tuple[str, Union[int, str]]] = Field(default_factory=list, example=[("book_name", 1)])
+    unique: bool = Field(False, example=True)
+    sparse: bool = Field(False, example=False)
+    partial_filter_expression: Optional[Dict[str, Any]] = Field(None, example={"available": True})
+    expire_after_seconds: Optional[int] = Field(None, example=3600)
+    weights: Optional[Dict[str, int]] = Field(None, example={"book_name": 10, "author": 5})
+    default_language: Optional[str] = Field(None, example="english")
+
+    class Config:
+        # keeps integers and strings of Union[int, str] fields as they are instead of casting to the first type
+        smart_union = True
+
+    @validator("keys", always=True)
+    def set_default_keys(cls, keys, values):
+        if not keys and "name" in values: return [(values["name"], pymongo.ASCENDING)]
+        return keys
+
+    @classmethod
+    def from_index_params(cls, index_params: Tuple) -> "IndexSpec":
+        """
+        Converts the legacy index params tuple to the index spec
+
+        :param Tuple index_params: ("<index_name>", <uniqueness_bool>[, <index_keys>[, <index_options>]]),
+                                   where <index_keys> is a list of (<field>, <index_type>) pairs and
+                                   <index_options> is a dict of extra create_index options
+        :raises ValueError: if the tuple format is not compatible with the requirements
+        :return IndexSpec: index spec
+        """
+        if not isinstance(index_params, tuple) or len(index_params) not in (2, 3, 4):
+            raise ValueError(
+                "One of the elements of <required_index_params> has invalid value or the format is not compatible with the requirements: "
+                "Tuple[str, bool] or Tuple[str, bool, List[Tuple[str, Any]], Dict[str, Any]]"
+            )
+        name, unique = index_params[:2]
+        keys = index_params[2] if len(index_params) > 2 else []
+        options = index_params[3] if len(index_params) > 3 else {}
+        return cls(
+            name=name,
+            keys=keys,
+            unique=unique,
+            sparse=options.get("sparse", False),
+            partial_filter_expression=options.get("partialFilterExpression"),
+            expire_after_seconds=options.get("expireAfterSeconds"),
+            weights=options.get("weights"),
+            default_language=options.get("default_language")
+        )
+
+    @property
+    def is_text_index(self) -> bool:
+        return any(index_type == pymongo.TEXT for _, index_type in self.keys)
+
+    def get_create_index_options(self) -> Dict[str, Any]:
+        """
+        Builds keyword arguments of pymongo create_index() for the index
+
+        :return Dict[str, Any]: create_index() options
+        """
+        options = {"name": self.name, "unique": self.unique}
+        if self.sparse: options["sparse"] = True
+        if self.partial_filter_expression is not None: options["partialFilterExpression"] = self.partial_filter_expression
+        if self.expire_after_seconds is not None: options["expireAfterSeconds"] = self.expire_after_seconds
+        if self.weights is not None: options["weights"] = self.weights
+        if self.default_language is not None: options["default_language"] = self.default_language
+        return options
+
+    def get_expected_index_keys(self) -> List[Tuple[str, Union[int, str]]]:
+        """
+        Returns the keys of the index as the server reports them: text fields of the text index are replaced
+        by the internal text keys, while non-text prefix and suffix fields are kept in place
+
+        :return List[Tuple[str, Union[int, str]]]: index keys
+        """
+        if not self.is_text_index:
+            return list(self.keys)
+        text_positions = [position for position, (_, index_type) in enumerate(self.keys) if index_type == pymongo.TEXT]
+        return self.keys[:text_positions[0]] + TEXT_INDEX_KEYS + self.keys[text_positions[-1] + 1:]
+
+    def get_differences(self, index_info: Dict[str, Any]) -> List[str]:
+        """
+        Compares the spec with the existing index
+
+        :param Dict[str, Any] index_info: existing index description, an item of index_information() result
+        :return List[str]: descriptions of the differences, empty if the index matches the spec
+        """
+        differences = []
+
+        def compare(option_name: str, expected: Any, actual: Any) -> None:
+            if expected != actual: differences.append(f"{option_name}: expected {expected}, found {actual}")
+
+        compare("keys", [tuple(key) for key in self.get_expected_index_keys()], [tuple(key) for key in index_info["key"]])
+        compare("unique", self.unique, bool(index_info.get("unique", False)))
+        compare("sparse", self.sparse, bool(index_info.get("sparse", False)))
+        compare("partialFilterExpression", self.partial_filter_expression, index_info.get("partialFilterExpression"))
+        actual_expire_after_seconds = index_info.get("expireAfterSeconds")
+        if actual_expire_after_seconds is not None: actual_expire_after_seconds = int(actual_expire_after_seconds)
+        compare("expireAfterSeconds", self.expire_after_seconds, actual_expire_after_seconds)
+        if self.is_text_index:
+            # text fields without explicit weight have the weight of 1
+            expected_weights = {field: 1 for field, index_type in self.keys if index_type == pymongo.TEXT}
+            expected_weights.update(self.weights or {})
+            compare("weights", expected_weights, dict(index_info.get("weights", {})))
+            compare("default_language", self.default_language or "english", index_info.get("default_language", "english"))
+        return differences
+
+
+class IndexDiffReport(BaseModel):
+    """
+    Dry-run difference between the declared index specs and the indexes existing within the collection
+    """
+    collection_name: str = Field(..., example="books")
+    # declared, but absent indexes
+    missing: List[str] = Field(default_factory=list, example=["book_name"])
+    # declared indexes existing with other keys or options, index name -> differences
+    changed: Dict[str, List[str]] = Field(default_factory=dict, example={"book_id": ["unique: expected True, found False"]})
+    # existing, but not declared indexes
+    extra: List[str] = Field(default_factory=list, example=["author_1"])
+    # number of index accesses since the server start per index name, taken from $indexStats
+    usage: Dict[str, int] = Field(default_factory=dict, example={"book_id": 1024, "author_1": 0})
+
+    @property
+    def unused(self) -> List[str]:
+        """
+        Existing indexes never used since the server start (except the default _id index)
+        """
+        return [name for name, ops in self.usage.items() if ops == 0 and name != DEFAULT_ID_INDEX_NAME]
+
+    @property
+    def has_drift(self) -> bool:
+        return bool(self.missing or self.changed or self.extra)
+
+
+def to_index_specs(required_index_params: List[Union[IndexSpec, Tuple]]) -> List[IndexSpec]:
+    """
+    Converts the list of index specs and legacy index params tuples to the list of index specs
+
+    :param List[Union[IndexSpec, Tuple]] required_index_params: index specs or legacy index params tuples
+    :raises ValueError: if the value or any of its elements has incompatible format
+    :return List[IndexSpec]: index specs
+    """
+    if not isinstance(required_index_params, list):
+        raise ValueError(
+            "Invalid value was passed as <required_index_params> or the format is not compatible with the requirements: "
+            "List[IndexSpec] or List[Tuple[str, bool]]"
+        )
+    return [
+        index_params if isinstance(index_params, IndexSpec) else IndexSpec.from_index_params(index_params)
+        for index_params in required_index_params
+    ]
+
+
+def diff_indexes(
+        collection_name: str,
+        index_specs: List[IndexSpec],
+        index_information: Dict[str, Dict[str, Any]],
+        index_usage: Optional[Dict[str, int]] = None
+) -> IndexDiffReport:
+    """
+    Compares the declared index specs with the existing indexes of the collection without changing anything
+
+    :param str collection_name: name of the collection
+    :param List[IndexSpec] index_specs: declared index specs
+    :param Dict[str, Dict[str, Any]] index_information: existing indexes, result of collection index_information()
+    :param Optional[Dict[str, int]] index_usage: number of accesses per index name, e.g. taken from $indexStats
+    :return IndexDiffReport: difference report
+    """
+    report = IndexDiffReport(collection_name=collection_name, usage=index_usage or {})
+    declared_index_names = set()
+    for index_spec in index_specs:
+        declared_index_names.add(index_spec.name)
+        if index_spec.name not in index_information:
+            report.missing.append(index_spec.name)
+            continue
+        differences = index_spec.get_differences(index_information[index_spec.name])
+        if differences: report.changed[index_spec.name] = differences
+    report.extra = [
+        name for name in index_information if name not in declared_index_names and name != DEFAULT_ID_INDEX_NAME
+    ]
+    return report
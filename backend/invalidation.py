@@ -0,0 +1,433 @@
+# backend/invalidation.py
+
+import os
+import json
+import time
+import socket
+import threading
+from uuid import uuid4
+from collections import OrderedDict
+from typing import Any, Optional, Dict, List, Tuple, Iterable, Callable
+
+from pymongo.errors import PyMongoError, OperationFailure
+
+
+SUPPORTED_INVALIDATION_BUS_BACKENDS = ("local", "unix", "mongo")
+
+# largest datagram payload sent at once, stays well below the default unix socket buffer size
+MAX_DATAGRAM_SIZE = 32768
+
+
+def make_invalidation_key(collection_name: str, field_name: str, value: Any) -> str:
+    """
+    Returns the key of the cached entries derived from the document with the given field value
+
+    :param str collection_name: name of the collection the document belongs to
+    :param str field_name: name of the key field, e.g. 'username'
+    :param Any value: value of the key field
+    :return str: invalidation key, e.g. 'users:username:johndoe'
+    """
+    return f"{collection_name}:{field_name}:{value}"
+
+
+def make_collection_invalidation_key(collection_name: str) -> str:
+    """
+    Returns the key invalidating all the cached entries derived from the collection
+
+    :param str collection_name: name of the collection
+    :return str: invalidation key, e.g. 'users:*'
+    """
+    return f"{collection_name}:*"
+
+
+def get_invalidation_keys(collection_name: str, key_fields: Iterable[str], *documents: Optional[Dict[str, Any]]) -> List[str]:
+    """
+    Returns the invalidation keys of the key fields found in the documents (or equality filters).
+    Returns the collection-wide key if none of the key fields is found, so the written documents are
+    never left cached
+
+    :param str collection_name: name of the collection the documents belong to
+    :param Iterable[str] key_fields: names of the fields the cached entries are keyed by
+    :param Optional[Dict[str, Any]] documents: written documents, filters of the writes or None
+    :return List[str]: invalidation keys
+    """
+    keys = []
+    for document in documents:
+        if not document:
+            continue
+        for field_name in key_fields:
+            value = document.get(field_name)
+            # filters with operators (e.g. {"$in": [...]}) do not name the documents
+            if isinstance(value, (str, int, float, bool)):
+                key = make_invalidation_key(collection_name, field_name, value)
+                if key not in keys: keys.append(key)
+    return keys or [make_collection_invalidation_key(collection_name)]
+
+
+class InvalidatingCache:
+    """
+    Size and TTL bounded LRU cache of the entries derived from a single collection, keyed by invalidation keys.
+    Subscribed to the invalidation bus, it evicts the entries of the written documents as soon as the write
+    is announced, so the TTL only bounds the staleness if an invalidation is lost
+    """
+
+    def __init__(self, collection_name: str, ttl_seconds: float = 300.0, max_size: int = 10000):
+        self.collection_name: str = collection_name
+        self.ttl_seconds: float = ttl_seconds
+        self.max_size: int = max_size
+        self._lock = threading.Lock()
+        # invalidation key -> (expiry time, value)
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        # incremented by every invalidation, so the values read before it are not cached after it
+        self.generation: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.collection_name}, {len(self._entries)} entries)"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns the cached value
+
+        :param str key: invalidation key
+        :return Optional[Any]: cached value or None if absent or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any, generation: Optional[int] = None) -> None:
+        """
+        Caches the value, evicting the least recently used entries over the size limit
+
+        :param str key: invalidation key
+        :param Any value: value to be cached
+        :param Optional[int] generation: cache generation taken before the value was read, the value is
+                                         not cached if any invalidation has arrived since then
+        :return None:
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys: List[str]) -> None:
+        """
+        Evicts the entries of the invalidation keys, the collection-wide key clears the cache
+
+        :param List[str] keys: invalidation keys
+        :return None:
+        """
+        prefix = f"{self.collection_name}:"
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                if key == make_collection_invalidation_key(self.collection_name):
+                    self._entries.clear()
+                elif key.startswith(prefix):
+                    self._entries.pop(key, None)
+
+
+class InvalidationBus:
+    """
+    Announces the keys of the written documents to the in-process caches of every service worker.
+    Listeners of the writing worker are called synchronously by publish(), so the worker reads its own writes.
+    This base class serves a single worker only
+    """
+
+    def __init__(self, logger: Optional[Any] = None):
+        self.logger: Optional[Any] = logger
+        self._listeners: List[Callable[[List[str]], None]] = []
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self._listeners)} listeners)"
+
+    def subscribe(self, listener: Callable[[List[str]], None]) -> None:
+        """
+        Subscribes the listener (e.g. InvalidatingCache.invalidate) to the invalidation keys
+
+        :param Callable[[List[str]], None] listener: callable accepting list of invalidation keys
+        :return None:
+        """
+        self._listeners.append(listener)
+
+    def register(self, mongo_adapter: Any, key_fields: List[str]) -> None:
+        """
+        Registers the collection whose writes are announced, no-op unless the bus watches the collections itself
+
+        :param MongoAdapter mongo_adapter: adapter of the collection
+        :param List[str] key_fields: names of the fields the cached entries are keyed by
+        :return None:
+        """
+
+    def publish(self, keys: List[str]) -> None:
+        """
+        Announces the invalidation keys to the listeners of this and of all the other workers
+
+        :param List[str] keys: invalidation keys
+        :return None:
+        """
+        self._dispatch(keys)
+
+    def _dispatch(self, keys: List[str]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(keys)
+            except Exception as e:
+                if self.logger: self.logger.exception(f"Invalidation listener {listener} failed: {e}")
+
+    def start(self) -> None:
+        """
+        Starts receiving the invalidations of the other workers
+
+        :return None:
+        """
+
+    def close(self) -> None:
+        """
+        Stops receiving the invalidations of the other workers
+
+        :return None:
+        """
+
+
+class UnixSocketInvalidationBus(InvalidationBus):
+    """
+    Invalidation bus of the workers of a single host. Every worker binds its own unix datagram socket in the shared
+    folder, publish() sends the keys to the sockets of all the other workers without waiting for them, while
+    the receiver thread of every worker dispatches the received keys to its listeners. Sockets left by
+    the exited workers are removed by the first publish failing to reach them
+    """
+
+    def __init__(self, socket_folder_path: str, logger: Optional[Any] = None):
+        super().__init__(logger=logger)
+        self.socket_folder_path: str = socket_folder_path
+        self.socket_path: str = os.path.join(socket_folder_path, f"{os.getpid()}-{uuid4().hex[:8]}.sock")
+        self._socket: Optional[socket.socket] = None
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        self._stop_event = threading.Event()
+        self._receiver: Optional[threading.Thread] = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.socket_path}, {len(self._listeners)} listeners)"
+
+    @staticmethod
+    def _to_datagrams(keys: List[str]) -> List[bytes]:
+        datagrams, batch, batch_size = [], [], 2
+        for key in keys:
+            key_size = len(key.encode()) + 4
+            if batch and batch_size + key_size > MAX_DATAGRAM_SIZE:
+                datagrams.append(json.dumps(batch).encode())
+                batch, batch_size = [], 2
+            batch.append(key)
+            batch_size += key_size
+        if batch: datagrams.append(json.dumps(batch).encode())
+        return datagrams
+
+    def publish(self, keys: List[str]) -> None:
+        self._dispatch(keys)
+        datagrams = self._to_datagrams(keys)
+        try:
+            peer_socket_paths = [
+                entry.path for entry in os.scandir(self.socket_folder_path)
+                if entry.name.endswith(".sock") and entry.path != self.socket_path
+            ]
+        except OSError as e:
+            if self.logger: self.logger.warning(f"Failed to list invalidation sockets: {e}")
+            return
+        for peer_socket_path in peer_socket_paths:
+            for datagram in datagrams:
+                try:
+                    self._sender.sendto(datagram, peer_socket_path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # nobody listens on the socket, the worker has exited
+                    try:
+                        os.unlink(peer_socket_path)
+                    except OSError:
+                        pass
+                    break
+                except OSError as e:
+                    # the receive buffer of the peer is full, its cache is bounded by TTL until the next invalidation
+                    if self.logger: self.logger.warning(f"Failed to send invalidation to {peer_socket_path}: {e}")
+                    break
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                datagram = self._socket.recv(MAX_DATAGRAM_SIZE * 2)
+            except socket.timeout:
+                continue
+            except OSError:
+                if self._stop_event.is_set():
+                    return
+                raise
+            try:
+                keys = json.loads(datagram)
+            except ValueError:
+                continue
+            self._dispatch(keys)
+
+    def start(self) -> None:
+        if self._receiver is not None:
+            return
+        os.makedirs(self.socket_folder_path, mode=0o700, exist_ok=True)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.socket_path)
+        self._socket.settimeout(0.5)
+        self._receiver = threading.Thread(target=self._run, name="invalidation-receiver", daemon=True)
+        self._receiver.start()
+
+    def close(self) -> None:
+        if self._receiver is None:
+            return
+        self._stop_event.set()
+        self._receiver.join()
+        self._receiver = None
+        self._socket.close()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+
+class MongoChangeStreamInvalidationBus(InvalidationBus):
+    """
+    Invalidation bus watching the registered collections by a single MongoDB change stream of the database
+    (requires replica set or sharded cluster), so the writes of every worker, and of any other client of
+    the database, are announced. Old values of the key fields of replaced, updated and deleted documents
+    are known only if the collections record pre-images (MongoDB 6.0+, 'pre_images' set), otherwise such writes
+    invalidate the whole collection cache
+    """
+
+    CHANGE_STREAM_NOT_SUPPORTED_ERROR_CODE = 40573
+
+    def __init__(self, pre_images: bool = False, logger: Optional[Any] = None):
+        super().__init__(logger=logger)
+        self.pre_images: bool = pre_images
+        self._database: Any = None
+        # collection name -> key fields
+        self._collection_key_fields: Dict[str, List[str]] = {}
+        self._resume_token: Optional[Dict[str, Any]] = None
+        self._stop_event = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    def register(self, mongo_adapter: Any, key_fields: List[str]) -> None:
+        self._database = mongo_adapter.db
+        self._collection_key_fields[mongo_adapter.collection_name] = list(key_fields)
+
+    @staticmethod
+    def get_change_keys(collection_key_fields: Dict[str, List[str]], change: Dict[str, Any]) -> List[str]:
+        """
+        Returns the invalidation keys of the change stream event
+
+        :param Dict[str, List[str]] collection_key_fields: key fields per watched collection
+        :param Dict[str, Any] change: change stream event
+        :return List[str]: invalidation keys, empty for the events of the unwatched collections
+        """
+        collection_name = change.get("ns", {}).get("coll")
+        key_fields = collection_key_fields.get(collection_name)
+        if key_fields is None:
+            return []
+        operation_type = change.get("operationType")
+        previous_document = change.get("fullDocumentBeforeChange")
+        document = change.get("fullDocument")
+        if operation_type == "insert":
+            return get_invalidation_keys(collection_name, key_fields, document)
+        if operation_type == "update":
+            updated_fields = set(change.get("updateDescription", {}).get("updatedFields", {}))
+            updated_fields |= set(change.get("updateDescription", {}).get("removedFields", []))
+            # without pre-image the old values of the changed key fields are unknown
+            if previous_document is None and updated_fields & set(key_fields):
+                return [make_collection_invalidation_key(collection_name)]
+            return get_invalidation_keys(collection_name, key_fields, previous_document, document)
+        if operation_type in ("replace", "delete") and previous_document is not None:
+            return get_invalidation_keys(collection_name, key_fields, previous_document, document)
+        return [make_collection_invalidation_key(collection_name)]
+
+    def _watch(self) -> None:
+        watch_kwargs = {"full_document": "updateLookup", "max_await_time_ms": 1000}
+        if self.pre_images: watch_kwargs["full_document_before_change"] = "whenAvailable"
+        pipeline = [{"$match": {"ns.coll": {"$in": list(self._collection_key_fields)}}}]
+        with self._database.watch(pipeline=pipeline, resume_after=self._resume_token, **watch_kwargs) as stream:
+            while not self._stop_event.is_set():
+                change = stream.try_next()
+                if change is None:
+                    continue
+                self._resume_token = stream.resume_token
+                keys = self.get_change_keys(self._collection_key_fields, change)
+                if keys: self._dispatch(keys)
+
+    def _run(self) -> None:
+        retry_delay_seconds = 0.1
+        while not self._stop_event.is_set():
+            try:
+                self._watch()
+                retry_delay_seconds = 0.1
+            except PyMongoError as e:
+                if isinstance(e, OperationFailure) and e.code == self.CHANGE_STREAM_NOT_SUPPORTED_ERROR_CODE:
+                    # standalone server never starts the stream, the writes of this worker are still dispatched
+                    if self.logger: self.logger.warning(
+                        f"Change streams are not supported: {e}, invalidating the caches of this worker only"
+                    )
+                    return
+                if self.logger: self.logger.warning(f"Invalidation change stream is interrupted: {e}, resuming")
+                # the changes missed while the stream is down are unknown, so all the caches are cleared
+                self._resume_token = None
+                self._dispatch([make_collection_invalidation_key(name) for name in self._collection_key_fields])
+            self._stop_event.wait(retry_delay_seconds)
+            retry_delay_seconds = min(retry_delay_seconds * 2, 5.0)
+
+    def start(self) -> None:
+        if self._watcher is not None or self._database is None:
+            return
+        self._watcher = threading.Thread(target=self._run, name="invalidation-change-stream", daemon=True)
+        self._watcher.start()
+
+    def close(self) -> None:
+        if self._watcher is None:
+            return
+        self._stop_event.set()
+        self._watcher.join()
+        self._watcher = None
+
+
+def init_invalidation_bus(config: Dict[str, Any], logger: Optional[Any] = None) -> InvalidationBus:
+    """
+    Creates the invalidation bus selected by the 'INVALIDATION_BUS_BACKEND' config value: 'local' for a single
+    worker (default), 'unix' for the workers of a single host, 'mongo' for the workers of any hosts
+
+    :param Dict[str, Any] config: config extracted from .env file
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :raises ValueError: if unsupported invalidation bus backend is configured
+    :return InvalidationBus: invalidation bus instance
+    """
+    backend = (config.get("INVALIDATION_BUS_BACKEND") or "local").lower()
+    if backend not in SUPPORTED_INVALIDATION_BUS_BACKENDS:
+        raise ValueError(
+            f"Unsupported invalidation bus backend: {backend}, expected one of: {', '.join(SUPPORTED_INVALIDATION_BUS_BACKENDS)}"
+        )
+    if backend == "unix":
+        return UnixSocketInvalidationBus(
+            socket_folder_path=config.get("INVALIDATION_SOCKET_FOLDER_PATH") or "/tmp/fastapi_demo_invalidation",
+            logger=logger
+        )
+    if backend == "mongo":
+        return MongoChangeStreamInvalidationBus(
+            pre_images=(config.get("INVALIDATION_PRE_IMAGES") or "false").lower() == "true",
+            logger=logger
+        )
+    return InvalidationBus(logger=logger)
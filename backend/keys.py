@@ -0,0 +1,238 @@
+# backend/keys.py
+
+import os
+import time
+import threading
+from typing import Any, Optional, Dict, List, Tuple
+
+from jose import jwk, JWTError
+from jose.backends.base import Key
+
+
+SUPPORTED_ASYMMETRIC_ALGORITHMS = ("RS256", "RS384", "RS512", "ES256", "ES384", "ES512")
+SYMMETRIC_ALGORITHMS = ("HS256", "HS384", "HS512")
+# the keys folder is rescanned for the unknown key ID at most once per interval, so forged key IDs cost nothing
+UNKNOWN_KID_RELOAD_INTERVAL_SECONDS = 1.0
+
+
+class SigningKey:
+    """
+    Parsed JWT key identified by its key ID ('kid' header of the tokens it signs)
+    """
+
+    __slots__ = ("kid", "algorithm", "private_key", "public_key", "created_at")
+
+    def __init__(self, kid: Optional[str], algorithm: str, private_key: Key, public_key: Key, created_at: float = 0.0):
+        self.kid: Optional[str] = kid
+        self.algorithm: str = algorithm
+        self.private_key: Key = private_key
+        # the same key object for the symmetric algorithms
+        self.public_key: Key = public_key
+        self.created_at: float = created_at
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.kid}, {self.algorithm})"
+
+    def to_public_jwk(self) -> Dict[str, Any]:
+        """
+        Returns the public part of the key as JSON Web Key
+
+        :return Dict[str, Any]: public JWK with key ID
+        """
+        return {**self.public_key.to_dict(), "kid": self.kid, "use": "sig", "alg": self.algorithm}
+
+
+class KeyRing:
+    """
+    JWT signing and verification keys parsed once and cached by key ID, so no PEM is parsed per request.
+    Asymmetric keys are read from '<kid>.pem' private key files of the keys folder, which is rescanned at most
+    every 'reload_interval_seconds' (only new and changed files are parsed). Tokens are signed by the newest key
+    older than 'publish_delay_seconds' (or by the 'active_kid' key if set), so the new key is published in JWKS
+    before it signs anything and the old keys keep verifying the tokens they signed until their files are removed.
+    The delay defaults to the reload interval, so every worker has loaded the new key before any worker signs by it,
+    and the token of the key ID not loaded yet rescans the folder at once (rate-limited) before it is rejected.
+    Zero-downtime rotation is: drop the new key file into the folder, remove the old one once the tokens it signed
+    have expired. Symmetric algorithms use the single secret key without key ID, as before
+    """
+
+    def __init__(
+            self,
+            algorithm: str,
+            secret_key: Optional[str] = None,
+            keys_folder_path: Optional[str] = None,
+            active_kid: Optional[str] = None,
+            publish_delay_seconds: Optional[float] = None,
+            reload_interval_seconds: float = 60.0,
+            logger: Optional[Any] = None
+    ):
+        self.algorithm: str = algorithm
+        self.keys_folder_path: Optional[str] = keys_folder_path
+        self.active_kid: Optional[str] = active_kid
+        self.reload_interval_seconds: float = reload_interval_seconds
+        self.publish_delay_seconds: float = (
+            reload_interval_seconds if publish_delay_seconds is None else publish_delay_seconds
+        )
+        self.logger: Optional[Any] = logger
+        if self.publish_delay_seconds < reload_interval_seconds and logger: logger.warning(
+            f"JWT key publish delay ({self.publish_delay_seconds} s) is shorter than the keys reload interval "
+            f"({reload_interval_seconds} s), the other workers may reject the tokens of the new key for a while"
+        )
+        self._lock = threading.Lock()
+        # kid -> (file modification time, parsed key)
+        self._keys: Dict[str, Tuple[float, SigningKey]] = {}
+        self._next_reload_at: float = 0.0
+        self._next_unknown_kid_reload_at: float = 0.0
+        self._secret_key: Optional[SigningKey] = None
+        if algorithm in SYMMETRIC_ALGORITHMS:
+            if not secret_key:
+                raise ValueError(f"Secret key is required by {algorithm} algorithm!")
+            key = jwk.construct(secret_key, algorithm)
+            self._secret_key = SigningKey(kid=None, algorithm=algorithm, private_key=key, public_key=key)
+        elif algorithm in SUPPORTED_ASYMMETRIC_ALGORITHMS:
+            if not keys_folder_path:
+                raise ValueError(f"Keys folder is required by {algorithm} algorithm!")
+            self.reload(force=True)
+        else:
+            raise ValueError(
+                f"Unsupported JWT algorithm: {algorithm}, expected one of: "
+                f"{', '.join(SYMMETRIC_ALGORITHMS + SUPPORTED_ASYMMETRIC_ALGORITHMS)}"
+            )
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.algorithm}, kids={sorted(self._keys)})"
+
+    @property
+    def is_asymmetric(self) -> bool:
+        return self._secret_key is None
+
+    def reload(self, force: bool = False) -> None:
+        """
+        Rescans the keys folder, parses the new and changed key files and forgets the removed ones
+
+        :param bool force: rescan even if the reload interval has not passed yet
+        :return None:
+        """
+        if not self.is_asymmetric or (not force and time.monotonic() < self._next_reload_at):
+            return
+        with self._lock:
+            if not force and time.monotonic() < self._next_reload_at:
+                return
+            self._next_reload_at = time.monotonic() + self.reload_interval_seconds
+            try:
+                with os.scandir(self.keys_folder_path) as entries:
+                    key_files = [
+                        (entry.name[:-len(".pem")], entry.path, entry.stat().st_mtime)
+                        for entry in entries if entry.is_file() and entry.name.endswith(".pem")
+                    ]
+            except OSError as e:
+                if force:
+                    raise
+                # the loaded keys keep serving until the folder is readable again
+                if self.logger: self.logger.warning(f"Failed to rescan JWT keys folder {self.keys_folder_path}: {e}")
+                return
+            keys = {}
+            for kid, key_file_path, modified_at in key_files:
+                cached = self._keys.get(kid)
+                if cached and cached[0] == modified_at:
+                    keys[kid] = cached
+                    continue
+                try:
+                    with open(key_file_path) as key_file:
+                        private_key = jwk.construct(key_file.read(), self.algorithm)
+                except Exception as e:
+                    if self.logger: self.logger.warning(f"Failed to load JWT key {key_file_path}: {e}")
+                    continue
+                keys[kid] = (modified_at, SigningKey(
+                    kid=kid,
+                    algorithm=self.algorithm,
+                    private_key=private_key,
+                    public_key=private_key.public_key(),
+                    created_at=modified_at
+                ))
+            # the whole mapping is swapped, so the readers never see it half updated
+            self._keys = keys
+        if self.logger: self.logger.debug(f"JWT keys are loaded: {self}")
+
+    def get_signing_key(self) -> SigningKey:
+        """
+        Returns the key new tokens are signed by
+
+        :raises JWTError: if no key is available for signing yet
+        :return SigningKey: signing key
+        """
+        if not self.is_asymmetric:
+            return self._secret_key
+        self.reload()
+        keys = [key for _, key in self._keys.values()]
+        if self.active_kid:
+            keys = [key for key in keys if key.kid == self.active_kid]
+        else:
+            published_before = time.time() - self.publish_delay_seconds
+            keys = [key for key in keys if key.created_at <= published_before] or keys
+        if not keys:
+            raise JWTError("No JWT signing key is available!")
+        return max(keys, key=lambda key: (key.created_at, key.kid))
+
+    def get_verification_key(self, kid: Optional[str]) -> SigningKey:
+        """
+        Returns the key the token with the given key ID is verified by, the keys of the removed key files
+        are forgotten by the next rescan of the keys folder
+
+        :param Optional[str] kid: key ID from the token header
+        :raises JWTError: if the key ID is unknown
+        :return SigningKey: verification key
+        """
+        if not self.is_asymmetric:
+            return self._secret_key
+        self.reload()
+        cached = self._keys.get(kid)
+        if cached is None and self._expire_reload_interval():
+            # the key might have been added since the last rescan and already sign by another worker
+            self.reload()
+            cached = self._keys.get(kid)
+        if cached is None:
+            raise JWTError(f"Unknown JWT key ID: {kid}")
+        return cached[1]
+
+    def _expire_reload_interval(self) -> bool:
+        with self._lock:
+            if time.monotonic() < self._next_unknown_kid_reload_at:
+                return False
+            self._next_unknown_kid_reload_at = time.monotonic() + UNKNOWN_KID_RELOAD_INTERVAL_SECONDS
+            self._next_reload_at = 0.0
+        return True
+
+    def get_jwks(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Returns the public keys of all the loaded keys as JSON Web Key Set, empty for symmetric algorithms
+
+        :return Dict[str, List[Dict[str, Any]]]: JWKS
+        """
+        if not self.is_asymmetric:
+            return {"keys": []}
+        self.reload()
+        return {"keys": [key.to_public_jwk() for _, key in sorted(self._keys.values(), key=lambda item: item[1].kid)]}
+
+
+def init_key_ring(config: Dict[str, Any], logger: Optional[Any] = None) -> KeyRing:
+    """
+    Creates the key ring of the algorithm set by 'ALGORITHM' config value, HS* algorithms use 'SECRET_KEY',
+    RS*/ES* ones use the private keys from 'JWT_KEYS_FOLDER_PATH' folder
+
+    :param Dict[str, Any] config: config extracted from .env file
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :raises ValueError: if unsupported algorithm is configured or its keys are not set
+    :return KeyRing: key ring instance
+    """
+    # the publish delay defaults to the keys reload interval
+    publish_delay_seconds = config.get("JWT_KEY_PUBLISH_DELAY_SECONDS")
+    return KeyRing(
+        algorithm=config.get("ALGORITHM") or "HS256",
+        secret_key=config.get("SECRET_KEY"),
+        keys_folder_path=config.get("JWT_KEYS_FOLDER_PATH") or "keys",
+        active_kid=config.get("JWT_ACTIVE_KID") or None,
+        publish_delay_seconds=float(publish_delay_seconds) if publish_delay_seconds else None,
+        reload_interval_seconds=float(config.get("JWT_KEYS_RELOAD_INTERVAL_SECONDS") or 60.0),
+        logger=logger
+    )
@@ -0,0 +1,1329 @@
+# backend/memory_database.py
+
+import re
+import copy
+import time
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional, Dict, List, Tuple, Iterator, Iterable, Union
+
+import bson
+import pymongo
+from bson.regex import Regex
+from pymongo.errors import (
+    BulkWriteError,
+    DuplicateKeyError,
+    ExecutionTimeout,
+    InvalidOperation,
+    NetworkTimeout,
+    OperationFailure,
+)
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import ReadPreference
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+from pymongo.write_concern import WriteConcern
+
+try:
+    # private API of pymongo (the deadline of pymongo.timeout() blocks), checked against pymongo==4.3.3
+    from pymongo._csot import remaining as get_timeout_remaining
+except ImportError:
+    # optional, the latency is not checked against the pymongo.timeout() deadlines without it
+    get_timeout_remaining = None
+
+from .indexes import TEXT_INDEX_KEYS, DEFAULT_ID_INDEX_NAME
+from .search import tokenize
+
+
+# the order of the values of different types, as MongoDB compares and sorts them
+TYPE_ORDER = {
+    type(None): 0,
+    int: 1,
+    float: 1,
+    str: 2,
+    dict: 3,
+    list: 4,
+    bytes: 5,
+    bson.ObjectId: 6,
+    bool: 7,
+    datetime: 8,
+}
+
+# codes of the server errors raised by the in-memory collections
+DUPLICATE_KEY_ERROR_CODE = 11000
+BAD_VALUE_ERROR_CODE = 2
+INDEX_NOT_FOUND_ERROR_CODE = 27
+INDEX_OPTIONS_CONFLICT_ERROR_CODE = 85
+EXCEEDED_TIME_LIMIT_ERROR_CODE = 50
+CHANGE_STREAMS_NOT_SUPPORTED_ERROR_CODE = 40573
+
+# clients shared by the adapters configured with the same host and port, as the adapters would share the server
+_in_memory_clients: Dict[Tuple[str, int], "InMemoryMongoClient"] = {}
+_in_memory_clients_lock = threading.Lock()
+
+
+def _get_path_values(value: Any, keys: List[str]) -> List[Any]:
+    # values of the dotted path, arrays of subdocuments are traversed as the server does
+    if not keys:
+        return [value]
+    if isinstance(value, dict):
+        return _get_path_values(value[keys[0]], keys[1:]) if keys[0] in value else []
+    if isinstance(value, list):
+        if keys[0].isdigit():
+            return _get_path_values(value[int(keys[0])], keys[1:]) if int(keys[0]) < len(value) else []
+        return [path_value for item in value if isinstance(item, dict) for path_value in _get_path_values(item, keys)]
+    return []
+
+
+def get_path_values(document: Dict[str, Any], path: str) -> List[Any]:
+    """
+    Returns the values of the document field named by the dotted path, e.g. 'metadata.book_id'
+
+    :param Dict[str, Any] document: document
+    :param str path: dotted path of the field
+    :return List[Any]: values of the field, empty if the field is missing
+    """
+    return _get_path_values(document, path.split("."))
+
+
+def get_path_value(document: Dict[str, Any], path: str) -> Any:
+    values = get_path_values(document, path)
+    return values[0] if values else None
+
+
+def _set_path_value(document: Dict[str, Any], path: str, value: Any) -> None:
+    *parents, key = path.split(".")
+    for parent in parents:
+        document = document.setdefault(parent, {})
+    document[key] = value
+
+
+def _unset_path_value(document: Dict[str, Any], path: str) -> None:
+    *parents, key = path.split(".")
+    for parent in parents:
+        document = document.get(parent)
+        if not isinstance(document, dict):
+            return
+    document.pop(key, None)
+
+
+def get_sort_key(value: Any) -> Tuple[int, Any]:
+    """
+    Returns the key ordering the values of any types as MongoDB does: first by the type, then by the value
+
+    :param Any value: value
+    :return Tuple[int, Any]: sort key
+    """
+    type_order = TYPE_ORDER.get(type(value), len(TYPE_ORDER))
+    if isinstance(value, dict):
+        return type_order, [(key, get_sort_key(item)) for key, item in value.items()]
+    if isinstance(value, list):
+        return type_order, [get_sort_key(item) for item in value]
+    if type_order == len(TYPE_ORDER):
+        return type_order, repr(value)
+    return type_order, value
+
+
+def _to_hashable(value: Any) -> Any:
+    if isinstance(value, dict):
+        return tuple((key, _to_hashable(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_to_hashable(item) for item in value)
+    return value
+
+
+def _values_equal(value: Any, expected: Any) -> bool:
+    # booleans are never equal to numbers, unlike in Python
+    if isinstance(value, bool) != isinstance(expected, bool):
+        return False
+    return get_sort_key(value)[0] == get_sort_key(expected)[0] and value == expected
+
+
+def to_bson_value(value: Any) -> Any:
+    """
+    Round-trips the value through BSON, so the stored and the queried values have the types the server would have
+    (e.g. tuples become lists, timezone-aware datetimes become naive UTC datetimes truncated to milliseconds)
+
+    :param Any value: value
+    :raises bson.errors.InvalidDocument: if the value cannot be encoded to BSON
+    :return Any: value as it would be read back from the server
+    """
+    return bson.decode(bson.encode({"value": value}))["value"]
+
+
+def _compare(values: List[Any], expected: Any, comparison: str) -> bool:
+    # values of different types are never ordered against each other, as by the server
+    for value in values:
+        candidates = value if isinstance(value, list) else [value]
+        for candidate in candidates:
+            if get_sort_key(candidate)[0] != get_sort_key(expected)[0] or isinstance(candidate, bool) != isinstance(expected, bool):
+                continue
+            if (
+                (comparison == "$gt" and candidate > expected)
+                or (comparison == "$gte" and candidate >= expected)
+                or (comparison == "$lt" and candidate < expected)
+                or (comparison == "$lte" and candidate <= expected)
+            ):
+                return True
+    return False
+
+
+def _matches_value(values: List[Any], expected: Any) -> bool:
+    # missing field matches null, array field matches its elements and the whole array
+    if expected is None and not values:
+        return True
+    if isinstance(expected, (Regex, re.Pattern)):
+        return _matches_regex(values, expected.pattern, "")
+    return any(
+        _values_equal(value, expected) or (isinstance(value, list) and any(_values_equal(item, expected) for item in value))
+        for value in values
+    )
+
+
+def _matches_regex(values: List[Any], pattern: str, regex_options: str) -> bool:
+    flags = (re.IGNORECASE if "i" in regex_options else 0) | (re.MULTILINE if "m" in regex_options else 0)
+    compiled_pattern = re.compile(pattern, flags)
+    return any(
+        isinstance(candidate, str) and compiled_pattern.search(candidate)
+        for value in values
+        for candidate in (value if isinstance(value, list) else [value])
+    )
+
+
+def _is_operator_expression(expected: Any) -> bool:
+    return isinstance(expected, dict) and bool(expected) and all(key.startswith("$") for key in expected)
+
+
+def _matches_condition(values: List[Any], condition: Any) -> bool:
+    if not _is_operator_expression(condition):
+        return _matches_value(values, condition)
+    for operator, expected in condition.items():
+        if operator == "$eq":
+            matched = _matches_value(values, expected)
+        elif operator == "$ne":
+            matched = not _matches_value(values, expected)
+        elif operator in ("$gt", "$gte", "$lt", "$lte"):
+            matched = _compare(values, expected, operator)
+        elif operator == "$in":
+            matched = any(_matches_value(values, item) for item in expected)
+        elif operator == "$nin":
+            matched = not any(_matches_value(values, item) for item in expected)
+        elif operator == "$exists":
+            matched = bool(values) == bool(expected)
+        elif operator == "$regex":
+            matched = _matches_regex(values, getattr(expected, "pattern", expected), condition.get("$options", ""))
+        elif operator == "$options":
+            continue
+        elif operator == "$not":
+            matched = not _matches_condition(values, expected)
+        elif operator == "$size":
+            matched = any(isinstance(value, list) and len(value) == expected for value in values)
+        elif operator == "$all":
+            matched = all(_matches_value(values, item) for item in expected)
+        elif operator == "$elemMatch":
+            matched = any(
+                isinstance(value, list) and any(
+                    matches_filter(item, expected) if isinstance(item, dict) and not _is_operator_expression(expected)
+                    else _matches_condition([item], expected)
+                    for item in value
+                )
+                for value in values
+            )
+        else:
+            raise OperationFailure(f"unknown operator: {operator}", code=BAD_VALUE_ERROR_CODE)
+        if not matched:
+            return False
+    return True
+
+
+def matches_filter(document: Dict[str, Any], q_filter: Optional[Dict[str, Any]]) -> bool:
+    """
+    Checks that the document matches the query filter. Supports field equality (including array elements and
+    dotted paths), comparison, $in / $nin, $exists, $regex, $not, $size, $all, $elemMatch and the logical
+    $and / $or / $nor operators. $text operator is evaluated by the collection, since it needs the text index
+
+    :param Dict[str, Any] document: document
+    :param Optional[Dict[str, Any]] q_filter: query filter, matches every document if empty
+    :raises OperationFailure: if the filter uses an unsupported operator
+    :return bool: True if the document matches the filter
+    """
+    for key, condition in (q_filter or {}).items():
+        if key == "$and":
+            matched = all(matches_filter(document, sub_filter) for sub_filter in condition)
+        elif key == "$or":
+            matched = any(matches_filter(document, sub_filter) for sub_filter in condition)
+        elif key == "$nor":
+            matched = not any(matches_filter(document, sub_filter) for sub_filter in condition)
+        elif key in ("$text", "$comment"):
+            continue
+        elif key.startswith("$"):
+            raise OperationFailure(f"unknown top level operator: {key}", code=BAD_VALUE_ERROR_CODE)
+        else:
+            matched = _matches_condition(get_path_values(document, key), condition)
+        if not matched:
+            return False
+    return True
+
+
+def evaluate_expression(expression: Any, document: Dict[str, Any]) -> Any:
+    """
+    Evaluates the aggregation expression against the document: '$field' paths, literals, subdocuments and
+    $cond, $ifNull, $eq, $ne, $gt, $gte, $lt, $lte, $and, $or, $not, $add, $subtract, $multiply,
+    $size and $toLower operators
+
+    :param Any expression: aggregation expression
+    :param Dict[str, Any] document: document
+    :raises OperationFailure: if the expression uses an unsupported operator
+    :return Any: value of the expression
+    """
+    if isinstance(expression, str) and expression.startswith("$"):
+        return get_path_value(document, expression[1:])
+    if isinstance(expression, list):
+        return [evaluate_expression(item, document) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if not _is_operator_expression(expression):
+        return {key: evaluate_expression(value, document) for key, value in expression.items()}
+    (operator, operand), = expression.items()
+    if operator == "$literal":
+        return operand
+    if operator == "$cond":
+        if isinstance(operand, dict): operand = [operand["if"], operand["then"], operand["else"]]
+        condition, if_true, if_false = operand
+        return evaluate_expression(if_true if evaluate_expression(condition, document) else if_false, document)
+    arguments = evaluate_expression(operand if isinstance(operand, list) else [operand], document)
+    if operator == "$ifNull":
+        return next((argument for argument in arguments if argument is not None), None)
+    if operator in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte"):
+        left, right = get_sort_key(arguments[0]), get_sort_key(arguments[1])
+        return {
+            "$eq": left == right, "$ne": left != right, "$gt": left > right,
+            "$gte": left >= right, "$lt": left < right, "$lte": left <= right
+        }[operator]
+    if operator == "$and":
+        return all(arguments)
+    if operator == "$or":
+        return any(arguments)
+    if operator == "$not":
+        return not arguments[0]
+    if operator == "$add":
+        return sum(argument or 0 for argument in arguments)
+    if operator == "$subtract":
+        return arguments[0] - arguments[1]
+    if operator == "$multiply":
+        product = 1
+        for argument in arguments:
+            product *= argument
+        return product
+    if operator == "$size":
+        return len(arguments[0])
+    if operator == "$toLower":
+        return (arguments[0] or "").lower()
+    raise OperationFailure(f"Unrecognized expression '{operator}'", code=BAD_VALUE_ERROR_CODE)
+
+
+def _accumulate(operator: str, values: List[Any]) -> Any:
+    if operator == "$sum":
+        return sum(value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool))
+    if operator == "$avg":
+        numbers = [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        return sum(numbers) / len(numbers) if numbers else None
+    if operator in ("$min", "$max"):
+        present = [value for value in values if value is not None]
+        if not present:
+            return None
+        return (min if operator == "$min" else max)(present, key=get_sort_key)
+    if operator == "$first":
+        return values[0] if values else None
+    if operator == "$last":
+        return values[-1] if values else None
+    if operator == "$push":
+        return values
+    if operator == "$addToSet":
+        unique_values = {}
+        for value in values:
+            unique_values.setdefault(_to_hashable(value), value)
+        return list(unique_values.values())
+    raise OperationFailure(f"unknown group operator '{operator}'", code=BAD_VALUE_ERROR_CODE)
+
+
+def apply_projection(document: Dict[str, Any], projection: Optional[Any], text_score: float = 0.0) -> Dict[str, Any]:
+    """
+    Copies the document leaving out the fields excluded by the projection (or keeping only the included ones).
+    Supports top-level fields and {"$meta": "textScore"} fields
+
+    :param Dict[str, Any] document: document
+    :param Optional[Any] projection: projection dict or list of included fields, whole document if None
+    :param float text_score: relevance of the document for the $text query
+    :return Dict[str, Any]: projected copy of the document
+    """
+    if not projection:
+        return copy.deepcopy(document)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: True for field in projection}
+    meta_fields = [field for field, value in projection.items() if isinstance(value, dict)]
+    flags = {field: bool(value) for field, value in projection.items() if not isinstance(value, dict)}
+    included = [field for field, flag in flags.items() if flag and field != "_id"]
+    if included:
+        projected = {"_id": document["_id"]} if "_id" in document else {}
+        for field in included:
+            if field in document: projected[field] = copy.deepcopy(document[field])
+    else:
+        projected = {field: copy.deepcopy(value) for field, value in document.items() if flags.get(field, True)}
+    if not flags.get("_id", True): projected.pop("_id", None)
+    for field in meta_fields:
+        projected[field] = text_score
+    return projected
+
+
+def _validate_update(update: Dict[str, Any], replacement: bool) -> None:
+    # the same checks as pymongo does before sending the update to the server
+    if not isinstance(update, dict):
+        raise TypeError("update / replacement must be an instance of dict")
+    has_operators = bool(update) and next(iter(update)).startswith("$")
+    if replacement and has_operators:
+        raise ValueError("replacement can not include $ operators")
+    if not replacement and not has_operators:
+        raise ValueError("update only works with $ operators")
+
+
+def apply_update(document: Dict[str, Any], update: Dict[str, Any], is_insert: bool = False) -> None:
+    """
+    Applies the update operators to the document in place. Supports $set, $unset, $inc, $min, $max, $mul,
+    $setOnInsert, $push, $addToSet (both with $each), $pull and $currentDate operators
+
+    :param Dict[str, Any] document: document to be updated
+    :param Dict[str, Any] update: update operators, e.g. {"$set": {"available": False}}
+    :param bool is_insert: True if the document is being inserted by the upsert, so $setOnInsert applies
+    :raises OperationFailure: if the update uses an unsupported operator or is not applicable to the document
+    :return None:
+    """
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            if path == "_id" or path.startswith("_id."):
+                raise OperationFailure("Performing an update on the path '_id' would modify the immutable field '_id'", code=66)
+            current_values = get_path_values(document, path)
+            current = current_values[0] if current_values else None
+            if operator == "$set" or (operator == "$setOnInsert" and is_insert):
+                _set_path_value(document, path, value)
+            elif operator == "$setOnInsert":
+                continue
+            elif operator == "$unset":
+                _unset_path_value(document, path)
+            elif operator in ("$inc", "$mul"):
+                if current is not None and not isinstance(current, (int, float)):
+                    raise OperationFailure(f"Cannot apply {operator} to a value of non-numeric type", code=14)
+                _set_path_value(document, path, (current or 0) + value if operator == "$inc" else (current or 0) * value)
+            elif operator in ("$min", "$max"):
+                if current is None or (get_sort_key(value) < get_sort_key(current)) == (operator == "$min"):
+                    _set_path_value(document, path, value)
+            elif operator == "$currentDate":
+                _set_path_value(document, path, to_bson_value(datetime.now(timezone.utc)))
+            elif operator in ("$push", "$addToSet"):
+                if current is not None and not isinstance(current, list):
+                    raise OperationFailure(f"The field '{path}' must be an array", code=2)
+                items = list(current or [])
+                added = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                for item in added:
+                    if operator == "$push" or not any(_values_equal(existing, item) for existing in items):
+                        items.append(item)
+                _set_path_value(document, path, items)
+            elif operator == "$pull":
+                if isinstance(current, list):
+                    _set_path_value(document, path, [
+                        item for item in current
+                        if not (
+                            _matches_condition([item], value) if not isinstance(item, dict) or _is_operator_expression(value)
+                            else matches_filter(item, value)
+                        )
+                    ])
+            else:
+                raise OperationFailure(f"Unknown modifier: {operator}", code=9)
+
+
+def get_upsert_document(q_filter: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Builds the base of the document inserted by the upsert from the equality conditions of the filter
+
+    :param Dict[str, Any] q_filter: query filter of the upsert
+    :return Dict[str, Any]: document with the fields of the equality conditions
+    """
+    document = {}
+    for key, condition in q_filter.items():
+        if key == "$and":
+            for sub_filter in condition:
+                for sub_key, value in get_upsert_document(sub_filter).items():
+                    _set_path_value(document, sub_key, value)
+        elif key.startswith("$"):
+            continue
+        elif not _is_operator_expression(condition):
+            _set_path_value(document, key, copy.deepcopy(condition))
+        elif "$eq" in condition:
+            _set_path_value(document, key, copy.deepcopy(condition["$eq"]))
+    return document
+
+
+class _IndexState:
+    """
+    Index of the in-memory collection. Only unique indexes keep their keys, the rest of the indexes are kept
+    to be reported, to enforce TTL and text search and to be chosen by the query planner
+    """
+
+    def __init__(self, name: str, keys: List[Tuple[str, Union[int, str]]], options: Dict[str, Any]):
+        self.name: str = name
+        self.keys: List[Tuple[str, Union[int, str]]] = keys
+        self.options: Dict[str, Any] = options
+        self.unique: bool = bool(options.get("unique"))
+        self.sparse: bool = bool(options.get("sparse"))
+        self.partial_filter_expression: Optional[Dict[str, Any]] = options.get("partialFilterExpression")
+        self.expire_after_seconds: Optional[int] = options.get("expireAfterSeconds")
+        self.text_fields: Dict[str, int] = {}
+        if any(index_type == pymongo.TEXT for _, index_type in keys):
+            self.text_fields = {field: 1 for field, index_type in keys if index_type == pymongo.TEXT}
+            self.text_fields.update(options.get("weights") or {})
+        # unique key -> _id of the document holding it
+        self.entries: Dict[Any, Any] = {}
+        self.accesses: int = 0
+        self.since: datetime = to_bson_value(datetime.now(timezone.utc))
+
+    def get_info(self) -> Dict[str, Any]:
+        # the index description as reported by index_information()
+        info: Dict[str, Any] = {"v": 2, "key": list(self.keys)}
+        if self.text_fields:
+            text_positions = [position for position, (_, index_type) in enumerate(self.keys) if index_type == pymongo.TEXT]
+            info["key"] = self.keys[:text_positions[0]] + TEXT_INDEX_KEYS + self.keys[text_positions[-1] + 1:]
+            info["weights"] = dict(self.text_fields)
+            info["default_language"] = self.options.get("default_language") or "english"
+            info["language_override"] = "language"
+            info["textIndexVersion"] = 3
+        for option_name in ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds"):
+            if self.options.get(option_name): info[option_name] = self.options[option_name]
+        return info
+
+    def get_key(self, document: Dict[str, Any]) -> Optional[Any]:
+        # None if the document is left out of the index (sparse or partial index)
+        if self.partial_filter_expression is not None and not matches_filter(document, self.partial_filter_expression):
+            return None
+        fields = [field for field, _ in self.keys]
+        values = [get_path_values(document, field) for field in fields]
+        if self.sparse and not any(values):
+            return None
+        return tuple(_to_hashable(field_values[0] if field_values else None) for field_values in values)
+
+
+class _CollectionState:
+    """
+    Documents and indexes of the in-memory collection shared by all the collection objects
+    configured with different options
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # _id -> document, dicts keep the insertion (natural) order
+        self.documents: Dict[Any, Dict[str, Any]] = {}
+        self.indexes: Dict[str, _IndexState] = {DEFAULT_ID_INDEX_NAME: _IndexState(DEFAULT_ID_INDEX_NAME, [("_id", 1)], {"unique": True})}
+        self.exists: bool = False
+
+
+class InMemoryCursor:
+    """
+    Cursor over the documents of the in-memory collection. The query runs once the cursor is iterated,
+    so sort(), skip() and limit() can be chained before
+    """
+
+    def __init__(
+            self,
+            collection: "InMemoryCollection",
+            q_filter: Optional[Dict[str, Any]] = None,
+            projection: Optional[Any] = None,
+            skip: int = 0,
+            limit: int = 0,
+            sort: Optional[List[Tuple[str, Any]]] = None,
+            max_time_ms: Optional[int] = None
+    ):
+        self._collection: "InMemoryCollection" = collection
+        self._filter: Dict[str, Any] = q_filter or {}
+        self._projection: Optional[Any] = projection
+        self._skip: int = skip
+        self._limit: int = limit
+        self._sort: Optional[List[Tuple[str, Any]]] = sort
+        self._max_time_ms: Optional[int] = max_time_ms
+        self._results: Optional[Iterator[Dict[str, Any]]] = None
+
+    def sort(self, key_or_list: Union[str, List[Tuple[str, Any]]], direction: Any = pymongo.ASCENDING) -> "InMemoryCursor":
+        self._sort = [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+        return self
+
+    def skip(self, skip: int) -> "InMemoryCursor":
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int) -> "InMemoryCursor":
+        self._limit = limit
+        return self
+
+    def max_time_ms(self, max_time_ms: Optional[int]) -> "InMemoryCursor":
+        self._max_time_ms = max_time_ms
+        return self
+
+    def explain(self) -> Dict[str, Any]:
+        return self._collection._explain(self._filter)
+
+    def close(self) -> None:
+        self._results = iter(())
+
+    def __iter__(self) -> "InMemoryCursor":
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        if self._results is None:
+            self._results = iter(self._collection._find(
+                self._filter, self._projection, self._skip, self._limit, self._sort, self._max_time_ms
+            ))
+        return next(self._results)
+
+    def __enter__(self) -> "InMemoryCursor":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class _BulkRecorder:
+    # receives the write operations (pymongo InsertOne, ReplaceOne, UpdateOne etc.) of bulk_write() in the same way
+    # as pymongo bulk does
+    def __init__(self):
+        self.operations: List[Tuple[str, Dict[str, Any]]] = []
+
+    def add_insert(self, document):
+        if "_id" not in document: document["_id"] = bson.ObjectId()
+        self.operations.append(("insert", {"document": document}))
+
+    def add_update(self, selector, update, multi=False, upsert=False, collation=None, array_filters=None, hint=None):
+        self.operations.append(("update", {"q_filter": selector, "update": update, "multi": multi, "upsert": upsert}))
+
+    def add_replace(self, selector, replacement, upsert=False, collation=None, hint=None):
+        self.operations.append(("replace", {"q_filter": selector, "replacement": replacement, "upsert": upsert}))
+
+    def add_delete(self, selector, limit, collation=None, hint=None):
+        self.operations.append(("delete", {"q_filter": selector, "multi": limit == 0}))
+
+
+class InMemoryCollection:
+    """
+    In-process stand-in of pymongo Collection keeping the documents in memory. Covers the operations used by
+    MongoAdapter: inserts, replaces and updates with upserts, find_one_and_* operations, paged and sorted finds,
+    counts, bulk writes, unique, sparse, partial, TTL and text indexes, $text search, explain() and simple
+    aggregation pipelines. Stored documents are round-tripped through BSON, so they are read back with the types
+    the server would return. Every operation is delayed by the latency of the client and fails with
+    ExecutionTimeout or NetworkTimeout if the latency exceeds its maxTimeMS or pymongo.timeout() deadline.
+    Change streams are not supported, as by a standalone server
+    """
+
+    def __init__(
+            self,
+            database: "InMemoryDatabase",
+            name: str,
+            state: _CollectionState,
+            read_preference: Any = ReadPreference.PRIMARY,
+            read_concern: Optional[ReadConcern] = None,
+            write_concern: Optional[WriteConcern] = None
+    ):
+        self.database: "InMemoryDatabase" = database
+        self.name: str = name
+        self.full_name: str = f"{database.name}.{name}"
+        self._state: _CollectionState = state
+        self.read_preference: Any = read_preference
+        self.read_concern: ReadConcern = read_concern or ReadConcern()
+        self.write_concern: WriteConcern = write_concern or WriteConcern()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.full_name})"
+
+    def __getitem__(self, name: str) -> "InMemoryCollection":
+        return self.database[f"{self.name}.{name}"]
+
+    def with_options(self, **collection_options) -> "InMemoryCollection":
+        return InMemoryCollection(
+            database=self.database,
+            name=self.name,
+            state=self._state,
+            read_preference=collection_options.get("read_preference", self.read_preference),
+            read_concern=collection_options.get("read_concern", self.read_concern),
+            write_concern=collection_options.get("write_concern", self.write_concern)
+        )
+
+    # ---- internals ----
+
+    @staticmethod
+    def _get_max_time_ms(kwargs: Dict[str, Any]) -> Optional[int]:
+        # cursors accept 'max_time_ms', while command helpers accept 'maxTimeMS'
+        return kwargs.get("max_time_ms", kwargs.get("maxTimeMS"))
+
+    def _round_trip(self, operation: str, max_time_ms: Optional[int] = None) -> None:
+        self.database.client.simulate_round_trip(operation, max_time_ms)
+
+    def _purge_expired(self) -> None:
+        # expired documents are removed as soon as they expire, not by the TTL monitor running every minute
+        ttl_indexes = [index for index in self._state.indexes.values() if index.expire_after_seconds is not None]
+        if not ttl_indexes:
+            return
+        now = to_bson_value(datetime.now(timezone.utc))
+        for index in ttl_indexes:
+            field = index.keys[0][0]
+            expires_after = timedelta(seconds=index.expire_after_seconds)
+            for _id, document in list(self._state.documents.items()):
+                dates = [
+                    value for values in get_path_values(document, field)
+                    for value in (values if isinstance(values, list) else [values]) if isinstance(value, datetime)
+                ]
+                if dates and min(dates) + expires_after <= now: self._remove(_id)
+
+    def _duplicate_key_error(self, index: _IndexState, document: Dict[str, Any]) -> DuplicateKeyError:
+        key_value = {field: get_path_value(document, field) for field, _ in index.keys}
+        message = f"E11000 duplicate key error collection: {self.full_name} index: {index.name} dup key: {key_value}"
+        return DuplicateKeyError(message, DUPLICATE_KEY_ERROR_CODE, {
+            "code": DUPLICATE_KEY_ERROR_CODE,
+            "errmsg": message,
+            "keyPattern": {field: index_type for field, index_type in index.keys},
+            "keyValue": key_value
+        })
+
+    def _store(self, document: Dict[str, Any], previous_id: Any = None) -> None:
+        # checks every unique index before changing anything, so the failed write leaves no trace.
+        # The replaced document keeps its _id and its position in the natural order
+        unique_keys = []
+        for index in self._state.indexes.values():
+            if not index.unique:
+                continue
+            key = index.get_key(document)
+            if key is None:
+                continue
+            holder_id = index.entries.get(key)
+            if holder_id is not None and holder_id != previous_id:
+                raise self._duplicate_key_error(index, document)
+            unique_keys.append((index, key))
+        if previous_id is not None: self._unindex(self._state.documents[previous_id])
+        for index, key in unique_keys:
+            index.entries[key] = document["_id"]
+        self._state.documents[document["_id"]] = document
+        self._state.exists = True
+
+    def _unindex(self, document: Dict[str, Any]) -> None:
+        for index in self._state.indexes.values():
+            key = index.get_key(document) if index.unique else None
+            if key is not None and index.entries.get(key) == document["_id"]: del index.entries[key]
+
+    def _remove(self, _id: Any) -> Optional[Dict[str, Any]]:
+        document = self._state.documents.pop(_id, None)
+        if document is not None: self._unindex(document)
+        return document
+
+    def _replace_document(self, document: Dict[str, Any], new_document: Dict[str, Any]) -> Dict[str, Any]:
+        new_document = to_bson_value(new_document)
+        new_document = {"_id": document["_id"], **{key: value for key, value in new_document.items() if key != "_id"}}
+        self._store(new_document, previous_id=document["_id"])
+        return new_document
+
+    def _get_text_index(self) -> _IndexState:
+        for index in self._state.indexes.values():
+            if index.text_fields:
+                return index
+        raise OperationFailure("text index required for $text query", code=INDEX_NOT_FOUND_ERROR_CODE)
+
+    @staticmethod
+    def _get_text_score(index: _IndexState, document: Dict[str, Any], query_tokens: Iterable[str]) -> float:
+        score = 0.0
+        for field, weight in index.text_fields.items():
+            field_tokens = Counter(
+                token
+                for value in get_path_values(document, field)
+                for text in (value if isinstance(value, list) else [value]) if isinstance(text, str)
+                for token in tokenize(text)
+            )
+            if field_tokens:
+                # every matched term counts once, frequent terms of short fields count a bit more
+                total = sum(field_tokens.values())
+                score += weight * sum(1.0 + field_tokens[token] / total for token in query_tokens if token in field_tokens)
+        return score
+
+    def _plan(self, q_filter: Dict[str, Any]) -> Optional[_IndexState]:
+        # the index with the longest prefix of the filtered fields is chosen, unique one if there is a tie.
+        # Partial indexes are never chosen, the filter would have to imply their filter expression
+        if "$text" in q_filter:
+            return self._get_text_index()
+        filtered_fields = {key for key in q_filter if not key.startswith("$")}
+        best_index, best_rank = None, (0, False)
+        for index in self._state.indexes.values():
+            if index.text_fields or index.partial_filter_expression is not None:
+                continue
+            prefix_length = 0
+            for field, _ in index.keys:
+                if field not in filtered_fields:
+                    break
+                prefix_length += 1
+            rank = (prefix_length, index.unique)
+            if prefix_length and rank > best_rank:
+                best_index, best_rank = index, rank
+        return best_index
+
+    def _select(self, q_filter: Optional[Dict[str, Any]], sort: Optional[List[Tuple[str, Any]]] = None) -> List[Tuple[Dict[str, Any], float]]:
+        # returns the matching documents with their text scores, sorted if the sort is passed
+        q_filter = to_bson_value(q_filter or {})
+        self._purge_expired()
+        index = self._plan(q_filter)
+        if index is not None: index.accesses += 1
+        selected = []
+        text_query = q_filter.get("$text")
+        query_tokens = set(tokenize(text_query["$search"])) if text_query else set()
+        for document in self._state.documents.values():
+            if not matches_filter(document, q_filter):
+                continue
+            score = self._get_text_score(index, document, query_tokens) if text_query else 0.0
+            if text_query and not score:
+                continue
+            selected.append((document, score))
+        for key, direction in reversed(sort or []):
+            if isinstance(direction, dict):
+                # {"$meta": "textScore"} sorts by relevance, best first
+                selected.sort(key=lambda item: item[1], reverse=True)
+            else:
+                selected.sort(key=lambda item: get_sort_key(get_path_value(item[0], key)), reverse=direction == pymongo.DESCENDING)
+        return selected
+
+    def _find(
+            self,
+            q_filter: Dict[str, Any],
+            projection: Optional[Any],
+            skip: int,
+            limit: int,
+            sort: Optional[List[Tuple[str, Any]]],
+            max_time_ms: Optional[int]
+    ) -> List[Dict[str, Any]]:
+        self._round_trip("find", max_time_ms)
+        with self._state.lock:
+            selected = self._select(q_filter, sort)[skip:]
+            if limit: selected = selected[:abs(limit)]
+            return [apply_projection(document, projection, score) for document, score in selected]
+
+    def _explain(self, q_filter: Dict[str, Any]) -> Dict[str, Any]:
+        with self._state.lock:
+            index = self._plan(to_bson_value(q_filter))
+        if index is None:
+            winning_plan = {"stage": "COLLSCAN", "filter": q_filter, "direction": "forward"}
+        elif index.text_fields:
+            winning_plan = {"stage": "TEXT_MATCH", "inputStage": {"stage": "TEXT_OR", "inputStage": {"stage": "IXSCAN", "indexName": index.name}}}
+        else:
+            winning_plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": index.name, "keyPattern": dict(index.keys)}}
+        return {"queryPlanner": {"namespace": self.full_name, "parsedQuery": q_filter, "winningPlan": winning_plan}}
+
+    def _insert(self, document: Dict[str, Any]) -> Any:
+        if not isinstance(document, dict):
+            raise TypeError("document must be an instance of dict")
+        # the _id is added to the passed document, as pymongo does
+        if "_id" not in document: document["_id"] = bson.ObjectId()
+        self._store(to_bson_value(document))
+        return document["_id"]
+
+    def _update(
+            self,
+            q_filter: Dict[str, Any],
+            update: Dict[str, Any],
+            multi: bool = False,
+            upsert: bool = False,
+            replacement: bool = False,
+            sort: Optional[List[Tuple[str, Any]]] = None
+    ) -> Tuple[int, int, Any, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        # returns the numbers of matched and modified documents, the upserted _id, the first document before
+        # and after the write
+        _validate_update(update, replacement=replacement)
+        update = to_bson_value(update)
+        selected = self._select(q_filter, sort)
+        if not multi: selected = selected[:1]
+        if not selected:
+            if not upsert:
+                return 0, 0, None, None, None
+            document = get_upsert_document(to_bson_value(q_filter))
+            if replacement:
+                document = {**({"_id": document["_id"]} if "_id" in document else {}), **update}
+            else:
+                apply_update(document, update, is_insert=True)
+            document.setdefault("_id", bson.ObjectId())
+            document = {"_id": document.pop("_id"), **document}
+            self._store(document)
+            return 0, 0, document["_id"], None, document
+        modified = 0
+        first_before = first_after = None
+        for document, _ in selected:
+            if replacement:
+                new_document = copy.deepcopy(update)
+            else:
+                new_document = copy.deepcopy(document)
+                apply_update(new_document, update)
+            changed = new_document != document if not replacement else {**new_document, "_id": document["_id"]} != document
+            after = self._replace_document(document, new_document) if changed else document
+            modified += int(changed)
+            if first_before is None: first_before, first_after = document, after
+        return len(selected), modified, None, first_before, first_after
+
+    def _delete(self, q_filter: Dict[str, Any], multi: bool = False, sort: Optional[List[Tuple[str, Any]]] = None) -> List[Dict[str, Any]]:
+        selected = self._select(q_filter, sort)
+        if not multi: selected = selected[:1]
+        return [self._remove(document["_id"]) for document, _ in selected]
+
+    # ---- indexes ----
+
+    def create_index(self, keys: Union[str, List[Tuple[str, Any]]], **kwargs) -> str:
+        if isinstance(keys, str): keys = [(keys, pymongo.ASCENDING)]
+        keys = [tuple(key) for key in keys]
+        name = kwargs.pop("name", None) or "_".join(f"{field}_{index_type}" for field, index_type in keys)
+        options = {option_name: value for option_name, value in kwargs.items() if value is not None and value is not False}
+        self._round_trip("create_index")
+        with self._state.lock:
+            existing = self._state.indexes.get(name)
+            if existing is not None:
+                if existing.keys != keys or existing.options != options:
+                    raise OperationFailure(
+                        f"An existing index has the same name as the requested index: {name}",
+                        code=INDEX_OPTIONS_CONFLICT_ERROR_CODE
+                    )
+                return name
+            index = _IndexState(name=name, keys=keys, options=options)
+            if index.text_fields and any(other.text_fields for other in self._state.indexes.values()):
+                raise OperationFailure("Index already exists with different name", code=INDEX_OPTIONS_CONFLICT_ERROR_CODE)
+            if index.unique:
+                for document in self._state.documents.values():
+                    key = index.get_key(document)
+                    if key is None:
+                        continue
+                    if key in index.entries:
+                        raise self._duplicate_key_error(index, document)
+                    index.entries[key] = document["_id"]
+            self._state.indexes[name] = index
+            self._state.exists = True
+            return name
+
+    def create_indexes(self, indexes: List[Any]) -> List[str]:
+        return [self.create_index(list(index.document["key"].items()), **{
+            option_name: value for option_name, value in index.document.items() if option_name != "key"
+        }) for index in indexes]
+
+    def index_information(self) -> Dict[str, Dict[str, Any]]:
+        self._round_trip("index_information")
+        with self._state.lock:
+            return {name: index.get_info() for name, index in self._state.indexes.items()}
+
+    def list_indexes(self) -> Iterator[Dict[str, Any]]:
+        return iter([{"name": name, **info} for name, info in self.index_information().items()])
+
+    def drop_index(self, index_or_name: Union[str, List[Tuple[str, Any]]]) -> None:
+        self._round_trip("drop_index")
+        with self._state.lock:
+            name = index_or_name
+            if not isinstance(index_or_name, str):
+                name = next((index.name for index in self._state.indexes.values() if index.keys == [tuple(key) for key in index_or_name]), None)
+            if name == DEFAULT_ID_INDEX_NAME:
+                raise OperationFailure("cannot drop _id index", code=72)
+            if name not in self._state.indexes:
+                raise OperationFailure(f"index not found with name [{name}]", code=INDEX_NOT_FOUND_ERROR_CODE)
+            del self._state.indexes[name]
+
+    def drop_indexes(self) -> None:
+        with self._state.lock:
+            for name in list(self._state.indexes):
+                if name != DEFAULT_ID_INDEX_NAME: del self._state.indexes[name]
+
+    # ---- writes ----
+
+    def insert_one(self, document: Dict[str, Any], **kwargs) -> InsertOneResult:
+        self._round_trip("insert_one", self._get_max_time_ms(kwargs))
+        with self._state.lock:
+            self._purge_expired()
+            return InsertOneResult(self._insert(document), acknowledged=True)
+
+    def insert_many(self, documents: Iterable[Dict[str, Any]], ordered: bool = True, **kwargs) -> InsertManyResult:
+        documents = list(documents)
+        if not documents:
+            raise TypeError("documents must be a non-empty list")
+        result = self.bulk_write([pymongo.InsertOne(document) for document in documents], ordered=ordered)
+        return InsertManyResult([document["_id"] for document in documents][:result.inserted_count], acknowledged=True)
+
+    def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False, **kwargs) -> UpdateResult:
+        self._round_trip("replace_one", self._get_max_time_ms(kwargs))
+        with self._state.lock:
+            matched, modified, upserted_id, _, _ = self._update(filter, replacement, upsert=upsert, replacement=True)
+        return self._to_update_result(matched, modified, upserted_id)
+
+    def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, **kwargs) -> UpdateResult:
+        self._round_trip("update_one", self._get_max_time_ms(kwargs))
+        with self._state.lock:
+            matched, modified, upserted_id, _, _ = self._update(filter, update, upsert=upsert)
+        return self._to_update_result(matched, modified, upserted_id)
+
+    def update_many(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, **kwargs) -> UpdateResult:
+        self._round_trip("update_many", self._get_max_time_ms(kwargs))
+        with self._state.lock:
+            matched, modified, upserted_id, _, _ = self._update(filter, update, multi=True, upsert=upsert)
+        return self._to_update_result(matched, modified, upserted_id)
+
+    @staticmethod
+    def _to_update_result(matched: int, modified: int, upserted_id: Any) -> UpdateResult:
+        raw_result = {"n": matched or int(upserted_id is not None), "nModified": modified, "updatedExisting": bool(matched)}
+        if upserted_id is not None: raw_result["upserted"] = upserted_id
+        return UpdateResult(raw_result, acknowledged=True)
+
+    def delete_one(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        self._round_trip("delete_one", self._get_max_time_ms(kwargs))
+        with self._state.lock:
+            return DeleteResult({"n": len(self._delete(filter))}, acknowledged=True)
+
+    def delete_many(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        self._round_trip("delete_many", self._get_max_time_ms(kwargs))
+        with self._state.lock:
+            return DeleteResult({"n": len(self._delete(filter, multi=True))}, acknowledged=True)
+
+    def bulk_write(self, requests: List[Any], ordered: bool = True, **kwargs) -> BulkWriteResult:
+        recorder = _BulkRecorder()
+        for request in requests:
+            request._add_to_bulk(recorder)
+        if not recorder.operations:
+            raise InvalidOperation("No operations to execute")
+        self._round_trip("bulk_write", self._get_max_time_ms(kwargs))
+        result = {
+            "writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+            "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []
+        }
+        with self._state.lock:
+            self._purge_expired()
+            for position, (operation, params) in enumerate(recorder.operations):
+                try:
+                    if operation == "insert":
+                        self._insert(params["document"])
+                        result["nInserted"] += 1
+                    elif operation == "delete":
+                        result["nRemoved"] += len(self._delete(params["q_filter"], multi=params["multi"]))
+                    else:
+                        matched, modified, upserted_id, _, _ = self._update(
+                            params["q_filter"],
+                            params["replacement"] if operation == "replace" else params["update"],
+                            multi=params.get("multi", False),
+                            upsert=params["upsert"],
+                            replacement=operation == "replace"
+                        )
+                        result["nMatched"] += matched
+                        result["nModified"] += modified
+                        if upserted_id is not None:
+                            result["nUpserted"] += 1
+                            result["upserted"].append({"index": position, "_id": upserted_id})
+                except OperationFailure as e:
+                    result["writeErrors"].append({
+                        "index": position, "code": e.code, "errmsg": str(e),
+                        "op": params.get("document", params.get("q_filter")), **(e.details or {})
+                    })
+                    if ordered:
+                        break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, acknowledged=True)
+
+    # ---- reads ----
+
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection: Optional[Any] = None, **kwargs) -> InMemoryCursor:
+        sort = kwargs.get("sort")
+        return InMemoryCursor(
+            collection=self,
+            q_filter=filter,
+            projection=projection,
+            skip=kwargs.get("skip", 0),
+            limit=kwargs.get("limit", 0),
+            sort=[(sort, pymongo.ASCENDING)] if isinstance(sort, str) else sort,
+            max_time_ms=self._get_max_time_ms(kwargs)
+        )
+
+    def find_one(self, filter: Optional[Any] = None, *args, **kwargs) -> Optional[Dict[str, Any]]:
+        if filter is not None and not isinstance(filter, dict): filter = {"_id": filter}
+        projection = args[0] if args else kwargs.pop("projection", None)
+        self._round_trip("find_one", self._get_max_time_ms(kwargs))
+        with self._state.lock:
+            selected = self._select(filter, kwargs.get("sort"))
+            return apply_projection(selected[0][0], projection, selected[0][1]) if selected else None
+
+    def count_documents(self, filter: Dict[str, Any], **kwargs) -> int:
+        self._round_trip("count_documents", self._get_max_time_ms(kwargs))
+        with self._state.lock:
+            selected = self._select(filter)[kwargs.get("skip", 0):]
+            return min(len(selected), kwargs["limit"]) if kwargs.get("limit") else len(selected)
+
+    def estimated_document_count(self, **kwargs) -> int:
+        self._round_trip("estimated_document_count", self._get_max_time_ms(kwargs))
+        with self._state.lock:
+            self._purge_expired()
+            return len(self._state.documents)
+
+    def distinct(self, key: str, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Any]:
+        self._round_trip("distinct", self._get_max_time_ms(kwargs))
+        with self._state.lock:
+            values = [
+                value
+                for document, _ in self._select(filter)
+                for field_values in get_path_values(document, key)
+                for value in (field_values if isinstance(field_values, list) else [field_values])
+            ]
+        return _accumulate("$addToSet", copy.deepcopy(values))
+
+    # ---- atomic read-modify-write ----
+
+    def find_one_and_update(
+            self,
+            filter: Dict[str, Any],
+            update: Dict[str, Any],
+            projection: Optional[Any] = None,
+            sort: Optional[List[Tuple[str, Any]]] = None,
+            upsert: bool = False,
+            return_document: bool = pymongo.ReturnDocument.BEFORE,
+            **kwargs
+    ) -> Optional[Dict[str, Any]]:
+        self._round_trip("find_one_and_update", self._get_max_time_ms(kwargs))
+        with self._state.lock:
+            _, _, _, before, after = self._update(filter, update, upsert=upsert, sort=sort)
+        document = after if return_document == pymongo.ReturnDocument.AFTER else before
+        return apply_projection(document, projection) if document is not None else None
+
+    def find_one_and_replace(
+            self,
+            filter: Dict[str, Any],
+            replacement: Dict[str, Any],
+            projection: Optional[Any] = None,
+            sort: Optional[List[Tuple[str, Any]]] = None,
+            upsert: bool = False,
+            return_document: bool = pymongo.ReturnDocument.BEFORE,
+            **kwargs
+    ) -> Optional[Dict[str, Any]]:
+        self._round_trip("find_one_and_replace", self._get_max_time_ms(kwargs))
+        with self._state.lock:
+            _, _, _, before, after = self._update(filter, replacement, upsert=upsert, replacement=True, sort=sort)
+        document = after if return_document == pymongo.ReturnDocument.AFTER else before
+        return apply_projection(document, projection) if document is not None else None
+
+    def find_one_and_delete(
+            self,
+            filter: Dict[str, Any],
+            projection: Optional[Any] = None,
+            sort: Optional[List[Tuple[str, Any]]] = None,
+            **kwargs
+    ) -> Optional[Dict[str, Any]]:
+        self._round_trip("find_one_and_delete", self._get_max_time_ms(kwargs))
+        with self._state.lock:
+            deleted = self._delete(filter, sort=sort)
+        return apply_projection(deleted[0], projection) if deleted else None
+
+    # ---- aggregation ----
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> Iterator[Dict[str, Any]]:
+        """
+        Runs the aggregation pipeline of $match, $group, $sort, $skip, $limit, $project, $count and $indexStats stages
+
+        :param List[Dict[str, Any]] pipeline: aggregation pipeline
+        :raises OperationFailure: if the pipeline uses an unsupported stage or operator
+        :return Iterator[Dict[str, Any]]: results iterator
+        """
+        self._round_trip("aggregate", self._get_max_time_ms(kwargs))
+        with self._state.lock:
+            if pipeline and "$indexStats" in pipeline[0]:
+                documents = [
+                    {"name": index.name, "key": dict(index.keys), "accesses": {"ops": index.accesses, "since": index.since}}
+                    for index in self._state.indexes.values()
+                ]
+                pipeline = pipeline[1:]
+            elif pipeline and "$match" in pipeline[0]:
+                # the leading $match is planned as a query, so it uses the indexes
+                documents = [copy.deepcopy(document) for document, _ in self._select(pipeline[0]["$match"])]
+                pipeline = pipeline[1:]
+            else:
+                documents = [copy.deepcopy(document) for document, _ in self._select({})]
+        for stage in pipeline:
+            (stage_name, stage_spec), = stage.items()
+            if stage_name == "$match":
+                stage_spec = to_bson_value(stage_spec)
+                documents = [document for document in documents if matches_filter(document, stage_spec)]
+            elif stage_name == "$group":
+                documents = self._group(stage_spec, documents)
+            elif stage_name == "$sort":
+                for key, direction in reversed(list(stage_spec.items())):
+                    documents.sort(key=lambda document: get_sort_key(get_path_value(document, key)), reverse=direction == pymongo.DESCENDING)
+            elif stage_name == "$skip":
+                documents = documents[stage_spec:]
+            elif stage_name == "$limit":
+                documents = documents[:stage_spec]
+            elif stage_name == "$project":
+                computed = {field: value for field, value in stage_spec.items() if not isinstance(value, (bool, int))}
+                flags = {field: value for field, value in stage_spec.items() if field not in computed}
+                documents = [
+                    {**apply_projection(document, flags or {"_id": True}), **{
+                        field: evaluate_expression(expression, document) for field, expression in computed.items()
+                    }}
+                    for document in documents
+                ]
+            elif stage_name == "$count":
+                documents = [{stage_spec: len(documents)}] if documents else []
+            else:
+                raise OperationFailure(f"Unrecognized pipeline stage name: '{stage_name}'", code=40324)
+        return iter(documents)
+
+    @staticmethod
+    def _group(stage_spec: Dict[str, Any], documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        groups: Dict[Any, Tuple[Any, List[Dict[str, Any]]]] = {}
+        for document in documents:
+            group_id = evaluate_expression(stage_spec["_id"], document)
+            groups.setdefault(_to_hashable(group_id), (group_id, []))[1].append(document)
+        grouped = []
+        for group_id, group_documents in groups.values():
+            group = {"_id": group_id}
+            for field, accumulator in stage_spec.items():
+                if field == "_id":
+                    continue
+                (operator, expression), = accumulator.items()
+                group[field] = _accumulate(operator, [evaluate_expression(expression, document) for document in group_documents])
+            grouped.append(group)
+        return grouped
+
+    # ---- collection ----
+
+    def watch(self, *args, **kwargs) -> Any:
+        raise OperationFailure(
+            "The $changeStream stage is only supported on replica sets", code=CHANGE_STREAMS_NOT_SUPPORTED_ERROR_CODE
+        )
+
+    def drop(self) -> None:
+        self.database.drop_collection(self.name)
+
+
+class InMemoryDatabase:
+    """
+    In-process stand-in of pymongo Database holding in-memory collections
+    """
+
+    def __init__(self, client: "InMemoryMongoClient", name: str):
+        self.client: "InMemoryMongoClient" = client
+        self.name: str = name
+        self._collection_states: Dict[str, _CollectionState] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name})"
+
+    def __getitem__(self, name: str) -> InMemoryCollection:
+        with self._lock:
+            state = self._collection_states.setdefault(name, _CollectionState())
+        return InMemoryCollection(database=self, name=name, state=state)
+
+    def get_collection(self, name: str, **collection_options) -> InMemoryCollection:
+        collection = self[name]
+        return collection.with_options(**collection_options) if collection_options else collection
+
+    def list_collection_names(self, **kwargs) -> List[str]:
+        with self._lock:
+            return [name for name, state in self._collection_states.items() if state.exists]
+
+    def drop_collection(self, name: str) -> None:
+        with self._lock:
+            self._collection_states.pop(name, None)
+
+    def watch(self, *args, **kwargs) -> Any:
+        raise OperationFailure(
+            "The $changeStream stage is only supported on replica sets", code=CHANGE_STREAMS_NOT_SUPPORTED_ERROR_CODE
+        )
+
+
+class InMemoryMongoClient:
+    """
+    In-process stand-in of pymongo MongoClient for the tests and the local development without MongoDB server.
+    Keeps the databases in memory for the lifetime of the client. Every operation takes 'latency_ms'
+    (or the latency set for the operation name, e.g. "find_one" or "bulk_write"), so the timeouts, caching
+    and coalescing can be tested deterministically
+    """
+
+    def __init__(self, latency_ms: float = 0.0, operation_latency_ms: Optional[Dict[str, float]] = None):
+        self.latency_ms: float = latency_ms
+        self.operation_latency_ms: Dict[str, float] = dict(operation_latency_ms or {})
+        self._databases: Dict[str, InMemoryDatabase] = {}
+        self._lock = threading.Lock()
+        # number of the operations sent per operation name
+        self.operation_counts: Counter = Counter()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(latency_ms={self.latency_ms})"
+
+    def __getitem__(self, name: str) -> InMemoryDatabase:
+        with self._lock:
+            if name not in self._databases: self._databases[name] = InMemoryDatabase(client=self, name=name)
+            return self._databases[name]
+
+    def get_database(self, name: str, **kwargs) -> InMemoryDatabase:
+        return self[name]
+
+    def list_database_names(self) -> List[str]:
+        with self._lock:
+            return [name for name, database in self._databases.items() if database.list_collection_names()]
+
+    def drop_database(self, name: str) -> None:
+        with self._lock:
+            self._databases.pop(name, None)
+
+    def close(self) -> None:
+        pass
+
+    def set_latency(self, latency_ms: float, operation: Optional[str] = None) -> None:
+        """
+        Sets the latency of every operation or of the single operation
+
+        :param float latency_ms: latency in milliseconds
+        :param Optional[str] operation: pymongo method name, e.g. "find_one", sets the latency of all
+                                        the operations without own latency if None
+        :return None:
+        """
+        if operation is None:
+            self.latency_ms = latency_ms
+        else:
+            self.operation_latency_ms[operation] = latency_ms
+
+    def simulate_round_trip(self, operation: str, max_time_ms: Optional[int] = None) -> None:
+        """
+        Waits for the latency of the operation. Fails as the server would if the latency exceeds the server-side
+        time limit of the operation, or as the client would if it exceeds the pymongo.timeout() deadline
+
+        :param str operation: pymongo method name
+        :param Optional[int] max_time_ms: server-side time limit of the operation (maxTimeMS)
+        :raises ExecutionTimeout: if the latency exceeds the time limit of the operation
+        :raises NetworkTimeout: if the latency exceeds the remaining time of pymongo.timeout() block
+        :return None:
+        """
+        with self._lock:
+            self.operation_counts[operation] += 1
+        latency_seconds = self.operation_latency_ms.get(operation, self.latency_ms) / 1000
+        # pymongo keeps the deadline of the enclosing pymongo.timeout() block in a context variable
+        remaining_seconds = get_timeout_remaining() if get_timeout_remaining else None
+        if remaining_seconds is not None and latency_seconds > remaining_seconds:
+            time.sleep(max(remaining_seconds, 0.0))
+            raise NetworkTimeout(f"{operation} timed out after {max(remaining_seconds, 0.0) * 1000:.0f} ms")
+        if max_time_ms and latency_seconds > max_time_ms / 1000:
+            time.sleep(max_time_ms / 1000)
+            raise ExecutionTimeout("operation exceeded time limit", code=EXCEEDED_TIME_LIMIT_ERROR_CODE)
+        if latency_seconds > 0: time.sleep(latency_seconds)
+
+
+def get_in_memory_mongo_client(host: str, port: int, latency_ms: float = 0.0) -> InMemoryMongoClient:
+    """
+    Returns the in-memory client of the given address, creating it on the first call, so all the adapters
+    configured with the same address share the same databases, as they would share the server
+
+    :param str host: host of the server being replaced
+    :param int port: port of the server being replaced
+    :param float latency_ms: latency of every operation, applied when the client is created
+    :return InMemoryMongoClient: in-memory client
+    """
+    with _in_memory_clients_lock:
+        address = (host, int(port))
+        if address not in _in_memory_clients:
+            _in_memory_clients[address] = InMemoryMongoClient(latency_ms=latency_ms)
+        return _in_memory_clients[address]
@@ -1,6 +1,6 @@
 # backend/models.py
 
-from typing import Optional
+from typing import Optional, List
 from pydantic import BaseModel, Field, EmailStr
 
 
@@ -45,6 +45,39 @@ class Token(BaseModel):
     expires_at: Optional[str] = Field(None, example="2023-03-30T13:22:01.366168+06:00")
     expires_in: Optional[int] = Field(None, example=21600)
     updated_at: Optional[str] = Field(None, example="2023-03-29T07:22:01.366168+00:00")
+    refresh_token: Optional[str] = Field(None, example="n3Qm1yH0c4q2X3e6s1bO7e0r9lN2i5gU8cK4t3Yz6wA")
+    refresh_token_expires_at: Optional[str] = Field(None, example="2023-04-28T07:22:01.366168+00:00")
+
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str = Field(..., min_length=1, max_length=256, example="n3Qm1yH0c4q2X3e6s1bO7e0r9lN2i5gU8cK4t3Yz6wA")
+
+
+class BookFile(BaseModel):
+    file_id: str = Field(..., example="5f0c1c8f2b6e4a7d9c3e1f2a4b6d8e0c")
+    book_id: str = Field(..., example="936d4b41ec874007af150bbac8e714c3")
+    filename: str = Field(..., example="cover.jpg")
+    content_type: str = Field(..., example="image/jpeg")
+    length: int = Field(..., example=48213)
+    # hex SHA-256 of the content, served as ETag
+    etag: str = Field(..., example="9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08")
+    uploaded_at: str = Field(..., example="2023-03-29T07:22:01.366168+00:00")
+
+
+class AuthorStats(BaseModel):
+    author: Optional[str] = Field(None, example="Sir Arthur Conan Doyle")
+    total: int = Field(..., example=12)
+    available: int = Field(..., example=9)
+
+
+class BookShelfStats(BaseModel):
+    total: int = Field(..., example=1250)
+    available: int = Field(..., example=1010)
+    checked_out: int = Field(..., example=240)
+    # authors with the most books first
+    by_author: List[AuthorStats] = Field(...)
+    # time of the last recount of the whole book shelf, None until the first one
+    reconciled_at: Optional[str] = Field(None, example="2023-03-29T07:22:01.366168+00:00")
 
 
 class TokenData(BaseModel):
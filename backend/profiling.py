@@ -0,0 +1,240 @@
+# backend/profiling.py
+
+import re
+import sys
+import hmac
+import time
+import random
+import threading
+from pathlib import Path
+from datetime import datetime
+from collections import Counter
+from contextvars import Context, ContextVar
+from typing import Any, Optional, Dict, List, Tuple, AnyStr
+
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+
+from utils.logger_setup import PROJECT_FOLDER_PATH
+
+
+PROFILE_REQUEST_HEADER = b"x-profile-request"
+DEFAULT_PROFILES_FOLDER_PATH = Path(PROJECT_FOLDER_PATH, "logs", "profiles")
+# (file name, function name) of the frames the event loop and the thread pool workers wait for the work in
+IDLE_FUNCTIONS = {("selectors.py", "select"), ("queue.py", "get")}
+
+# profiling session of the current request, copied along with the request context into the thread pool workers
+PROFILING_SESSION: ContextVar[Optional[Counter]] = ContextVar("profiling_session", default=None)
+# (module, function, local variable) of the thread pool worker frame running the functions by context.run()
+# of the context copied from the caller, checked against anyio==3.6.2 (see test_thread_pool_worker_context_is_found)
+WORKER_CONTEXT_FRAME = ("anyio._backends._asyncio", "run", "context")
+
+
+class StackSampler:
+    """
+    Low-overhead sampling profiler of the requests.
+    While at least one profiling session is open, the background thread takes the stacks of the threads running
+    the profiled requests every 'interval_ms' milliseconds and adds them to the session of their request.
+    The request is run by the event loop thread the session was opened from, while its sync endpoints and
+    dependencies are run by the thread pool workers within the copy of the request context, so the workers are
+    matched to the session by the context variable set for the request. The event loop samples waiting for
+    the events are dropped, so are the stacks of the idle workers and of the other threads.
+    The sampler thread sleeps on the condition while no session is open
+    """
+
+    def __init__(self, interval_ms: float = 5.0):
+        self.interval_ms: float = interval_ms
+        self._condition = threading.Condition()
+        # id of the session -> (session, ident of the event loop thread running the request)
+        self._sessions: Dict[int, Tuple[Counter, int]] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(interval_ms={self.interval_ms})"
+
+    def start_session(self) -> Counter:
+        """
+        Opens a new profiling session of the request run by the calling thread, starts the sampler thread
+        on first use. The caller sets the session to PROFILING_SESSION context variable of the request,
+        so the thread pool workers running the sync code of the request are sampled as well
+
+        :return Counter: folded stacks counter of the session filled in by the sampler
+        """
+        session = Counter()
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+            self._sessions[id(session)] = (session, threading.get_ident())
+            self._condition.notify()
+        return session
+
+    def stop_session(self, session: Counter) -> Counter:
+        """
+        Closes the profiling session
+
+        :param Counter session: session returned by start_session()
+        :return Counter: folded stacks counter of the session
+        """
+        with self._condition:
+            self._sessions.pop(id(session), None)
+        return session
+
+    @staticmethod
+    def _fold_stack(frame: Any, thread_name: str) -> str:
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+            frame = frame.f_back
+        frames.append(thread_name)
+        return ";".join(reversed(frames))
+
+    @staticmethod
+    def _get_context_session(frame: Any) -> Optional[Counter]:
+        # only the worker frame itself is looked into, it is suspended in context.run() while the function runs
+        module_name, function_name, variable_name = WORKER_CONTEXT_FRAME
+        child_frame = None
+        while frame is not None:
+            if frame.f_code.co_name == function_name and frame.f_globals.get("__name__") == module_name:
+                context = frame.f_locals.get(variable_name)
+                if isinstance(context, Context):
+                    # idle worker waiting for the next function still keeps the context of the previous one
+                    if child_frame is None or StackSampler._is_idle(child_frame):
+                        return None
+                    return context.get(PROFILING_SESSION)
+            child_frame, frame = frame, frame.f_back
+
+    @staticmethod
+    def _is_idle(frame: Any) -> bool:
+        return (Path(frame.f_code.co_filename).name, frame.f_code.co_name) in IDLE_FUNCTIONS
+
+    def _run(self) -> None:
+        sampler_thread_id = threading.get_ident()
+        while True:
+            with self._condition:
+                while not self._sessions:
+                    self._condition.wait()
+                # the requests served concurrently by the same event loop share its samples
+                sessions_by_thread_id: Dict[int, List[Counter]] = {}
+                for session, thread_id in self._sessions.values():
+                    sessions_by_thread_id.setdefault(thread_id, []).append(session)
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            folded_stacks: List[Tuple[List[Counter], str]] = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler_thread_id:
+                    continue
+                sessions = sessions_by_thread_id.get(thread_id)
+                if sessions is not None:
+                    # the event loop idles in the selector while the request waits, e.g. for the worker thread
+                    if self._is_idle(frame):
+                        continue
+                else:
+                    session = self._get_context_session(frame)
+                    if session is None:
+                        continue
+                    sessions = [session]
+                folded_stacks.append((sessions, self._fold_stack(frame, thread_names.get(thread_id, str(thread_id)))))
+            with self._condition:
+                for sessions, folded_stack in folded_stacks:
+                    for session in sessions:
+                        # the session might have been closed in between
+                        if id(session) in self._sessions: session[folded_stack] += 1
+            time.sleep(self.interval_ms / 1000)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling the sampled requests.
+    Profiles the configured fraction of requests and every request carrying X-Profile-Request header with
+    the admin token. The folded stacks of every profiled request (flamegraph.pl / speedscope compatible) are saved
+    to the profiles folder into the file tagged with the time, method, route and latency of the request.
+    Not sampled requests pay only for one random number
+    """
+
+    def __init__(
+            self,
+            app: Any,
+            sample_rate: float = 0.01,
+            admin_token: Optional[AnyStr] = None,
+            profiles_folder_path: Path = DEFAULT_PROFILES_FOLDER_PATH,
+            interval_ms: float = 5.0,
+            logger: Optional[Any] = None
+    ):
+        self.app = app
+        self.sample_rate: float = sample_rate
+        self.admin_token: Optional[bytes] = admin_token.encode() if isinstance(admin_token, str) else admin_token
+        self.profiles_folder_path: Path = Path(profiles_folder_path)
+        self.logger: Optional[Any] = logger
+        self.sampler = StackSampler(interval_ms=interval_ms)
+        self.profiles_folder_path.mkdir(parents=True, exist_ok=True)
+
+    def _is_sampled(self, scope: Dict[str, Any]) -> bool:
+        if self.admin_token:
+            for header_name, header_value in scope.get("headers", ()):
+                if header_name == PROFILE_REQUEST_HEADER:
+                    return hmac.compare_digest(header_value, self.admin_token)
+        return random.random() < self.sample_rate
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or not self._is_sampled(scope):
+            await self.app(scope, receive, send)
+            return
+        status_code = 0
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start": status_code = message["status"]
+            await send(message)
+
+        session = self.sampler.start_session()
+        session_token = PROFILING_SESSION.set(session)
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            latency_ms = (time.perf_counter() - started_at) * 1000
+            self.sampler.stop_session(session)
+            PROFILING_SESSION.reset(session_token)
+            await run_in_threadpool(self._save_profile, scope, status_code, latency_ms, session)
+
+    def _save_profile(self, scope: Dict[str, Any], status_code: int, latency_ms: float, session: Counter) -> None:
+        # router stores the matched endpoint in the scope, fall back to the raw path for unmatched requests
+        endpoint = scope.get("endpoint")
+        route = getattr(endpoint, "__name__", None) or scope.get("path", "")
+        route = re.sub(r"[^A-Za-z0-9_.-]+", "_", route).strip("_") or "root"
+        profile_path = Path(
+            self.profiles_folder_path,
+            f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{scope['method']}_{route}_{status_code}_{latency_ms:.0f}ms.folded"
+        )
+        with open(profile_path, "w", encoding="utf-8") as profile_file:
+            for folded_stack, samples in session.most_common():
+                profile_file.write(f"{folded_stack} {samples}\n")
+        if self.logger: self.logger.debug(
+            f"Saved profile of {scope['method']} {scope.get('path')} ({latency_ms:.1f} ms, "
+            f"{sum(session.values())} samples) to {profile_path}"
+        )
+
+
+def init_profiling(app: FastAPI, config: Dict[str, Any], logger: Optional[Any] = None) -> None:
+    """
+    Adds the profiling middleware to the application if 'PROFILING_ENABLED' config value is set.
+    Nothing is added otherwise, so disabled profiling costs nothing at all
+
+    :param FastAPI app: application instance
+    :param Dict[str, Any] config: config extracted from .env file
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :return None:
+    """
+    if (config.get("PROFILING_ENABLED") or "false").lower() != "true":
+        return
+    app.add_middleware(
+        ProfilingMiddleware,
+        sample_rate=float(config.get("PROFILING_SAMPLE_RATE") or 0.01),
+        admin_token=config.get("PROFILING_ADMIN_TOKEN") or None,
+        profiles_folder_path=Path(config.get("PROFILING_FOLDER_PATH") or DEFAULT_PROFILES_FOLDER_PATH),
+        interval_ms=float(config.get("PROFILING_INTERVAL_MS") or 5.0),
+        logger=logger
+    )
+    if logger: logger.debug("Request profiling is enabled")
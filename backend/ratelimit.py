@@ -0,0 +1,291 @@
+# backend/ratelimit.py
+
+import math
+import time
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Optional, Dict, List, Tuple
+
+from jose import JWTError
+from fastapi import FastAPI, status
+from fastapi.concurrency import run_in_threadpool
+
+from .security import decode_jwt_token
+
+
+SUPPORTED_RATE_LIMIT_STORE_BACKENDS = ("memory", "redis")
+
+# expensive endpoints (bcrypt hashing and verification) limited by the separate stricter per-IP bucket
+AUTH_ROUTES = frozenset((("POST", "/token"), ("POST", "/user/signup")))
+
+
+class RateLimit:
+    """
+    Token bucket limit: the bucket holds up to 'burst' tokens and is refilled by 'per_second' tokens every second,
+    every request takes a single token and is rejected if the bucket is empty
+    """
+
+    def __init__(self, name: str, per_second: float, burst: float):
+        self.name: str = name
+        self.per_second: float = per_second
+        self.burst: float = burst
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name}, per_second={self.per_second}, burst={self.burst})"
+
+
+class RateLimitStore(ABC):
+    """
+    Abstract store of the token buckets, shared by all the service workers if the store is shared
+    """
+
+    # True if consume() performs blocking I/O and must not be called from the event loop thread
+    blocking: bool = False
+
+    @abstractmethod
+    def consume(self, key: str, rate_limit: RateLimit, cost: float = 1.0) -> Tuple[bool, float]:
+        """
+        Takes the tokens from the bucket if there are enough of them
+
+        :param str key: bucket key, e.g. 'ip:127.0.0.1'
+        :param RateLimit rate_limit: limit of the bucket
+        :param float cost: number of tokens to take
+        :return Tuple[bool, float]: True if the tokens are taken and the number of seconds to wait
+                                    until enough tokens are refilled if not
+        """
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """
+    Rate limit store keeping the buckets of a single process.
+    Buckets are kept in the order of their last use, and every call evicts the least recently used buckets
+    which are full again (idle bucket is equivalent to the absent one), so the idle buckets never pile up,
+    while the cost of every call stays O(1) amortized
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> [tokens, last update time, time when the bucket is full again]
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def consume(self, key: str, rate_limit: RateLimit, cost: float = 1.0) -> Tuple[bool, float]:
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._buckets.get(key)
+            tokens = rate_limit.burst
+            if bucket is not None: tokens = min(rate_limit.burst, bucket[0] + (now - bucket[1]) * rate_limit.per_second)
+            allowed = tokens >= cost
+            retry_after_seconds = 0.0
+            if allowed:
+                tokens -= cost
+            else:
+                retry_after_seconds = (cost - tokens) / rate_limit.per_second
+            self._buckets[key] = [tokens, now, now + (rate_limit.burst - tokens) / rate_limit.per_second]
+            self._buckets.move_to_end(key)
+            self._evict_idle_buckets(now)
+        return allowed, retry_after_seconds
+
+    def _evict_idle_buckets(self, now: float) -> None:
+        while self._buckets:
+            _, bucket = next(iter(self._buckets.items()))
+            if bucket[2] > now:
+                return
+            self._buckets.popitem(last=False)
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """
+    Rate limit store keeping the buckets in Redis (or any server speaking Redis protocol with Lua scripting),
+    so the limits hold across all the service workers. The bucket is refilled and consumed atomically
+    by the server-side script using the server clock (requires Redis 5+ replicating the script effects),
+    idle buckets are expired by the server
+    """
+
+    blocking = True
+
+    # KEYS[1] - bucket key, ARGV - refill rate per second, burst, cost
+    TOKEN_BUCKET_SCRIPT = """
+        local rate = tonumber(ARGV[1])
+        local burst = tonumber(ARGV[2])
+        local cost = tonumber(ARGV[3])
+        local time = redis.call("TIME")
+        local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+        local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+        local tokens = burst
+        if bucket[1] then
+            tokens = math.min(burst, tonumber(bucket[1]) + math.max(0, now - tonumber(bucket[2])) * rate)
+        end
+        local allowed = 0
+        local retry_after = 0
+        if tokens >= cost then
+            tokens = tokens - cost
+            allowed = 1
+        else
+            retry_after = (cost - tokens) / rate
+        end
+        redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated_at", tostring(now))
+        redis.call("PEXPIRE", KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+        return {allowed, tostring(retry_after)}
+    """
+
+    def __init__(self, redis_client: Any, key_prefix: str = "rate_limit:"):
+        self.redis_client = redis_client
+        self.key_prefix: str = key_prefix
+        self._script = redis_client.register_script(self.TOKEN_BUCKET_SCRIPT)
+
+    def consume(self, key: str, rate_limit: RateLimit, cost: float = 1.0) -> Tuple[bool, float]:
+        allowed, retry_after_seconds = self._script(
+            keys=[f"{self.key_prefix}{key}"],
+            args=[rate_limit.per_second, rate_limit.burst, cost]
+        )
+        return bool(allowed), float(retry_after_seconds)
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware limiting the request rate per client IP and per user (the 'sub' claim of valid JWT).
+    Auth routes are additionally limited by the stricter per-IP bucket. Requests over any of the limits are
+    rejected with 429 and Retry-After header before reaching the endpoints
+    """
+
+    def __init__(
+            self,
+            app: Any,
+            store: RateLimitStore,
+            ip_limit: Optional[RateLimit] = None,
+            user_limit: Optional[RateLimit] = None,
+            auth_ip_limit: Optional[RateLimit] = None,
+            logger: Optional[Any] = None
+    ):
+        self.app = app
+        self.store: RateLimitStore = store
+        self.ip_limit: Optional[RateLimit] = ip_limit
+        self.user_limit: Optional[RateLimit] = user_limit
+        self.auth_ip_limit: Optional[RateLimit] = auth_ip_limit
+        self.logger: Optional[Any] = logger
+
+    @staticmethod
+    def _get_username(scope: Dict[str, Any]) -> Optional[str]:
+        for header_name, header_value in scope.get("headers", ()):
+            if header_name == b"authorization":
+                scheme, _, token = header_value.decode("latin-1").partition(" ")
+                if scheme.lower() != "bearer" or not token:
+                    return None
+                # signature is verified, so nobody can spend the tokens of another user
+                try:
+                    return decode_jwt_token(encoded_token=token).get("sub")
+                except JWTError:
+                    return None
+        return None
+
+    def _get_buckets(self, scope: Dict[str, Any]) -> List[Tuple[str, RateLimit]]:
+        client_host = scope["client"][0] if scope.get("client") else "unknown"
+        buckets = []
+        if self.auth_ip_limit and (scope["method"], scope["path"]) in AUTH_ROUTES:
+            buckets.append((f"auth_ip:{client_host}", self.auth_ip_limit))
+        if self.ip_limit:
+            buckets.append((f"ip:{client_host}", self.ip_limit))
+        if self.user_limit:
+            username = self._get_username(scope)
+            if username: buckets.append((f"user:{username}", self.user_limit))
+        return buckets
+
+    def _consume(self, buckets: List[Tuple[str, RateLimit]]) -> Tuple[Optional[str], float]:
+        for key, rate_limit in buckets:
+            allowed, retry_after_seconds = self.store.consume(key=key, rate_limit=rate_limit)
+            if not allowed:
+                return key, retry_after_seconds
+        return None, 0.0
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        buckets = self._get_buckets(scope)
+        if self.store.blocking:
+            exhausted_key, retry_after_seconds = await run_in_threadpool(self._consume, buckets)
+        else:
+            exhausted_key, retry_after_seconds = self._consume(buckets)
+        if exhausted_key is None:
+            await self.app(scope, receive, send)
+            return
+        if self.logger: self.logger.warning(
+            f"Rejected {scope['method']} {scope['path']} request: rate limit of {exhausted_key} is exceeded"
+        )
+        body = b'{"detail": "Too many requests, please retry later"}'
+        await send({
+            "type": "http.response.start",
+            "status": status.HTTP_429_TOO_MANY_REQUESTS,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(math.ceil(retry_after_seconds), 1)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def init_rate_limit_store(config: Dict[str, Any]) -> RateLimitStore:
+    """
+    Creates the rate limit store selected by the 'RATE_LIMIT_STORE_BACKEND' config value ('memory' by default
+    or 'redis' to share the limits across the service workers)
+
+    :param Dict[str, Any] config: config extracted from .env file
+    :raises ValueError: if unsupported store backend is configured
+    :return RateLimitStore: rate limit store instance
+    """
+    backend = (config.get("RATE_LIMIT_STORE_BACKEND") or "memory").lower()
+    if backend not in SUPPORTED_RATE_LIMIT_STORE_BACKENDS:
+        raise ValueError(
+            f"Unsupported rate limit store backend: {backend}, expected one of: {', '.join(SUPPORTED_RATE_LIMIT_STORE_BACKENDS)}"
+        )
+    if backend == "memory":
+        return InMemoryRateLimitStore()
+    import redis
+    return RedisRateLimitStore(
+        redis_client=redis.Redis.from_url(config.get("RATE_LIMIT_REDIS_URL") or "redis://localhost:6379/0"),
+        key_prefix=config.get("RATE_LIMIT_REDIS_KEY_PREFIX") or "rate_limit:"
+    )
+
+
+def init_rate_limiting(app: FastAPI, config: Dict[str, Any], logger: Optional[Any] = None) -> Optional[RateLimitStore]:
+    """
+    Adds the rate limit middleware to the application if 'RATE_LIMIT_ENABLED' config value is set.
+    Every limit is configured by RATE_LIMIT_<IP|USER|AUTH_IP>_PER_SECOND and RATE_LIMIT_<IP|USER|AUTH_IP>_BURST
+    config values, the limit is turned off if its rate is not set
+
+    :param FastAPI app: application instance
+    :param Dict[str, Any] config: config extracted from .env file
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :return Optional[RateLimitStore]: rate limit store or None if rate limiting is disabled
+    """
+    if (config.get("RATE_LIMIT_ENABLED") or "false").lower() != "true":
+        return None
+
+    def get_rate_limit(name: str) -> Optional[RateLimit]:
+        per_second = config.get(f"RATE_LIMIT_{name.upper()}_PER_SECOND")
+        if not per_second:
+            return None
+        return RateLimit(
+            name=name,
+            per_second=float(per_second),
+            burst=float(config.get(f"RATE_LIMIT_{name.upper()}_BURST") or max(float(per_second), 1.0))
+        )
+
+    store = init_rate_limit_store(config=config)
+    rate_limits = {name: get_rate_limit(name) for name in ("ip", "user", "auth_ip")}
+    app.add_middleware(
+        RateLimitMiddleware,
+        store=store,
+        ip_limit=rate_limits["ip"],
+        user_limit=rate_limits["user"],
+        auth_ip_limit=rate_limits["auth_ip"],
+        logger=logger
+    )
+    if logger: logger.debug(f"Rate limiting is enabled: {store.__class__.__name__}, {list(rate_limits.values())}")
+    return store
@@ -0,0 +1,290 @@
+# backend/refresh_tokens.py
+
+import time
+import secrets
+import hashlib
+import threading
+from uuid import uuid4
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Optional, Dict, Set, Tuple
+
+from .database import MongoAdapter, QueryOptions, get_slow_query_params, get_mongo_client_params
+from .resilience import get_resilience_params
+from .indexes import IndexSpec
+
+
+class InvalidRefreshTokenError(ValueError):
+    """
+    Raised when the refresh token is unknown, expired, revoked or already used
+    """
+
+
+class RefreshTokenStore(ABC):
+    """
+    Storage of the long-lived refresh tokens exchanged for new access tokens without password verification.
+    Only SHA-256 hashes of the tokens are stored: the tokens are 256-bit random values, so unlike passwords they
+    cannot be brute-forced and need no slow hashing, while the leaked storage does not leak usable tokens.
+    Every refresh token is single use: the refresh rotates it to the new token of the same family, and
+    presenting the already used token again (i.e. the stolen token is replayed) revokes the whole family
+    """
+
+    def __init__(self, ttl_seconds: int = 2592000, logger: Optional[Any] = None):
+        self.ttl_seconds: int = ttl_seconds
+        self.logger: Optional[Any] = logger
+
+    @staticmethod
+    def hash_token(token: str) -> str:
+        """
+        Returns the hash of the refresh token it is stored under
+
+        :param str token: refresh token
+        :return str: hex digest of the token hash
+        """
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @staticmethod
+    def generate_token() -> str:
+        """
+        Generates new random refresh token
+
+        :return str: URL-safe refresh token
+        """
+        return secrets.token_urlsafe(32)
+
+    @abstractmethod
+    def issue(self, username: str, family_id: Optional[str] = None) -> Tuple[str, datetime]:
+        """
+        Issues new refresh token for the user
+
+        :param str username: username the token is issued for
+        :param Optional[str] family_id: ID of the token family the rotated token belongs to, new family if None
+        :return Tuple[str, datetime]: refresh token and its expiry time (UTC)
+        """
+
+    @abstractmethod
+    def rotate(self, token: str) -> Tuple[str, str, datetime]:
+        """
+        Exchanges the valid refresh token for the new one of the same family, the passed token is used up
+
+        :param str token: refresh token
+        :raises InvalidRefreshTokenError: if the token is not valid, reuse of the used token revokes its family
+        :return Tuple[str, str, datetime]: username, new refresh token and its expiry time (UTC)
+        """
+
+    @abstractmethod
+    def revoke(self, token: str) -> bool:
+        """
+        Revokes the whole family of the refresh token (i.e. the login session)
+
+        :param str token: refresh token
+        :return bool: True if the token was found
+        """
+
+    @abstractmethod
+    def revoke_user(self, username: str) -> int:
+        """
+        Revokes all the refresh tokens of the user, e.g. once the user is changed or disabled
+
+        :param str username: username
+        :return int: number of revoked tokens
+        """
+
+    def _warn_reuse(self, username: str, family_id: str) -> None:
+        if self.logger: self.logger.warning(
+            f"Used refresh token of {username} is presented again, revoked token family {family_id}"
+        )
+
+
+class _InMemoryRefreshToken:
+    __slots__ = ("username", "family_id", "expires_at", "used", "revoked")
+
+    def __init__(self, username: str, family_id: str, expires_at: datetime):
+        self.username: str = username
+        self.family_id: str = family_id
+        self.expires_at: datetime = expires_at
+        self.used: bool = False
+        self.revoked: bool = False
+
+
+class InMemoryRefreshTokenStore(RefreshTokenStore):
+    """
+    Refresh token store keeping the token hashes in process memory, used along with the embedded storage backends.
+    Expired tokens are purged at most once per purge interval
+    """
+
+    def __init__(self, ttl_seconds: int = 2592000, logger: Optional[Any] = None):
+        super().__init__(ttl_seconds=ttl_seconds, logger=logger)
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, _InMemoryRefreshToken] = {}
+        self._families: Dict[str, Set[str]] = {}
+        self._purge_interval_seconds: float = min(60.0, ttl_seconds)
+        self._next_purge_at: float = time.monotonic() + self._purge_interval_seconds
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self._tokens)} tokens)"
+
+    def _purge_expired(self, now: datetime) -> None:
+        if time.monotonic() < self._next_purge_at:
+            return
+        self._next_purge_at = time.monotonic() + self._purge_interval_seconds
+        for token_hash in [token_hash for token_hash, entry in self._tokens.items() if entry.expires_at <= now]:
+            self._forget(token_hash)
+
+    def _forget(self, token_hash: str) -> None:
+        entry = self._tokens.pop(token_hash)
+        family = self._families.get(entry.family_id)
+        if family is None:
+            return
+        family.discard(token_hash)
+        if not family: del self._families[entry.family_id]
+
+    def _revoke_family(self, family_id: str) -> int:
+        token_hashes = self._families.get(family_id, ())
+        for token_hash in token_hashes:
+            self._tokens[token_hash].revoked = True
+        return len(token_hashes)
+
+    def issue(self, username: str, family_id: Optional[str] = None) -> Tuple[str, datetime]:
+        token = self.generate_token()
+        token_hash = self.hash_token(token)
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl_seconds)
+        family_id = family_id or uuid4().hex
+        with self._lock:
+            self._purge_expired(now)
+            self._tokens[token_hash] = _InMemoryRefreshToken(username, family_id, expires_at)
+            self._families.setdefault(family_id, set()).add(token_hash)
+        return token, expires_at
+
+    def rotate(self, token: str) -> Tuple[str, str, datetime]:
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._tokens.get(self.hash_token(token))
+            if entry is None or entry.revoked or entry.expires_at <= now:
+                raise InvalidRefreshTokenError("Refresh token is not valid!")
+            if entry.used:
+                self._revoke_family(entry.family_id)
+                self._warn_reuse(entry.username, entry.family_id)
+                raise InvalidRefreshTokenError("Refresh token is not valid!")
+            entry.used = True
+        new_token, expires_at = self.issue(username=entry.username, family_id=entry.family_id)
+        return entry.username, new_token, expires_at
+
+    def revoke(self, token: str) -> bool:
+        with self._lock:
+            entry = self._tokens.get(self.hash_token(token))
+            if entry is None:
+                return False
+            self._revoke_family(entry.family_id)
+        return True
+
+    def revoke_user(self, username: str) -> int:
+        with self._lock:
+            family_ids = {entry.family_id for entry in self._tokens.values() if entry.username == username}
+            return sum(self._revoke_family(family_id) for family_id in family_ids)
+
+
+class MongoRefreshTokenStore(RefreshTokenStore):
+    """
+    Refresh token store keeping the token hashes in the MongoDB collection with TTL index, so the tokens are
+    shared by all the service workers and are removed by the server once expired.
+    The token is used up by the single conditional update, so only one of concurrent refreshes with
+    the same token succeeds
+    """
+
+    REQUIRED_INDEX_PARAMS = [
+        IndexSpec(name="token_hash", unique=True),
+        IndexSpec(name="family_id"),
+        IndexSpec(name="username"),
+        IndexSpec(name="expires_at", expire_after_seconds=0),
+    ]
+
+    def __init__(self, mongo_adapter: MongoAdapter, ttl_seconds: int = 2592000, logger: Optional[Any] = None):
+        super().__init__(ttl_seconds=ttl_seconds, logger=logger)
+        self.mongo_adapter: MongoAdapter = mongo_adapter
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.mongo_adapter.collection_name})"
+
+    def issue(self, username: str, family_id: Optional[str] = None) -> Tuple[str, datetime]:
+        token = self.generate_token()
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl_seconds)
+        self.mongo_adapter.insert_db_entry(data={
+            "token_hash": self.hash_token(token),
+            "family_id": family_id or uuid4().hex,
+            "username": username,
+            "used": False,
+            "revoked": False,
+            "created_at": now,
+            "expires_at": expires_at
+        })
+        return token, expires_at
+
+    def rotate(self, token: str) -> Tuple[str, str, datetime]:
+        token_hash = self.hash_token(token)
+        now = datetime.utcnow()
+        document = self.mongo_adapter.find_one_and_update(
+            data={"token_hash": token_hash, "used": False, "revoked": False, "expires_at": {"$gt": now}},
+            update={"$set": {"used": True, "used_at": now}}
+        )
+        if document is None:
+            document = self.mongo_adapter.read_first_match(data={"token_hash": token_hash})
+            if document and document["used"] and not document["revoked"]:
+                self.mongo_adapter.update_db_entries(
+                    data={"family_id": document["family_id"]}, update={"$set": {"revoked": True}}
+                )
+                self._warn_reuse(document["username"], document["family_id"])
+            raise InvalidRefreshTokenError("Refresh token is not valid!")
+        new_token, expires_at = self.issue(username=document["username"], family_id=document["family_id"])
+        return document["username"], new_token, expires_at
+
+    def revoke(self, token: str) -> bool:
+        document = self.mongo_adapter.read_first_match(data={"token_hash": self.hash_token(token)})
+        if not document:
+            return False
+        self.mongo_adapter.update_db_entries(data={"family_id": document["family_id"]}, update={"$set": {"revoked": True}})
+        return True
+
+    def revoke_user(self, username: str) -> int:
+        return self.mongo_adapter.update_db_entries(
+            data={"username": username, "revoked": False}, update={"$set": {"revoked": True}}
+        )
+
+
+def init_refresh_token_store(config: Dict[str, Any], logger: Optional[Any] = None) -> RefreshTokenStore:
+    """
+    Creates the refresh token store selected by the 'REFRESH_TOKEN_STORE_BACKEND' config value ('mongo' or 'memory'),
+    which defaults to 'mongo' for the mongo book storage backend and to 'memory' for the embedded ones
+
+    :param Dict[str, Any] config: config extracted from .env file
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :raises ValueError: if unsupported refresh token store backend is configured
+    :return RefreshTokenStore: refresh token store instance
+    """
+    default_backend = "mongo" if (config.get("BOOK_STORAGE_BACKEND") or "mongo").lower() == "mongo" else "memory"
+    backend = (config.get("REFRESH_TOKEN_STORE_BACKEND") or default_backend).lower()
+    ttl_seconds = int(float(config.get("REFRESH_TOKEN_EXPIRE_DAYS") or 30) * 86400)
+    if backend == "memory":
+        return InMemoryRefreshTokenStore(ttl_seconds=ttl_seconds, logger=logger)
+    if backend != "mongo":
+        raise ValueError(f"Unsupported refresh token store backend: {backend}, expected one of: mongo, memory")
+    mongo_adapter = MongoAdapter(
+        host=config["MONGODB_HOST"],
+        port=config["MONGODB_PORT"],
+        db_name=config["MONGODB_DB_NAME"],
+        username=config["MONGODB_USERNAME"],
+        password=config["MONGODB_PASSWORD"],
+        requires_auth=True,
+        collection_name=config.get("MONGODB_REFRESH_TOKEN_COLLECTION_NAME") or "refresh_tokens",
+        required_index_params=MongoRefreshTokenStore.REQUIRED_INDEX_PARAMS,
+        **get_slow_query_params(config),
+        **get_mongo_client_params(config),
+        **get_resilience_params(config, logger=logger),
+        # used and revoked tokens must be seen at once, so reads are never served by secondaries
+        query_options=QueryOptions.from_config(config).merge(QueryOptions(read_preference="primary")),
+        logger=logger
+    )
+    return MongoRefreshTokenStore(mongo_adapter=mongo_adapter, ttl_seconds=ttl_seconds, logger=logger)
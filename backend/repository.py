@@ -0,0 +1,696 @@
+# backend/repository.py
+
+import sqlite3
+import threading
+from pathlib import Path
+from itertools import islice
+from abc import ABC, abstractmethod
+from typing import Any, Optional, Dict, List, Tuple, AnyStr, Iterable, Iterator, Callable
+
+import pymongo
+from pydantic import BaseModel, Field
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+
+from .models import Book
+from .database import MongoAdapter, QueryOptions, get_slow_query_params, get_mongo_client_params
+from .resilience import get_resilience_params
+from .indexes import IndexSpec
+from .batching import WriteCoalescer
+from .mock_data import default_book_shelf
+from .search import InvertedIndex, BOOK_TEXT_INDEX_WEIGHTS
+
+
+SUPPORTED_BOOK_STORAGE_BACKENDS = ("mongo", "sqlite", "memory")
+
+# indexes required by MongoBookRepository in the books collection
+BOOK_COLLECTION_INDEX_PARAMS = [
+    IndexSpec(name="book_id", unique=True),
+    IndexSpec(name="book_name", unique=True),
+    IndexSpec(
+        name="book_text",
+        keys=[(field_name, pymongo.TEXT) for field_name in BOOK_TEXT_INDEX_WEIGHTS],
+        weights=BOOK_TEXT_INDEX_WEIGHTS,
+        default_language="english"
+    ),
+]
+
+
+class BookAlreadyExistsError(ValueError):
+    """
+    Raised when a book with the same book name or book ID is already stored on the book shelf
+    """
+
+
+class BookNotFoundError(LookupError):
+    """
+    Raised when the requested book is not found on the book shelf
+    """
+
+
+class BookAvailabilityConflictError(ValueError):
+    """
+    Raised when the book cannot be checked out or returned because it is already in the requested state
+    """
+
+
+class BookChange(BaseModel):
+    """
+    Describes a single change of the book shelf passed to the book repository listeners
+    """
+    operation: str = Field(..., example="add")
+    book: Book = Field(...)
+    previous_book: Optional[Book] = Field(None)
+
+
+class BookRepository(ABC):
+    """
+    Storage-agnostic interface of the book shelf used by the book endpoints.
+    Every implementation returns Book pydantic models, so the endpoints never deal with
+    the storage specific document or row formats.
+    Listeners subscribed to the repository are notified about every successful write made through it
+    """
+
+    def __init__(self, logger: Optional[Any] = None):
+        self.logger: Optional[Any] = logger
+        self._listeners: List[Callable[[BookChange], None]] = []
+
+    def subscribe(self, listener: Callable[[BookChange], None]) -> None:
+        """
+        Subscribes the listener to the changes of the book shelf. Listeners are called synchronously
+        right after the change is written, so they have to be cheap
+
+        :param Callable[[BookChange], None] listener: callable accepting BookChange pydantic model
+        :return None:
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, operation: str, book: Book, previous_book: Optional[Book] = None) -> None:
+        if not self._listeners:
+            return
+        change = BookChange(operation=operation, book=book, previous_book=previous_book)
+        for listener in self._listeners:
+            try:
+                listener(change)
+            except Exception as e:
+                # listener failure must never fail the write that has already happened
+                if self.logger: self.logger.exception(f"Book repository listener {listener} failed: {e}")
+
+    @abstractmethod
+    def get_book(self, book_id: str) -> Optional[Book]:
+        """
+        Returns the book with the given book ID or None if the book is not found
+
+        :param str book_id: book ID
+        :return Optional[Book]: book pydantic model
+        """
+
+    @abstractmethod
+    def list_books(self, limit: int = 10, skip: int = 0) -> List[Book]:
+        """
+        Returns a page of books in insertion order
+
+        :param int limit: maximum number of books to return
+        :param int skip: number of books to skip
+        :return List[Book]: list of book pydantic models
+        """
+
+    @abstractmethod
+    def iter_books(self) -> Iterator[Book]:
+        """
+        Lazily iterates over all the books on the book shelf
+
+        :return Iterator[Book]: books iterator
+        """
+
+    @abstractmethod
+    def count_books(self) -> int:
+        """
+        Returns the number of books on the book shelf
+
+        :return int: number of books
+        """
+
+    def count_books_by_author(self) -> Dict[Optional[str], Tuple[int, int]]:
+        """
+        Counts the books of every author from scratch, the backends supporting grouping in the storage override it
+
+        :return Dict[Optional[str], Tuple[int, int]]: total and available number of books per author
+        """
+        counts: Dict[Optional[str], Tuple[int, int]] = {}
+        for book in self.iter_books():
+            total, available = counts.get(book.author, (0, 0))
+            counts[book.author] = (total + 1, available + int(book.available))
+        return counts
+
+    @abstractmethod
+    def add_book(self, book: Book) -> Book:
+        """
+        Adds a new book to the book shelf
+
+        :param Book book: book pydantic model
+        :raises BookAlreadyExistsError: if a book with the same book name or book ID already exists
+        :return Book: added book
+        """
+
+    def add_books(self, books: Iterable[Book], batch_size: int = 1000) -> int:
+        """
+        Adds the books in bulk (e.g. when loading a dataset), the books already existing on the book shelf
+        are skipped. The books are consumed lazily batch by batch, so any number of books can be added
+
+        :param Iterable[Book] books: book pydantic models
+        :param int batch_size: number of books written at once by the backends supporting bulk writes
+        :return int: number of added books
+        """
+        added = 0
+        for book in books:
+            try:
+                self.add_book(book)
+                added += 1
+            except BookAlreadyExistsError:
+                pass
+        return added
+
+    @abstractmethod
+    def replace_book(self, book: Book) -> None:
+        """
+        Replaces the book with the same book ID or inserts it if it does not exist yet
+
+        :param Book book: book pydantic model
+        :raises BookAlreadyExistsError: if another book with the same book name already exists
+        :return None:
+        """
+
+    @abstractmethod
+    def delete_book_by_name(self, book_name: str) -> Optional[Book]:
+        """
+        Deletes the book with the given book name
+
+        :param str book_name: book name
+        :return Optional[Book]: deleted book or None if the book was not found
+        """
+
+    @abstractmethod
+    def search_books(self, query: str, limit: int = 10, skip: int = 0) -> List[Book]:
+        """
+        Returns a page of books matching the search phrase by book name, author or description,
+        best matches first
+
+        :param str query: search phrase
+        :param int limit: maximum number of books to return
+        :param int skip: number of best matching books to skip
+        :return List[Book]: list of book pydantic models
+        """
+
+    @abstractmethod
+    def _set_book_availability(self, book_id: str, available: bool) -> Optional[Book]:
+        """
+        Atomically sets the availability of the book only if it is currently in the opposite state
+
+        :param str book_id: book ID
+        :param bool available: new availability of the book
+        :return Optional[Book]: updated book or None if the book is not found or is already in the requested state
+        """
+
+    def _change_book_availability(self, operation: str, book_id: str, available: bool) -> Book:
+        updated_book = self._set_book_availability(book_id=book_id, available=available)
+        if updated_book:
+            self._notify(operation, book=updated_book, previous_book=updated_book.copy(update={"available": not available}))
+            return updated_book
+        # the conditional update did not match, find out why only on this rare path
+        if not self.get_book(book_id=book_id):
+            raise BookNotFoundError(f"The book with ID {book_id} was not found in the book shelf!")
+        raise BookAvailabilityConflictError(
+            f"The book with ID {book_id} is already {'available' if available else 'checked out'}!"
+        )
+
+    def checkout_book(self, book_id: str) -> Book:
+        """
+        Marks the available book as checked out
+
+        :param str book_id: book ID
+        :raises BookNotFoundError: if the book is not found
+        :raises BookAvailabilityConflictError: if the book is already checked out
+        :return Book: checked out book
+        """
+        return self._change_book_availability("checkout", book_id=book_id, available=False)
+
+    def return_book(self, book_id: str) -> Book:
+        """
+        Marks the checked out book as available again
+
+        :param str book_id: book ID
+        :raises BookNotFoundError: if the book is not found
+        :raises BookAvailabilityConflictError: if the book is not checked out
+        :return Book: returned book
+        """
+        return self._change_book_availability("return", book_id=book_id, available=True)
+
+    def close(self) -> None:
+        """
+        Releases resources held by the repository (if any)
+
+        :return None:
+        """
+
+
+class InMemoryBookRepository(BookRepository):
+    """
+    Book repository keeping the book shelf in process memory.
+    Books are indexed both by book ID and by book name, so lookups and duplicate checks are O(1),
+    and by the inverted full-text index used for search.
+    Suitable for edge deployments and tests, data is lost on restart
+    """
+
+    def __init__(self, books: Optional[Iterable[Book]] = None, logger: Optional[Any] = None):
+        super().__init__(logger=logger)
+        self._lock = threading.RLock()
+        self._books_by_id: Dict[str, Book] = {}
+        self._book_ids_by_name: Dict[str, str] = {}
+        self._text_index = InvertedIndex()
+        for book in books or ():
+            self.add_book(book)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self._books_by_id)} books)"
+
+    def get_book(self, book_id: str) -> Optional[Book]:
+        return self._books_by_id.get(book_id)
+
+    def list_books(self, limit: int = 10, skip: int = 0) -> List[Book]:
+        with self._lock:
+            return list(islice(self._books_by_id.values(), skip, skip + limit))
+
+    def iter_books(self) -> Iterator[Book]:
+        with self._lock:
+            books = list(self._books_by_id.values())
+        yield from books
+
+    def count_books(self) -> int:
+        return len(self._books_by_id)
+
+    def add_book(self, book: Book) -> Book:
+        with self._lock:
+            if book.book_name in self._book_ids_by_name or book.book_id in self._books_by_id:
+                raise BookAlreadyExistsError(f"The book {book.book_name} already exists in the book shelf!")
+            self._books_by_id[book.book_id] = book
+            self._book_ids_by_name[book.book_name] = book.book_id
+            self._text_index.add(book)
+        self._notify("add", book=book)
+        return book
+
+    def replace_book(self, book: Book) -> None:
+        with self._lock:
+            if self._book_ids_by_name.get(book.book_name, book.book_id) != book.book_id:
+                raise BookAlreadyExistsError(f"The book {book.book_name} already exists in the book shelf!")
+            previous_book = self._books_by_id.get(book.book_id)
+            if previous_book: self._book_ids_by_name.pop(previous_book.book_name, None)
+            self._books_by_id[book.book_id] = book
+            self._book_ids_by_name[book.book_name] = book.book_id
+            self._text_index.add(book)
+        self._notify("replace", book=book, previous_book=previous_book)
+
+    def delete_book_by_name(self, book_name: str) -> Optional[Book]:
+        with self._lock:
+            book_id = self._book_ids_by_name.pop(book_name, None)
+            if book_id is None:
+                return
+            self._text_index.remove(book_id)
+            deleted_book = self._books_by_id.pop(book_id)
+        self._notify("delete", book=deleted_book)
+        return deleted_book
+
+    def _set_book_availability(self, book_id: str, available: bool) -> Optional[Book]:
+        with self._lock:
+            book = self._books_by_id.get(book_id)
+            if not book or book.available == available:
+                return
+            updated_book = book.copy(update={"available": available})
+            self._books_by_id[book_id] = updated_book
+        return updated_book
+
+    def search_books(self, query: str, limit: int = 10, skip: int = 0) -> List[Book]:
+        with self._lock:
+            return [
+                self._books_by_id[book_id]
+                for book_id, _ in self._text_index.search(query=query, limit=limit, skip=skip)
+            ]
+
+
+class SQLiteBookRepository(BookRepository):
+    """
+    Book repository backed by an embedded SQLite database file.
+    The database works in WAL mode, so readers never block the writer. Every thread gets its own
+    connection, and all the statements are static parametrized SQL, so they are prepared once per connection
+    and reused from the sqlite3 statement cache afterwards.
+    Full-text search is served by the in-memory inverted index, built from the table on start up
+    and kept up to date by the write methods
+    """
+
+    CREATE_TABLE_SQL = (
+        "CREATE TABLE IF NOT EXISTS books ("
+        "book_id TEXT NOT NULL PRIMARY KEY, "
+        "book_name TEXT NOT NULL UNIQUE, "
+        "author TEXT, "
+        "description TEXT, "
+        "available INTEGER NOT NULL)"
+    )
+    SELECT_BY_ID_SQL = "SELECT book_id, book_name, author, description, available FROM books WHERE book_id = ?"
+    SELECT_BY_NAME_SQL = "SELECT book_id, book_name, author, description, available FROM books WHERE book_name = ?"
+    SELECT_PAGE_SQL = "SELECT book_id, book_name, author, description, available FROM books ORDER BY rowid LIMIT ? OFFSET ?"
+    SELECT_ALL_SQL = "SELECT book_id, book_name, author, description, available FROM books ORDER BY rowid"
+    COUNT_SQL = "SELECT COUNT(*) FROM books"
+    COUNT_BY_AUTHOR_SQL = "SELECT author, COUNT(*), SUM(available) FROM books GROUP BY author"
+    INSERT_SQL = "INSERT INTO books (book_id, book_name, author, description, available) VALUES (?, ?, ?, ?, ?)"
+    INSERT_OR_IGNORE_SQL = (
+        "INSERT OR IGNORE INTO books (book_id, book_name, author, description, available) VALUES (?, ?, ?, ?, ?)"
+    )
+    UPSERT_SQL = (
+        "INSERT INTO books (book_id, book_name, author, description, available) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (book_id) DO UPDATE SET book_name = excluded.book_name, author = excluded.author, "
+        "description = excluded.description, available = excluded.available"
+    )
+    DELETE_BY_ID_AND_NAME_SQL = "DELETE FROM books WHERE book_id = ? AND book_name = ?"
+    UPDATE_AVAILABILITY_SQL = "UPDATE books SET available = ? WHERE book_id = ? AND available = ?"
+
+    def __init__(self, database_path: AnyStr, logger: Optional[Any] = None):
+        super().__init__(logger=logger)
+        self.database_path: AnyStr = database_path
+        self._local = threading.local()
+        Path(database_path).parent.mkdir(parents=True, exist_ok=True)
+        connection = self._get_connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            connection.execute(self.CREATE_TABLE_SQL)
+        self._text_index = InvertedIndex()
+        self._text_index.add_many(self.iter_books())
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.database_path})"
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """
+        Returns the SQLite connection of the current thread, opens it on first use
+
+        :return sqlite3.Connection: connection
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, timeout=10.0, cached_statements=64)
+            # WAL guarantees durability of committed transactions on checkpoint, NORMAL is safe in this mode
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _row_to_book(row: Optional[tuple]) -> Optional[Book]:
+        if row is None:
+            return
+        book_id, book_name, author, description, available = row
+        return Book(book_id=book_id, book_name=book_name, author=author, description=description, available=bool(available))
+
+    @staticmethod
+    def _book_to_row(book: Book) -> tuple:
+        return book.book_id, book.book_name, book.author, book.description, int(book.available)
+
+    def get_book(self, book_id: str) -> Optional[Book]:
+        row = self._get_connection().execute(self.SELECT_BY_ID_SQL, (book_id,)).fetchone()
+        return self._row_to_book(row)
+
+    def list_books(self, limit: int = 10, skip: int = 0) -> List[Book]:
+        rows = self._get_connection().execute(self.SELECT_PAGE_SQL, (limit, skip)).fetchall()
+        return [self._row_to_book(row) for row in rows]
+
+    def iter_books(self) -> Iterator[Book]:
+        for row in self._get_connection().execute(self.SELECT_ALL_SQL):
+            yield self._row_to_book(row)
+
+    def count_books(self) -> int:
+        return self._get_connection().execute(self.COUNT_SQL).fetchone()[0]
+
+    def count_books_by_author(self) -> Dict[Optional[str], Tuple[int, int]]:
+        return {
+            author: (total, available)
+            for author, total, available in self._get_connection().execute(self.COUNT_BY_AUTHOR_SQL)
+        }
+
+    def add_book(self, book: Book) -> Book:
+        connection = self._get_connection()
+        try:
+            with connection:
+                connection.execute(self.INSERT_SQL, self._book_to_row(book))
+        except sqlite3.IntegrityError as e:
+            raise BookAlreadyExistsError(f"The book {book.book_name} already exists in the book shelf!") from e
+        self._text_index.add(book)
+        self._notify("add", book=book)
+        return book
+
+    def add_books(self, books: Iterable[Book], batch_size: int = 1000) -> int:
+        connection = self._get_connection()
+        added = 0
+        books = iter(books)
+        while True:
+            batch = list(islice(books, batch_size))
+            if not batch:
+                return added
+            # one transaction per batch, existing books are skipped by the unique constraints
+            with connection:
+                added_books = [
+                    book for book in batch
+                    if connection.execute(self.INSERT_OR_IGNORE_SQL, self._book_to_row(book)).rowcount
+                ]
+            self._text_index.add_many(added_books)
+            for book in added_books:
+                self._notify("add", book=book)
+            added += len(added_books)
+
+    def replace_book(self, book: Book) -> None:
+        connection = self._get_connection()
+        try:
+            with connection:
+                # take the write lock before reading the previous version, so it cannot change in between
+                connection.execute("BEGIN IMMEDIATE")
+                previous_book = self._row_to_book(connection.execute(self.SELECT_BY_ID_SQL, (book.book_id,)).fetchone())
+                connection.execute(self.UPSERT_SQL, self._book_to_row(book))
+        except sqlite3.IntegrityError as e:
+            raise BookAlreadyExistsError(f"The book {book.book_name} already exists in the book shelf!") from e
+        self._text_index.add(book)
+        self._notify("replace", book=book, previous_book=previous_book)
+
+    def delete_book_by_name(self, book_name: str) -> Optional[Book]:
+        connection = self._get_connection()
+        with connection:
+            row = connection.execute(self.SELECT_BY_NAME_SQL, (book_name,)).fetchone()
+            if row is None:
+                return
+            # the row might have been deleted by a concurrent writer in between
+            if not connection.execute(self.DELETE_BY_ID_AND_NAME_SQL, (row[0], book_name)).rowcount:
+                return
+        self._text_index.remove(row[0])
+        deleted_book = self._row_to_book(row)
+        self._notify("delete", book=deleted_book)
+        return deleted_book
+
+    def _set_book_availability(self, book_id: str, available: bool) -> Optional[Book]:
+        connection = self._get_connection()
+        with connection:
+            # the availability precondition is part of the statement, so concurrent writers cannot both succeed
+            updated = connection.execute(self.UPDATE_AVAILABILITY_SQL, (int(available), book_id, int(not available))).rowcount
+            if not updated:
+                return
+            row = connection.execute(self.SELECT_BY_ID_SQL, (book_id,)).fetchone()
+        return self._row_to_book(row)
+
+    def search_books(self, query: str, limit: int = 10, skip: int = 0) -> List[Book]:
+        books = (
+            self.get_book(book_id=book_id)
+            for book_id, _ in self._text_index.search(query=query, limit=limit, skip=skip)
+        )
+        # skip the books deleted in between index lookup and reading the rows
+        return [book for book in books if book]
+
+    def close(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class MongoBookRepository(BookRepository):
+    """
+    Book repository backed by the MongoDB books collection through the MongoAdapter.
+    Expects unique indexes on both 'book_id' and 'book_name' and a text index in the collection
+    (see BOOK_COLLECTION_INDEX_PARAMS).
+    If the write coalescer is passed, new books are inserted through it, so concurrent inserts share bulk writes.
+    Catalogue reads (get, list, count and search) are run with 'catalogue_read_options' (e.g. to be served by
+    secondaries), while writes and the atomic read-modify-write operations always use the adapter defaults
+    """
+
+    def __init__(
+            self,
+            mongo_adapter: MongoAdapter,
+            write_coalescer: Optional[WriteCoalescer] = None,
+            catalogue_read_options: Optional[QueryOptions] = None,
+            logger: Optional[Any] = None
+    ):
+        super().__init__(logger=logger)
+        self.mongo_adapter: MongoAdapter = mongo_adapter
+        self.write_coalescer: Optional[WriteCoalescer] = write_coalescer
+        self.catalogue_read_options: Optional[QueryOptions] = catalogue_read_options
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.mongo_adapter.collection_name})"
+
+    def get_book(self, book_id: str) -> Optional[Book]:
+        extracted_data = self.mongo_adapter.extract_db_entry(
+            index_name="book_id", entry_id=book_id, options=self.catalogue_read_options
+        )
+        if extracted_data:
+            return Book(**extracted_data)
+
+    def list_books(self, limit: int = 10, skip: int = 0) -> List[Book]:
+        if limit <= 0:
+            return []
+        return [
+            Book(**document)
+            for document in self.mongo_adapter.read_many(limit=limit, skip=skip, options=self.catalogue_read_options)
+        ]
+
+    def iter_books(self) -> Iterator[Book]:
+        for document in self.mongo_adapter.iterate_db_entries(options=self.catalogue_read_options):
+            yield Book(**document)
+
+    def count_books(self) -> int:
+        return self.mongo_adapter.count_db_entries(options=self.catalogue_read_options)
+
+    def count_books_by_author(self) -> Dict[Optional[str], Tuple[int, int]]:
+        # grouped by the server, only a document per author is sent back
+        results = self.mongo_adapter.aggregate([{"$group": {
+            "_id": "$author",
+            "total": {"$sum": 1},
+            "available": {"$sum": {"$cond": ["$available", 1, 0]}}
+        }}], options=self.catalogue_read_options)
+        return {result["_id"]: (result["total"], result["available"]) for result in results}
+
+    def add_book(self, book: Book) -> Book:
+        try:
+            if self.write_coalescer:
+                self.write_coalescer.insert(data=book.dict())
+            else:
+                self.mongo_adapter.insert_db_entry(data=book.dict())
+        except DuplicateKeyError as e:
+            raise BookAlreadyExistsError(f"The book {book.book_name} already exists in the book shelf!") from e
+        self._notify("add", book=book)
+        return book
+
+    def add_books(self, books: Iterable[Book], batch_size: int = 1000) -> int:
+        added = 0
+        books = iter(books)
+        while True:
+            batch = list(islice(books, batch_size))
+            if not batch:
+                return added
+            try:
+                # unordered, so the duplicates fail alone and the rest of the batch is inserted
+                self.mongo_adapter.bulk_write([pymongo.InsertOne(book.dict()) for book in batch], ordered=False)
+                failed_positions = set()
+            except BulkWriteError as e:
+                write_errors = e.details.get("writeErrors", [])
+                if any(error.get("code") != 11000 for error in write_errors) or e.details.get("writeConcernErrors"):
+                    raise
+                failed_positions = {error["index"] for error in write_errors}
+            for position, book in enumerate(batch):
+                if position not in failed_positions:
+                    self._notify("add", book=book)
+            added += len(batch) - len(failed_positions)
+
+    def replace_book(self, book: Book) -> None:
+        try:
+            previous_document = self.mongo_adapter.find_one_and_replace(index_name="book_id", data=book.dict())
+        except DuplicateKeyError as e:
+            raise BookAlreadyExistsError(f"The book {book.book_name} already exists in the book shelf!") from e
+        self._notify("replace", book=book, previous_book=Book(**previous_document) if previous_document else None)
+
+    def delete_book_by_name(self, book_name: str) -> Optional[Book]:
+        deleted_document = self.mongo_adapter.find_one_and_delete(data={"book_name": book_name})
+        if deleted_document:
+            deleted_book = Book(**deleted_document)
+            self._notify("delete", book=deleted_book)
+            return deleted_book
+
+    def close(self) -> None:
+        if self.write_coalescer: self.write_coalescer.close()
+
+    def _set_book_availability(self, book_id: str, available: bool) -> Optional[Book]:
+        updated_document = self.mongo_adapter.find_one_and_update(
+            data={"book_id": book_id, "available": not available},
+            update={"$set": {"available": available}}
+        )
+        if updated_document:
+            return Book(**updated_document)
+
+    def search_books(self, query: str, limit: int = 10, skip: int = 0) -> List[Book]:
+        if limit <= 0:
+            return []
+        return [
+            Book(**document)
+            for document in self.mongo_adapter.text_search(
+                query=query, limit=limit, skip=skip, options=self.catalogue_read_options
+            )
+        ]
+
+
+def init_book_repository(config: Dict[str, Any], logger: Optional[Any] = None) -> BookRepository:
+    """
+    Creates the book repository selected by the 'BOOK_STORAGE_BACKEND' config value
+    ('mongo' by default, 'sqlite' or 'memory'). The in-memory backend is seeded with the mock book shelf.
+    Inserts of the mongo backend are coalesced into bulk writes if 'WRITE_COALESCING_ENABLED' is set,
+    catalogue reads of the mongo backend use the 'MONGODB_CATALOGUE_*' query options
+
+    :param Dict[str, Any] config: config extracted from .env file
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :raises ValueError: if unsupported storage backend is configured
+    :return BookRepository: book repository instance
+    """
+    backend = (config.get("BOOK_STORAGE_BACKEND") or "mongo").lower()
+    if backend not in SUPPORTED_BOOK_STORAGE_BACKENDS:
+        raise ValueError(
+            f"Unsupported book storage backend: {backend}, expected one of: {', '.join(SUPPORTED_BOOK_STORAGE_BACKENDS)}"
+        )
+    if logger: logger.debug("Initializing book repository with %s storage backend ...", backend)
+    if backend == "memory":
+        return InMemoryBookRepository(books=(book.copy() for book in default_book_shelf.values()), logger=logger)
+    if backend == "sqlite":
+        return SQLiteBookRepository(
+            database_path=config.get("SQLITE_DATABASE_PATH") or "data/books.sqlite3",
+            logger=logger
+        )
+    mongo_adapter = MongoAdapter(
+        host=config["MONGODB_HOST"],
+        port=config["MONGODB_PORT"],
+        db_name=config["MONGODB_DB_NAME"],
+        username=config["MONGODB_USERNAME"],
+        password=config["MONGODB_PASSWORD"],
+        requires_auth=True,
+        collection_name=config["MONGODB_BOOK_SHELF_COLLECTION_NAME"],
+        required_index_params=BOOK_COLLECTION_INDEX_PARAMS,
+        **get_slow_query_params(config),
+        **get_mongo_client_params(config),
+        **get_resilience_params(config, logger=logger),
+        query_options=QueryOptions.from_config(config),
+        logger=logger
+    )
+    write_coalescer = None
+    if (config.get("WRITE_COALESCING_ENABLED") or "false").lower() == "true":
+        write_coalescer = WriteCoalescer(
+            mongo_adapter=mongo_adapter,
+            max_delay_ms=float(config.get("WRITE_COALESCING_MAX_DELAY_MS") or 5.0),
+            max_batch_size=int(config.get("WRITE_COALESCING_MAX_BATCH_SIZE") or 100),
+            logger=logger
+        )
+    return MongoBookRepository(
+        mongo_adapter=mongo_adapter,
+        write_coalescer=write_coalescer,
+        catalogue_read_options=QueryOptions.from_config(config, prefix="MONGODB_CATALOGUE"),
+        logger=logger
+    )
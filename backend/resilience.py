@@ -0,0 +1,231 @@
+# backend/resilience.py
+
+import time
+import random
+import threading
+from collections import deque
+from typing import Any, Optional, Dict, Tuple, Deque
+
+from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError, ExecutionTimeout, WTimeoutError
+
+
+# errors signalling that the cluster is unavailable or overloaded, they are counted by the circuit breaker
+CIRCUIT_BREAKER_FAILURE_ERRORS = (ConnectionFailure, ExecutionTimeout, WTimeoutError)
+
+# transient errors worth retrying (network errors, primary stepdowns), server selection timeout is not retried,
+# since the client has already waited for a suitable server for the whole server selection timeout
+RETRYABLE_ERRORS = (ConnectionFailure,)
+NON_RETRYABLE_ERRORS = (ServerSelectionTimeoutError,)
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised instead of calling the database while the circuit breaker is open
+    """
+
+    def __init__(self, message: str, retry_after_seconds: float):
+        super().__init__(message)
+        self.retry_after_seconds: float = retry_after_seconds
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker failing the calls fast while the database is unavailable.
+    The breaker is closed while the failure rate of the calls finished within the last 'window_seconds' stays below
+    'failure_rate_threshold' (the rate is evaluated once at least 'minimum_calls' calls are finished), then it opens
+    and rejects all the calls for 'open_seconds'. After that it turns half-open and lets through up to
+    'half_open_max_calls' probe calls: successful probe closes the breaker, failed one opens it again
+    """
+
+    def __init__(
+            self,
+            name: str = "mongodb",
+            failure_rate_threshold: float = 0.5,
+            minimum_calls: int = 20,
+            window_seconds: float = 10.0,
+            open_seconds: float = 5.0,
+            half_open_max_calls: int = 1,
+            logger: Optional[Any] = None
+    ):
+        self.name: str = name
+        self.failure_rate_threshold: float = failure_rate_threshold
+        self.minimum_calls: int = minimum_calls
+        self.window_seconds: float = window_seconds
+        self.open_seconds: float = open_seconds
+        self.half_open_max_calls: int = half_open_max_calls
+        self.logger: Optional[Any] = logger
+        self._lock = threading.Lock()
+        self._state: str = CIRCUIT_CLOSED
+        # (finish time, failed) of the calls finished within the window
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._failures: int = 0
+        self._opened_at: float = 0.0
+        self._half_open_calls: int = 0
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}({self.name}, failure_rate_threshold={self.failure_rate_threshold}, "
+            f"minimum_calls={self.minimum_calls}, window_seconds={self.window_seconds}, open_seconds={self.open_seconds})"
+        )
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._get_state(time.monotonic())
+
+    def _get_state(self, now: float) -> str:
+        if self._state == CIRCUIT_OPEN and now - self._opened_at >= self.open_seconds:
+            self._set_state(CIRCUIT_HALF_OPEN)
+            self._half_open_calls = 0
+        return self._state
+
+    def _set_state(self, state: str) -> None:
+        if self.logger: self.logger.warning(f"Circuit breaker {self.name} turned from {self._state} to {state}")
+        self._state = state
+
+    def before_call(self) -> None:
+        """
+        Checks that the call is allowed, must be followed by record_success() or record_failure() once the call is done
+
+        :raises CircuitOpenError: if the breaker is open or all the half-open probe calls are already in progress
+        :return None:
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._get_state(now)
+            if state == CIRCUIT_CLOSED:
+                return
+            if state == CIRCUIT_HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return
+            retry_after_seconds = max(self._opened_at + self.open_seconds - now, 0.0) if state == CIRCUIT_OPEN else 1.0
+            raise CircuitOpenError(
+                f"Circuit breaker {self.name} is {state}, the call is rejected without reaching the database!",
+                retry_after_seconds=retry_after_seconds
+            )
+
+    def record_success(self) -> None:
+        """
+        Records the successful call
+
+        :return None:
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._get_state(now) == CIRCUIT_HALF_OPEN:
+                self._set_state(CIRCUIT_CLOSED)
+                self._outcomes.clear()
+                self._failures = 0
+                return
+            self._record_outcome(now, failed=False)
+
+    def record_failure(self) -> None:
+        """
+        Records the failed call, opens the breaker if the failure rate crossed the threshold
+
+        :return None:
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._get_state(now)
+            if state == CIRCUIT_OPEN:
+                return
+            if state == CIRCUIT_HALF_OPEN:
+                self._open(now)
+                return
+            self._record_outcome(now, failed=True)
+            if len(self._outcomes) >= self.minimum_calls and self._failures / len(self._outcomes) >= self.failure_rate_threshold:
+                self._open(now)
+
+    def _record_outcome(self, now: float, failed: bool) -> None:
+        self._outcomes.append((now, failed))
+        self._failures += failed
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            _, expired_failed = self._outcomes.popleft()
+            self._failures -= expired_failed
+
+    def _open(self, now: float) -> None:
+        self._set_state(CIRCUIT_OPEN)
+        self._opened_at = now
+        self._outcomes.clear()
+        self._failures = 0
+
+
+class RetryPolicy:
+    """
+    Bounded retries with exponential backoff and full jitter: the delay before the retry number N (starting from 0)
+    is a random value between 0 and min('max_delay_ms', 'base_delay_ms' * 2 ** N), so the retries of concurrent
+    requests are spread in time instead of hitting the recovering cluster all at once
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay_ms: float = 50.0, max_delay_ms: float = 500.0):
+        self.max_attempts: int = max_attempts
+        self.base_delay_ms: float = base_delay_ms
+        self.max_delay_ms: float = max_delay_ms
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(max_attempts={self.max_attempts}, base_delay_ms={self.base_delay_ms}, "
+            f"max_delay_ms={self.max_delay_ms})"
+        )
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        return isinstance(error, RETRYABLE_ERRORS) and not isinstance(error, NON_RETRYABLE_ERRORS)
+
+    def get_delay_seconds(self, attempt: int) -> Optional[float]:
+        """
+        Returns the delay before the next attempt
+
+        :param int attempt: number of the failed attempt, starting from 0
+        :return Optional[float]: delay in seconds or None if no attempts are left
+        """
+        if attempt + 1 >= self.max_attempts:
+            return None
+        return random.uniform(0, min(self.max_delay_ms, self.base_delay_ms * 2 ** attempt)) / 1000
+
+
+# circuit breakers shared by all the adapters of the same cluster, since the incident hits all of them together
+_circuit_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_resilience_params(config: Dict[str, Any], logger: Optional[Any] = None) -> Dict[str, Any]:
+    """
+    Extracts per-call deadline, retry policy and circuit breaker params of MongoAdapter from the config.
+    All the adapters of the same cluster share the same circuit breaker
+
+    :param Dict[str, Any] config: config extracted from .env file
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :return Dict[str, Any]: 'operation_timeout_ms', 'retry_policy' and 'circuit_breaker' keyword arguments of MongoAdapter
+    """
+    operation_timeout_ms = config.get("MONGODB_OPERATION_TIMEOUT_MS")
+    retry_policy = RetryPolicy(
+        max_attempts=int(config.get("MONGODB_READ_RETRY_ATTEMPTS") or 3),
+        base_delay_ms=float(config.get("MONGODB_READ_RETRY_BASE_DELAY_MS") or 50.0),
+        max_delay_ms=float(config.get("MONGODB_READ_RETRY_MAX_DELAY_MS") or 500.0)
+    )
+    circuit_breaker = None
+    if (config.get("CIRCUIT_BREAKER_ENABLED") or "false").lower() == "true":
+        cluster = (str(config.get("MONGODB_HOST")), str(config.get("MONGODB_PORT")))
+        with _circuit_breakers_lock:
+            if cluster not in _circuit_breakers:
+                _circuit_breakers[cluster] = CircuitBreaker(
+                    name=f"mongodb://{cluster[0]}:{cluster[1]}",
+                    failure_rate_threshold=float(config.get("CIRCUIT_BREAKER_FAILURE_RATE") or 0.5),
+                    minimum_calls=int(config.get("CIRCUIT_BREAKER_MINIMUM_CALLS") or 20),
+                    window_seconds=float(config.get("CIRCUIT_BREAKER_WINDOW_SECONDS") or 10.0),
+                    open_seconds=float(config.get("CIRCUIT_BREAKER_OPEN_SECONDS") or 5.0),
+                    logger=logger
+                )
+            circuit_breaker = _circuit_breakers[cluster]
+    return {
+        "operation_timeout_ms": float(operation_timeout_ms) if operation_timeout_ms else None,
+        "retry_policy": retry_policy,
+        "circuit_breaker": circuit_breaker
+    }
@@ -0,0 +1,202 @@
+# backend/revocation.py
+
+import time
+import heapq
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Optional, Dict, List, Tuple
+
+from .database import MongoAdapter, QueryOptions, get_slow_query_params, get_mongo_client_params
+from .resilience import get_resilience_params
+from .indexes import IndexSpec
+
+
+class TokenDenylist:
+    """
+    Set of the IDs ('jti' claims) of the revoked access tokens, checked by every authenticated request.
+    The check is a lookup in the local hash set, so it costs no I/O. Revoked IDs are kept only until
+    the tokens expire (expired tokens are rejected by the signature check anyway), so the set holds
+    no more than the tokens revoked within the access token lifetime and needs no probabilistic compaction.
+    This base class keeps the revocations of a single process, used along with the embedded storage backends
+    """
+
+    def __init__(self, logger: Optional[Any] = None):
+        self.logger: Optional[Any] = logger
+        self._lock = threading.Lock()
+        # jti -> expiry time of the token (UNIX timestamp)
+        self._revoked: Dict[str, float] = {}
+        # (expiry time, jti) heap used to forget the expired tokens in expiry order
+        self._expiry_heap: List[Tuple[float, str]] = []
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self._revoked)} revoked tokens)"
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def is_revoked(self, jti: str) -> bool:
+        """
+        Checks whether the token is revoked, never blocks on I/O
+
+        :param str jti: ID of the token
+        :return bool: True if the token is revoked
+        """
+        expires_at = self._revoked.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def revoke(self, jti: str, expires_at: float) -> None:
+        """
+        Revokes the token until its expiry
+
+        :param str jti: ID of the token
+        :param float expires_at: expiry time of the token ('exp' claim, UNIX timestamp)
+        :return None:
+        """
+        self._add(jti, expires_at)
+        if self.logger: self.logger.debug(f"Revoked access token {jti}")
+
+    def _add(self, jti: str, expires_at: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._forget_expired(now)
+            if expires_at <= now or self._revoked.get(jti, 0.0) >= expires_at:
+                return
+            self._revoked[jti] = expires_at
+            heapq.heappush(self._expiry_heap, (expires_at, jti))
+
+    def _forget_expired(self, now: float) -> None:
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, jti = heapq.heappop(self._expiry_heap)
+            if self._revoked.get(jti) == expires_at: del self._revoked[jti]
+
+    def start(self) -> None:
+        """
+        Starts keeping the local set in sync with the shared revocations, no-op for the process local denylist
+
+        :return None:
+        """
+
+    def close(self) -> None:
+        """
+        Stops keeping the local set in sync with the shared revocations, no-op for the process local denylist
+
+        :return None:
+        """
+
+
+class MongoTokenDenylist(TokenDenylist):
+    """
+    Token denylist sharing the revocations across the service workers through the MongoDB collection
+    with TTL index. Revocations are written to the collection and to the local set, while the background
+    thread pulls the revocations made by other workers every 'sync_interval_seconds', so the request path
+    never waits for the database. Revocations made elsewhere take effect within the sync interval
+    """
+
+    REQUIRED_INDEX_PARAMS = [
+        IndexSpec(name="jti", unique=True),
+        IndexSpec(name="revoked_at"),
+        IndexSpec(name="expires_at", expire_after_seconds=0),
+    ]
+
+    # revocations are pulled with the overlap covering the clock skew between the workers
+    SYNC_OVERLAP_SECONDS = 5.0
+
+    def __init__(self, mongo_adapter: MongoAdapter, sync_interval_seconds: float = 1.0, logger: Optional[Any] = None):
+        super().__init__(logger=logger)
+        self.mongo_adapter: MongoAdapter = mongo_adapter
+        self.sync_interval_seconds: float = sync_interval_seconds
+        self._synced_at: Optional[datetime] = None
+        self._stop_event = threading.Event()
+        self._syncer: Optional[threading.Thread] = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.mongo_adapter.collection_name}, {len(self._revoked)} revoked tokens)"
+
+    def revoke(self, jti: str, expires_at: float) -> None:
+        now = datetime.utcnow()
+        self.mongo_adapter.silent_replace_db_entry(index_name="jti", data={
+            "jti": jti,
+            "revoked_at": now,
+            "expires_at": datetime.utcfromtimestamp(expires_at)
+        })
+        super().revoke(jti, expires_at)
+
+    def sync(self) -> int:
+        """
+        Pulls the revocations made since the previous sync into the local set, the first sync pulls
+        all the revocations of not yet expired tokens
+
+        :return int: number of pulled revocations
+        """
+        now = datetime.utcnow()
+        if self._synced_at is None:
+            query = {"expires_at": {"$gt": now}}
+        else:
+            query = {"revoked_at": {"$gte": self._synced_at - timedelta(seconds=self.SYNC_OVERLAP_SECONDS)}}
+        documents = self.mongo_adapter.read_many(data=query)
+        for document in documents:
+            self._add(document["jti"], (document["expires_at"] - datetime(1970, 1, 1)).total_seconds())
+        self._synced_at = now
+        return len(documents)
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.sync_interval_seconds):
+            try:
+                self.sync()
+            except Exception as e:
+                # the local set keeps serving the known revocations until the database is back
+                if self.logger: self.logger.warning(f"Failed to sync revoked tokens: {e}")
+
+    def start(self) -> None:
+        if self._syncer is not None:
+            return
+        self.sync()
+        self._syncer = threading.Thread(target=self._run, name="token-denylist-sync", daemon=True)
+        self._syncer.start()
+
+    def close(self) -> None:
+        if self._syncer is None:
+            return
+        self._stop_event.set()
+        self._syncer.join()
+        self._syncer = None
+
+
+def init_token_denylist(config: Dict[str, Any], logger: Optional[Any] = None) -> TokenDenylist:
+    """
+    Creates the token denylist selected by the 'TOKEN_DENYLIST_BACKEND' config value ('mongo' or 'memory'),
+    which defaults to 'mongo' for the mongo book storage backend and to 'memory' for the embedded ones
+
+    :param Dict[str, Any] config: config extracted from .env file
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :raises ValueError: if unsupported token denylist backend is configured
+    :return TokenDenylist: token denylist instance
+    """
+    default_backend = "mongo" if (config.get("BOOK_STORAGE_BACKEND") or "mongo").lower() == "mongo" else "memory"
+    backend = (config.get("TOKEN_DENYLIST_BACKEND") or default_backend).lower()
+    if backend == "memory":
+        return TokenDenylist(logger=logger)
+    if backend != "mongo":
+        raise ValueError(f"Unsupported token denylist backend: {backend}, expected one of: mongo, memory")
+    mongo_adapter = MongoAdapter(
+        host=config["MONGODB_HOST"],
+        port=config["MONGODB_PORT"],
+        db_name=config["MONGODB_DB_NAME"],
+        username=config["MONGODB_USERNAME"],
+        password=config["MONGODB_PASSWORD"],
+        requires_auth=True,
+        collection_name=config.get("MONGODB_TOKEN_DENYLIST_COLLECTION_NAME") or "revoked_tokens",
+        required_index_params=MongoTokenDenylist.REQUIRED_INDEX_PARAMS,
+        **get_slow_query_params(config),
+        **get_mongo_client_params(config),
+        **get_resilience_params(config, logger=logger),
+        # revocations must be seen as soon as they are written, so reads are never served by secondaries
+        query_options=QueryOptions.from_config(config).merge(QueryOptions(read_preference="primary")),
+        logger=logger
+    )
+    return MongoTokenDenylist(
+        mongo_adapter=mongo_adapter,
+        sync_interval_seconds=float(config.get("TOKEN_DENYLIST_SYNC_INTERVAL_SECONDS") or 1.0),
+        logger=logger
+    )
@@ -0,0 +1,233 @@
+# backend/search.py
+
+import re
+import heapq
+import bisect
+import threading
+import unicodedata
+from math import log
+from collections import Counter
+from typing import Dict, List, Tuple, Set, Iterable, Optional
+
+from .models import Book
+
+
+# relevance weights of the searchable book fields, shared by the MongoDB text index and the in-memory index
+BOOK_TEXT_INDEX_WEIGHTS: Dict[str, int] = {"book_name": 10, "author": 5, "description": 1}
+
+# words too frequent to carry any relevance, MongoDB text index skips english stop words in the same way
+STOP_WORDS = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on", "or",
+    "that", "the", "this", "to", "was", "with"
+))
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# separates normalized title from the original one within a single title suggester entry,
+# it sorts before any printable character and never survives normalization
+SUGGESTION_ENTRY_SEPARATOR = "\x1f"
+
+
+def normalize_title(title: str) -> str:
+    """
+    Normalizes the book title for prefix matching: applies unicode compatibility normalization,
+    folds the case and collapses whitespaces
+
+    :param str title: book title
+    :return str: normalized title
+    """
+    return " ".join(unicodedata.normalize("NFKC", title).casefold().split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits the text into lowercase word tokens, leaving out the stop words
+
+    :param str text: text to be tokenized
+    :return List[str]: list of tokens
+    """
+    return [token for token in TOKEN_PATTERN.findall(text.casefold()) if token not in STOP_WORDS]
+
+
+def get_weighted_term_frequencies(book: Book, weights: Optional[Dict[str, int]] = None) -> Counter:
+    """
+    Counts the tokens of the searchable book fields, every occurrence counted with the weight of its field
+
+    :param Book book: book pydantic model
+    :param Optional[Dict[str, int]] weights: weights of the book fields, defaults to BOOK_TEXT_INDEX_WEIGHTS
+    :return Counter: weighted term frequencies
+    """
+    term_frequencies = Counter()
+    for field_name, weight in (weights or BOOK_TEXT_INDEX_WEIGHTS).items():
+        for token in tokenize(getattr(book, field_name) or ""):
+            term_frequencies[token] += weight
+    return term_frequencies
+
+
+class InvertedIndex:
+    """
+    In-memory full-text index over the book name, author and description fields.
+    Keeps a posting list (book ID -> weighted term frequency) per token, so a query only touches
+    the books containing at least one of the query tokens instead of scanning the whole book shelf.
+    Books are ranked by the sum of weighted term frequencies multiplied by the inverse document frequency
+    of every matched token
+    """
+
+    def __init__(self, weights: Optional[Dict[str, int]] = None):
+        self.weights: Dict[str, int] = weights or BOOK_TEXT_INDEX_WEIGHTS
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._tokens_by_book_id: Dict[str, Set[str]] = {}
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self._tokens_by_book_id)} books, {len(self._postings)} tokens)"
+
+    def __len__(self):
+        return len(self._tokens_by_book_id)
+
+    def add(self, book: Book) -> None:
+        """
+        Indexes the book, replacing previously indexed version of the book with the same book ID
+
+        :param Book book: book pydantic model
+        :return None:
+        """
+        term_frequencies = get_weighted_term_frequencies(book, weights=self.weights)
+        with self._lock:
+            self._remove(book.book_id)
+            for token, term_frequency in term_frequencies.items():
+                self._postings.setdefault(token, {})[book.book_id] = term_frequency
+            self._tokens_by_book_id[book.book_id] = set(term_frequencies)
+
+    def add_many(self, books: Iterable[Book]) -> None:
+        """
+        Indexes every book of the iterable
+
+        :param Iterable[Book] books: books to be indexed
+        :return None:
+        """
+        for book in books:
+            self.add(book)
+
+    def remove(self, book_id: str) -> None:
+        """
+        Removes the book from the index, does nothing if the book is not indexed
+
+        :param str book_id: book ID
+        :return None:
+        """
+        with self._lock:
+            self._remove(book_id)
+
+    def _remove(self, book_id: str) -> None:
+        for token in self._tokens_by_book_id.pop(book_id, ()):
+            posting = self._postings[token]
+            del posting[book_id]
+            if not posting: del self._postings[token]
+
+    def search(self, query: str, limit: int = 10, skip: int = 0) -> List[Tuple[str, float]]:
+        """
+        Returns a page of book IDs matching at least one of the query tokens, best matches first
+
+        :param str query: search phrase
+        :param int limit: maximum number of results to return
+        :param int skip: number of best matches to skip
+        :return List[Tuple[str, float]]: list of (book ID, relevance score) pairs
+        """
+        query_tokens = set(tokenize(query))
+        scores: Dict[str, float] = {}
+        with self._lock:
+            number_of_books = len(self._tokens_by_book_id)
+            for token in query_tokens:
+                posting = self._postings.get(token)
+                if not posting:
+                    continue
+                inverse_document_frequency = log(1 + number_of_books / len(posting))
+                for book_id, term_frequency in posting.items():
+                    scores[book_id] = scores.get(book_id, 0.0) + term_frequency * inverse_document_frequency
+        # ties are broken by book ID to keep pagination stable
+        best_matches = heapq.nsmallest(skip + limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return best_matches[skip:]
+
+
+class TitleSuggester:
+    """
+    In-memory prefix index of book titles used for autocomplete.
+    Keeps a single sorted list of "<normalized title><separator><original title>" strings, so the completions of
+    a prefix are found by binary search followed by a short sequential scan, and every title costs just one
+    string object and one list slot (no per-node overhead of a trie)
+    """
+
+    def __init__(self, titles: Optional[Iterable[str]] = None):
+        self._lock = threading.Lock()
+        self._entries: List[str] = []
+        if titles: self.add_many(titles)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self._entries)} titles)"
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _make_entry(title: str) -> str:
+        return f"{normalize_title(title)}{SUGGESTION_ENTRY_SEPARATOR}{title}"
+
+    def add(self, title: str) -> None:
+        """
+        Adds the title to the index, does nothing if the title is already indexed
+
+        :param str title: book title
+        :return None:
+        """
+        entry = self._make_entry(title)
+        with self._lock:
+            position = bisect.bisect_left(self._entries, entry)
+            if position == len(self._entries) or self._entries[position] != entry:
+                self._entries.insert(position, entry)
+
+    def add_many(self, titles: Iterable[str]) -> None:
+        """
+        Adds all the titles of the iterable at once, sorting the index only one time
+
+        :param Iterable[str] titles: book titles
+        :return None:
+        """
+        new_entries = [self._make_entry(title) for title in titles]
+        with self._lock:
+            self._entries = sorted(set(self._entries).union(new_entries))
+
+    def remove(self, title: str) -> None:
+        """
+        Removes the title from the index, does nothing if the title is not indexed
+
+        :param str title: book title
+        :return None:
+        """
+        entry = self._make_entry(title)
+        with self._lock:
+            position = bisect.bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                del self._entries[position]
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[str]:
+        """
+        Returns up to the limit of original titles which normalized form starts with the normalized prefix,
+        in alphabetical order
+
+        :param str prefix: beginning of the title typed by the user
+        :param int limit: maximum number of completions to return
+        :return List[str]: list of titles
+        """
+        normalized_prefix = normalize_title(prefix)
+        if not normalized_prefix or limit <= 0:
+            return []
+        separator_length = len(SUGGESTION_ENTRY_SEPARATOR)
+        completions = []
+        with self._lock:
+            position = bisect.bisect_left(self._entries, normalized_prefix)
+            for entry in self._entries[position:position + limit]:
+                if not entry.startswith(normalized_prefix):
+                    break
+                completions.append(entry[entry.index(SUGGESTION_ENTRY_SEPARATOR) + separator_length:])
+        return completions
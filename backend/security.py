@@ -3,6 +3,7 @@
 import os
 import binascii
 
+from uuid import uuid4
 from hashlib import sha1
 from datetime import datetime, timedelta, timezone
 from typing import AnyStr, Dict, NoReturn, Union, Optional
@@ -11,9 +12,13 @@ from jose import jwt
 from dotenv import dotenv_values
 from passlib.context import CryptContext 
 
+from .keys import KeyRing, init_key_ring
+
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 config = dotenv_values(".env")
+# JWT keys are parsed once, tokens are signed and verified by the cached key objects
+key_ring: KeyRing = init_key_ring(config=config)
 
 
 def generate_secret_key() -> bytes:
@@ -67,7 +72,8 @@ def get_password_hash(plain_password: AnyStr) -> AnyStr:
 
 def create_access_token(data: Dict, expires_delta: Optional[timedelta] = None) -> Dict[AnyStr, AnyStr]:
     """
-    Creates JWT access token based on passed data and applies passed JWT token lifetime 
+    Creates JWT access token based on passed data and applies passed JWT token lifetime.
+    Every token gets unique 'jti' claim used to revoke it
 
     :param data: data to be used as claims set
     :type data: Dict
@@ -84,12 +90,15 @@ def create_access_token(data: Dict, expires_delta: Optional[timedelta] = None) -
         expires_delta = timedelta(minutes=180)
     expires_at = utcnow + expires_delta
 
-    to_encode.update({"exp": expires_at})
+    # unique token ID makes the single token revocable before its expiry
+    to_encode.update({"exp": expires_at, "jti": uuid4().hex})
     # encode the given contents to get a JWT token
+    signing_key = key_ring.get_signing_key()
     encoded_jwt = jwt.encode(
         claims=to_encode,
-        key=config["SECRET_KEY"],
-        algorithm=config["ALGORITHM"]
+        key=signing_key.private_key,
+        algorithm=signing_key.algorithm,
+        headers={"kid": signing_key.kid} if signing_key.kid else None
     )
     return {
         "access_token": encoded_jwt,
@@ -102,18 +111,20 @@ def create_access_token(data: Dict, expires_delta: Optional[timedelta] = None) -
 
 def decode_jwt_token(encoded_token: AnyStr) -> Dict[AnyStr, AnyStr]:
     """
-    Decodes given JWT token based on secret key and algorithm from 
-    config and returns decoded JTW token payload
+    Decodes given JWT token verifying it by the key of its key ID (or by the secret key for
+    symmetric algorithms) and returns decoded JTW token payload
 
     :param encoded_token: encoded JWT token
     :type encoded_token: AnyStr
     :return: decoded JWT token payload
     :rtype: Dict[AnyStr, AnyStr]
     """
+    # the key is picked by the 'kid' header, the algorithm is pinned by the key, not taken from the token
+    verification_key = key_ring.get_verification_key(kid=jwt.get_unverified_header(encoded_token).get("kid"))
     payload = jwt.decode(
         token=encoded_token,
-        key=config["SECRET_KEY"],
-        algorithms=config["ALGORITHM"]
+        key=verification_key.public_key,
+        algorithms=[verification_key.algorithm]
     )
     return payload
 
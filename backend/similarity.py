@@ -0,0 +1,339 @@
+# backend/similarity.py
+
+import time
+import threading
+from collections import Counter
+from typing import Any, Optional, Dict, List, Tuple
+
+import numpy as np
+import scipy.sparse as sparse
+
+from .models import Book
+from .repository import BookRepository, BookChange
+from .search import get_weighted_term_frequencies
+
+
+# book fields the similarity is computed from, changes of the other fields (e.g. availability) keep the vectors
+SIMILARITY_FIELDS = ("book_name", "author", "description")
+
+# maximum number of cells of the dense block of similarities computed at once (4M float32 cells take 16 MiB),
+# the rows are batched by it, so the larger the book shelf, the fewer rows a batch has
+SIMILARITY_BATCH_CELLS = 1 << 22
+
+
+class SimilarBooksIndex:
+    """
+    Precomputed most similar books of every book on the book shelf, so recommending them is a single lookup.
+    Books are compared by cosine similarity of their TF-IDF vectors built from the book name, author and
+    description (field weights and tokens are shared with the full-text search). The L2-normalized vectors are
+    kept in the sparse matrix, and the similarities are computed by the matrix products batch of rows by batch
+    of rows, the top 'neighbors' of every row are selected by vectorized partial sorting.
+    The background thread builds the index on start up and then updates it with the changes of the book shelf,
+    collected by the book repository listener for 'update_delay_seconds' and applied together: vectors of the new
+    and changed books are computed with the current vocabulary, their neighbors are computed against all the
+    books, and the other books take them in only if they beat their worst neighbors. Deleted and availability
+    changes are visible at once. Once the number of changes since the last build exceeds 'full_rebuild_ratio'
+    of the book shelf, the index is rebuilt from scratch, so the vocabulary and the IDF weights catch up
+    """
+
+    def __init__(
+            self,
+            book_repository: BookRepository,
+            neighbors: int = 10,
+            update_delay_seconds: float = 1.0,
+            full_rebuild_ratio: float = 0.1,
+            logger: Optional[Any] = None
+    ):
+        self.book_repository: BookRepository = book_repository
+        self.neighbors: int = neighbors
+        self.update_delay_seconds: float = update_delay_seconds
+        self.full_rebuild_ratio: float = full_rebuild_ratio
+        self.logger: Optional[Any] = logger
+        self._lock = threading.Lock()
+        # TF-IDF model, used by the builder thread only
+        self._vocabulary: Dict[str, int] = {}
+        self._idf: np.ndarray = np.zeros(0, dtype=np.float32)
+        self._matrix: sparse.csr_matrix = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self._text_hashes: Dict[str, int] = {}
+        self._changes_since_rebuild: int = 0
+        self._built: bool = False
+        # served by lookup: row of the book -> rows of its most similar books, best first, padded by -1
+        self._rows: Dict[str, int] = {}
+        self._row_book_ids: List[Optional[str]] = []
+        self._neighbor_rows: np.ndarray = np.full((0, neighbors), -1, dtype=np.int64)
+        self._neighbor_scores: np.ndarray = np.zeros((0, neighbors), dtype=np.float32)
+        self._books: Dict[str, Book] = {}
+        # book ID -> latest version of the changed book, None if the book is deleted
+        self._pending: Dict[str, Optional[Book]] = {}
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._builder: Optional[threading.Thread] = None
+        book_repository.subscribe(self.apply_change)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self._rows)} books, {len(self._vocabulary)} tokens)"
+
+    @staticmethod
+    def _get_text_hash(book: Book) -> int:
+        return hash(tuple(getattr(book, field_name) for field_name in SIMILARITY_FIELDS))
+
+    def apply_change(self, change: BookChange) -> None:
+        """
+        Queues the book shelf change to be applied by the background thread, called by the book repository
+        on every write
+
+        :param BookChange change: book shelf change
+        :return None:
+        """
+        with self._lock:
+            if change.operation == "delete":
+                self._pending[change.book.book_id] = None
+                self._books.pop(change.book.book_id, None)
+            else:
+                self._pending[change.book.book_id] = change.book
+                if change.book.book_id in self._books: self._books[change.book.book_id] = change.book
+        self._wake_event.set()
+
+    def get_similar_books(self, book_id: str, limit: int = 10) -> Optional[List[Book]]:
+        """
+        Returns the most similar books of the book, best first
+
+        :param str book_id: book ID
+        :param int limit: maximum number of returned books, at most 'neighbors' books are kept per book
+        :return Optional[List[Book]]: list of book pydantic models or None if the book is not indexed (yet)
+        """
+        with self._lock:
+            row = self._rows.get(book_id)
+            if row is None or book_id not in self._books:
+                return None
+            similar_books = []
+            for neighbor_row in self._neighbor_rows[row].tolist():
+                if neighbor_row < 0 or len(similar_books) >= limit:
+                    break
+                neighbor_book = self._books.get(self._row_book_ids[neighbor_row])
+                if neighbor_book: similar_books.append(neighbor_book)
+            return similar_books
+
+    @staticmethod
+    def _vectorize(term_frequencies: List[Counter], vocabulary: Dict[str, int], idf: np.ndarray) -> sparse.csr_matrix:
+        # sublinear term frequencies weighted by IDF, every row is L2-normalized, so dot products are cosines
+        indptr, indices, frequencies = [0], [], []
+        for book_term_frequencies in term_frequencies:
+            for token, frequency in book_term_frequencies.items():
+                column = vocabulary.get(token)
+                if column is not None:
+                    indices.append(column)
+                    frequencies.append(frequency)
+            indptr.append(len(indices))
+        indptr, indices = np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int64)
+        data = np.log1p(np.asarray(frequencies, dtype=np.float32)) * idf[indices]
+        row_lengths = np.diff(indptr)
+        norms = np.sqrt(np.bincount(
+            np.repeat(np.arange(len(term_frequencies)), row_lengths), weights=data ** 2, minlength=len(term_frequencies)
+        ))
+        data = (data / np.repeat(norms, row_lengths)).astype(np.float32)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(term_frequencies), len(vocabulary)))
+
+    def _select_top(self, columns: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # keeps the best scored columns of every row, best first (ties by row number), padded by -1
+        top_columns = np.full((scores.shape[0], self.neighbors), -1, dtype=np.int64)
+        top_scores = np.zeros((scores.shape[0], self.neighbors), dtype=np.float32)
+        k = min(self.neighbors, scores.shape[1])
+        if k == 0:
+            return top_columns, top_scores
+        if scores.shape[1] > k:
+            best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            columns, scores = np.take_along_axis(columns, best, axis=1), np.take_along_axis(scores, best, axis=1)
+        order = np.lexsort((columns, -scores), axis=1)
+        columns, scores = np.take_along_axis(columns, order, axis=1), np.take_along_axis(scores, order, axis=1)
+        top_columns[:, :k] = np.where(scores > 0, columns, -1)
+        top_scores[:, :k] = np.where(scores > 0, scores, 0)
+        return top_columns, top_scores
+
+    def _get_top_neighbors(self, matrix: sparse.csr_matrix, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # computes the most similar rows of the given rows against all the rows of the matrix
+        neighbor_rows = np.full((len(rows), self.neighbors), -1, dtype=np.int64)
+        neighbor_scores = np.zeros((len(rows), self.neighbors), dtype=np.float32)
+        number_of_rows = matrix.shape[0]
+        if not len(rows) or number_of_rows < 2:
+            return neighbor_rows, neighbor_scores
+        transposed = matrix.T.tocsr()
+        batch_size = max(1, SIMILARITY_BATCH_CELLS // number_of_rows)
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            similarities = (matrix[batch] @ transposed).toarray()
+            # the book is not similar to itself
+            similarities[np.arange(len(batch)), batch] = 0
+            columns = np.broadcast_to(np.arange(number_of_rows), similarities.shape)
+            neighbor_rows[start:start + len(batch)], neighbor_scores[start:start + len(batch)] = self._select_top(
+                columns, similarities
+            )
+        return neighbor_rows, neighbor_scores
+
+    def rebuild(self) -> None:
+        """
+        Builds the index from scratch from all the books on the book shelf
+
+        :return None:
+        """
+        started_at = time.perf_counter()
+        with self._lock:
+            # the changes made so far are read from the book shelf, the ones made while reading it stay queued
+            self._pending.clear()
+        books = list(self.book_repository.iter_books())
+        term_frequencies = [get_weighted_term_frequencies(book) for book in books]
+        document_frequencies = Counter(token for book_term_frequencies in term_frequencies for token in book_term_frequencies)
+        vocabulary = {token: column for column, token in enumerate(document_frequencies)}
+        idf = (np.log(
+            (1 + len(books)) / (1 + np.fromiter(document_frequencies.values(), dtype=np.float32, count=len(vocabulary)))
+        ) + 1).astype(np.float32)
+        matrix = self._vectorize(term_frequencies, vocabulary, idf)
+        neighbor_rows, neighbor_scores = self._get_top_neighbors(matrix, np.arange(len(books)))
+        self._vocabulary, self._idf, self._matrix = vocabulary, idf, matrix
+        self._text_hashes = {book.book_id: self._get_text_hash(book) for book in books}
+        self._changes_since_rebuild = 0
+        with self._lock:
+            self._rows = {book.book_id: row for row, book in enumerate(books)}
+            self._row_book_ids = [book.book_id for book in books]
+            self._neighbor_rows, self._neighbor_scores = neighbor_rows, neighbor_scores
+            self._books = {book.book_id: book for book in books}
+            self._built = True
+        if self.logger: self.logger.debug(
+            f"Similar books index of {len(books)} books and {len(vocabulary)} tokens is built "
+            f"in {time.perf_counter() - started_at:.2f} s"
+        )
+
+    def update(self) -> None:
+        """
+        Applies the queued changes of the book shelf to the index, rebuilds it from scratch if there are
+        too many changes since the last build
+
+        :return None:
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            for book_id, book in pending.items():
+                if book is None: self._books.pop(book_id, None)
+                else: self._books[book_id] = book
+        if not self._built:
+            self.rebuild()
+            return
+        removed_rows, added_books = [], []
+        for book_id, book in pending.items():
+            text_hash = None if book is None else self._get_text_hash(book)
+            if text_hash == self._text_hashes.get(book_id):
+                continue
+            if book_id in self._rows: removed_rows.append(self._rows[book_id])
+            if book is None:
+                self._text_hashes.pop(book_id, None)
+            else:
+                self._text_hashes[book_id] = text_hash
+                added_books.append(book)
+        if not removed_rows and not added_books:
+            return
+        self._changes_since_rebuild += len(removed_rows) + len(added_books)
+        if self._changes_since_rebuild > self.full_rebuild_ratio * len(self._text_hashes):
+            self.rebuild()
+            return
+
+        matrix, neighbor_rows, neighbor_scores = self._matrix, self._neighbor_rows, self._neighbor_scores
+        removed_rows = np.asarray(removed_rows, dtype=np.int64)
+        stale_rows = np.zeros(0, dtype=np.int64)
+        if len(removed_rows):
+            mask = np.ones(matrix.shape[0], dtype=np.float32)
+            mask[removed_rows] = 0
+            matrix = (sparse.diags(mask) @ matrix).tocsr()
+            matrix.eliminate_zeros()
+            # the books which had the removed books among their neighbors are recomputed from scratch
+            stale_rows = np.nonzero(np.isin(neighbor_rows, removed_rows).any(axis=1))[0]
+            stale_rows = stale_rows[~np.isin(stale_rows, removed_rows)]
+        new_matrix = self._vectorize(
+            [get_weighted_term_frequencies(book) for book in added_books], self._vocabulary, self._idf
+        )
+        new_rows = np.arange(matrix.shape[0], matrix.shape[0] + len(added_books))
+        matrix = sparse.vstack([matrix, new_matrix], format="csr")
+        neighbor_rows = np.vstack([neighbor_rows, np.full((len(added_books), self.neighbors), -1, dtype=np.int64)])
+        neighbor_scores = np.vstack([neighbor_scores, np.zeros((len(added_books), self.neighbors), dtype=np.float32)])
+        neighbor_rows[removed_rows], neighbor_scores[removed_rows] = -1, 0
+        recomputed_rows = np.concatenate([stale_rows, new_rows])
+        neighbor_rows[recomputed_rows], neighbor_scores[recomputed_rows] = self._get_top_neighbors(matrix, recomputed_rows)
+        if len(added_books):
+            # the other books take the new ones in only if they beat the worst of their neighbors
+            new_similarities = (matrix @ new_matrix.T).tocsr()
+            best_new_scores = new_similarities.max(axis=1).toarray().ravel()
+            candidate_rows = np.nonzero(best_new_scores > neighbor_scores[:, -1])[0]
+            candidate_rows = candidate_rows[~np.isin(candidate_rows, recomputed_rows)]
+            if len(candidate_rows):
+                columns = np.hstack([
+                    neighbor_rows[candidate_rows], np.broadcast_to(new_rows, (len(candidate_rows), len(new_rows)))
+                ])
+                scores = np.hstack([neighbor_scores[candidate_rows], new_similarities[candidate_rows].toarray()])
+                neighbor_rows[candidate_rows], neighbor_scores[candidate_rows] = self._select_top(columns, scores)
+        self._matrix = matrix
+        with self._lock:
+            for row in removed_rows.tolist():
+                self._rows.pop(self._row_book_ids[row], None)
+                self._row_book_ids[row] = None
+            for row, book in zip(new_rows.tolist(), added_books):
+                self._rows[book.book_id] = row
+                self._row_book_ids.append(book.book_id)
+            self._neighbor_rows, self._neighbor_scores = neighbor_rows, neighbor_scores
+
+    def _run(self) -> None:
+        try:
+            self.rebuild()
+        except Exception as e:
+            # the index is built by the first update then
+            if self.logger: self.logger.warning(f"Failed to build similar books index: {e}")
+        while not self._stop_event.is_set():
+            self._wake_event.wait()
+            # the changes made shortly one after another are applied together
+            if self._stop_event.wait(self.update_delay_seconds):
+                return
+            self._wake_event.clear()
+            try:
+                self.update()
+            except Exception as e:
+                if self.logger: self.logger.warning(f"Failed to update similar books index: {e}")
+
+    def start(self) -> None:
+        """
+        Starts building the index and keeping it up to date in the background
+
+        :return None:
+        """
+        if self._builder is not None:
+            return
+        self._builder = threading.Thread(target=self._run, name="similar-books-builder", daemon=True)
+        self._builder.start()
+
+    def close(self) -> None:
+        if self._builder is None:
+            return
+        self._stop_event.set()
+        self._wake_event.set()
+        self._builder.join()
+        self._builder = None
+
+
+def init_similar_books_index(
+        config: Dict[str, Any],
+        book_repository: BookRepository,
+        logger: Optional[Any] = None
+) -> SimilarBooksIndex:
+    """
+    Creates the index of the most similar books of the repository, configured by 'SIMILAR_BOOKS_*' config values
+
+    :param Dict[str, Any] config: config extracted from .env file
+    :param BookRepository book_repository: book repository
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :return SimilarBooksIndex: similar books index instance
+    """
+    return SimilarBooksIndex(
+        book_repository=book_repository,
+        neighbors=int(config.get("SIMILAR_BOOKS_NEIGHBORS") or 10),
+        update_delay_seconds=float(config.get("SIMILAR_BOOKS_UPDATE_DELAY_SECONDS") or 1.0),
+        full_rebuild_ratio=float(config.get("SIMILAR_BOOKS_FULL_REBUILD_RATIO") or 0.1),
+        logger=logger
+    )
@@ -0,0 +1,180 @@
+# backend/stats.py
+
+import heapq
+import threading
+from datetime import datetime, timezone
+from typing import Any, Optional, Dict, List, Set
+
+from .models import Book, AuthorStats, BookShelfStats
+from .repository import BookRepository, BookChange
+
+
+class BookShelfStatistics:
+    """
+    Faceted statistics of the book shelf (number of books in total, by availability and by author) served from
+    in-memory counters, so reading them never touches the storage. The counters are updated incrementally by
+    the book repository listener on every write made through the repository (including bulk ingestion).
+    The background thread recounts the book shelf from scratch every 'reconcile_interval_seconds' and corrects
+    the counters that drifted, e.g. by the writes of the other service workers or made around the repository.
+    Authors whose books were written while the recount was running keep their incremental counters
+    until the next recount, as the recount may or may not have seen those writes
+    """
+
+    def __init__(
+            self,
+            book_repository: BookRepository,
+            reconcile_interval_seconds: float = 300.0,
+            logger: Optional[Any] = None
+    ):
+        self.book_repository: BookRepository = book_repository
+        self.reconcile_interval_seconds: float = reconcile_interval_seconds
+        self.logger: Optional[Any] = logger
+        self.reconciled_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+        # author -> [total, available]
+        self._counts: Dict[Optional[str], List[int]] = {}
+        self._total: int = 0
+        self._available: int = 0
+        # authors written during the running recount, None if no recount is running
+        self._touched_authors: Optional[Set[Optional[str]]] = None
+        self._stop_event = threading.Event()
+        self._reconciler: Optional[threading.Thread] = None
+        book_repository.subscribe(self.apply_change)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self._total} books, {len(self._counts)} authors)"
+
+    def _count(self, book: Book, sign: int) -> None:
+        counts = self._counts.setdefault(book.author, [0, 0])
+        counts[0] += sign
+        counts[1] += sign * int(book.available)
+        self._total += sign
+        self._available += sign * int(book.available)
+        if counts[0] <= 0: del self._counts[book.author]
+        if self._touched_authors is not None: self._touched_authors.add(book.author)
+
+    def apply_change(self, change: BookChange) -> None:
+        """
+        Updates the counters by the book shelf change, called by the book repository on every write
+
+        :param BookChange change: book shelf change
+        :return None:
+        """
+        with self._lock:
+            if change.operation == "delete":
+                self._count(change.book, -1)
+                return
+            if change.previous_book:
+                self._count(change.previous_book, -1)
+            self._count(change.book, 1)
+
+    def reconcile(self) -> int:
+        """
+        Recounts the books of every author from scratch and corrects the drifted counters
+
+        :return int: number of corrected authors
+        """
+        with self._lock:
+            self._touched_authors = set()
+        try:
+            recounted = self.book_repository.count_books_by_author()
+        except Exception:
+            with self._lock:
+                self._touched_authors = None
+            raise
+        corrected = 0
+        with self._lock:
+            touched_authors, self._touched_authors = self._touched_authors, None
+            for author in set(self._counts) | set(recounted):
+                if author in touched_authors:
+                    continue
+                expected = list(recounted.get(author, (0, 0)))
+                if self._counts.get(author, [0, 0]) == expected:
+                    continue
+                corrected += 1
+                if expected[0] > 0:
+                    self._counts[author] = expected
+                else:
+                    self._counts.pop(author, None)
+            self._total = sum(counts[0] for counts in self._counts.values())
+            self._available = sum(counts[1] for counts in self._counts.values())
+            self.reconciled_at = datetime.now(timezone.utc)
+        if corrected and self.logger:
+            self.logger.info(f"Book shelf statistics of {corrected} authors drifted and were corrected")
+        return corrected
+
+    def get_stats(self, authors_limit: int = 20) -> BookShelfStats:
+        """
+        Returns the current statistics of the book shelf
+
+        :param int authors_limit: maximum number of authors returned, the ones with the most books first
+        :return BookShelfStats: book shelf statistics pydantic model
+        """
+        with self._lock:
+            top_authors = heapq.nlargest(
+                authors_limit, self._counts.items(), key=lambda item: (item[1][0], item[1][1])
+            )
+            total, available, reconciled_at = self._total, self._available, self.reconciled_at
+        return BookShelfStats(
+            total=total,
+            available=available,
+            checked_out=total - available,
+            by_author=[
+                AuthorStats(author=author, total=counts[0], available=counts[1]) for author, counts in top_authors
+            ],
+            reconciled_at=reconciled_at.isoformat() if reconciled_at else None
+        )
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.reconcile_interval_seconds):
+            try:
+                self.reconcile()
+            except Exception as e:
+                # the incremental counters keep being served until the storage is back
+                if self.logger: self.logger.warning(f"Failed to reconcile book shelf statistics: {e}")
+
+    def start(self) -> None:
+        """
+        Counts the book shelf and starts recounting it periodically (unless the interval is 0)
+
+        :return None:
+        """
+        if self._reconciler is not None:
+            return
+        try:
+            self.reconcile()
+        except Exception as e:
+            if self.logger: self.logger.warning(f"Failed to count book shelf statistics: {e}")
+        if self.reconcile_interval_seconds <= 0:
+            return
+        self._reconciler = threading.Thread(target=self._run, name="book-stats-reconcile", daemon=True)
+        self._reconciler.start()
+
+    def close(self) -> None:
+        if self._reconciler is None:
+            return
+        self._stop_event.set()
+        self._reconciler.join()
+        self._reconciler = None
+
+
+def init_book_statistics(
+        config: Dict[str, Any],
+        book_repository: BookRepository,
+        logger: Optional[Any] = None
+) -> BookShelfStatistics:
+    """
+    Creates the book shelf statistics maintained by the writes of the repository and recounted every
+    'BOOK_STATS_RECONCILE_INTERVAL_SECONDS' (5 minutes by default)
+
+    :param Dict[str, Any] config: config extracted from .env file
+    :param BookRepository book_repository: book repository
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :return BookShelfStatistics: book shelf statistics instance
+    """
+    return BookShelfStatistics(
+        book_repository=book_repository,
+        reconcile_interval_seconds=float(config.get("BOOK_STATS_RECONCILE_INTERVAL_SECONDS") or 300),
+        logger=logger
+    )
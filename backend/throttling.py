@@ -0,0 +1,158 @@
+# backend/throttling.py
+
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Dict, List
+
+from .security import get_password_hash, verify_password
+
+
+class LoginThrottle:
+    """
+    Brute-force protection of the login endpoint.
+    Counts failed logins per username and per client IP, and once the free failures are used up, locks
+    the username (IP) out for the period doubled by every next failure up to 'max_lockout_seconds'.
+    The lockout is checked before the password hash is verified, so the locked out attempts cost no bcrypt work.
+    Failures of unknown usernames are padded to the calibrated duration of the password verification
+    by sleeping (not hashing), so they are cheap while taking about the same time as wrong passwords.
+    Counters of the usernames (IPs) without failures for 'failure_ttl_seconds' are forgotten
+    """
+
+    def __init__(
+            self,
+            username_free_failures: int = 5,
+            ip_free_failures: int = 20,
+            base_lockout_seconds: float = 1.0,
+            max_lockout_seconds: float = 900.0,
+            failure_ttl_seconds: float = 900.0,
+            password_check_seconds: float = 0.2,
+            logger: Optional[Any] = None
+    ):
+        self.username_free_failures: int = username_free_failures
+        self.ip_free_failures: int = ip_free_failures
+        self.base_lockout_seconds: float = base_lockout_seconds
+        self.max_lockout_seconds: float = max_lockout_seconds
+        self.failure_ttl_seconds: float = failure_ttl_seconds
+        # duration of the password verification, failures of unknown usernames are padded to it
+        self.password_check_seconds: float = password_check_seconds
+        self.logger: Optional[Any] = logger
+        self._lock = threading.Lock()
+        # key -> [number of failures, locked until, last failure time], ordered by the last failure time
+        self._failures: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(username_free_failures={self.username_free_failures}, "
+            f"ip_free_failures={self.ip_free_failures}, base_lockout_seconds={self.base_lockout_seconds}, "
+            f"max_lockout_seconds={self.max_lockout_seconds})"
+        )
+
+    @staticmethod
+    def _get_keys(username: str, client_host: str) -> Dict[str, str]:
+        # usernames are case folded, so the case variations of the same username share the counter
+        return {"username": f"username:{username.casefold()}", "ip": f"ip:{client_host}"}
+
+    def calibrate(self) -> float:
+        """
+        Measures the duration of the password verification with the current hashing settings
+
+        :return float: duration of the password verification in seconds
+        """
+        hashed_password = get_password_hash("calibration password")
+        started_at = time.perf_counter()
+        verify_password(plain_password="wrong password", hashed_password=hashed_password)
+        self.password_check_seconds = time.perf_counter() - started_at
+        if self.logger: self.logger.debug(f"Password verification takes {self.password_check_seconds * 1000:.0f} ms")
+        return self.password_check_seconds
+
+    def get_lockout_seconds(self, username: str, client_host: str) -> float:
+        """
+        Returns the remaining lockout time of either the username or the client IP
+
+        :param str username: username of the login attempt
+        :param str client_host: IP of the client
+        :return float: remaining lockout time in seconds, 0 if the login attempt is allowed
+        """
+        now = time.monotonic()
+        remaining_seconds = 0.0
+        with self._lock:
+            for key in self._get_keys(username, client_host).values():
+                failure = self._failures.get(key)
+                if failure: remaining_seconds = max(remaining_seconds, failure[1] - now)
+        return remaining_seconds
+
+    def record_failure(self, username: str, client_host: str) -> None:
+        """
+        Counts the failed login of the username from the client IP, locks them out if free failures are used up
+
+        :param str username: username of the login attempt
+        :param str client_host: IP of the client
+        :return None:
+        """
+        now = time.monotonic()
+        free_failures = {"username": self.username_free_failures, "ip": self.ip_free_failures}
+        with self._lock:
+            for kind, key in self._get_keys(username, client_host).items():
+                failures, locked_until, _ = self._failures.pop(key, (0, 0.0, 0.0))
+                failures += 1
+                if failures > free_failures[kind]:
+                    lockout_seconds = min(
+                        self.base_lockout_seconds * 2 ** (failures - free_failures[kind] - 1), self.max_lockout_seconds
+                    )
+                    locked_until = now + lockout_seconds
+                    if self.logger: self.logger.warning(
+                        f"Login of {key} is locked out for {lockout_seconds:.0f} s after {failures} failed attempts"
+                    )
+                self._failures[key] = [failures, locked_until, now]
+            self._forget_stale_failures(now)
+
+    def record_success(self, username: str, client_host: str) -> None:
+        """
+        Resets the failure counter of the username. Counter of the IP is kept, otherwise a single valid account
+        would let the attacker reset the IP counter at will
+
+        :param str username: username of the login attempt
+        :param str client_host: IP of the client
+        :return None:
+        """
+        with self._lock:
+            self._failures.pop(self._get_keys(username, client_host)["username"], None)
+
+    def _forget_stale_failures(self, now: float) -> None:
+        while self._failures:
+            _, (_, locked_until, last_failure_at) = next(iter(self._failures.items()))
+            if now - last_failure_at < self.failure_ttl_seconds or locked_until > now:
+                return
+            self._failures.popitem(last=False)
+
+    async def delay_failure(self, elapsed_seconds: float) -> None:
+        """
+        Pads the failed login to the duration of the password verification without using CPU,
+        so the failures of unknown usernames cannot be told from wrong passwords by the response time
+
+        :param float elapsed_seconds: time already spent on the login attempt
+        :return None:
+        """
+        remaining_seconds = self.password_check_seconds - elapsed_seconds
+        if remaining_seconds > 0: await asyncio.sleep(remaining_seconds)
+
+
+def init_login_throttle(config: Dict[str, Any], logger: Optional[Any] = None) -> LoginThrottle:
+    """
+    Creates the login throttle configured by LOGIN_THROTTLE_* config values
+
+    :param Dict[str, Any] config: config extracted from .env file
+    :param logger: logger instance, defaults to None
+    :type logger: Optional[Any]
+    :return LoginThrottle: login throttle instance
+    """
+    return LoginThrottle(
+        username_free_failures=int(config.get("LOGIN_THROTTLE_USERNAME_FREE_FAILURES") or 5),
+        ip_free_failures=int(config.get("LOGIN_THROTTLE_IP_FREE_FAILURES") or 20),
+        base_lockout_seconds=float(config.get("LOGIN_THROTTLE_BASE_LOCKOUT_SECONDS") or 1.0),
+        max_lockout_seconds=float(config.get("LOGIN_THROTTLE_MAX_LOCKOUT_SECONDS") or 900.0),
+        failure_ttl_seconds=float(config.get("LOGIN_THROTTLE_FAILURE_TTL_SECONDS") or 900.0),
+        logger=logger
+    )
@@ -0,0 +1,81 @@
+# benchmarks/bench_book_repository.py
+
+"""
+Runs the same workload against every requested book storage backend and prints
+operations per second for each of its phases.
+Run from the project's root directory, e.g.:
+python -m benchmarks.bench_book_repository --backends memory sqlite --books 20000
+The 'mongo' backend is configured from the .env file in the same way as the service itself.
+"""
+
+import random
+import argparse
+import tempfile
+from uuid import uuid4
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, List
+
+from dotenv import dotenv_values
+
+from backend.models import Book
+from backend.repository import BookRepository, InMemoryBookRepository, SQLiteBookRepository, init_book_repository
+
+
+def make_books(number_of_books: int, seed: int) -> List[Book]:
+    rng = random.Random(seed)
+    return [
+        Book(
+            book_id=uuid4().hex,
+            book_name=f"Benchmark Book {book_number}",
+            author=f"Author {rng.randint(1, max(1, number_of_books // 10))}",
+            description=" ".join(rng.choice(("lorem", "ipsum", "dolor", "sit", "amet")) for _ in range(40)),
+            available=True
+        )
+        for book_number in range(number_of_books)
+    ]
+
+
+def timed(label: str, operations: int, func: Callable[[], None]) -> None:
+    started_at = perf_counter()
+    func()
+    elapsed = perf_counter() - started_at
+    print(f"  {label:<12} {operations:>8} ops  {elapsed:8.3f} s  {operations / elapsed:>12,.0f} ops/s")
+
+
+def run_workload(repository: BookRepository, books: List[Book], seed: int) -> None:
+    rng = random.Random(seed)
+    lookups = [rng.choice(books).book_id for _ in range(len(books))]
+    pages = len(books) // 10
+
+    timed("add", len(books), lambda: [repository.add_book(book=book) for book in books])
+    timed("get", len(lookups), lambda: [repository.get_book(book_id=book_id) for book_id in lookups])
+    timed("list page", pages, lambda: [repository.list_books(limit=10, skip=page * 10) for page in range(pages)])
+    timed("delete", len(books), lambda: [repository.delete_book_by_name(book_name=book.book_name) for book in books])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Book storage backends benchmark")
+    parser.add_argument("--backends", nargs="+", default=["memory", "sqlite"], choices=["memory", "sqlite", "mongo"])
+    parser.add_argument("--books", type=int, default=10000, help="number of books used by the workload")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    books = make_books(number_of_books=args.books, seed=args.seed)
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        repository_factories: Dict[str, Callable[[], BookRepository]] = {
+            "memory": InMemoryBookRepository,
+            "sqlite": lambda: SQLiteBookRepository(database_path=str(Path(temporary_directory, "books.sqlite3"))),
+            "mongo": lambda: init_book_repository(config={**dotenv_values(".env"), "BOOK_STORAGE_BACKEND": "mongo"}),
+        }
+        for backend in args.backends:
+            print(f"{backend}:")
+            repository = repository_factories[backend]()
+            try:
+                run_workload(repository=repository, books=books, seed=args.seed)
+            finally:
+                repository.close()
+
+
+if __name__ == "__main__":
+    main()
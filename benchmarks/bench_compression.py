@@ -0,0 +1,85 @@
+# benchmarks/bench_compression.py
+
+"""
+Compresses pages of realistic book shelf JSON (as returned by GET /books) with every available content encoding
+and level, and prints the compression ratio, the CPU time per page and the time to transfer the page over
+the given link, so the bandwidth saved can be weighed against the CPU spent.
+Run from the project's root directory, e.g.:
+python -m benchmarks.bench_compression --page-size 100 --link-mbps 10
+'br' and 'zstd' encodings are measured only if 'brotli' and 'zstandard' packages are installed.
+"""
+
+import json
+import random
+import argparse
+from uuid import uuid4
+from time import perf_counter
+from typing import Dict, List
+
+from fastapi.encoders import jsonable_encoder
+
+from backend.models import Book
+from backend.compression import Compressor, get_available_encodings
+
+
+LEVELS: Dict[str, List[int]] = {
+    "gzip": [1, 6, 9],
+    "br": [1, 4, 5, 9, 11],
+    "zstd": [1, 3, 6, 12, 19],
+}
+
+WORDS = (
+    "the adventures of a detective who travels across London and solves mysteries with his loyal friend while "
+    "an old family secret is revealed in a small village by the sea where the war changed everything for "
+    "two sisters searching for their lost father during the long winter of a forgotten kingdom"
+).split()
+
+
+def make_books(number_of_books: int, seed: int) -> List[Book]:
+    rng = random.Random(seed)
+    return [
+        Book(
+            book_id=uuid4().hex,
+            book_name=" ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))).capitalize(),
+            author=f"{rng.choice(('John', 'Mary', 'Arthur', 'Jane', 'Leo'))} {rng.choice(('Doyle', 'Austen', 'Tolstoy', 'Smith'))}",
+            # descriptions make up most of the payload, from a sentence to a few paragraphs
+            description=" ".join(rng.choice(WORDS) for _ in range(int(rng.paretovariate(1.5) * 30))).capitalize(),
+            available=rng.random() < 0.8
+        )
+        for _ in range(number_of_books)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Response compression benchmark")
+    parser.add_argument("--page-size", type=int, default=100, help="number of books per response page")
+    parser.add_argument("--pages", type=int, default=50, help="number of distinct pages compressed")
+    parser.add_argument("--link-mbps", type=float, default=10.0, help="client link bandwidth in megabits per second")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    books = make_books(number_of_books=args.page_size * args.pages, seed=args.seed)
+    pages = [
+        json.dumps(jsonable_encoder(books[page * args.page_size:(page + 1) * args.page_size])).encode()
+        for page in range(args.pages)
+    ]
+    identity_size = sum(len(page) for page in pages) / len(pages)
+    bytes_per_ms = args.link_mbps * 1_000_000 / 8 / 1000
+    print(f"{args.pages} pages of {args.page_size} books, {identity_size / 1024:.1f} KiB per page, {args.link_mbps} Mbit/s link")
+    print(f"  {'encoding':<10} {'level':>5} {'KiB/page':>9} {'ratio':>6} {'CPU ms/page':>12} {'MiB/s':>8} {'transfer ms':>12} {'total ms':>9}")
+    transfer_ms = identity_size / bytes_per_ms
+    print(f"  {'identity':<10} {'-':>5} {identity_size / 1024:>9.1f} {1.0:>6.2f} {0.0:>12.3f} {'-':>8} {transfer_ms:>12.1f} {transfer_ms:>9.1f}")
+    for encoding in get_available_encodings():
+        for level in LEVELS[encoding]:
+            started_at = perf_counter()
+            compressed_size = sum(len(Compressor.compress_body(encoding, level, page)) for page in pages) / len(pages)
+            cpu_ms = (perf_counter() - started_at) * 1000 / len(pages)
+            transfer_ms = compressed_size / bytes_per_ms
+            print(
+                f"  {encoding:<10} {level:>5} {compressed_size / 1024:>9.1f} {identity_size / compressed_size:>6.2f} "
+                f"{cpu_ms:>12.3f} {identity_size / 1024 / 1024 / (cpu_ms / 1000):>8.1f} {transfer_ms:>12.1f} {cpu_ms + transfer_ms:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# benchmarks/bench_write_coalescing.py
+
+"""
+Compares the throughput of concurrent single-book inserts written one by one against
+the same inserts coalesced into bulk writes by WriteCoalescer with various flush windows.
+Uses a throwaway collection of the test MongoDB configured by TEST_MONGODB_* variables of the .env file.
+Run from the project's root directory, e.g.:
+python -m benchmarks.bench_write_coalescing --inserts 5000 --concurrency 64 --delays-ms 1 5 10
+"""
+
+import argparse
+from uuid import uuid4
+from time import perf_counter
+from typing import Callable, Any, Dict
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import dotenv_values
+
+from backend.database import MongoAdapter
+from backend.batching import WriteCoalescer
+
+
+BENCHMARK_COLLECTION_NAME = "bench_write_coalescing"
+
+
+def init_mongo_adapter(config: Dict[str, Any]) -> MongoAdapter:
+    return MongoAdapter(
+        host=config["TEST_MONGODB_HOST"],
+        port=config["TEST_MONGODB_PORT"],
+        db_name=config["TEST_MONGODB_DB_NAME"],
+        username=config.get("TEST_MONGODB_USERNAME"),
+        password=config.get("TEST_MONGODB_PASSWORD"),
+        requires_auth=bool(config.get("TEST_MONGODB_USERNAME")),
+        collection_name=BENCHMARK_COLLECTION_NAME,
+        required_index_params=[("book_id", True)]
+    )
+
+
+def run(label: str, inserts: int, concurrency: int, insert: Callable[[Dict[str, Any]], Any]) -> None:
+    documents = [
+        {"book_id": uuid4().hex, "book_name": f"Benchmark Book {number}", "available": True}
+        for number in range(inserts)
+    ]
+    started_at = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(insert, documents))
+    elapsed = perf_counter() - started_at
+    print(f"{label:<28} {inserts:>8} inserts  {elapsed:8.3f} s  {inserts / elapsed:>10,.0f} inserts/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write coalescing benchmark")
+    parser.add_argument("--inserts", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64, help="number of concurrent writers")
+    parser.add_argument("--delays-ms", type=float, nargs="+", default=[1.0, 5.0, 10.0], help="flush windows to try")
+    parser.add_argument("--max-batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    mongo_adapter = init_mongo_adapter(config=dotenv_values(".env"))
+    try:
+        run("per-request insert_one", args.inserts, args.concurrency, lambda data: mongo_adapter.insert_db_entry(data=data))
+        for max_delay_ms in args.delays_ms:
+            coalescer = WriteCoalescer(
+                mongo_adapter=mongo_adapter,
+                max_delay_ms=max_delay_ms,
+                max_batch_size=args.max_batch_size
+            )
+            run(f"coalesced, {max_delay_ms:g} ms window", args.inserts, args.concurrency, lambda data: coalescer.insert(data=data))
+            coalescer.close()
+    finally:
+        mongo_adapter.db.drop_collection(BENCHMARK_COLLECTION_NAME)
+
+
+if __name__ == "__main__":
+    main()
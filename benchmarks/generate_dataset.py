@@ -0,0 +1,254 @@
+# benchmarks/generate_dataset.py
+
+"""
+Deterministically generates a large synthetic book shelf and user base and loads it in bulk, so pagination,
+search and caching can be measured at production-like sizes. The same seed always produces the same records.
+Book names and authors follow Zipf distributions (a few popular words and prolific authors, a long tail of rare
+ones), descriptions have heavy-tailed lengths. Users share a small pool of passwords whose bcrypt hashes are
+computed once at the chosen cost: the password of the user number N is 'password-<N % password pool size>'.
+Run from the project's root directory, e.g.:
+python -m benchmarks.generate_dataset --target sqlite --books 1000000 --users 100000
+python -m benchmarks.generate_dataset --target jsonl --output-folder data/dataset --books 5000000
+Targets: 'mongo' (collections configured by the .env file), 'sqlite' (embedded backend at SQLITE_DATABASE_PATH
+or --sqlite-path), 'memory' (in-process repository, measures generation and indexing only) and 'jsonl'
+(books.jsonl and users.jsonl files, to be loaded by mongoimport or any other stand-in).
+"""
+
+import json
+import random
+import argparse
+from pathlib import Path
+from itertools import islice, accumulate
+from time import perf_counter
+from uuid import UUID
+from typing import Any, Dict, List, Iterable, Iterator
+
+import pymongo
+from dotenv import dotenv_values
+from passlib.hash import bcrypt
+
+from backend.models import Book, UserInDB
+from backend.indexes import IndexSpec
+from backend.database import MongoAdapter
+from backend.repository import BookRepository, InMemoryBookRepository, SQLiteBookRepository, init_book_repository
+
+
+NOUNS = (
+    "night house war love time world life city king girl river garden shadow empire winter summer journey stone "
+    "fire island dream sea road letter daughter son mountain memory storm forest star moon sun light glass iron "
+    "paper heart voice song book story door window bridge tower ghost wolf fox crow rose thorn salt bone blood "
+    "ash smoke snow rain wind dust clock map key mirror"
+).split()
+
+ADJECTIVES = (
+    "secret last dark lost silent golden broken hidden ancient wild quiet long little great forgotten northern "
+    "eternal crimson"
+).split()
+
+FUNCTION_WORDS = "the of and a in to with for on by".split()
+
+TITLE_TEMPLATES = ("The {adjective} {noun}", "{noun} of {noun}", "The {noun} and the {noun}", "{adjective} {noun}s")
+
+FIRST_NAMES = (
+    "John Mary Arthur Jane Leo Anna Ivan Olga Ilgiz Maria James Linda Robert Emma Pierre Sofia Hiro Yuki Ahmed "
+    "Fatima Carlos Lucia Chen Wei Amara Kofi Elena Nikolai Sara David"
+).split()
+
+LAST_NAMES = (
+    "Doyle Austen Tolstoy Smith Rowling Roberts Duseev Garcia Tanaka Ivanova Martin Brown Rossi Kim Okafor "
+    "Novak Silva Jensen Kowalski Dubois Haddad Nakamura Petrov Moreau Lindgren Costa Mensah Walker Young Khan"
+).split()
+
+
+class ZipfSampler:
+    """
+    Samples the items of the list with probabilities proportional to 1 / rank ** exponent
+    """
+
+    def __init__(self, items: List[Any], exponent: float, rng: random.Random):
+        self.items: List[Any] = items
+        self.rng: random.Random = rng
+        self.cum_weights: List[float] = list(accumulate(1.0 / rank ** exponent for rank in range(1, len(items) + 1)))
+
+    def sample(self, k: int = 1) -> List[Any]:
+        return self.rng.choices(self.items, cum_weights=self.cum_weights, k=k)
+
+
+def make_uuid(rng: random.Random) -> str:
+    return UUID(int=rng.getrandbits(128), version=4).hex
+
+
+def generate_books(number_of_books: int, seed: int, number_of_authors: int = 0) -> Iterator[Book]:
+    """
+    Lazily generates the books, the same seed always produces the same books
+
+    :param int number_of_books: number of books
+    :param int seed: random seed
+    :param int number_of_authors: number of distinct authors, defaults to a tenth of the books
+    :return Iterator[Book]: books iterator
+    """
+    rng = random.Random(seed)
+    nouns = ZipfSampler(NOUNS, exponent=1.1, rng=rng)
+    adjectives = ZipfSampler(ADJECTIVES, exponent=1.1, rng=rng)
+    # descriptions are dominated by the function words, as the natural text is
+    words = ZipfSampler(FUNCTION_WORDS + NOUNS + ADJECTIVES, exponent=1.0, rng=rng)
+    authors = ZipfSampler(
+        [
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            + (f" {author_number}" if author_number >= len(FIRST_NAMES) * len(LAST_NAMES) else "")
+            for author_number in range(number_of_authors or max(number_of_books // 10, 1))
+        ],
+        exponent=1.2,
+        rng=rng
+    )
+    # book names are unique, popular titles are told apart by the volume number
+    title_counts: Dict[str, int] = {}
+    for _ in range(number_of_books):
+        template = rng.choice(TITLE_TEMPLATES)
+        title = template.format(adjective=adjectives.sample()[0], noun="{noun}").capitalize()
+        while "{noun}" in title:
+            title = title.replace("{noun}", nouns.sample()[0], 1)
+        title_counts[title] = title_counts.get(title, 0) + 1
+        if title_counts[title] > 1:
+            title = f"{title}, vol. {title_counts[title]}"
+        yield Book(
+            book_id=make_uuid(rng),
+            book_name=title,
+            author=authors.sample()[0],
+            description=" ".join(words.sample(k=min(int(rng.paretovariate(1.5) * 20), 2000))).capitalize() or None,
+            available=rng.random() < 0.8
+        )
+
+
+def hash_password_pool(password_pool_size: int, bcrypt_rounds: int, seed: int) -> List[str]:
+    """
+    Computes the bcrypt hashes of the password pool, salts are derived from the seed,
+    so the same seed always produces the same hashes
+
+    :param int password_pool_size: number of distinct passwords
+    :param int bcrypt_rounds: bcrypt cost factor (log2 of the number of rounds)
+    :param int seed: random seed
+    :return List[str]: hashes of 'password-<N>' passwords
+    """
+    rng = random.Random(seed)
+    salt_alphabet = "./ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+    return [
+        bcrypt.using(
+            rounds=bcrypt_rounds,
+            # the last salt character carries 2 bits only, so it is one of the 4 canonical ones
+            salt="".join(rng.choice(salt_alphabet) for _ in range(21)) + rng.choice(".Oeu")
+        ).hash(f"password-{password_number}")
+        for password_number in range(password_pool_size)
+    ]
+
+
+def generate_users(number_of_users: int, seed: int, password_hashes: List[str]) -> Iterator[UserInDB]:
+    """
+    Lazily generates the users, the same seed always produces the same users
+
+    :param int number_of_users: number of users
+    :param int seed: random seed
+    :param List[str] password_hashes: hashes of the password pool, see hash_password_pool()
+    :return Iterator[UserInDB]: users iterator
+    """
+    rng = random.Random(seed)
+    for user_number in range(number_of_users):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = f"{first_name.lower()}.{last_name.lower()}{user_number}"
+        yield UserInDB(
+            username=username,
+            hashed_password=password_hashes[user_number % len(password_hashes)],
+            disabled=rng.random() < 0.02,
+            full_name=f"{first_name} {last_name}",
+            email=f"{username}@example.com"
+        )
+
+
+def load_users_to_mongo(config: Dict[str, Any], users: Iterable[UserInDB], batch_size: int) -> int:
+    mongo_adapter = MongoAdapter(
+        host=config["MONGODB_HOST"],
+        port=config["MONGODB_PORT"],
+        db_name=config["MONGODB_DB_NAME"],
+        username=config["MONGODB_USERNAME"],
+        password=config["MONGODB_PASSWORD"],
+        requires_auth=True,
+        collection_name=config["MONGODB_USER_COLLECTION_NAME"],
+        required_index_params=[IndexSpec(name="username", unique=True)]
+    )
+    added = 0
+    users = iter(users)
+    while True:
+        batch = list(islice(users, batch_size))
+        if not batch:
+            return added
+        # upserts by username, so the load can be repeated
+        mongo_adapter.bulk_write(
+            [pymongo.ReplaceOne({"username": user.username}, user.dict(), upsert=True) for user in batch], ordered=False
+        )
+        added += len(batch)
+
+
+def write_jsonl(file_path: Path, records: Iterable[Any]) -> int:
+    written = 0
+    with open(file_path, "w", encoding="utf-8") as jsonl_file:
+        for record in records:
+            jsonl_file.write(json.dumps(record.dict()) + "\n")
+            written += 1
+    return written
+
+
+def timed(label: str, load: Any) -> None:
+    started_at = perf_counter()
+    loaded = load()
+    elapsed = perf_counter() - started_at
+    print(f"  {label:<6} {loaded:>10} records  {elapsed:8.1f} s  {loaded / max(elapsed, 1e-9):>10,.0f} records/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Synthetic dataset generator")
+    parser.add_argument("--target", default="sqlite", choices=["mongo", "sqlite", "memory", "jsonl"])
+    parser.add_argument("--books", type=int, default=100000, help="number of books")
+    parser.add_argument("--authors", type=int, default=0, help="number of distinct authors, a tenth of the books by default")
+    parser.add_argument("--users", type=int, default=10000, help="number of users")
+    parser.add_argument("--password-pool", type=int, default=16, help="number of distinct user passwords")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="bcrypt cost factor of the password hashes")
+    parser.add_argument("--batch-size", type=int, default=5000, help="number of records written at once")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sqlite-path", default=None, help="SQLite database path, SQLITE_DATABASE_PATH by default")
+    parser.add_argument("--output-folder", default="data/dataset", help="output folder of the jsonl target")
+    args = parser.parse_args()
+
+    config = dotenv_values(".env")
+    books = generate_books(number_of_books=args.books, seed=args.seed, number_of_authors=args.authors)
+    started_at = perf_counter()
+    password_hashes = hash_password_pool(args.password_pool, bcrypt_rounds=args.bcrypt_rounds, seed=args.seed)
+    print(f"{args.password_pool} password hashes at cost {args.bcrypt_rounds} computed in {perf_counter() - started_at:.1f} s")
+    # users get their own seed, so the books do not change with the number of users and vice versa
+    users = generate_users(number_of_users=args.users, seed=args.seed + 1, password_hashes=password_hashes)
+    print(f"{args.target}:")
+    if args.target == "jsonl":
+        output_folder = Path(args.output_folder)
+        output_folder.mkdir(parents=True, exist_ok=True)
+        timed("books", lambda: write_jsonl(output_folder / "books.jsonl", books))
+        timed("users", lambda: write_jsonl(output_folder / "users.jsonl", users))
+        return
+    if args.target == "mongo":
+        repository: BookRepository = init_book_repository(config={**config, "BOOK_STORAGE_BACKEND": "mongo"})
+    elif args.target == "sqlite":
+        repository = SQLiteBookRepository(
+            database_path=args.sqlite_path or config.get("SQLITE_DATABASE_PATH") or "data/books.sqlite3"
+        )
+    else:
+        repository = InMemoryBookRepository()
+    try:
+        timed("books", lambda: repository.add_books(books, batch_size=args.batch_size))
+    finally:
+        repository.close()
+    if args.target == "mongo":
+        timed("users", lambda: load_users_to_mongo(config, users, batch_size=args.batch_size))
+    else:
+        print("  users are stored by MongoDB only, use 'mongo' or 'jsonl' target to load them")
+
+
+if __name__ == "__main__":
+    main()
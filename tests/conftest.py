@@ -9,7 +9,8 @@ from fastapi.testclient import TestClient
 
 from backend.endpoints import app
 from backend.models import UserInDB
-from backend.database import MongoAdapter
+from backend.indexes import IndexSpec
+from backend.database import MongoAdapter, get_mongo_client_params
 
 
 # extract environmental variables from .env file
@@ -59,7 +60,7 @@ def create_test_user_model() -> UserInDB:
 def _mongo_adapter_book_shelf_collection() -> MongoAdapter:
     """
     Fixture creates instance of MongoAdapter class to work with
-    book shelf collection
+    book shelf collection, kept in memory if 'TEST_MONGODB_CLIENT' config value is "memory"
 
     :return database.MongoAdapter: instance of MongoAdapter class
     """
@@ -67,8 +68,14 @@ def _mongo_adapter_book_shelf_collection() -> MongoAdapter:
         host=config["TEST_MONGODB_HOST"],
         port=int(config["TEST_MONGODB_PORT"]),
         db_name=config["TEST_MONGODB_DB_NAME"],
+        username=config.get("TEST_MONGODB_USERNAME"),
+        password=config.get("TEST_MONGODB_PASSWORD"),
+        requires_auth=bool(config.get("TEST_MONGODB_USERNAME")),
         collection_name=config["TEST_MONGODB_BOOK_SHELF_COLLECTION_NAME"],
-        recreate_indexes=True
+        # test documents are identified by 'issue' field
+        required_index_params=[IndexSpec(name="issue", unique=True)],
+        recreate_indexes=True,
+        **get_mongo_client_params(config, prefix="TEST_MONGODB")
     )
     return mongo_adapter
 
@@ -78,7 +85,7 @@ def _mongo_adapter_book_shelf_collection() -> MongoAdapter:
 def _mongo_adapter_users_collection() -> MongoAdapter:
     """
     Fixture creates instance of MongoAdapter class to work with
-    users collection
+    users collection, kept in memory if 'TEST_MONGODB_CLIENT' config value is "memory"
 
     :return database.MongoAdapter: instance of MongoAdapter class
     """
@@ -86,7 +93,12 @@ def _mongo_adapter_users_collection() -> MongoAdapter:
         host=config["TEST_MONGODB_HOST"],
         port=int(config["TEST_MONGODB_PORT"]),
         db_name=config["TEST_MONGODB_DB_NAME"],
+        username=config.get("TEST_MONGODB_USERNAME"),
+        password=config.get("TEST_MONGODB_PASSWORD"),
+        requires_auth=bool(config.get("TEST_MONGODB_USERNAME")),
         collection_name=config["TEST_MONGODB_USER_COLLECTION_NAME"],
-        recreate_indexes=True
+        required_index_params=[IndexSpec(name="username", unique=True)],
+        recreate_indexes=True,
+        **get_mongo_client_params(config, prefix="TEST_MONGODB")
     )
     return mongo_adapter
@@ -0,0 +1,114 @@
+# tests/test_admission.py
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.admission import AdmissionLimiter, AdmissionController, AdmissionControlMiddleware
+
+
+"""
+Test class for admission.py module contains test cases to check
+admission control and load shedding per route class
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_admission.py --cov-report term-missing --cov=sources
+"""
+
+
+@pytest.mark.admission
+class TestAdmissionLimiter:
+    """
+    Test class to check functionality of AdmissionLimiter class
+    """
+
+    def test_queue_and_handoff(self):
+        """
+        Checks that requests over the limit wait in the bounded queue, get the released slots in order,
+        and are rejected once the queue is full or the queue timeout expires
+        """
+
+        async def scenario():
+            limiter = AdmissionLimiter(route_class="auth", max_concurrency=1, max_queue=1, queue_timeout_ms=200)
+            assert await limiter.acquire()
+            waiting = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            # the queue is full
+            assert not await limiter.acquire()
+            limiter.release()
+            assert await waiting
+            assert limiter.get_stats()["in_flight"] == 1
+            # the slot is not released in time
+            assert not await limiter.acquire()
+            limiter.release()
+            return limiter.get_stats()
+
+        stats = asyncio.run(scenario())
+        assert stats == {
+            "in_flight": 0, "queued": 0, "max_concurrency": 1, "max_queue": 1, "admitted_total": 2, "rejected_total": 2
+        }
+
+    def test_cancelled_waiter_leaves_queue(self):
+        """
+        Checks that the waiting request cancelled by the client leaves the queue without taking the slot
+        """
+
+        async def scenario():
+            limiter = AdmissionLimiter(route_class="reads", max_concurrency=1, max_queue=1, queue_timeout_ms=1000)
+            assert await limiter.acquire()
+            waiting = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            waiting.cancel()
+            await asyncio.sleep(0)
+            limiter.release()
+            return limiter.get_stats()
+
+        stats = asyncio.run(scenario())
+        assert stats["in_flight"] == 0 and stats["queued"] == 0
+
+
+@pytest.mark.admission
+class TestAdmissionControlMiddleware:
+    """
+    Test class to check functionality of AdmissionControlMiddleware class
+    """
+
+    def test_saturated_route_class_does_not_block_others(self):
+        """
+        Checks that requests of the saturated route class are rejected with 429 and Retry-After,
+        while requests of the other route classes are still served
+        """
+        app = FastAPI()
+        login_started, release_login = threading.Event(), threading.Event()
+
+        @app.post("/token")
+        def login():
+            login_started.set()
+            release_login.wait(timeout=5)
+            return {"access_token": "token"}
+
+        @app.get("/books/{book_id}")
+        def read_book(book_id: str):
+            return {"book_id": book_id}
+
+        controller = AdmissionController(limiters={
+            "auth": AdmissionLimiter(route_class="auth", max_concurrency=1, max_queue=0, reject_status_code=429),
+            "reads": AdmissionLimiter(route_class="reads", max_concurrency=1),
+        })
+        app.add_middleware(AdmissionControlMiddleware, controller=controller)
+        client = TestClient(app)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            first_login = executor.submit(client.post, "/token")
+            assert login_started.wait(timeout=5)
+            rejected_login = client.post("/token")
+            assert client.get("/books/1").status_code == 200
+            assert controller.get_stats()["auth"]["in_flight"] == 1
+            release_login.set()
+            assert first_login.result().status_code == 200
+        assert rejected_login.status_code == 429
+        assert rejected_login.headers["retry-after"] == "1"
+        assert controller.get_stats()["auth"]["rejected_total"] == 1
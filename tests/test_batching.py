@@ -0,0 +1,129 @@
+# tests/test_batching.py
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteConcernError
+
+from backend.batching import WriteCoalescer
+
+
+"""
+Test class for batching.py module contains test cases to check
+group-commit coalescing of concurrent inserts
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_batching.py --cov-report term-missing --cov=sources
+"""
+
+
+class BulkWriteRecorder:
+    """
+    Stand-in of MongoAdapter recording bulk writes and enforcing uniqueness of 'book_name' field
+    """
+
+    collection_name = "test_books"
+
+    def __init__(self, round_trip_seconds: float = 0.0, write_concern_failed: bool = False):
+        self.round_trip_seconds = round_trip_seconds
+        self.write_concern_failed = write_concern_failed
+        self.batch_sizes = []
+        self.book_names = set()
+        self._lock = threading.Lock()
+
+    def bulk_write(self, requests, ordered=False):
+        time.sleep(self.round_trip_seconds)
+        write_errors = []
+        with self._lock:
+            self.batch_sizes.append(len(requests))
+            for index, request in enumerate(requests):
+                document = request._doc
+                if document["book_name"] in self.book_names:
+                    write_errors.append({"index": index, "code": 11000, "errmsg": "E11000 duplicate key error"})
+                    continue
+                document["_id"] = ObjectId()
+                self.book_names.add(document["book_name"])
+        write_concern_errors = [{"code": 64, "errmsg": "waiting for replication timed out"}] if self.write_concern_failed else []
+        if write_errors or write_concern_errors:
+            raise BulkWriteError({"writeErrors": write_errors, "writeConcernErrors": write_concern_errors})
+
+
+@pytest.mark.batching
+class TestWriteCoalescer:
+    """
+    Test class to check functionality of WriteCoalescer class
+    """
+
+    def test_concurrent_inserts_share_bulk_writes(self):
+        """
+        Checks that concurrent inserts are flushed together and every caller gets its own _id
+        """
+        recorder = BulkWriteRecorder(round_trip_seconds=0.01)
+        coalescer = WriteCoalescer(mongo_adapter=recorder, max_delay_ms=20, max_batch_size=50)
+        with ThreadPoolExecutor(max_workers=50) as executor:
+            inserted_ids = list(executor.map(
+                lambda number: coalescer.insert(data={"book_name": f"Book {number}"}), range(200)
+            ))
+        coalescer.close()
+        assert len(set(inserted_ids)) == 200
+        assert sum(recorder.batch_sizes) == 200
+        assert len(recorder.batch_sizes) < 200
+        assert max(recorder.batch_sizes) <= 50
+
+    def test_duplicate_fails_only_its_own_insert(self):
+        """
+        Checks that the duplicate key error is delivered only to the caller of the duplicate document
+        """
+        recorder = BulkWriteRecorder()
+        coalescer = WriteCoalescer(mongo_adapter=recorder, max_delay_ms=50)
+        futures = [coalescer.submit(data={"book_name": book_name}) for book_name in ("A", "B", "A", "C")]
+        coalescer.close()
+        assert isinstance(futures[2].exception(), DuplicateKeyError)
+        assert all(future.result() for number, future in enumerate(futures) if number != 2)
+
+    def test_close_flushes_queued_documents(self):
+        """
+        Checks that closing the coalescer flushes pending documents and refuses new ones
+        """
+        recorder = BulkWriteRecorder()
+        coalescer = WriteCoalescer(mongo_adapter=recorder, max_delay_ms=10000)
+        future = coalescer.submit(data={"book_name": "A"})
+        coalescer.close()
+        assert future.result(timeout=1)
+        with pytest.raises(RuntimeError):
+            coalescer.submit(data={"book_name": "B"})
+
+    def test_write_concern_error_fails_the_inserts(self):
+        """
+        Checks that the documents written without the required acknowledgement fail with WriteConcernError,
+        as the single inserts do
+        """
+        coalescer = WriteCoalescer(mongo_adapter=BulkWriteRecorder(write_concern_failed=True), max_delay_ms=50)
+        futures = [coalescer.submit(data={"book_name": book_name}) for book_name in ("A", "A")]
+        coalescer.close()
+        assert isinstance(futures[0].exception(), WriteConcernError)
+        assert isinstance(futures[1].exception(), DuplicateKeyError)
+
+    def test_insert_racing_close_is_never_left_waiting(self):
+        """
+        Checks that the insert queued while the coalescer is being closed is still flushed,
+        instead of landing behind the stop sentinel with its caller waiting forever
+        """
+        coalescer = WriteCoalescer(mongo_adapter=BulkWriteRecorder(), max_delay_ms=1)
+        closing_threads = []
+        queue_put = coalescer._queue.put
+
+        def put_racing_close(item):
+            # close() is called by another thread right between the closed check and the put
+            if item is not None and not closing_threads:
+                closing_threads.append(threading.Thread(target=coalescer.close))
+                closing_threads[0].start()
+                time.sleep(0.05)
+            queue_put(item)
+
+        coalescer._queue.put = put_racing_close
+        future = coalescer.submit(data={"book_name": "A"})
+        closing_threads[0].join()
+        assert future.result(timeout=1)
@@ -0,0 +1,118 @@
+# tests/test_changes.py
+
+import asyncio
+import threading
+
+import pytest
+
+from backend.models import Book
+from backend.repository import InMemoryBookRepository
+from backend.changes import BookChangeFeed, MongoBookChangeFeed, TooManySubscribersError
+
+
+"""
+Test class for changes.py module contains test cases to check
+the book shelf change feed streamed to the subscribers
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_changes.py --cov-report term-missing --cov=sources
+"""
+
+
+def make_book(number: int) -> Book:
+    return Book(book_id=f"id{number}", book_name=f"Book {number}", available=True)
+
+
+@pytest.mark.changes
+class TestBookChangeFeed:
+    """
+    Test class to check functionality of BookChangeFeed class
+    """
+
+    def test_repository_changes_are_delivered(self):
+        """
+        Checks that the writes made through the repository (including other threads) reach the subscriber in order
+        """
+
+        async def scenario():
+            book_repository = InMemoryBookRepository(books=[])
+            book_change_feed = BookChangeFeed()
+            book_change_feed.attach(book_repository)
+            subscription = book_change_feed.subscribe()
+            writer = threading.Thread(target=lambda: [book_repository.add_book(make_book(number)) for number in range(3)])
+            writer.start()
+            writer.join()
+            book_repository.checkout_book("id1")
+            book_repository.delete_book_by_name("Book 2")
+            events = [await asyncio.wait_for(subscription.get(), timeout=1) for _ in range(5)]
+            return [(event.operation, event.book.book_id) for event in events]
+
+        assert asyncio.run(scenario()) == [("add", "id0"), ("add", "id1"), ("add", "id2"), ("checkout", "id1"), ("delete", "id2")]
+
+    def test_reconnect_replays_missed_events(self):
+        """
+        Checks that the reconnecting subscriber gets the events after its last event ID,
+        and is told to reset if those are no longer kept
+        """
+
+        async def scenario():
+            book_change_feed = BookChangeFeed(history_size=3)
+            for number in range(5):
+                book_change_feed.publish(operation="add", book=make_book(number))
+            last_event_id = book_change_feed._history[-2].event_id
+            resumed = book_change_feed.subscribe(last_event_id=last_event_id)
+            evicted = book_change_feed.subscribe(last_event_id="unknown")
+            return [event.book.book_id for event in resumed.replayed_events], resumed.reset, evicted.reset
+
+        assert asyncio.run(scenario()) == (["id4"], False, True)
+
+    def test_slow_subscriber_is_disconnected(self):
+        """
+        Checks that the subscriber falling behind is closed, while the subscribers limit is enforced
+        """
+
+        async def scenario():
+            book_change_feed = BookChangeFeed(max_queue=2, max_subscribers=1)
+            subscription = book_change_feed.subscribe()
+            with pytest.raises(TooManySubscribersError):
+                book_change_feed.subscribe()
+            for number in range(3):
+                book_change_feed.publish(operation="add", book=make_book(number))
+            await asyncio.sleep(0)
+            return [await subscription.get() for _ in range(3)]
+
+        events = asyncio.run(scenario())
+        assert [event.book.book_id for event in events[:2]] == ["id0", "id1"] and events[2] is None
+
+    def test_reset_disconnects_subscribers(self):
+        """
+        Checks that once the changes may have been missed, the connected subscribers are disconnected
+        and are told to reset after reconnecting
+        """
+
+        async def scenario():
+            book_change_feed = BookChangeFeed()
+            book_change_feed.publish(operation="add", book=make_book(1))
+            last_event_id = book_change_feed._history[-1].event_id
+            subscription = book_change_feed.subscribe(last_event_id=last_event_id)
+            book_change_feed.reset()
+            closed_event = await asyncio.wait_for(subscription.get(), timeout=1)
+            reconnected = book_change_feed.subscribe(last_event_id=last_event_id)
+            return closed_event, reconnected.reset, len(book_change_feed._subscriptions)
+
+        assert asyncio.run(scenario()) == (None, True, 1)
+
+    def test_change_stream_events_are_translated(self):
+        """
+        Checks that MongoDB change stream events are translated into the book shelf changes
+        """
+        document = {"_id": "object id", **make_book(1).dict()}
+        assert MongoBookChangeFeed.to_book_change(
+            {"operationType": "insert", "fullDocument": document}
+        ) == ("add", make_book(1), None)
+        assert MongoBookChangeFeed.to_book_change({
+            "operationType": "update",
+            "fullDocument": {**document, "available": False},
+            "updateDescription": {"updatedFields": {"available": False}}
+        })[0] == "checkout"
+        assert MongoBookChangeFeed.to_book_change({"operationType": "delete"}) == ("delete", None, None)
+        assert MongoBookChangeFeed.to_book_change({"operationType": "drop"}) is None
@@ -0,0 +1,140 @@
+# tests/test_compression.py
+
+import zlib
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+
+from backend.compression import CompressionMiddleware, Compressor, select_encoding
+
+
+"""
+Test class for compression.py module contains test cases to check
+the response compression middleware
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_compression.py --cov-report term-missing --cov=sources
+"""
+
+
+def make_app(messages: List[Dict[str, Any]]) -> Any:
+    async def app(scope, receive, send):
+        for message in messages:
+            await send(message)
+    return app
+
+
+def run_middleware(messages: List[Dict[str, Any]], path: str = "/books", **kwargs) -> List[Dict[str, Any]]:
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "headers": [(b"accept-encoding", b"gzip, deflate")]}
+    middleware = CompressionMiddleware(make_app(messages), encodings=["gzip"], **kwargs)
+    asyncio.run(middleware(scope, None, send))
+    return sent
+
+
+def make_decompress(encoding: str) -> Any:
+    # returns the function decoding the compressed stream chunk by chunk
+    if encoding == "br":
+        brotli = pytest.importorskip("brotli")
+        return brotli.Decompressor().process
+    zstandard = pytest.importorskip("zstandard")
+    return zstandard.ZstdDecompressor().decompressobj().decompress
+
+
+def start_message(status: int = 200, content_type: bytes = b"application/json", **headers) -> Dict[str, Any]:
+    return {
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type)] + [(name.encode(), value) for name, value in headers.items()]
+    }
+
+
+@pytest.mark.compression
+class TestCompression:
+    """
+    Test class to check functionality of CompressionMiddleware class
+    """
+
+    @pytest.mark.parametrize("accept_encoding, expected", [
+        (None, None),
+        ("gzip, deflate, br", "br"),
+        ("gzip;q=1.0, br;q=0.5", "gzip"),
+        ("zstd, br, gzip", "zstd"),
+        ("*", "zstd"),
+        ("*, zstd;q=0", "br"),
+        ("identity", None),
+    ])
+    def test_encoding_is_negotiated(self, accept_encoding, expected):
+        """
+        Checks that the encoding with the highest client weight is selected, the server preference breaks the ties
+        """
+        assert select_encoding(accept_encoding, ["zstd", "br", "gzip"]) == expected
+
+    def test_complete_body_is_compressed_above_threshold(self):
+        """
+        Checks that only the bodies above the threshold are compressed, with the headers describing the encoding
+        """
+        body = b'[' + b'{"book_name": "Shantaram", "description": "A novel"},' * 100 + b'{}]'
+        small = run_middleware([start_message(), {"type": "http.response.body", "body": b"[]"}], minimum_size=100)
+        assert dict(small[0]["headers"]).get(b"content-encoding") is None and small[1]["body"] == b"[]"
+        sent = run_middleware([
+            start_message(**{"content-length": str(len(body)).encode(), "etag": b'"abc"'}),
+            {"type": "http.response.body", "body": body}
+        ], minimum_size=100)
+        headers = dict(sent[0]["headers"])
+        assert headers[b"content-encoding"] == b"gzip" and headers[b"vary"] == b"Accept-Encoding"
+        assert b"content-length" not in headers and headers[b"etag"] == b'W/"abc"'
+        assert zlib.decompress(sent[1]["body"], 31) == body and len(sent[1]["body"]) < len(body) / 10
+
+    def test_streamed_chunks_are_flushed_one_by_one(self):
+        """
+        Checks that every streamed chunk is compressed and can be decoded as soon as it is received
+        """
+        events = [f"id: {number}\ndata: {{}}\n\n".encode() for number in range(3)]
+        sent = run_middleware([start_message(content_type=b"text/event-stream")] + [
+            {"type": "http.response.body", "body": event, "more_body": True} for event in events
+        ] + [{"type": "http.response.body", "body": b"", "more_body": False}], path="/books/changes")
+        decompressor = zlib.decompressobj(31)
+        assert [decompressor.decompress(message["body"]) for message in sent[1:4]] == events
+        assert decompressor.decompress(sent[4]["body"]) == b"" and decompressor.eof
+
+    @pytest.mark.parametrize("encoding", ["br", "zstd"])
+    def test_optional_encodings_round_trip(self, encoding):
+        """
+        Checks that the bodies compressed by brotli and zstandard are decoded back, both whole and chunk by chunk
+        """
+        decompress = make_decompress(encoding)
+        body = b'[' + b'{"book_name": "Shantaram", "description": "A novel"},' * 100 + b'{}]'
+        compressed = Compressor.compress_body(encoding=encoding, level=5, body=body)
+        assert decompress(compressed) == body and len(compressed) < len(body) / 10
+        events = [f"id: {number}\ndata: {{}}\n\n".encode() for number in range(3)]
+        compressor = Compressor(encoding=encoding, level=1)
+        decompress = make_decompress(encoding)
+        assert [decompress(compressor.compress(event)) for event in events] == events
+        assert decompress(compressor.compress(b"", last=True)) == b""
+
+    @pytest.mark.parametrize("message", [
+        start_message(status=206),
+        start_message(content_type=b"image/png"),
+        start_message(**{"content-encoding": b"br"}),
+        start_message(**{"cache-control": b"no-transform"}),
+    ])
+    def test_incompressible_responses_are_sent_as_they_are(self, message):
+        """
+        Checks that partial content, compressed media types and already encoded responses are not compressed
+        """
+        body = b"x" * 4096
+        sent = run_middleware([message, {"type": "http.response.body", "body": body}])
+        assert sent == [message, {"type": "http.response.body", "body": body}]
+
+    def test_route_profiles_select_levels(self):
+        """
+        Checks that the compression level is selected by the route profile
+        """
+        middleware = CompressionMiddleware(make_app([]), encodings=["gzip"])
+        assert middleware.get_level("GET", "/books/changes", "gzip") == 1
+        assert middleware.get_level("GET", "/books", "gzip") == middleware.get_level("GET", "/user/me", "gzip") == 6
@@ -1,11 +1,23 @@
 # tests/test_database.py
 
+import time
+from uuid import uuid4
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, List
+from unittest.mock import MagicMock
 
+import pymongo
 import pytest
 from dotenv import dotenv_values
+from pymongo.errors import BulkWriteError, DuplicateKeyError, ExecutionTimeout, NetworkTimeout
+from pymongo.read_preferences import ReadPreference
+from pymongo.write_concern import WriteConcern
 
-from backend.database import MongoAdapter
+from backend.models import Book
+from backend.indexes import IndexSpec
+from backend.database import MongoAdapter, QueryOptions, get_mongo_client_params, SLOW_QUERY_EXPLAIN_MAX_TIME_MS
+from backend.memory_database import InMemoryMongoClient, get_in_memory_mongo_client
+from backend.repository import MongoBookRepository, BOOK_COLLECTION_INDEX_PARAMS
 
 
 config = dotenv_values(".env")
@@ -19,6 +31,26 @@ python -m pytest -rA -v --tb=line test_database.py --cov-report term-missing --c
 """
 
 
+def init_test_mongo_adapter() -> MongoAdapter:
+    """
+    Creates instance of MongoAdapter class to work with the test book shelf collection,
+    kept in memory if 'TEST_MONGODB_CLIENT' config value is "memory"
+
+    :return MongoAdapter: instance of MongoAdapter class
+    """
+    return MongoAdapter(
+        host=config["TEST_MONGODB_HOST"],
+        port=int(config["TEST_MONGODB_PORT"]),
+        db_name=config["TEST_MONGODB_DB_NAME"],
+        username=config.get("TEST_MONGODB_USERNAME"),
+        password=config.get("TEST_MONGODB_PASSWORD"),
+        requires_auth=bool(config.get("TEST_MONGODB_USERNAME")),
+        collection_name=config["TEST_MONGODB_BOOK_SHELF_COLLECTION_NAME"],
+        recreate_indexes=False,
+        **get_mongo_client_params(config, prefix="TEST_MONGODB")
+    )
+
+
 class TestDatabase:
     """
     Test class to check functionality of endpoints
@@ -30,7 +62,8 @@ class TestDatabase:
         """
         Prepare test environment
         """
-        raise NotImplementedError
+        cls.mongo_adapter = init_test_mongo_adapter()
+        cls.mongo_adapter.collection.delete_many({})
 
     @pytest.mark.mongodb
     @pytest.mark.parametrize("insertable_data, expected", [
@@ -249,4 +282,329 @@ class TestDatabase:
         """
         Tidy up test environment
         """
-        raise NotImplementedError
+        cls.mongo_adapter.collection.delete_many({})
+
+
+class SlowCollection:
+    """
+    Stand-in of pymongo collection answering every find_one() after the given delay,
+    with the query plan of the given stage
+    """
+
+    def __init__(self, delay_seconds: float, plan_stage: str, explain_error: Exception = None):
+        self.delay_seconds = delay_seconds
+        self.plan_stage = plan_stage
+        self.explain_error = explain_error
+        self.explained_filters = []
+        self.explain_max_time_ms = []
+
+    def find_one(self, *args, **kwargs):
+        time.sleep(self.delay_seconds)
+        if args and args[0].get("book_name") == "Failing Book":
+            raise ExecutionTimeout("operation exceeded time limit", code=50)
+        return {"book_name": "Dummy Book"}
+
+    def find(self, q_filter):
+        collection = self
+
+        class Cursor:
+            def max_time_ms(self, max_time_ms):
+                collection.explain_max_time_ms.append(max_time_ms)
+                return self
+
+            def explain(self):
+                if collection.explain_error:
+                    raise collection.explain_error
+                collection.explained_filters.append(q_filter)
+                return {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": collection.plan_stage}}}}
+
+        return Cursor()
+
+
+def wait_for(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+@pytest.mark.slow_queries
+class TestSlowQueryLog:
+    """
+    Test class to check slow query logging of MongoAdapter
+    """
+
+    @staticmethod
+    def init_mongo_adapter(collection: SlowCollection, **kwargs) -> MongoAdapter:
+        # client connects lazily, so no server is needed as long as the collection is replaced
+        mongo_adapter = MongoAdapter(
+            host="localhost",
+            port=27017,
+            db_name="test_db",
+            collection_name="test_books",
+            requires_auth=False,
+            recreate_indexes=False,
+            logger=MagicMock(),
+            **kwargs
+        )
+        mongo_adapter.collection = collection
+        return mongo_adapter
+
+    @pytest.mark.parametrize("delay_seconds, expected_warnings", [
+        (0.0, 0),
+        (0.03, 1),
+    ])
+    def test_slow_query_is_logged(self, delay_seconds: float, expected_warnings: int):
+        """
+        Checks that only the queries slower than the threshold are logged with their filter and collection
+
+        :param delay_seconds: query duration
+        :type delay_seconds: float
+        :param expected_warnings: expected number of logged warnings
+        :type expected_warnings: int
+        """
+        mongo_adapter = self.init_mongo_adapter(
+            SlowCollection(delay_seconds=delay_seconds, plan_stage="IXSCAN"), slow_query_threshold_ms=20
+        )
+        mongo_adapter.extract_db_entry(index_name="book_name", entry_id="Dummy Book")
+        assert mongo_adapter.logger.warning.call_count == expected_warnings
+        if expected_warnings:
+            message = mongo_adapter.logger.warning.call_args.args[0]
+            assert "test_db.test_books" in message and "{'book_name': 'Dummy Book'}" in message
+
+    def test_collscan_is_explained_once_per_query_shape(self):
+        """
+        Checks that the slow query shape is explained once and the collection scan is reported
+        """
+        collection = SlowCollection(delay_seconds=0.0, plan_stage="COLLSCAN")
+        mongo_adapter = self.init_mongo_adapter(collection, slow_query_threshold_ms=0, explain_slow_queries=True)
+        for username in ("alice", "bob"):
+            mongo_adapter.read_first_match(data={"username": username})
+        mongo_adapter.read_first_match(data={"book_name": "Dummy Book"})
+        assert wait_for(lambda: len(collection.explained_filters) == 2)
+        assert sorted(collection.explained_filters, key=repr) == [{"book_name": "Dummy Book"}, {"username": "alice"}]
+        assert collection.explain_max_time_ms == [SLOW_QUERY_EXPLAIN_MAX_TIME_MS] * 2
+        assert wait_for(lambda: len([
+            call for call in mongo_adapter.logger.warning.call_args_list if "COLLSCAN" in call.args[0]
+        ]) == 2)
+
+    def test_failed_queries_and_explains_are_not_remembered(self):
+        """
+        Checks that the failed slow query is not explained, and the query shape whose explain failed
+        is explained again by the next slow query of the shape
+        """
+        collection = SlowCollection(delay_seconds=0.0, plan_stage="IXSCAN", explain_error=ExecutionTimeout("timeout"))
+        mongo_adapter = self.init_mongo_adapter(collection, slow_query_threshold_ms=0, explain_slow_queries=True)
+        with pytest.raises(ExecutionTimeout):
+            mongo_adapter.read_first_match(data={"book_name": "Failing Book"})
+        assert mongo_adapter._explained_query_shapes == {}
+        mongo_adapter.read_first_match(data={"book_name": "Dummy Book"})
+        assert wait_for(lambda: mongo_adapter._explained_query_shapes == {} and collection.explain_max_time_ms)
+        collection.explain_error = None
+        mongo_adapter.read_first_match(data={"book_name": "Dummy Book"})
+        assert wait_for(lambda: collection.explained_filters == [{"book_name": "Dummy Book"}])
+
+
+class OptionsRecordingCollection:
+    """
+    Stand-in of pymongo collection recording the options of the collection used by every call
+    """
+
+    def __init__(self, collection_options=None, calls=None):
+        self.collection_options = collection_options or {}
+        self.calls = calls if calls is not None else []
+
+    def with_options(self, **collection_options):
+        return OptionsRecordingCollection(collection_options=collection_options, calls=self.calls)
+
+    def find_one(self, *args, **kwargs):
+        self.calls.append(("find_one", self.collection_options, kwargs))
+        return {"book_id": "1", "book_name": "Dummy Book", "available": True}
+
+    def find_one_and_update(self, *args, **kwargs):
+        self.calls.append(("find_one_and_update", self.collection_options, kwargs))
+        return {"book_id": "1", "book_name": "Dummy Book", "available": False}
+
+
+@pytest.mark.query_options
+class TestQueryOptions:
+    """
+    Test class to check read preference, read and write concern and time limit options of MongoAdapter
+    """
+
+    @staticmethod
+    def init_mongo_adapter(**kwargs) -> MongoAdapter:
+        # client connects lazily, so no server is needed to configure the collection
+        return MongoAdapter(
+            host="localhost",
+            port=27017,
+            db_name="test_db",
+            collection_name="test_books",
+            requires_auth=False,
+            recreate_indexes=False,
+            **kwargs
+        )
+
+    def test_per_call_options_override_adapter_defaults(self):
+        """
+        Checks that the options passed per call override the adapter defaults, keeping the rest of them
+        """
+        mongo_adapter = self.init_mongo_adapter(query_options=QueryOptions(write_concern="majority", journal=True))
+        collection, effective_options = mongo_adapter.get_collection(QueryOptions(read_preference="secondaryPreferred"))
+        assert collection.read_preference == ReadPreference.SECONDARY_PREFERRED
+        assert collection.write_concern == WriteConcern(w="majority", j=True)
+        collection, _ = mongo_adapter.get_collection(QueryOptions(write_concern=1, journal=False))
+        assert collection.read_preference == ReadPreference.PRIMARY
+        assert collection.write_concern == WriteConcern(w=1, j=False)
+
+    def test_options_from_config(self):
+        """
+        Checks that the query options are extracted from the config values with the given prefix
+        """
+        config = {
+            "MONGODB_WRITE_CONCERN": "2",
+            "MONGODB_WRITE_CONCERN_JOURNAL": "true",
+            "MONGODB_READ_CONCERN": "",
+            "MONGODB_CATALOGUE_READ_PREFERENCE": "nearest",
+            "MONGODB_CATALOGUE_MAX_TIME_MS": "300",
+        }
+        assert QueryOptions.from_config(config) == QueryOptions(write_concern=2, journal=True)
+        assert QueryOptions.from_config(config, prefix="MONGODB_CATALOGUE") == QueryOptions(read_preference="nearest", max_time_ms=300)
+        with pytest.raises(ValueError):
+            QueryOptions(read_preference="anywhere")
+
+    def test_catalogue_reads_go_to_secondaries(self):
+        """
+        Checks that only catalogue reads of the book repository use catalogue read options, while
+        the read-modify-write operations use the adapter defaults
+        """
+        mongo_adapter = self.init_mongo_adapter(query_options=QueryOptions(max_time_ms=5000))
+        mongo_adapter.collection = OptionsRecordingCollection()
+        book_repository = MongoBookRepository(
+            mongo_adapter=mongo_adapter,
+            catalogue_read_options=QueryOptions(read_preference="secondaryPreferred", max_time_ms=100)
+        )
+        book_repository.get_book(book_id="1")
+        book_repository.checkout_book(book_id="1")
+        (_, read_options, read_kwargs), (_, write_options, write_kwargs) = mongo_adapter.collection.calls
+        assert read_options == {"read_preference": ReadPreference.SECONDARY_PREFERRED}
+        assert read_kwargs["max_time_ms"] == 100
+        assert write_options == {}
+        assert write_kwargs["maxTimeMS"] == 5000
+
+
+def make_book_document(book_name: str, author: str = "Test Author", description: str = "Test") -> Dict[str, Any]:
+    return {"book_id": uuid4().hex, "book_name": book_name, "author": author, "description": description, "available": True}
+
+
+@pytest.mark.memory_database
+class TestInMemoryMongoClient:
+    """
+    Test class to check MongoAdapter working with the in-memory client instead of MongoDB server
+    """
+
+    @staticmethod
+    def init_mongo_adapter(client: InMemoryMongoClient, **kwargs) -> MongoAdapter:
+        kwargs.setdefault("required_index_params", BOOK_COLLECTION_INDEX_PARAMS)
+        return MongoAdapter(
+            host="localhost",
+            port=27017,
+            db_name="test_db",
+            collection_name="test_books",
+            requires_auth=False,
+            client=client,
+            **kwargs
+        )
+
+    def test_unique_indexes_and_upserts(self):
+        """
+        Checks that the declared indexes are created as the server reports them, unique indexes reject
+        the duplicates and the replaces upsert the documents
+        """
+        mongo_adapter = self.init_mongo_adapter(InMemoryMongoClient())
+        report = mongo_adapter.diff_required_indexes()
+        assert not report.missing and not report.changed and not report.extra
+        document = make_book_document("Shantaram")
+        mongo_adapter.insert_db_entry(data=document)
+        with pytest.raises(DuplicateKeyError):
+            mongo_adapter.insert_db_entry(data={**make_book_document("Shantaram")})
+        assert mongo_adapter.silent_replace_db_entry(index_name="book_id", data=make_book_document("Dune"))
+        replacement = {**document, "available": False}
+        del replacement["_id"]
+        assert mongo_adapter.find_one_and_replace(index_name="book_id", data=replacement)["available"] is True
+        assert mongo_adapter.find_one_and_update(
+            data={"book_id": document["book_id"], "available": True}, update={"$set": {"available": False}}
+        ) is None
+        deleted_document = mongo_adapter.find_one_and_delete(data={"book_name": "Shantaram"})
+        assert deleted_document["available"] is False and mongo_adapter.count_db_entries() == 1
+
+    def test_pagination_and_text_search(self):
+        """
+        Checks that the pages are sorted and sliced as by the server, and the text search ranks the matches
+        of the book name above the matches of the description, using the text index
+        """
+        mongo_adapter = self.init_mongo_adapter(InMemoryMongoClient())
+        for book_name in ("Emma", "Dune", "Carrie", "Beloved", "Atonement"):
+            mongo_adapter.insert_db_entry(data=make_book_document(book_name))
+        mongo_adapter.insert_db_entry(data=make_book_document("Ulysses", description="Not the Dune sequel"))
+        page = mongo_adapter.read_many(limit=2, skip=1, sort=[("book_name", 1)])
+        assert [document["book_name"] for document in page] == ["Beloved", "Carrie"] and "_id" not in page[0]
+        assert mongo_adapter.count_db_entries(data={"book_name": {"$in": ["Emma", "Dune", "Moby Dick"]}}) == 2
+        found = mongo_adapter.text_search(query="dune")
+        assert [document["book_name"] for document in found] == ["Dune", "Ulysses"]
+        assert found[0]["score"] > found[1]["score"]
+        assert mongo_adapter.explain_query({"book_name": "Dune"}) == ["FETCH", "IXSCAN"]
+        assert mongo_adapter.explain_query({"author": "Test Author"}) == ["COLLSCAN"]
+
+    def test_bulk_write_reports_duplicates(self):
+        """
+        Checks that the unordered bulk write applies all the operations but the duplicates,
+        reporting the failed ones by their positions
+        """
+        mongo_adapter = self.init_mongo_adapter(InMemoryMongoClient())
+        mongo_adapter.insert_db_entry(data=make_book_document("Dune"))
+        requests = [pymongo.InsertOne(make_book_document(book_name)) for book_name in ("Emma", "Dune", "Carrie", "Emma")]
+        with pytest.raises(BulkWriteError) as error_info:
+            mongo_adapter.bulk_write(requests, ordered=False)
+        assert [error["index"] for error in error_info.value.details["writeErrors"]] == [1, 3]
+        assert error_info.value.details["nInserted"] == 2 and mongo_adapter.count_db_entries() == 3
+        book_repository = MongoBookRepository(mongo_adapter=mongo_adapter)
+        books = [Book(**make_book_document(book_name)) for book_name in ("Carrie", "Beloved")]
+        assert book_repository.add_books(books) == 1
+
+    def test_latency_is_injected(self):
+        """
+        Checks that the operations take the latency of the client, so the slow queries are logged and
+        the operations slower than their time limits or deadlines time out
+        """
+        client = InMemoryMongoClient()
+        mongo_adapter = self.init_mongo_adapter(client, slow_query_threshold_ms=20, logger=MagicMock())
+        mongo_adapter.insert_db_entry(data=make_book_document("Dune"))
+        client.set_latency(30, operation="find_one")
+        assert mongo_adapter.extract_db_entry(index_name="book_name", entry_id="Dune")["book_name"] == "Dune"
+        slow_query_warnings = [call for call in mongo_adapter.logger.warning.call_args_list if "Slow query" in call.args[0]]
+        assert len(slow_query_warnings) == 1
+        with pytest.raises(ExecutionTimeout):
+            mongo_adapter.extract_db_entry(index_name="book_name", entry_id="Dune", options=QueryOptions(max_time_ms=10))
+        mongo_adapter.operation_timeout_ms = 10
+        with pytest.raises(NetworkTimeout):
+            mongo_adapter.extract_db_entry(index_name="book_name", entry_id="Dune")
+        assert client.operation_counts["find_one"] == 3
+
+    def test_ttl_indexes_expire_documents(self):
+        """
+        Checks that the documents of TTL indexes expire, and the adapters of the same address share the data
+        """
+        client = get_in_memory_mongo_client(host="memory-test", port=27017)
+        mongo_adapter = self.init_mongo_adapter(client, required_index_params=[
+            IndexSpec(name="expires_at", expire_after_seconds=0)
+        ])
+        now = datetime.now(timezone.utc)
+        mongo_adapter.insert_db_entry(data={"key": "expired", "expires_at": now - timedelta(seconds=1)})
+        mongo_adapter.insert_db_entry(data={"key": "live", "expires_at": now + timedelta(hours=1)})
+        other_adapter = self.init_mongo_adapter(
+            get_in_memory_mongo_client(host="memory-test", port="27017"), recreate_indexes=False
+        )
+        assert [document["key"] for document in other_adapter.read_many()] == ["live"]
+        assert other_adapter.read_many()[0]["expires_at"].tzinfo is None
+        client.drop_database("test_db")
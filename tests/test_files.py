@@ -0,0 +1,101 @@
+# tests/test_files.py
+
+import hashlib
+
+import pytest
+
+from backend.files import (
+    LocalDiskFileStore,
+    GridFSFileStore,
+    BookFileNotFoundError,
+    FileTooLargeError,
+    RangeNotSatisfiableError,
+    parse_range_header,
+)
+
+
+"""
+Test class for files.py module contains test cases to check
+the storage of the files attached to the books
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_files.py --cov-report term-missing --cov=sources
+"""
+
+
+CONTENT = bytes(range(256)) * 40
+
+
+@pytest.mark.files
+class TestFiles:
+    """
+    Test class to check functionality of the file stores and the byte range parsing
+    """
+
+    @pytest.mark.parametrize("range_header, expected", [
+        (None, None),
+        ("bytes=0-99", (0, 99)),
+        ("bytes=10000-", (10000, 10239)),
+        ("bytes=-40", (10200, 10239)),
+        ("bytes=10000-99999", (10000, 10239)),
+        ("bytes=0-1,5-9", None),
+        ("bytes=9-5", None),
+        ("items=0-1", None),
+        ("bytes=abc-", None),
+    ])
+    def test_range_header_is_parsed(self, range_header, expected):
+        """
+        Checks that single byte ranges are parsed, while multiple and malformed ones are ignored
+        """
+        assert parse_range_header(range_header, len(CONTENT)) == expected
+
+    def test_unsatisfiable_range_is_rejected(self):
+        """
+        Checks that the ranges starting beyond the end of the file are rejected
+        """
+        with pytest.raises(RangeNotSatisfiableError):
+            parse_range_header("bytes=10240-", len(CONTENT))
+        with pytest.raises(RangeNotSatisfiableError):
+            parse_range_header("bytes=-1", 0)
+
+    def test_disk_store_streams_uploads_and_ranges(self, tmp_path):
+        """
+        Checks that the file uploaded chunk by chunk is listed only once complete, is hashed as a whole
+        and is served by byte ranges spanning several chunks
+        """
+        file_store = LocalDiskFileStore(folder_path=str(tmp_path), chunk_size_bytes=1000)
+        upload = file_store.open_upload(book_id="book1", filename="sample.pdf", content_type="application/pdf")
+        for offset in range(0, len(CONTENT), 700):
+            upload.write(CONTENT[offset:offset + 700])
+        assert file_store.list_files("book1") == []
+        book_file = upload.complete()
+        assert book_file.length == len(CONTENT) and book_file.etag == hashlib.sha256(CONTENT).hexdigest()
+        assert file_store.list_files("book1") == [book_file] == [file_store.get_file("book1", book_file.file_id)]
+        assert b"".join(file_store.iter_content(book_file)) == CONTENT
+        chunks = list(file_store.iter_content(book_file, start=999, end=2500))
+        assert [len(chunk) for chunk in chunks] == [1000, 502] and b"".join(chunks) == CONTENT[999:2501]
+        assert file_store.delete_book_files("book1") == 1
+        with pytest.raises(BookFileNotFoundError):
+            file_store.get_file("book1", book_file.file_id)
+        with pytest.raises(BookFileNotFoundError):
+            file_store.get_file("../book1", book_file.file_id)
+
+    def test_too_large_upload_is_discarded(self, tmp_path):
+        """
+        Checks that the upload exceeding the maximum size fails without leaving anything behind
+        """
+        file_store = LocalDiskFileStore(folder_path=str(tmp_path), max_size_bytes=1000)
+        upload = file_store.open_upload(book_id="book1", filename="cover.png", content_type="image/png")
+        upload.write(CONTENT[:600])
+        with pytest.raises(FileTooLargeError):
+            upload.write(CONTENT[600:1200])
+        upload.abort()
+        assert file_store.list_files("book1") == [] and not list((tmp_path / "book1").iterdir())
+
+    def test_gridfs_documents_are_translated(self):
+        """
+        Checks that the metadata of the files collection documents round trips into the file metadata
+        """
+        book_file = LocalDiskFileStore._new_book_file(book_id="book1", filename="cover.jpg", content_type="image/jpeg")
+        book_file = book_file.copy(update={"length": 42, "etag": "abc"})
+        document = {"filename": "cover.jpg", "length": 42, "metadata": GridFSFileStore.to_metadata(book_file)}
+        assert GridFSFileStore.to_book_file(document) == book_file
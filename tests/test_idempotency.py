@@ -0,0 +1,148 @@
+# tests/test_idempotency.py
+
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.models import Message
+from backend.idempotency import (
+    InMemoryIdempotencyStore,
+    IdempotencyKeyReusedError,
+    IdempotentRequestInProgressError,
+    run_idempotent,
+)
+
+
+"""
+Test class for idempotency.py module contains test cases to check
+that write handlers run at most once per idempotency key
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_idempotency.py --cov-report term-missing --cov=sources
+"""
+
+
+class CountingHandler:
+    """
+    Handler counting its calls, optionally slow or failing
+    """
+
+    def __init__(self, delay: float = 0.0, fails: bool = False):
+        self.calls = 0
+        self.delay = delay
+        self.fails = fails
+        self._lock = threading.Lock()
+
+    def __call__(self) -> Message:
+        with self._lock:
+            self.calls += 1
+            call_number = self.calls
+        time.sleep(self.delay)
+        if self.fails:
+            raise RuntimeError("Handler failed!")
+        return Message(message=f"call {call_number}")
+
+
+def call(
+        store: InMemoryIdempotencyStore,
+        handler: CountingHandler,
+        key: str = "key",
+        payload: dict = None,
+        subject: str = "johndoe"
+) -> Message:
+    return run_idempotent(
+        store=store,
+        scope="test",
+        subject=subject,
+        key=key,
+        request_payload=payload or {"book_name": "Test Book"},
+        handler=handler,
+        response_model=Message
+    )
+
+
+@pytest.mark.idempotency
+class TestIdempotency:
+    """
+    Test class to check functionality of run_idempotent() function along with the in-memory store
+    """
+
+    def test_retry_replays_stored_response(self):
+        """
+        Checks that retries get the first response without running the handler again
+        """
+        store, handler = InMemoryIdempotencyStore(), CountingHandler()
+        assert call(store, handler) == call(store, handler) == Message(message="call 1")
+        assert call(store, handler, key="another key") == Message(message="call 2")
+        assert call(store, handler, key=None) == Message(message="call 3")
+        assert handler.calls == 3
+
+    def test_key_reused_for_different_payload(self):
+        """
+        Checks that the key cannot be reused for a request with a different payload
+        """
+        store, handler = InMemoryIdempotencyStore(), CountingHandler()
+        call(store, handler)
+        with pytest.raises(IdempotencyKeyReusedError):
+            call(store, handler, payload={"book_name": "Another Book"})
+
+    def test_keys_of_different_callers_do_not_collide(self):
+        """
+        Checks that the same key sent by different callers neither replays the response of another caller
+        nor is reported as reused
+        """
+        store, handler = InMemoryIdempotencyStore(), CountingHandler()
+        assert call(store, handler) == Message(message="call 1")
+        assert call(store, handler, subject="janedoe") == Message(message="call 2")
+        assert call(store, handler, subject="mallory", payload={"book_name": "Another Book"}) == Message(message="call 3")
+        with pytest.raises(IdempotencyKeyReusedError):
+            call(store, handler, subject="janedoe", payload={"book_name": "Another Book"})
+
+    def test_secret_fingerprint_is_keyed(self):
+        """
+        Checks that the secrets are fingerprinted by HMAC keyed by the store key, not by the plain hash
+        """
+        store = InMemoryIdempotencyStore(fingerprint_key=b"server key")
+        fingerprint = store.get_secret_fingerprint("weak_password")
+        assert fingerprint == store.get_secret_fingerprint("weak_password")
+        assert fingerprint != InMemoryIdempotencyStore(fingerprint_key=b"another key").get_secret_fingerprint("weak_password")
+        assert fingerprint != hashlib.sha256(b"weak_password").hexdigest()
+
+    def test_failed_handler_releases_key(self):
+        """
+        Checks that the failed request does not store anything and can be retried
+        """
+        store = InMemoryIdempotencyStore()
+        with pytest.raises(RuntimeError):
+            call(store, CountingHandler(fails=True))
+        assert call(store, CountingHandler()) == Message(message="call 1")
+
+    def test_concurrent_duplicates_wait_for_in_flight_request(self):
+        """
+        Checks that concurrent duplicates wait for the in-flight request and share its response
+        """
+        store, handler = InMemoryIdempotencyStore(), CountingHandler(delay=0.2)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(lambda _: call(store, handler), range(8)))
+        assert handler.calls == 1
+        assert all(response == Message(message="call 1") for response in responses)
+
+    def test_in_flight_request_wait_timeout(self):
+        """
+        Checks that the duplicate gives up waiting after the timeout
+        """
+        store = InMemoryIdempotencyStore(wait_timeout_seconds=0.1)
+        store.acquire(key="test:johndoe:key", request_fingerprint="fingerprint")
+        with pytest.raises(IdempotentRequestInProgressError):
+            store.acquire(key="test:johndoe:key", request_fingerprint="fingerprint")
+
+    def test_stored_response_expires(self):
+        """
+        Checks that the handler runs again once the stored response expired
+        """
+        store, handler = InMemoryIdempotencyStore(ttl_seconds=0), CountingHandler()
+        call(store, handler)
+        call(store, handler)
+        assert handler.calls == 2
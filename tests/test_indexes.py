@@ -0,0 +1,176 @@
+# tests/test_indexes.py
+
+from typing import Any, Dict, List
+from unittest.mock import MagicMock
+
+import pytest
+
+from backend.database import MongoAdapter
+from backend.indexes import IndexSpec, diff_indexes, to_index_specs
+from backend.repository import BOOK_COLLECTION_INDEX_PARAMS
+
+
+"""
+Test class for indexes.py module contains test cases to check
+declarative index specs and index drift reports
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_indexes.py --cov-report term-missing --cov=sources
+"""
+
+
+# indexes of the books collection as they are reported by index_information()
+BOOK_COLLECTION_INDEX_INFORMATION: Dict[str, Dict[str, Any]] = {
+    "_id_": {"v": 2, "key": [("_id", 1)]},
+    "book_id": {"v": 2, "key": [("book_id", 1)], "unique": True},
+    "book_name": {"v": 2, "key": [("book_name", 1)], "unique": True},
+    "book_text": {
+        "v": 2,
+        "key": [("_fts", "text"), ("_ftsx", 1)],
+        "weights": {"author": 5, "book_name": 10, "description": 1},
+        "default_language": "english",
+        "language_override": "language",
+        "textIndexVersion": 3
+    },
+}
+
+
+class IndexedCollection:
+    """
+    Stand-in of pymongo collection keeping the index information and the index usage statistics
+    """
+
+    name = "books"
+
+    def __init__(self, index_information: Dict[str, Dict[str, Any]], index_usage: Dict[str, int]):
+        self.indexes = dict(index_information)
+        self.index_usage = index_usage
+        self.created_indexes: List[str] = []
+
+    def index_information(self):
+        return self.indexes
+
+    def aggregate(self, pipeline):
+        assert pipeline == [{"$indexStats": {}}]
+        return [{"name": name, "accesses": {"ops": ops}} for name, ops in self.index_usage.items()]
+
+    def create_index(self, keys, name, **kwargs):
+        self.created_indexes.append(name)
+        self.indexes[name] = {"v": 2, "key": keys}
+
+    def drop_index(self, name):
+        self.indexes.pop(name)
+
+
+@pytest.mark.indexes
+class TestIndexSpec:
+    """
+    Test class to check functionality of IndexSpec class and diff_indexes function
+    """
+
+    def test_legacy_index_params_are_converted(self):
+        """
+        Checks that the legacy index params tuples are converted to the equivalent index specs
+        """
+        index_specs = to_index_specs([("book_id", True), ("expires_at", False, [("expires_at", 1)], {"expireAfterSeconds": 0})])
+        assert index_specs[0] == IndexSpec(name="book_id", keys=[("book_id", 1)], unique=True)
+        assert index_specs[1].get_create_index_options() == {"name": "expires_at", "unique": False, "expireAfterSeconds": 0}
+        with pytest.raises(ValueError):
+            to_index_specs([("book_id",)])
+
+    def test_matching_indexes_have_no_drift(self):
+        """
+        Checks that the existing books collection indexes (including the text one) match their specs
+        """
+        report = diff_indexes("books", BOOK_COLLECTION_INDEX_PARAMS, BOOK_COLLECTION_INDEX_INFORMATION)
+        assert not report.has_drift
+
+    def test_drift_report(self):
+        """
+        Checks that missing, changed and extra indexes are reported along with the unused ones
+        """
+        index_information = dict(BOOK_COLLECTION_INDEX_INFORMATION)
+        index_information.pop("book_name")
+        index_information["book_id"] = {"v": 2, "key": [("book_id", -1)]}
+        index_information["author_1"] = {"v": 2, "key": [("author", 1)]}
+        report = diff_indexes(
+            "books",
+            BOOK_COLLECTION_INDEX_PARAMS,
+            index_information,
+            index_usage={"_id_": 0, "book_id": 10, "book_text": 3, "author_1": 0}
+        )
+        assert report.missing == ["book_name"]
+        assert report.changed == {"book_id": [
+            "keys: expected [('book_id', 1)], found [('book_id', -1)]",
+            "unique: expected True, found False"
+        ]}
+        assert report.extra == ["author_1"]
+        assert report.unused == ["author_1"]
+
+    @pytest.mark.parametrize("index_spec, expected_keys", [
+        (IndexSpec(name="author_year", keys=[("author", 1), ("year", -1)]), [("author", 1), ("year", -1)]),
+        (IndexSpec(name="shelf_text", keys=[("shelf", 1), ("book_name", "text")]), [("shelf", 1), ("_fts", "text"), ("_ftsx", 1)]),
+    ])
+    def test_expected_index_keys(self, index_spec: IndexSpec, expected_keys: List):
+        """
+        Checks the keys of compound and compound text indexes as they are reported by the server
+
+        :param index_spec: index spec
+        :type index_spec: IndexSpec
+        :param expected_keys: expected index keys
+        :type expected_keys: List
+        """
+        assert index_spec.get_expected_index_keys() == expected_keys
+
+
+@pytest.mark.indexes
+class TestMongoAdapterIndexes:
+    """
+    Test class to check index management of MongoAdapter class
+    """
+
+    @staticmethod
+    def init_mongo_adapter(collection: IndexedCollection) -> MongoAdapter:
+        # client connects lazily, so no server is needed as long as the collection is replaced
+        mongo_adapter = MongoAdapter(
+            host="localhost",
+            port=27017,
+            db_name="test_db",
+            collection_name="books",
+            requires_auth=False,
+            recreate_indexes=False,
+            required_index_params=BOOK_COLLECTION_INDEX_PARAMS,
+            logger=MagicMock()
+        )
+        mongo_adapter.collection = collection
+        return mongo_adapter
+
+    def test_recreate_creates_only_missing_indexes(self):
+        """
+        Checks that only missing indexes are created, while changed ones are reported
+        """
+        index_information = {"_id_": BOOK_COLLECTION_INDEX_INFORMATION["_id_"], "book_id": {"v": 2, "key": [("book_id", 1)]}}
+        collection = IndexedCollection(index_information, index_usage={})
+        mongo_adapter = self.init_mongo_adapter(collection)
+        mongo_adapter.recreate_required_indexes()
+        assert collection.created_indexes == ["book_name", "book_text"]
+        assert any("book_id" in call.args[0] for call in mongo_adapter.logger.warning.call_args_list)
+
+    @pytest.mark.parametrize("dry_run", [True, False])
+    def test_drop_unused_indexes(self, dry_run: bool):
+        """
+        Checks that only the unused indexes which are not declared are dropped
+
+        :param dry_run: dry run flag
+        :type dry_run: bool
+        """
+        index_information = dict(BOOK_COLLECTION_INDEX_INFORMATION)
+        index_information["author_1"] = {"v": 2, "key": [("author", 1)]}
+        index_information["year_1"] = {"v": 2, "key": [("year", 1)]}
+        collection = IndexedCollection(
+            index_information,
+            index_usage={"_id_": 0, "book_id": 0, "book_name": 5, "book_text": 0, "author_1": 0, "year_1": 7}
+        )
+        mongo_adapter = self.init_mongo_adapter(collection)
+        assert mongo_adapter.drop_unused_indexes(dry_run=dry_run) == ["author_1"]
+        assert ("author_1" in collection.indexes) is dry_run
+        assert "book_id" in collection.indexes and "year_1" in collection.indexes
@@ -0,0 +1,194 @@
+# tests/test_invalidation.py
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from backend.database import MongoAdapter
+from backend.memory_database import InMemoryMongoClient
+from backend.invalidation import (
+    InvalidationBus,
+    InvalidatingCache,
+    UnixSocketInvalidationBus,
+    MongoChangeStreamInvalidationBus,
+)
+
+
+"""
+Test class for invalidation.py module contains test cases to check
+the cache invalidation announced to the service workers
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_invalidation.py --cov-report term-missing --cov=sources
+"""
+
+
+class UsersCollection:
+    """
+    Stands in for the pymongo collection, returning canned results of the write operations
+    """
+
+    def insert_one(self, document):
+        return SimpleNamespace(inserted_id="object id")
+
+    def replace_one(self, filter, replacement, upsert):
+        return SimpleNamespace(modified_count=1, upserted_id=None)
+
+    def find_one_and_update(self, filter, update, **kwargs):
+        return {"username": update["$set"].get("username", filter["username"]), "disabled": True}
+
+    def update_many(self, filter, update):
+        return SimpleNamespace(modified_count=2)
+
+    def delete_one(self, filter):
+        return SimpleNamespace(deleted_count=0)
+
+
+def wait_for(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+@pytest.mark.invalidation
+class TestInvalidation:
+    """
+    Test class to check functionality of InvalidatingCache and the invalidation buses
+    """
+
+    def test_cache_evicts_invalidated_entries(self):
+        """
+        Checks that the cache evicts the announced keys, clears itself on the collection-wide key,
+        ignores the keys of other collections and drops the values read before the invalidation
+        """
+        cache = InvalidatingCache(collection_name="users", max_size=2)
+        cache.set("users:username:alice", "alice")
+        cache.set("users:username:bob", "bob")
+        cache.invalidate(["users:username:alice", "books:*"])
+        assert cache.get("users:username:alice") is None and cache.get("users:username:bob") == "bob"
+        generation = cache.generation
+        cache.invalidate(["users:*"])
+        cache.set("users:username:bob", "stale bob", generation=generation)
+        assert len(cache) == 0
+        cache.set("users:username:carol", "carol")
+        cache.set("users:username:dave", "dave")
+        cache.set("users:username:erin", "erin")
+        assert cache.get("users:username:carol") is None and len(cache) == 2
+
+    def test_adapter_writes_publish_keys(self):
+        """
+        Checks that the writes of MongoAdapter publish the keys of the written documents, old and new ones,
+        while the writes not naming the documents invalidate the whole collection and no-op writes publish nothing
+        """
+        published = []
+        invalidation_bus = InvalidationBus()
+        invalidation_bus.subscribe(published.append)
+        mongo_adapter = MongoAdapter(
+            host="localhost",
+            port=27017,
+            db_name="test_db",
+            collection_name="users",
+            requires_auth=False,
+            recreate_indexes=False,
+            invalidation_bus=invalidation_bus,
+            invalidation_key_fields=["username"]
+        )
+        mongo_adapter.collection = UsersCollection()
+        mongo_adapter.insert_db_entry(data={"username": "alice"})
+        mongo_adapter.silent_replace_db_entry(index_name="username", data={"username": "bob"})
+        mongo_adapter.find_one_and_update(data={"username": "bob"}, update={"$set": {"username": "carol"}})
+        mongo_adapter.update_db_entries(data={"disabled": False}, update={"$set": {"disabled": True}})
+        mongo_adapter.delete_db_entry(index_name="username", entry_id="dave")
+        assert published == [
+            ["users:username:alice"],
+            ["users:username:bob"],
+            ["users:username:bob", "users:username:carol"],
+            ["users:*"],
+        ]
+
+    def test_unix_socket_bus_reaches_other_workers(self, tmp_path):
+        """
+        Checks that the keys published by one worker reach the listeners of the other worker,
+        and that the sockets of exited workers are removed
+        """
+        received = []
+        publisher = UnixSocketInvalidationBus(socket_folder_path=str(tmp_path))
+        subscriber = UnixSocketInvalidationBus(socket_folder_path=str(tmp_path))
+        subscriber.subscribe(received.append)
+        publisher.start()
+        subscriber.start()
+        exited = UnixSocketInvalidationBus(socket_folder_path=str(tmp_path))
+        exited.start()
+        exited._stop_event.set()
+        exited._receiver.join()
+        exited._socket.close()
+        try:
+            publisher.publish(["users:username:alice"])
+            assert wait_for(lambda: received == [["users:username:alice"]])
+            assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+                path.split("/")[-1] for path in (publisher.socket_path, subscriber.socket_path)
+            )
+            keys = [f"users:username:{number:06}" for number in range(5000)]
+            publisher.publish(keys)
+            assert wait_for(lambda: sum(received[1:], []) == keys)
+        finally:
+            publisher.close()
+            subscriber.close()
+        assert not list(tmp_path.iterdir())
+
+    def test_change_stream_events_are_translated(self):
+        """
+        Checks that the change stream events of the watched collections are translated into invalidation keys,
+        falling back to the whole collection when the old key values are unknown
+        """
+        collection_key_fields = {"users": ["username"]}
+        get_change_keys = MongoChangeStreamInvalidationBus.get_change_keys
+        assert get_change_keys(collection_key_fields, {
+            "operationType": "insert", "ns": {"coll": "users"}, "fullDocument": {"username": "alice"}
+        }) == ["users:username:alice"]
+        assert get_change_keys(collection_key_fields, {
+            "operationType": "update",
+            "ns": {"coll": "users"},
+            "fullDocument": {"username": "alice", "disabled": True},
+            "updateDescription": {"updatedFields": {"disabled": True}}
+        }) == ["users:username:alice"]
+        assert get_change_keys(collection_key_fields, {
+            "operationType": "update",
+            "ns": {"coll": "users"},
+            "fullDocument": {"username": "bob"},
+            "updateDescription": {"updatedFields": {"username": "bob"}}
+        }) == ["users:*"]
+        assert get_change_keys(collection_key_fields, {
+            "operationType": "delete", "ns": {"coll": "users"}, "fullDocumentBeforeChange": {"username": "carol"}
+        }) == ["users:username:carol"]
+        assert get_change_keys(collection_key_fields, {"operationType": "delete", "ns": {"coll": "users"}}) == ["users:*"]
+        assert get_change_keys(collection_key_fields, {"operationType": "insert", "ns": {"coll": "books"}}) == []
+
+    def test_change_stream_bus_stops_on_standalone_server(self):
+        """
+        Checks that the change stream bus gives up at once if the server does not support change streams,
+        without clearing the caches on retries, and keeps dispatching the writes of this worker
+        """
+        mongo_adapter = MongoAdapter(
+            host="localhost",
+            port=27017,
+            db_name="test_db",
+            collection_name="users",
+            requires_auth=False,
+            client=InMemoryMongoClient()
+        )
+        logger = SimpleNamespace(warnings=[])
+        logger.warning = logger.warnings.append
+        bus = MongoChangeStreamInvalidationBus(logger=logger)
+        bus.register(mongo_adapter, ["username"])
+        received = []
+        bus.subscribe(received.append)
+        bus.start()
+        try:
+            assert wait_for(lambda: not bus._watcher.is_alive())
+            assert received == [] and len(logger.warnings) == 1
+            bus.publish(["users:username:alice"])
+            assert received == [["users:username:alice"]]
+        finally:
+            bus.close()
@@ -0,0 +1,129 @@
+# tests/test_keys.py
+
+import os
+import time
+
+import pytest
+from jose import jwt, jwk, JWTError
+
+from backend.keys import KeyRing, init_key_ring
+
+
+"""
+Test class for keys.py module contains test cases to check
+JWT signing keys cache and rotation
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_keys.py --cov-report term-missing --cov=sources
+"""
+
+
+def write_private_key(keys_folder, kid: str, algorithm: str, created_at: float) -> None:
+    if algorithm.startswith("RS"):
+        rsa = pytest.importorskip("rsa")
+        pem = rsa.newkeys(1024)[1].save_pkcs1().decode()
+    else:
+        ecdsa = pytest.importorskip("ecdsa")
+        pem = ecdsa.SigningKey.generate(curve=ecdsa.NIST256p).to_pem().decode()
+    key_file_path = keys_folder / f"{kid}.pem"
+    key_file_path.write_text(pem)
+    os.utime(key_file_path, (created_at, created_at))
+
+
+def sign(key_ring: KeyRing) -> str:
+    signing_key = key_ring.get_signing_key()
+    return jwt.encode(
+        {"sub": "alice"}, signing_key.private_key, algorithm=signing_key.algorithm, headers={"kid": signing_key.kid}
+    )
+
+
+def verify(key_ring: KeyRing, token: str) -> dict:
+    verification_key = key_ring.get_verification_key(kid=jwt.get_unverified_header(token)["kid"])
+    return jwt.decode(token, verification_key.public_key, algorithms=[verification_key.algorithm])
+
+
+@pytest.mark.keys
+class TestKeyRing:
+    """
+    Test class to check functionality of KeyRing class
+    """
+
+    @pytest.mark.parametrize("algorithm", ["RS256", "ES256"])
+    def test_tokens_are_verified_by_published_keys(self, tmp_path, algorithm):
+        """
+        Checks that the tokens carry the key ID and are verified by the public key published in JWKS
+        """
+        write_private_key(tmp_path, kid="first", algorithm=algorithm, created_at=time.time() - 3600)
+        key_ring = KeyRing(algorithm=algorithm, keys_folder_path=str(tmp_path))
+        token = sign(key_ring)
+        assert jwt.get_unverified_header(token)["kid"] == "first"
+        (public_jwk,) = key_ring.get_jwks()["keys"]
+        assert public_jwk["kid"] == "first" and "d" not in public_jwk
+        assert jwt.decode(token, jwk.construct(public_jwk), algorithms=[algorithm])["sub"] == "alice"
+
+    def test_rotation_publishes_new_key_before_signing(self, tmp_path):
+        """
+        Checks that the new key is published at once but signs only after the publish delay,
+        while the tokens of the old key are still verified
+        """
+        write_private_key(tmp_path, kid="old", algorithm="ES256", created_at=time.time() - 3600)
+        key_ring = KeyRing(
+            algorithm="ES256", keys_folder_path=str(tmp_path), publish_delay_seconds=600, reload_interval_seconds=0
+        )
+        old_token = sign(key_ring)
+        write_private_key(tmp_path, kid="new", algorithm="ES256", created_at=time.time())
+        assert [key["kid"] for key in key_ring.get_jwks()["keys"]] == ["new", "old"]
+        assert jwt.get_unverified_header(sign(key_ring))["kid"] == "old"
+        os.utime(tmp_path / "new.pem", (time.time() - 601, time.time() - 601))
+        new_token = sign(key_ring)
+        assert jwt.get_unverified_header(new_token)["kid"] == "new"
+        assert verify(key_ring, old_token)["sub"] == verify(key_ring, new_token)["sub"] == "alice"
+        (tmp_path / "old.pem").unlink()
+        with pytest.raises(JWTError):
+            verify(key_ring, old_token)
+
+    def test_other_workers_verify_new_key_at_once(self, tmp_path, monkeypatch):
+        """
+        Checks that the new key does not sign before the reload interval by default, and the worker which
+        has not rescanned the keys folder yet loads the unknown key ID at once instead of rejecting the token,
+        rescanning the folder for the unknown key IDs at most once per second
+        """
+        write_private_key(tmp_path, kid="old", algorithm="ES256", created_at=time.time() - 3600)
+        signing_worker = KeyRing(algorithm="ES256", keys_folder_path=str(tmp_path), reload_interval_seconds=60)
+        verifying_worker = init_key_ring({"ALGORITHM": "ES256", "JWT_KEYS_FOLDER_PATH": str(tmp_path)})
+        assert signing_worker.publish_delay_seconds == verifying_worker.publish_delay_seconds == 60
+        write_private_key(tmp_path, kid="new", algorithm="ES256", created_at=time.time() - 30)
+        signing_worker.reload(force=True)
+        assert jwt.get_unverified_header(sign(signing_worker))["kid"] == "old"
+        os.utime(tmp_path / "new.pem", (time.time() - 61, time.time() - 61))
+        signing_worker.reload(force=True)
+        new_token = sign(signing_worker)
+        assert jwt.get_unverified_header(new_token)["kid"] == "new"
+        assert verify(verifying_worker, new_token)["sub"] == "alice"
+        scans = []
+        scandir = os.scandir
+        monkeypatch.setattr("backend.keys.os.scandir", lambda path: scans.append(path) or scandir(path))
+        for _ in range(3):
+            with pytest.raises(JWTError):
+                verifying_worker.get_verification_key(kid="forged")
+        assert len(scans) <= 1
+
+    def test_keys_are_parsed_once(self, tmp_path, monkeypatch):
+        """
+        Checks that the unchanged key files are not parsed again by the reloads
+        """
+        write_private_key(tmp_path, kid="first", algorithm="ES256", created_at=time.time() - 3600)
+        key_ring = KeyRing(algorithm="ES256", keys_folder_path=str(tmp_path), reload_interval_seconds=0)
+        monkeypatch.setattr("backend.keys.jwk.construct", lambda *args: pytest.fail("Key is parsed again!"))
+        for _ in range(3):
+            verify(key_ring, sign(key_ring))
+
+    def test_symmetric_algorithm_uses_secret_key(self):
+        """
+        Checks that HS256 keeps signing by the secret key without key ID and publishes no keys
+        """
+        key_ring = KeyRing(algorithm="HS256", secret_key="secret")
+        signing_key = key_ring.get_signing_key()
+        assert signing_key.kid is None and key_ring.get_verification_key(kid=None) is signing_key
+        assert key_ring.get_jwks() == {"keys": []}
+        with pytest.raises(ValueError):
+            KeyRing(algorithm="none")
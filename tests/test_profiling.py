@@ -0,0 +1,140 @@
+# tests/test_profiling.py
+
+import sys
+import time
+import threading
+from pathlib import Path
+
+import anyio
+import pytest
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.testclient import TestClient
+
+from backend.profiling import ProfilingMiddleware, StackSampler, PROFILING_SESSION, WORKER_CONTEXT_FRAME
+
+
+"""
+Test class for profiling.py module contains test cases to check
+sampled request profiling
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_profiling.py --cov-report term-missing --cov=sources
+"""
+
+
+def make_client(profiles_folder_path: Path, sample_rate: float, admin_token: str = None) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/slow")
+    def slow_endpoint():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        return {"status": "done"}
+
+    @app.get("/slow-async")
+    async def slow_async_endpoint():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        return {"status": "done"}
+
+    app.add_middleware(
+        ProfilingMiddleware,
+        sample_rate=sample_rate,
+        admin_token=admin_token,
+        profiles_folder_path=profiles_folder_path,
+        interval_ms=1
+    )
+    return TestClient(app)
+
+
+@pytest.mark.profiling
+class TestProfilingMiddleware:
+    """
+    Test class to check functionality of ProfilingMiddleware class
+    """
+
+    def test_sampled_request_is_profiled(self, tmp_path: Path):
+        """
+        Checks that the profile of sampled request is saved, tagged with the route, and shows the hot path
+        """
+        client = make_client(profiles_folder_path=tmp_path, sample_rate=1.0)
+        assert client.get("/slow").status_code == 200
+        profile_paths = list(tmp_path.glob("*_GET_slow_endpoint_200_*ms.folded"))
+        assert len(profile_paths) == 1
+        assert "slow_endpoint (test_profiling.py" in profile_paths[0].read_text()
+
+    def test_only_request_threads_are_profiled(self, tmp_path: Path):
+        """
+        Checks that the profiles show the event loop and the worker threads running the request,
+        but neither the other busy threads nor the idle ones
+        """
+        stop_event = threading.Event()
+
+        def unrelated_busy_loop():
+            while not stop_event.is_set():
+                pass
+
+        busy_thread = threading.Thread(target=unrelated_busy_loop, daemon=True)
+        busy_thread.start()
+        try:
+            client = make_client(profiles_folder_path=tmp_path, sample_rate=1.0)
+            assert client.get("/slow").status_code == 200
+            assert client.get("/slow-async").status_code == 200
+        finally:
+            stop_event.set()
+            busy_thread.join()
+        sync_profile = next(tmp_path.glob("*_GET_slow_endpoint_200_*ms.folded")).read_text()
+        async_profile = next(tmp_path.glob("*_GET_slow_async_endpoint_200_*ms.folded")).read_text()
+        assert "slow_endpoint (test_profiling.py" in sync_profile
+        assert "slow_async_endpoint (test_profiling.py" in async_profile
+        for profile in (sync_profile, async_profile):
+            assert "unrelated_busy_loop" not in profile
+            assert "select (selectors.py" not in profile
+            assert "get (queue.py" not in profile
+
+    @pytest.mark.parametrize("headers, expected_profiles", [
+        ({}, 0),
+        ({"X-Profile-Request": "wrong token"}, 0),
+        ({"X-Profile-Request": "admin token"}, 1),
+    ])
+    def test_admin_header(self, tmp_path: Path, headers: dict, expected_profiles: int):
+        """
+        Checks that the request is profiled regardless of the sample rate only with the valid admin token
+
+        :param headers: request headers
+        :type headers: dict
+        :param expected_profiles: expected number of saved profiles
+        :type expected_profiles: int
+        """
+        client = make_client(profiles_folder_path=tmp_path, sample_rate=0.0, admin_token="admin token")
+        assert client.get("/slow", headers=headers).status_code == 200
+        assert len(list(tmp_path.glob("*.folded"))) == expected_profiles
+
+    def test_thread_pool_worker_context_is_found(self):
+        """
+        Checks that the thread pool worker running the sync code of the request is matched to its session.
+        Fails if the installed anyio no longer runs the functions from WORKER_CONTEXT_FRAME,
+        the sync endpoints would be missing from the profiles otherwise
+        """
+        sampler = StackSampler()
+
+        def get_worker_session():
+            return StackSampler._get_context_session(sys._current_frames()[threading.get_ident()])
+
+        async def run_request():
+            session = sampler.start_session()
+            token = PROFILING_SESSION.set(session)
+            try:
+                return session, await run_in_threadpool(get_worker_session)
+            finally:
+                sampler.stop_session(session)
+                PROFILING_SESSION.reset(token)
+
+        session, worker_session = anyio.run(run_request)
+        assert worker_session is session, (
+            f"Thread pool worker is not matched to the profiling session, check {WORKER_CONTEXT_FRAME} "
+            f"against the installed anyio version"
+        )
+        assert anyio.run(run_in_threadpool, get_worker_session) is None
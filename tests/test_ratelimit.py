@@ -0,0 +1,108 @@
+# tests/test_ratelimit.py
+
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.security import create_access_token
+from backend.ratelimit import RateLimit, InMemoryRateLimitStore, RedisRateLimitStore, RateLimitMiddleware
+
+
+"""
+Test class for ratelimit.py module contains test cases to check
+token bucket rate limiting per IP and per user
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_ratelimit.py --cov-report term-missing --cov=sources
+"""
+
+
+@pytest.fixture(params=["memory", "redis"])
+def rate_limit_store(request):
+    """
+    Rate limit store of every supported backend, Redis one is backed by a local fake server
+    """
+    if request.param == "memory":
+        return InMemoryRateLimitStore()
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return RedisRateLimitStore(redis_client=fakeredis.FakeRedis())
+
+
+@pytest.mark.ratelimit
+class TestRateLimitStore:
+    """
+    Test class to check functionality of the rate limit stores
+    """
+
+    def test_burst_then_refill(self, rate_limit_store):
+        """
+        Checks that the bucket allows the burst, rejects the rest with the time to wait and is refilled in time
+        """
+        rate_limit = RateLimit(name="ip", per_second=20, burst=3)
+        decisions = [rate_limit_store.consume(key="ip:10.0.0.1", rate_limit=rate_limit) for _ in range(4)]
+        assert [allowed for allowed, _ in decisions] == [True, True, True, False]
+        assert 0 < decisions[-1][1] <= 0.05
+        assert rate_limit_store.consume(key="ip:10.0.0.2", rate_limit=rate_limit)[0]
+        time.sleep(0.06)
+        assert rate_limit_store.consume(key="ip:10.0.0.1", rate_limit=rate_limit)[0]
+
+    def test_idle_buckets_are_evicted(self):
+        """
+        Checks that the buckets refilled to the full are evicted by the following calls
+        """
+        rate_limit_store = InMemoryRateLimitStore()
+        rate_limit = RateLimit(name="ip", per_second=100, burst=1)
+        for number in range(100):
+            rate_limit_store.consume(key=f"ip:10.0.0.{number}", rate_limit=rate_limit)
+        time.sleep(0.02)
+        rate_limit_store.consume(key="ip:10.0.1.1", rate_limit=rate_limit)
+        assert len(rate_limit_store) == 1
+
+
+@pytest.mark.ratelimit
+class TestRateLimitMiddleware:
+    """
+    Test class to check functionality of RateLimitMiddleware class
+    """
+
+    @staticmethod
+    def make_client(**limits) -> TestClient:
+        app = FastAPI()
+
+        @app.get("/books")
+        def show_books():
+            return []
+
+        @app.post("/token")
+        def login():
+            return {}
+
+        app.add_middleware(RateLimitMiddleware, store=InMemoryRateLimitStore(), **limits)
+        return TestClient(app)
+
+    def test_user_limit_is_keyed_by_token_subject(self):
+        """
+        Checks that the users behind the same IP have separate buckets, while invalid tokens are not trusted
+        """
+        client = self.make_client(user_limit=RateLimit(name="user", per_second=0.01, burst=1))
+        alice = {"Authorization": f"Bearer {create_access_token(data={'sub': 'alice'})['access_token']}"}
+        bob = {"Authorization": f"Bearer {create_access_token(data={'sub': 'bob'})['access_token']}"}
+        assert client.get("/books", headers=alice).status_code == 200
+        rejected = client.get("/books", headers=alice)
+        assert rejected.status_code == 429
+        assert int(rejected.headers["retry-after"]) >= 1
+        assert client.get("/books", headers=bob).status_code == 200
+        assert client.get("/books", headers={"Authorization": "Bearer forged.token.value"}).status_code == 200
+
+    def test_auth_routes_have_stricter_ip_limit(self):
+        """
+        Checks that the auth routes are limited by their own per-IP bucket only
+        """
+        client = self.make_client(
+            ip_limit=RateLimit(name="ip", per_second=100, burst=100),
+            auth_ip_limit=RateLimit(name="auth_ip", per_second=0.01, burst=2)
+        )
+        assert [client.post("/token").status_code for _ in range(3)] == [200, 200, 429]
+        assert client.get("/books").status_code == 200
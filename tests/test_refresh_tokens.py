@@ -0,0 +1,90 @@
+# tests/test_refresh_tokens.py
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.refresh_tokens import InMemoryRefreshTokenStore, InvalidRefreshTokenError
+
+
+"""
+Test class for refresh_tokens.py module contains test cases to check
+rotation and revocation of refresh tokens
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_refresh_tokens.py --cov-report term-missing --cov=sources
+"""
+
+
+@pytest.mark.refresh_tokens
+class TestInMemoryRefreshTokenStore:
+    """
+    Test class to check functionality of InMemoryRefreshTokenStore class
+    """
+
+    def test_tokens_are_stored_hashed(self):
+        """
+        Checks that only the hash of the issued token is kept
+        """
+        store = InMemoryRefreshTokenStore()
+        token, _ = store.issue(username="alice")
+        assert token not in store._tokens
+        assert store.hash_token(token) in store._tokens
+
+    def test_rotation_uses_up_token(self):
+        """
+        Checks that the refresh returns the new token of the same user and the used token is rejected
+        """
+        store = InMemoryRefreshTokenStore()
+        token, _ = store.issue(username="alice")
+        username, new_token, _ = store.rotate(token=token)
+        assert username == "alice" and new_token != token
+        assert store.rotate(token=new_token)[0] == "alice"
+
+    def test_reuse_revokes_family(self):
+        """
+        Checks that the replayed used token revokes all the tokens it was rotated to, but not other sessions
+        """
+        store = InMemoryRefreshTokenStore()
+        token, _ = store.issue(username="alice")
+        other_session_token, _ = store.issue(username="alice")
+        _, rotated_token, _ = store.rotate(token=token)
+        with pytest.raises(InvalidRefreshTokenError):
+            store.rotate(token=token)
+        with pytest.raises(InvalidRefreshTokenError):
+            store.rotate(token=rotated_token)
+        assert store.rotate(token=other_session_token)[0] == "alice"
+
+    def test_concurrent_refreshes_with_same_token(self):
+        """
+        Checks that only one of concurrent refreshes with the same token succeeds
+        """
+        store = InMemoryRefreshTokenStore()
+        token, _ = store.issue(username="alice")
+
+        def refresh(_):
+            try:
+                return store.rotate(token=token)
+            except InvalidRefreshTokenError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(refresh, range(8)))
+        assert sum(result is not None for result in results) == 1
+
+    def test_revocation_and_expiry(self):
+        """
+        Checks that revoked, revoked per user and expired tokens are rejected
+        """
+        store = InMemoryRefreshTokenStore()
+        revoked_token, _ = store.issue(username="alice")
+        assert store.revoke(token=revoked_token)
+        assert not store.revoke(token="unknown token")
+        user_tokens = [store.issue(username="bob")[0] for _ in range(2)]
+        assert store.revoke_user(username="bob") == 2
+        for token in (revoked_token, *user_tokens, "unknown token"):
+            with pytest.raises(InvalidRefreshTokenError):
+                store.rotate(token=token)
+        expiring_store = InMemoryRefreshTokenStore(ttl_seconds=0)
+        expired_token, _ = expiring_store.issue(username="alice")
+        with pytest.raises(InvalidRefreshTokenError):
+            expiring_store.rotate(token=expired_token)
@@ -0,0 +1,263 @@
+# tests/test_repository.py
+
+from pathlib import Path
+from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.models import Book
+from backend.mock_data import default_book_shelf
+from backend.database import MongoAdapter
+from backend.memory_database import InMemoryMongoClient
+from backend.repository import (
+    BookRepository,
+    BookAlreadyExistsError,
+    BookNotFoundError,
+    BookAvailabilityConflictError,
+    InMemoryBookRepository,
+    SQLiteBookRepository,
+    MongoBookRepository,
+    BOOK_COLLECTION_INDEX_PARAMS,
+)
+
+
+"""
+Test class for repository.py module contains test cases to check that every
+storage backend honours the same BookRepository contract
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_repository.py --cov-report term-missing --cov=sources
+"""
+
+
+@pytest.fixture(params=["memory", "sqlite", "mongo"])
+def book_repository(request, tmp_path: Path) -> BookRepository:
+    """
+    Fixture creates the book repository with the default book shelf for every storage backend,
+    mongo one works with the in-memory client
+
+    :return BookRepository: book repository instance
+    """
+    if request.param == "memory":
+        repository = InMemoryBookRepository()
+    elif request.param == "sqlite":
+        repository = SQLiteBookRepository(database_path=str(Path(tmp_path, "books.sqlite3")))
+    else:
+        repository = MongoBookRepository(mongo_adapter=MongoAdapter(
+            host="localhost",
+            port=27017,
+            db_name="test_db",
+            collection_name="test_books",
+            requires_auth=False,
+            required_index_params=BOOK_COLLECTION_INDEX_PARAMS,
+            client=InMemoryMongoClient()
+        ))
+    for book in default_book_shelf.values():
+        repository.add_book(book=book.copy())
+    yield repository
+    repository.close()
+
+
+def make_book(book_name: str, available: bool = True) -> Book:
+    return Book(book_id=uuid4().hex, book_name=book_name, author="Test Author", description="Test", available=available)
+
+
+@pytest.mark.repository
+class TestBookRepository:
+    """
+    Test class to check functionality of the book repositories of every storage backend
+    """
+
+    @pytest.mark.parametrize("book_id, book_name", [
+        ("936d4b41ec874007af150bbac8e714c3", "Shantaram"),
+        ("414a1cf5764840c588afab3d17fb97df", "The adventures of Sherlock Holmes"),
+        ("00000000000000000000000000000000", None),
+    ])
+    def test_get_book(self, book_repository: BookRepository, book_id: str, book_name: str):
+        """
+        Test case checks the functionality of get_book() method
+
+        :param book_id: ID of the book to be extracted
+        :type book_id: str
+        :param book_name: expected book name or None if the book must not be found
+        :type book_name: str
+        """
+        book = book_repository.get_book(book_id=book_id)
+        assert (book.book_name if book else None) == book_name
+
+    def test_list_books_pagination(self, book_repository: BookRepository):
+        """
+        Test case checks that list_books() pages through the books in insertion order
+        """
+        all_books = book_repository.list_books(limit=100)
+        assert [book.book_id for book in all_books] == list(default_book_shelf.keys())
+        assert book_repository.list_books(limit=2, skip=1) == all_books[1:3]
+        assert book_repository.list_books(limit=0) == []
+        assert book_repository.count_books() == len(all_books)
+        assert list(book_repository.iter_books()) == all_books
+
+    def test_add_book_rejects_duplicate_name(self, book_repository: BookRepository):
+        """
+        Test case checks that add_book() refuses the second book with the same book name
+        """
+        book_repository.add_book(book=make_book("Test Book"))
+        with pytest.raises(BookAlreadyExistsError):
+            book_repository.add_book(book=make_book("Test Book"))
+        assert book_repository.count_books() == len(default_book_shelf) + 1
+
+    def test_replace_book(self, book_repository: BookRepository):
+        """
+        Test case checks that replace_book() both updates existing books and inserts new ones
+        """
+        book = book_repository.get_book(book_id="936d4b41ec874007af150bbac8e714c3")
+        book_repository.replace_book(book=book.copy(update={"book_name": "Shantaram, 2nd edition", "available": False}))
+        replaced_book = book_repository.get_book(book_id=book.book_id)
+        assert replaced_book.book_name == "Shantaram, 2nd edition"
+        assert replaced_book.available is False
+        # old name is released, so it can be reused by another book
+        book_repository.add_book(book=make_book("Shantaram"))
+
+        new_book = make_book("Upserted Book")
+        book_repository.replace_book(book=new_book)
+        assert book_repository.get_book(book_id=new_book.book_id) == new_book
+
+    def test_replace_book_rejects_name_of_another_book(self, book_repository: BookRepository):
+        """
+        Test case checks that replace_book() refuses to rename the book to the name of another book,
+        leaving both books intact
+        """
+        book = book_repository.add_book(book=make_book("Moby Dick"))
+        with pytest.raises(BookAlreadyExistsError):
+            book_repository.replace_book(book=book.copy(update={"book_name": "Shantaram"}))
+        with pytest.raises(BookAlreadyExistsError):
+            book_repository.replace_book(book=make_book("Shantaram"))
+        assert book_repository.get_book(book_id=book.book_id) == book
+        assert book_repository.get_book(book_id="936d4b41ec874007af150bbac8e714c3").book_name == "Shantaram"
+        assert book_repository.delete_book_by_name(book_name="Shantaram").book_id == "936d4b41ec874007af150bbac8e714c3"
+        assert book_repository.count_books() == len(default_book_shelf)
+
+    @pytest.mark.parametrize("book_name, expected", [
+        ("Shantaram", True),
+        ("Test Book That Does Not Exist", False),
+    ])
+    def test_delete_book_by_name(self, book_repository: BookRepository, book_name: str, expected: bool):
+        """
+        Test case checks the functionality of delete_book_by_name() method
+
+        :param book_name: name of the book to be deleted
+        :type book_name: str
+        :param expected: ``True`` if the book must be deleted, else ``False``
+        :type expected: bool
+        """
+        deleted_book = book_repository.delete_book_by_name(book_name=book_name)
+        assert bool(deleted_book) == expected
+        assert book_repository.delete_book_by_name(book_name=book_name) is None
+
+    @pytest.mark.parametrize("query, expected_book_names", [
+        ("sherlock", ["The adventures of Sherlock Holmes"]),
+        ("ROWLING", ["Harry Potter and the Chamber of Secrets"]),
+        ("adventures", ["The adventures of Sherlock Holmes", "Harry Potter and the Chamber of Secrets"]),
+        ("the", []),
+        ("nonexistent", []),
+    ])
+    def test_search_books(self, book_repository: BookRepository, query: str, expected_book_names: list):
+        """
+        Test case checks that search_books() returns matching books ranked by relevance
+
+        :param query: search phrase
+        :type query: str
+        :param expected_book_names: names of the books expected to be found, best matches first
+        :type expected_book_names: list
+        """
+        found_books = book_repository.search_books(query=query)
+        assert [book.book_name for book in found_books] == expected_book_names
+
+    def test_search_books_follows_writes(self, book_repository: BookRepository):
+        """
+        Test case checks that search results reflect added, replaced and deleted books
+        """
+        book = book_repository.add_book(book=make_book("Moby Dick"))
+        assert book_repository.search_books(query="moby") == [book]
+        book_repository.replace_book(book=book.copy(update={"book_name": "The Whale"}))
+        assert book_repository.search_books(query="moby") == []
+        assert book_repository.search_books(query="whale")[0].book_id == book.book_id
+        book_repository.delete_book_by_name(book_name="The Whale")
+        assert book_repository.search_books(query="whale") == []
+
+    def test_add_books_skips_existing(self, book_repository: BookRepository):
+        """
+        Test case checks that add_books() loads the books batch by batch, skipping the already stored book names
+        """
+        changes = []
+        book_repository.subscribe(changes.append)
+        books = [make_book(f"Bulk Book {number}") for number in range(5)] + [make_book("Shantaram")]
+        assert book_repository.add_books(books, batch_size=2) == 5
+        assert book_repository.add_books(books, batch_size=2) == 0
+        assert book_repository.count_books() == len(default_book_shelf) + 5
+        assert [change.book.book_name for change in changes] == [f"Bulk Book {number}" for number in range(5)]
+        assert {book.book_id for book in book_repository.search_books(query="bulk", limit=10)} == {
+            book.book_id for book in books[:5]
+        }
+
+    def test_subscribe(self, book_repository: BookRepository):
+        """
+        Test case checks that subscribed listeners are notified about every write
+        """
+        changes = []
+        book_repository.subscribe(changes.append)
+        book = book_repository.add_book(book=make_book("Moby Dick"))
+        with pytest.raises(BookAlreadyExistsError):
+            book_repository.add_book(book=make_book("Moby Dick"))
+        book_repository.replace_book(book=book.copy(update={"book_name": "The Whale"}))
+        book_repository.delete_book_by_name(book_name="The Whale")
+        book_repository.delete_book_by_name(book_name="The Whale")
+        assert [(change.operation, change.book.book_name) for change in changes] == [
+            ("add", "Moby Dick"), ("replace", "The Whale"), ("delete", "The Whale")
+        ]
+        assert changes[1].previous_book == book
+
+    def test_checkout_and_return_book(self, book_repository: BookRepository):
+        """
+        Test case checks the state transitions of checkout_book() and return_book() methods
+        """
+        book_id = "936d4b41ec874007af150bbac8e714c3"
+        assert book_repository.checkout_book(book_id=book_id).available is False
+        assert book_repository.get_book(book_id=book_id).available is False
+        with pytest.raises(BookAvailabilityConflictError):
+            book_repository.checkout_book(book_id=book_id)
+        assert book_repository.return_book(book_id=book_id).available is True
+        with pytest.raises(BookAvailabilityConflictError):
+            book_repository.return_book(book_id=book_id)
+        with pytest.raises(BookNotFoundError):
+            book_repository.checkout_book(book_id="00000000000000000000000000000000")
+
+    def test_concurrent_checkout_book(self, book_repository: BookRepository):
+        """
+        Test case hammers the same book with parallel checkouts and returns and checks that
+        no update is lost: every round exactly one checkout and exactly one return succeed,
+        the losers get the availability conflict and the checkouts of the missing book get not found
+        """
+        book_id = "414a1cf5764840c588afab3d17fb97df"
+        missing_book_id = "00000000000000000000000000000000"
+
+        def attempt(operation, target_book_id: str = book_id) -> str:
+            try:
+                operation(book_id=target_book_id)
+                return "ok"
+            except BookAvailabilityConflictError:
+                return "conflict"
+            except BookNotFoundError:
+                return "not found"
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            for _ in range(20):
+                checkouts = list(executor.map(lambda _: attempt(book_repository.checkout_book), range(32)))
+                assert (checkouts.count("ok"), checkouts.count("conflict")) == (1, 31)
+                assert book_repository.get_book(book_id=book_id).available is False
+                returns = list(executor.map(lambda _: attempt(book_repository.return_book), range(32)))
+                assert (returns.count("ok"), returns.count("conflict")) == (1, 31)
+                assert book_repository.get_book(book_id=book_id).available is True
+            missing_checkouts = list(executor.map(
+                lambda _: attempt(book_repository.checkout_book, missing_book_id), range(32)
+            ))
+            assert missing_checkouts == ["not found"] * 32
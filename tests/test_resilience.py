@@ -0,0 +1,166 @@
+# tests/test_resilience.py
+
+import time
+
+import pytest
+from pymongo.errors import AutoReconnect, DuplicateKeyError, ServerSelectionTimeoutError
+
+from backend.database import MongoAdapter
+from backend.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    CIRCUIT_CLOSED,
+    CIRCUIT_OPEN,
+    CIRCUIT_HALF_OPEN
+)
+
+
+"""
+Test class for resilience.py module contains test cases to check
+circuit breaker and bounded retries of MongoDB calls
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_resilience.py --cov-report term-missing --cov=sources
+"""
+
+
+class FlakyCollection:
+    """
+    Stand-in of pymongo collection failing the calls with the given errors before answering
+    """
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def _call(self, result):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return result
+
+    def find_one(self, *args, **kwargs):
+        return self._call({"book_name": "Dummy Book"})
+
+    def insert_one(self, data):
+        return self._call(None)
+
+
+def init_mongo_adapter(collection: FlakyCollection, **kwargs) -> MongoAdapter:
+    # client connects lazily, so no server is needed as long as the collection is replaced
+    mongo_adapter = MongoAdapter(
+        host="localhost",
+        port=27017,
+        db_name="test_db",
+        collection_name="test_books",
+        requires_auth=False,
+        recreate_indexes=False,
+        **kwargs
+    )
+    mongo_adapter.collection = collection
+    return mongo_adapter
+
+
+@pytest.mark.resilience
+class TestCircuitBreaker:
+    """
+    Test class to check functionality of CircuitBreaker class
+    """
+
+    def test_opens_on_failure_rate_and_recovers_through_probe(self):
+        """
+        Checks that the breaker opens once the failure rate crosses the threshold, rejects the calls while open
+        and lets a single probe through once half-open
+        """
+        circuit_breaker = CircuitBreaker(failure_rate_threshold=0.5, minimum_calls=4, open_seconds=0.05)
+        for failed in (False, True, False):
+            circuit_breaker.before_call()
+            circuit_breaker.record_failure() if failed else circuit_breaker.record_success()
+        assert circuit_breaker.state == CIRCUIT_CLOSED
+        circuit_breaker.before_call()
+        circuit_breaker.record_failure()
+        assert circuit_breaker.state == CIRCUIT_OPEN
+        with pytest.raises(CircuitOpenError) as exc_info:
+            circuit_breaker.before_call()
+        assert 0 < exc_info.value.retry_after_seconds <= 0.05
+        time.sleep(0.06)
+        assert circuit_breaker.state == CIRCUIT_HALF_OPEN
+        circuit_breaker.before_call()
+        with pytest.raises(CircuitOpenError):
+            circuit_breaker.before_call()
+        circuit_breaker.record_success()
+        assert circuit_breaker.state == CIRCUIT_CLOSED
+
+    def test_failed_probe_opens_again(self):
+        """
+        Checks that the failed half-open probe opens the breaker again
+        """
+        circuit_breaker = CircuitBreaker(minimum_calls=1, open_seconds=0.01)
+        circuit_breaker.record_failure()
+        time.sleep(0.02)
+        circuit_breaker.before_call()
+        circuit_breaker.record_failure()
+        assert circuit_breaker.state == CIRCUIT_OPEN
+
+
+@pytest.mark.resilience
+class TestMongoAdapterResilience:
+    """
+    Test class to check retries, deadlines and circuit breaker of MongoAdapter class
+    """
+
+    def test_reads_are_retried_with_bounded_backoff(self):
+        """
+        Checks that reads are retried on transient errors, while writes are not
+        """
+        retry_policy = RetryPolicy(max_attempts=3, base_delay_ms=1, max_delay_ms=2)
+        collection = FlakyCollection([AutoReconnect("primary stepped down")] * 2)
+        mongo_adapter = init_mongo_adapter(collection, retry_policy=retry_policy, operation_timeout_ms=1000)
+        assert mongo_adapter.read_first_match(data={"book_name": "Dummy Book"}) == {"book_name": "Dummy Book"}
+        assert collection.calls == 3
+
+        collection = FlakyCollection([AutoReconnect("primary stepped down")])
+        mongo_adapter = init_mongo_adapter(collection, retry_policy=retry_policy)
+        with pytest.raises(AutoReconnect):
+            mongo_adapter.insert_db_entry(data={"book_name": "Dummy Book"})
+        assert collection.calls == 1
+
+    @pytest.mark.parametrize("errors, expected_calls", [
+        ([AutoReconnect("network error")] * 3, 3),
+        ([ServerSelectionTimeoutError("no primary")], 1),
+    ])
+    def test_retries_give_up(self, errors, expected_calls):
+        """
+        Checks that retries stop after the last attempt and that server selection timeouts are not retried
+
+        :param errors: errors raised by the collection
+        :param expected_calls: expected number of attempts
+        """
+        collection = FlakyCollection(errors)
+        mongo_adapter = init_mongo_adapter(collection, retry_policy=RetryPolicy(max_attempts=3, base_delay_ms=1))
+        with pytest.raises(type(errors[0])):
+            mongo_adapter.read_first_match(data={"book_name": "Dummy Book"})
+        assert collection.calls == expected_calls
+
+    def test_open_circuit_fails_fast(self):
+        """
+        Checks that the open breaker rejects calls without touching the collection, while
+        non-transient errors (like duplicate key) are not counted as failures
+        """
+        circuit_breaker = CircuitBreaker(minimum_calls=2, failure_rate_threshold=0.5, open_seconds=60)
+        collection = FlakyCollection([DuplicateKeyError("duplicate"), DuplicateKeyError("duplicate")])
+        mongo_adapter = init_mongo_adapter(collection, circuit_breaker=circuit_breaker)
+        for _ in range(2):
+            with pytest.raises(DuplicateKeyError):
+                mongo_adapter.insert_db_entry(data={"book_name": "Dummy Book"})
+        assert circuit_breaker.state == CIRCUIT_CLOSED
+
+        collection = FlakyCollection([AutoReconnect("network error")] * 2)
+        mongo_adapter.collection = collection
+        for _ in range(2):
+            with pytest.raises(AutoReconnect):
+                mongo_adapter.read_first_match(data={"book_name": "Dummy Book"})
+        assert circuit_breaker.state == CIRCUIT_OPEN
+        with pytest.raises(CircuitOpenError):
+            mongo_adapter.read_first_match(data={"book_name": "Dummy Book"})
+        assert collection.calls == 2
@@ -0,0 +1,103 @@
+# tests/test_revocation.py
+
+import time
+from typing import Dict
+
+import pytest
+from fastapi import FastAPI, Depends
+from fastapi.testclient import TestClient
+
+from backend.security import create_access_token, decode_jwt_token
+from backend.authentication import get_token_payload
+from backend.revocation import TokenDenylist, MongoTokenDenylist
+
+
+"""
+Test class for revocation.py module contains test cases to check
+revocation of access tokens before their expiry
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_revocation.py --cov-report term-missing --cov=sources
+"""
+
+
+class RevokedTokensCollection:
+    """
+    Stand-in of MongoAdapter of the revoked tokens collection shared by several workers
+    """
+
+    def __init__(self):
+        self.documents: Dict[str, Dict] = {}
+        self.collection_name = "revoked_tokens"
+
+    def silent_replace_db_entry(self, index_name: str, data: Dict, options=None) -> None:
+        self.documents[data[index_name]] = data
+
+    def read_many(self, data: Dict, options=None, **kwargs) -> list:
+        (field, condition), = data.items()
+        operator, value = next(iter(condition.items()))
+        if operator == "$gt":
+            return [document for document in self.documents.values() if document[field] > value]
+        return [document for document in self.documents.values() if document[field] >= value]
+
+
+@pytest.mark.revocation
+class TestTokenDenylist:
+    """
+    Test class to check functionality of TokenDenylist and MongoTokenDenylist classes
+    """
+
+    def test_revoked_until_expiry(self):
+        """
+        Checks that the token is revoked until its expiry and is forgotten afterwards
+        """
+        token_denylist = TokenDenylist()
+        token_denylist.revoke(jti="expiring", expires_at=time.time() + 0.05)
+        token_denylist.revoke(jti="long-lived", expires_at=time.time() + 60)
+        token_denylist.revoke(jti="expired", expires_at=time.time() - 1)
+        assert token_denylist.is_revoked("expiring") and token_denylist.is_revoked("long-lived")
+        assert not token_denylist.is_revoked("expired") and not token_denylist.is_revoked("unknown")
+        time.sleep(0.06)
+        assert not token_denylist.is_revoked("expiring")
+        token_denylist.revoke(jti="another", expires_at=time.time() + 60)
+        assert len(token_denylist) == 2
+
+    def test_revocations_are_synced_across_workers(self):
+        """
+        Checks that the revocation made by one worker reaches the local set of another one by the sync
+        """
+        collection = RevokedTokensCollection()
+        first_worker, second_worker = MongoTokenDenylist(collection), MongoTokenDenylist(collection)
+        first_worker.revoke(jti="before start", expires_at=time.time() + 60)
+        second_worker.sync()
+        first_worker.revoke(jti="after start", expires_at=time.time() + 60)
+        assert not second_worker.is_revoked("after start")
+        assert second_worker.sync() == 2
+        assert second_worker.is_revoked("before start") and second_worker.is_revoked("after start")
+
+
+@pytest.mark.revocation
+class TestTokenPayloadDependency:
+    """
+    Test class to check functionality of get_token_payload() dependency
+    """
+
+    def test_revoked_token_is_rejected(self):
+        """
+        Checks that valid tokens are accepted, while revoked and forged ones are rejected
+        """
+        app = FastAPI()
+        app.state.token_denylist = TokenDenylist()
+
+        @app.get("/books")
+        def show_books(payload: Dict = Depends(get_token_payload)):
+            return {"username": payload["sub"]}
+
+        client = TestClient(app)
+        token = create_access_token(data={"sub": "alice"})["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        assert client.get("/books", headers=headers).json() == {"username": "alice"}
+        payload = decode_jwt_token(encoded_token=token)
+        app.state.token_denylist.revoke(jti=payload["jti"], expires_at=payload["exp"])
+        assert client.get("/books", headers=headers).status_code == 401
+        assert client.get("/books", headers={"Authorization": "Bearer forged.token.value"}).status_code == 401
+        assert client.get("/books").status_code == 401
@@ -0,0 +1,130 @@
+# tests/test_search.py
+
+from uuid import uuid4
+
+import pytest
+
+from backend.models import Book
+from backend.search import InvertedIndex, TitleSuggester, tokenize
+
+
+"""
+Test class for search.py module contains test cases to check
+the in-memory full-text index functionality
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_search.py --cov-report term-missing --cov=sources
+"""
+
+
+def make_book(book_name: str, author: str = None, description: str = None) -> Book:
+    return Book(book_id=uuid4().hex, book_name=book_name, author=author, description=description, available=True)
+
+
+@pytest.mark.search
+class TestInvertedIndex:
+    """
+    Test class to check functionality of InvertedIndex class
+    """
+
+    @pytest.mark.parametrize("text, expected", [
+        ("The Adventures of Sherlock Holmes", ["adventures", "sherlock", "holmes"]),
+        ("Harry Potter, and the Chamber!", ["harry", "potter", "chamber"]),
+        ("", []),
+    ])
+    def test_tokenize(self, text: str, expected: list):
+        """
+        Checks functionality of function tokenize()
+
+        :param text: text to be tokenized
+        :type text: str
+        :param expected: expected tokens
+        :type expected: list
+        """
+        assert tokenize(text) == expected
+
+    def test_search_ranks_book_name_above_description(self):
+        """
+        Checks that the match in the book name outweighs the match in the description
+        """
+        index = InvertedIndex()
+        described_book = make_book("Collected stories", description="Stories about a whale")
+        named_book = make_book("The Whale")
+        index.add_many([described_book, named_book, make_book("Unrelated")])
+        assert [book_id for book_id, _ in index.search("whale")] == [named_book.book_id, described_book.book_id]
+
+    def test_search_pagination(self):
+        """
+        Checks that search() pages through the ranked results without overlaps
+        """
+        index = InvertedIndex()
+        index.add_many(make_book(f"Volume {number}", description="saga " * number) for number in range(1, 26))
+        first_page = index.search("saga", limit=10)
+        second_page = index.search("saga", limit=10, skip=10)
+        last_page = index.search("saga", limit=10, skip=20)
+        assert len(first_page) == len(second_page) == 10 and len(last_page) == 5
+        ranked_book_ids = [book_id for book_id, _ in first_page + second_page + last_page]
+        assert len(set(ranked_book_ids)) == 25
+        assert [score for _, score in first_page] == sorted((score for _, score in first_page), reverse=True)
+
+    def test_remove(self):
+        """
+        Checks that removed and re-added books do not leave stale postings behind
+        """
+        index = InvertedIndex()
+        book = make_book("Moby Dick")
+        index.add(book)
+        index.add(book.copy(update={"book_name": "The Whale"}))
+        assert index.search("moby") == []
+        index.remove(book.book_id)
+        assert index.search("whale") == []
+        assert len(index) == 0
+
+
+@pytest.mark.search
+class TestTitleSuggester:
+    """
+    Test class to check functionality of TitleSuggester class
+    """
+
+    @pytest.mark.parametrize("prefix, limit, expected", [
+        ("the adv", 10, ["The Adventure Zone", "The adventures of Sherlock Holmes"]),
+        ("  THE   Adv", 1, ["The Adventure Zone"]),
+        ("harry", 10, ["Harry Potter and the Chamber of Secrets"]),
+        ("ﬁsh", 10, ["Fish and Chips"]),
+        ("zzz", 10, []),
+        ("   ", 10, []),
+    ])
+    def test_suggest(self, prefix: str, limit: int, expected: list):
+        """
+        Checks that suggest() matches normalized prefixes and returns the original titles
+
+        :param prefix: beginning of the title
+        :type prefix: str
+        :param limit: maximum number of completions
+        :type limit: int
+        :param expected: expected completions
+        :type expected: list
+        """
+        suggester = TitleSuggester(titles=[
+            "The adventures of Sherlock Holmes",
+            "Harry Potter and the Chamber of Secrets",
+            "The Adventure Zone",
+            "Fish and Chips",
+            "Shantaram",
+        ])
+        assert suggester.suggest(prefix=prefix, limit=limit) == expected
+
+    def test_add_and_remove(self):
+        """
+        Checks that incremental updates keep the index sorted and free of duplicates
+        """
+        suggester = TitleSuggester(titles=["Beta"])
+        suggester.add("Alpha")
+        suggester.add("Alpha")
+        suggester.add("Gamma")
+        assert suggester.suggest(prefix="a") == ["Alpha"]
+        assert len(suggester) == 3
+        suggester.remove("Alpha")
+        suggester.remove("Missing title")
+        assert suggester.suggest(prefix="a") == []
+        assert len(suggester) == 2
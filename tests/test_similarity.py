@@ -0,0 +1,107 @@
+# tests/test_similarity.py
+
+from uuid import uuid4
+from typing import List
+
+import pytest
+
+from backend.models import Book
+from backend.repository import InMemoryBookRepository
+from backend.similarity import SimilarBooksIndex
+
+
+"""
+Test class for similarity.py module contains test cases to check
+the similar books recommendations
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_similarity.py --cov-report term-missing --cov=sources
+"""
+
+
+def make_book(book_name: str, author: str, description: str) -> Book:
+    return Book(book_id=uuid4().hex, book_name=book_name, author=author, description=description, available=True)
+
+
+def get_names(books: List[Book]) -> List[str]:
+    return [book.book_name for book in books]
+
+
+@pytest.fixture
+def book_repository() -> InMemoryBookRepository:
+    """
+    Fixture creates the in-memory book repository with the books of a few distinct topics
+
+    :return InMemoryBookRepository: book repository instance
+    """
+    return InMemoryBookRepository(books=[
+        make_book("Dune", "Frank Herbert", "Desert planet, spice and the sandworms"),
+        make_book("Dune Messiah", "Frank Herbert", "The emperor of the desert planet faces a conspiracy"),
+        make_book("Children of Dune", "Frank Herbert", "The twins inherit the desert planet"),
+        make_book("Emma", "Jane Austen", "A young woman plays matchmaker in an english village"),
+        make_book("Persuasion", "Jane Austen", "A woman meets the naval officer she refused years ago"),
+        make_book("The Hound of the Baskervilles", "Arthur Conan Doyle", "A detective hunts the legendary hound"),
+    ])
+
+
+@pytest.mark.similarity
+class TestSimilarBooksIndex:
+    """
+    Test class to check functionality of SimilarBooksIndex class
+    """
+
+    def test_most_similar_books_come_first(self, book_repository):
+        """
+        Checks that the books sharing the author and the topic are recommended best first,
+        the book itself and the books sharing nothing are never recommended
+        """
+        similar_books_index = SimilarBooksIndex(book_repository=book_repository, neighbors=3)
+        similar_books_index.rebuild()
+        dune = next(book for book in book_repository.iter_books() if book.book_name == "Dune")
+        similar_names = get_names(similar_books_index.get_similar_books(dune.book_id))
+        assert set(similar_names[:2]) == {"Dune Messiah", "Children of Dune"} and "Dune" not in similar_names
+        assert len(similar_books_index.get_similar_books(dune.book_id, limit=1)) == 1
+        hound = next(book for book in book_repository.iter_books() if book.book_name.startswith("The Hound"))
+        assert similar_books_index.get_similar_books(hound.book_id) == []
+        assert similar_books_index.get_similar_books(uuid4().hex) is None
+
+    def test_changes_are_applied_incrementally(self, book_repository):
+        """
+        Checks that the added, changed and deleted books are applied to the index without rebuilding it,
+        and the availability changes are visible at once
+        """
+        similar_books_index = SimilarBooksIndex(book_repository=book_repository, neighbors=2, full_rebuild_ratio=10)
+        similar_books_index.rebuild()
+        emma = next(book for book in book_repository.iter_books() if book.book_name == "Emma")
+        sense = book_repository.add_book(make_book(
+            "Sense and Sensibility", "Jane Austen", "Two sisters in an english village look for a young man to marry"
+        ))
+        assert similar_books_index.get_similar_books(sense.book_id) is None
+        similar_books_index.update()
+        assert similar_books_index._changes_since_rebuild == 1
+        assert get_names(similar_books_index.get_similar_books(sense.book_id)) == ["Emma", "Persuasion"]
+        assert get_names(similar_books_index.get_similar_books(emma.book_id)) == ["Sense and Sensibility", "Persuasion"]
+        book_repository.checkout_book(sense.book_id)
+        assert similar_books_index.get_similar_books(emma.book_id)[0].available is False
+        book_repository.delete_book_by_name("Persuasion")
+        assert get_names(similar_books_index.get_similar_books(emma.book_id)) == ["Sense and Sensibility"]
+        book_repository.replace_book(sense.copy(update={"description": "Dune fan fiction about the desert planet"}))
+        similar_books_index.update()
+        assert similar_books_index._changes_since_rebuild == 4
+        assert get_names(similar_books_index.get_similar_books(emma.book_id)) == ["Sense and Sensibility"]
+        assert "Dune" in get_names(similar_books_index.get_similar_books(sense.book_id))
+
+    def test_background_builder(self, book_repository):
+        """
+        Checks that the background thread builds the index and applies the queued changes
+        """
+        similar_books_index = SimilarBooksIndex(book_repository=book_repository, update_delay_seconds=0.01)
+        similar_books_index.start()
+        try:
+            new_book = book_repository.add_book(make_book("God Emperor of Dune", "Frank Herbert", "Desert planet"))
+            for _ in range(500):
+                if similar_books_index.get_similar_books(new_book.book_id):
+                    break
+                similar_books_index._stop_event.wait(0.01)
+            assert "Dune" in get_names(similar_books_index.get_similar_books(new_book.book_id))
+        finally:
+            similar_books_index.close()
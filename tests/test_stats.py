@@ -0,0 +1,102 @@
+# tests/test_stats.py
+
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+
+from backend.models import Book
+from backend.database import MongoAdapter
+from backend.memory_database import InMemoryMongoClient
+from backend.stats import BookShelfStatistics
+from backend.repository import (
+    BookRepository,
+    InMemoryBookRepository,
+    SQLiteBookRepository,
+    MongoBookRepository,
+    BOOK_COLLECTION_INDEX_PARAMS,
+)
+
+
+"""
+Test class for stats.py module contains test cases to check
+the book shelf statistics maintained by the writes and recounted periodically
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_stats.py --cov-report term-missing --cov=sources
+"""
+
+
+def make_book(book_name: str, author: str, available: bool = True) -> Book:
+    return Book(book_id=uuid4().hex, book_name=book_name, author=author, description=None, available=available)
+
+
+@pytest.fixture(params=["memory", "sqlite", "mongo"])
+def book_repository(request, tmp_path: Path) -> BookRepository:
+    """
+    Fixture creates an empty book repository for every storage backend, mongo one works with the in-memory client
+
+    :return BookRepository: book repository instance
+    """
+    if request.param == "memory":
+        repository = InMemoryBookRepository()
+    elif request.param == "sqlite":
+        repository = SQLiteBookRepository(database_path=str(Path(tmp_path, "books.sqlite3")))
+    else:
+        repository = MongoBookRepository(mongo_adapter=MongoAdapter(
+            host="localhost",
+            port=27017,
+            db_name="test_db",
+            collection_name="test_books",
+            requires_auth=False,
+            required_index_params=BOOK_COLLECTION_INDEX_PARAMS,
+            client=InMemoryMongoClient()
+        ))
+    yield repository
+    repository.close()
+
+
+@pytest.mark.stats
+class TestBookShelfStatistics:
+    """
+    Test class to check functionality of BookShelfStatistics class
+    """
+
+    def test_counters_follow_the_writes(self, book_repository):
+        """
+        Checks that every write through the repository updates the counters without recounting
+        """
+        book_statistics = BookShelfStatistics(book_repository=book_repository, reconcile_interval_seconds=0)
+        book_statistics.start()
+        book_repository.add_books([make_book("Emma", "Jane Austen"), make_book("Persuasion", "Jane Austen")])
+        dune = book_repository.add_book(make_book("Dune", "Frank Herbert"))
+        book_repository.checkout_book(dune.book_id)
+        book_repository.delete_book_by_name("Persuasion")
+        book_repository.replace_book(make_book("Dune Messiah", "Frank Herbert", available=False))
+        stats = book_statistics.get_stats()
+        assert (stats.total, stats.available, stats.checked_out) == (3, 1, 2)
+        assert [(author.author, author.total, author.available) for author in stats.by_author] == [
+            ("Frank Herbert", 2, 0), ("Jane Austen", 1, 1)
+        ]
+        assert book_statistics.reconcile() == 0
+        assert len(book_statistics.get_stats(authors_limit=1).by_author) == 1
+
+    def test_reconciliation_corrects_drift(self, book_repository):
+        """
+        Checks that the recount corrects the counters missing the writes made around the repository listener
+        """
+        book_statistics = BookShelfStatistics(book_repository=book_repository, reconcile_interval_seconds=0)
+        book_statistics.start()
+        assert book_statistics.get_stats().reconciled_at is not None
+        book_repository.add_book(make_book("Emma", "Jane Austen"))
+        # books added by another worker are not seen by the listener
+        book_repository._listeners.remove(book_statistics.apply_change)
+        book_repository.add_book(make_book("Dune", "Frank Herbert"))
+        book_repository.checkout_book(book_repository.add_book(make_book("Persuasion", "Jane Austen")).book_id)
+        book_repository.subscribe(book_statistics.apply_change)
+        assert book_statistics.get_stats().total == 1
+        assert book_statistics.reconcile() == 2
+        stats = book_statistics.get_stats()
+        assert (stats.total, stats.available) == (3, 2)
+        assert {author.author: (author.total, author.available) for author in stats.by_author} == {
+            "Jane Austen": (2, 1), "Frank Herbert": (1, 1)
+        }
@@ -0,0 +1,69 @@
+# tests/test_throttling.py
+
+import time
+import asyncio
+
+import pytest
+
+from backend.throttling import LoginThrottle
+
+
+"""
+Test class for throttling.py module contains test cases to check
+brute-force login throttling
+test run terminal command (with activated venv):
+python -m pytest -rA -v --tb=line test_throttling.py --cov-report term-missing --cov=sources
+"""
+
+
+@pytest.mark.throttling
+class TestLoginThrottle:
+    """
+    Test class to check functionality of LoginThrottle class
+    """
+
+    def test_lockout_grows_exponentially(self):
+        """
+        Checks that the username is locked out once free failures are used up, and every next failure
+        doubles the lockout up to the maximum
+        """
+        login_throttle = LoginThrottle(username_free_failures=2, ip_free_failures=100, base_lockout_seconds=10, max_lockout_seconds=35)
+        lockouts = []
+        for _ in range(5):
+            login_throttle.record_failure(username="Alice", client_host="10.0.0.1")
+            lockouts.append(round(login_throttle.get_lockout_seconds(username="alice", client_host="10.0.0.2")))
+        assert lockouts == [0, 0, 10, 20, 35]
+
+    def test_success_resets_only_username(self):
+        """
+        Checks that successful login resets the username counter, while the IP counter is kept
+        """
+        login_throttle = LoginThrottle(username_free_failures=1, ip_free_failures=2, base_lockout_seconds=10)
+        for username in ("alice", "bob"):
+            login_throttle.record_failure(username=username, client_host="10.0.0.1")
+        login_throttle.record_success(username="alice", client_host="10.0.0.1")
+        assert login_throttle.get_lockout_seconds(username="alice", client_host="10.0.0.2") == 0
+        login_throttle.record_failure(username="carol", client_host="10.0.0.1")
+        assert login_throttle.get_lockout_seconds(username="alice", client_host="10.0.0.1") > 0
+        assert login_throttle.get_lockout_seconds(username="alice", client_host="10.0.0.3") == 0
+
+    def test_stale_failures_are_forgotten(self):
+        """
+        Checks that counters without recent failures are forgotten
+        """
+        login_throttle = LoginThrottle(username_free_failures=5, ip_free_failures=5, failure_ttl_seconds=0.01)
+        login_throttle.record_failure(username="alice", client_host="10.0.0.1")
+        time.sleep(0.02)
+        login_throttle.record_failure(username="bob", client_host="10.0.0.2")
+        assert set(login_throttle._failures) == {"username:bob", "ip:10.0.0.2"}
+
+    def test_failure_delay_is_padded_to_password_check(self):
+        """
+        Checks that the failed login is padded to the calibrated duration of the password verification
+        """
+        login_throttle = LoginThrottle()
+        password_check_seconds = login_throttle.calibrate()
+        assert password_check_seconds > 0
+        started_at = time.perf_counter()
+        asyncio.run(login_throttle.delay_failure(elapsed_seconds=0.0))
+        assert time.perf_counter() - started_at >= password_check_seconds * 0.9